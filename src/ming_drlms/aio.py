@@ -0,0 +1,555 @@
+"""
+---------------------------------------------------------------
+File name:                  aio.py
+Author:                     Ignorant-lu
+Date created:               2026/10/18
+Description:                基于 asyncio StreamReader 的 DRLMS 协议客户端：
+                            LOGIN/SUB/UNSUB/HISTORY/PUBT/PUBF/UPLOAD/DOWNLOAD/
+                            FETCH/LIST/ROOMINFO，单事件循环可承载大量订阅。
+----------------------------------------------------------------
+
+Changed history:
+                            2026/10/18: 初始创建;
+----
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+from pathlib import Path
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from . import state as _state
+from .protocol import Event, ProtocolError, decode_line, parse_event_header
+from .session import parse_welcome, tokens_enabled
+
+
+CHUNK_SIZE = 64 * 1024
+
+ProgressFn = Callable[[int], None]
+
+
+def _file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> Tuple[int, str]:
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while True:
+            buf = f.read(chunk_size)
+            if not buf:
+                break
+            h.update(buf)
+            size += len(buf)
+    return size, h.hexdigest()
+
+
+def _expect(resp: str, prefix: str) -> str:
+    if resp.startswith(prefix):
+        return resp
+    raise ProtocolError(resp, f"expected {prefix!r}, got {resp!r}")
+
+
+class AsyncClient:
+    """Asyncio client for the DRLMS text protocol.
+
+    连接有两种工作模式：
+
+    - 直读模式（未订阅）：命令按"发送 → 读应答"顺序执行，支持全部命令。
+    - 订阅模式（首次 ``sub()`` 之后）：后台读协程把 ``EVT|...`` 事件分发到事件队列，
+      其余行进入应答队列；此时仅支持行式命令（SUB/UNSUB/ROOMINFO/PUBT/PUBF/UPLOAD/LIST），
+      HISTORY 与 DOWNLOAD 需要独占读流，应使用另一条连接。
+
+    一条连接可以 SUB 任意多个房间，事件头自带房间名，由 ``events()`` 统一产出。
+
+    Args:
+        host (str): 服务器地址
+        port (int): 端口
+        timeout (float | None): 建连与等待应答的超时（秒）；事件流不受此限制
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        *,
+        timeout: Optional[float] = 10.0,
+    ):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.user: Optional[str] = None
+        self.rooms: Set[str] = set()
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._events: Optional[asyncio.Queue] = None
+        self._responses: Optional[asyncio.Queue] = None
+        self._reader_task: Optional[asyncio.Task] = None
+
+    # --- 生命周期 -----------------------------------------------------------
+
+    async def connect(self) -> "AsyncClient":
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        self._lock = asyncio.Lock()
+        self._events = asyncio.Queue()
+        self._responses = asyncio.Queue()
+        return self
+
+    @property
+    def connected(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+    @property
+    def subscribed(self) -> bool:
+        return self._reader_task is not None
+
+    async def close(self, quit: bool = True) -> None:
+        writer = self.writer
+        if writer is None:
+            return
+        self.writer = None
+        if quit and not writer.is_closing():
+            try:
+                writer.write(b"QUIT\n")
+                await asyncio.wait_for(writer.drain(), 1.0)
+            except Exception:
+                pass
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._reader_task = None
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
+        if self._events is not None:
+            self._events.put_nowait(None)
+
+    async def __aenter__(self) -> "AsyncClient":
+        if self.writer is None:
+            await self.connect()
+        return self
+
+    async def __aexit__(self, *_exc) -> None:
+        await self.close()
+
+    # --- 帧读写 -------------------------------------------------------------
+
+    async def _readline(self) -> str:
+        assert self.reader is not None
+        try:
+            raw = await self.reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            raw = e.partial
+        except asyncio.LimitOverrunError as e:
+            raise ProtocolError("", f"line too long: {e.consumed} bytes") from e
+        if raw.endswith(b"\n"):
+            raw = raw[:-1]
+        return decode_line(raw)
+
+    async def _read_payload(self, ev: Event) -> Event:
+        assert self.reader is not None
+        if ev.kind == "TEXT" and ev.length > 0:
+            ev.payload = await self.reader.readexactly(ev.length)
+        return ev
+
+    async def _response(self) -> str:
+        if self._reader_task is not None:
+            assert self._responses is not None
+            line = await asyncio.wait_for(self._responses.get(), self.timeout)
+            if line is None:
+                raise ConnectionError("connection closed by server")
+            return line
+        line = await asyncio.wait_for(self._readline(), self.timeout)
+        if not line and self.reader is not None and self.reader.at_eof():
+            raise ConnectionError("connection closed by server")
+        return line
+
+    async def _send(self, data: bytes) -> None:
+        if self.writer is None:
+            raise ConnectionError("not connected")
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def _command(self, line: str) -> str:
+        await self._send((line + "\n").encode())
+        return await self._response()
+
+    def _require_direct(self, what: str) -> None:
+        if self._reader_task is not None:
+            raise ProtocolError(
+                "", f"{what} is not available on a subscribed connection"
+            )
+
+    async def _reader_loop(self) -> None:
+        assert self._events is not None and self._responses is not None
+        try:
+            while True:
+                line = await self._readline()
+                if not line:
+                    if self.reader is None or self.reader.at_eof():
+                        break
+                    continue
+                ev = parse_event_header(line)
+                if ev is not None:
+                    await self._read_payload(ev)
+                    self._events.put_nowait(ev)
+                else:
+                    self._responses.put_nowait(line)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            self._events.put_nowait(None)
+            self._responses.put_nowait(None)
+
+    # --- 命令 ---------------------------------------------------------------
+
+    async def login(self, user: str, password: str) -> str:
+        """LOGIN|user|password → OK|WELCOME[|token|ttl].
+
+        state.json 中有该 (host, port, user) 的会话令牌时先 RESUME|token|password，
+        被拒才走 LOGIN；LOGIN 签发的新令牌写回 state.json。
+
+        Raises:
+            ProtocolError: 认证失败（code == "AUTH"）或应答异常
+        """
+
+        assert self._lock is not None
+        use_tokens = tokens_enabled()
+        async with self._lock:
+            token = (
+                _state.get_session_token(self.host, self.port, user)
+                if use_tokens
+                else None
+            )
+            if token:
+                resp = await self._command(f"RESUME|{token}|{password}")
+                if resp.startswith("OK|") or resp == "OK":
+                    self.user = user
+                    return resp
+                _state.drop_session_token(self.host, self.port, user)
+            resp = await self._command(f"LOGIN|{user}|{password}")
+        if not (resp.startswith("OK|") or resp == "OK"):
+            raise ProtocolError(resp)
+        issued = parse_welcome(resp) if use_tokens else None
+        if issued is not None:
+            _state.save_session_token(self.host, self.port, user, *issued)
+        self.user = user
+        return resp
+
+    async def list_files(self) -> List[str]:
+        """LIST → BEGIN / name... / END."""
+
+        assert self._lock is not None
+        async with self._lock:
+            resp = await self._command("LIST")
+            if resp != "BEGIN":
+                raise ProtocolError(resp)
+            names: List[str] = []
+            while True:
+                line = await self._response()
+                if line == "END":
+                    return names
+                names.append(line)
+
+    async def roominfo(self, room: str) -> Dict[str, Union[str, int]]:
+        """ROOMINFO|room → OK|ROOMINFO|room|owner|policy|subs|last_event_id.
+
+        新版服务器在其后追加扇出计数 queued|max_queue|dropped|kicked，存在时一并返回。
+        """
+
+        assert self._lock is not None
+        async with self._lock:
+            resp = await self._command(f"ROOMINFO|{room}")
+        parts = _expect(resp, "OK|ROOMINFO|").split("|")
+        if len(parts) < 7:
+            raise ProtocolError(resp, f"malformed ROOMINFO: {resp!r}")
+
+        def as_int(v: str, default: int) -> int:
+            try:
+                return int(v)
+            except ValueError:
+                return default
+
+        info: Dict[str, Union[str, int]] = {
+            "room": parts[2],
+            "owner": parts[3],
+            "policy": as_int(parts[4], -1),
+            "subs": as_int(parts[5], 0),
+            "last_event_id": as_int(parts[6], -1),
+        }
+        for key, val in zip(("queued", "max_queue", "dropped", "kicked"), parts[7:]):
+            info[key] = as_int(val, 0)
+        return info
+
+    async def sub(self, room: str, since_id: int = 0) -> str:
+        """SUB|room[|since_id]; switches the connection to subscription mode.
+
+        服务器在 OK|SUB 之后会补发最多 50 条 since_id 之后的历史事件，
+        它们与实时事件一样经 ``events()`` 产出。
+        """
+
+        assert self._lock is not None
+        async with self._lock:
+            if self._reader_task is None:
+                self._reader_task = asyncio.ensure_future(self._reader_loop())
+            cmd = f"SUB|{room}|{since_id}" if since_id > 0 else f"SUB|{room}"
+            resp = await self._command(cmd)
+        _expect(resp, "OK|SUB")
+        self.rooms.add(room)
+        return resp
+
+    async def unsub(self, room: str) -> str:
+        assert self._lock is not None
+        async with self._lock:
+            resp = await self._command(f"UNSUB|{room}")
+        _expect(resp, "OK|UNSUB")
+        self.rooms.discard(room)
+        return resp
+
+    async def history(
+        self, room: str, limit: int = 50, since_id: int = 0
+    ) -> List[Event]:
+        """HISTORY|room|limit[|since_id] → events... → OK|HISTORY."""
+
+        self._require_direct("HISTORY")
+        assert self._lock is not None
+        async with self._lock:
+            if since_id > 0:
+                await self._send(f"HISTORY|{room}|{limit}|{since_id}\n".encode())
+            else:
+                await self._send(f"HISTORY|{room}|{limit}\n".encode())
+            out: List[Event] = []
+            while True:
+                line = await self._response()
+                if line.startswith("OK|HISTORY") or line == "OK":
+                    return out
+                if line.startswith("ERR|"):
+                    raise ProtocolError(line)
+                ev = parse_event_header(line)
+                if ev is not None:
+                    out.append(await self._read_payload(ev))
+
+    async def pubt(self, room: str, data: Union[str, bytes]) -> int:
+        """PUBT|room|len|sha → READY → payload → OK|PUBT|event_id."""
+
+        blob = data.encode() if isinstance(data, str) else bytes(data)
+        sha = hashlib.sha256(blob).hexdigest()
+        assert self._lock is not None
+        async with self._lock:
+            _expect(await self._command(f"PUBT|{room}|{len(blob)}|{sha}"), "READY")
+            await self._send(blob)
+            resp = await self._response()
+        return int(_expect(resp, "OK|PUBT|").split("|")[-1])
+
+    async def _stream_file(
+        self, path: Path, progress: Optional[ProgressFn], chunk_size: int
+    ) -> None:
+        sent = 0
+        with open(path, "rb") as f:
+            while True:
+                buf = f.read(chunk_size)
+                if not buf:
+                    break
+                await self._send(buf)
+                sent += len(buf)
+                if progress is not None:
+                    progress(sent)
+
+    async def pubf(
+        self,
+        room: str,
+        path: Union[str, Path],
+        *,
+        name: Optional[str] = None,
+        progress: Optional[ProgressFn] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> int:
+        """PUBF|room|filename|size|sha → READY → bytes → OK|PUBF|event_id."""
+
+        p = Path(path)
+        loop = asyncio.get_event_loop()
+        size, sha = await loop.run_in_executor(None, _file_sha256, p)
+        assert self._lock is not None
+        async with self._lock:
+            hdr = f"PUBF|{room}|{name or p.name}|{size}|{sha}"
+            _expect(await self._command(hdr), "READY")
+            await self._stream_file(p, progress, chunk_size)
+            resp = await self._response()
+        return int(_expect(resp, "OK|PUBF|").split("|")[-1])
+
+    async def upload(
+        self,
+        path: Union[str, Path],
+        *,
+        name: Optional[str] = None,
+        progress: Optional[ProgressFn] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> str:
+        """UPLOAD|filename|size|sha → READY → bytes → OK|<sha>."""
+
+        p = Path(path)
+        loop = asyncio.get_event_loop()
+        size, sha = await loop.run_in_executor(None, _file_sha256, p)
+        assert self._lock is not None
+        async with self._lock:
+            _expect(
+                await self._command(f"UPLOAD|{name or p.name}|{size}|{sha}"), "READY"
+            )
+            await self._stream_file(p, progress, chunk_size)
+            resp = await self._response()
+        return _expect(resp, "OK|").split("|", 1)[1]
+
+    async def download(
+        self,
+        name: str,
+        out: Union[str, Path],
+        *,
+        progress: Optional[ProgressFn] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> Tuple[int, str]:
+        """DOWNLOAD|filename → SIZE|n|sha → READY → n bytes.
+
+        数据先写入 ``<out>.part``，边收边算 SHA-256，校验通过后原子改名。
+
+        Returns:
+            tuple[int, str]: (size, sha256hex)
+
+        Raises:
+            ProtocolError: 服务器报错或校验失败（code == "CHECKSUM"）
+        """
+
+        return await self._receive_file(
+            f"DOWNLOAD|{name}", "DOWNLOAD", out, progress, chunk_size
+        )
+
+    async def fetch(
+        self,
+        room: str,
+        event_id: int,
+        filename: str,
+        out: Union[str, Path],
+        *,
+        progress: Optional[ProgressFn] = None,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> Tuple[int, str]:
+        """FETCH|room|event_id|filename: download a file published with PUBF.
+
+        应答帧与 DOWNLOAD 相同；同样只能在直读模式（未订阅的连接）上使用。
+        """
+
+        return await self._receive_file(
+            f"FETCH|{room}|{int(event_id)}|{filename}",
+            "FETCH",
+            out,
+            progress,
+            chunk_size,
+        )
+
+    async def _receive_file(
+        self,
+        cmd: str,
+        what: str,
+        out: Union[str, Path],
+        progress: Optional[ProgressFn],
+        chunk_size: int,
+    ) -> Tuple[int, str]:
+        self._require_direct(what)
+        assert self._lock is not None and self.reader is not None
+        out_path = Path(out)
+        part = out_path.with_name(out_path.name + ".part")
+        async with self._lock:
+            resp = await self._command(cmd)
+            parts = _expect(resp, "SIZE|").split("|")
+            try:
+                size = int(parts[1])
+                want = parts[2]
+            except (IndexError, ValueError):
+                raise ProtocolError(resp, f"bad SIZE header: {resp!r}")
+            _expect(await self._response(), "READY")
+            h = hashlib.sha256()
+            remain = size
+            try:
+                with open(part, "wb") as f:
+                    while remain > 0:
+                        buf = await self.reader.read(min(chunk_size, remain))
+                        if not buf:
+                            raise ConnectionError(f"short read during {what}")
+                        f.write(buf)
+                        h.update(buf)
+                        remain -= len(buf)
+                        if progress is not None:
+                            progress(size - remain)
+            except BaseException:
+                try:
+                    part.unlink()
+                except OSError:
+                    pass
+                raise
+        got = h.hexdigest()
+        if got.lower() != want.lower():
+            try:
+                part.unlink()
+            except OSError:
+                pass
+            raise ProtocolError("ERR|CHECKSUM|mismatch")
+        os.replace(part, out_path)
+        return size, got
+
+    # --- 事件 ---------------------------------------------------------------
+
+    async def next_event(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """Wait for the next event; None when the connection has closed."""
+
+        assert self._events is not None
+        if timeout is None:
+            return await self._events.get()
+        return await asyncio.wait_for(self._events.get(), timeout)
+
+    async def events(self) -> AsyncIterator[Event]:
+        """Yield events from all subscribed rooms until the connection closes."""
+
+        while True:
+            ev = await self.next_event()
+            if ev is None:
+                return
+            yield ev
+
+
+async def connect(
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    *,
+    timeout: Optional[float] = 10.0,
+) -> AsyncClient:
+    """Open a connection and LOGIN; the caller owns ``close()``."""
+
+    client = AsyncClient(host, port, timeout=timeout)
+    await client.connect()
+    try:
+        await client.login(user, password)
+    except BaseException:
+        await client.close(quit=False)
+        raise
+    return client
+
+
+__all__ = ["CHUNK_SIZE", "AsyncClient", "connect"]
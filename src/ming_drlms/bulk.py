@@ -0,0 +1,349 @@
+"""
+---------------------------------------------------------------
+File name:                  bulk.py
+Author:                     Ignorant-lu
+Date created:               2026/10/18
+Description:                批量上传/下载：在有界的已登录连接池上并发传输多个文件，
+                            SHA-256 一致的文件直接跳过，汇总吞吐。
+----------------------------------------------------------------
+
+Changed history:
+                            2026/10/18: 初始创建;
+----
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional, Set, Union
+
+from .protocol import ProtocolError
+from .session import ConnectFn, LoginFn, SessionPool
+from .transfer import (
+    download_file,
+    file_sha256,
+    list_files,
+    stat_file,
+    upload_file,
+)
+
+
+DEFAULT_JOBS = 4
+
+ResultFn = Callable[["BulkResult"], None]
+BytesFn = Callable[[int], None]
+
+
+@dataclass
+class BulkResult:
+    """Outcome of one file in a bulk transfer.
+
+    Attributes:
+        name (str): 服务器端文件名
+        status (str): ``ok`` / ``skipped`` / ``failed``
+        size (int): 文件字节数
+        sha (str): sha256hex（失败时可能为空）
+        error (str): 失败原因
+    """
+
+    name: str
+    status: str
+    size: int = 0
+    sha: str = ""
+    error: str = ""
+
+
+@dataclass
+class BulkReport:
+    """Aggregate of a bulk transfer; ``bytes`` counts only transferred files."""
+
+    results: List[BulkResult] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def count(self, status: str) -> int:
+        return sum(1 for r in self.results if r.status == status)
+
+    @property
+    def ok(self) -> int:
+        return self.count("ok")
+
+    @property
+    def skipped(self) -> int:
+        return self.count("skipped")
+
+    @property
+    def failed(self) -> int:
+        return self.count("failed")
+
+    @property
+    def bytes(self) -> int:
+        return sum(r.size for r in self.results if r.status == "ok")
+
+    @property
+    def throughput(self) -> float:
+        """Transferred bytes per second over the whole run."""
+
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+
+class _Runner:
+    """Shared plumbing: a bounded session pool and one worker per connection."""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        *,
+        jobs: int,
+        connect: Optional[ConnectFn],
+        login: Optional[LoginFn],
+        on_result: Optional[ResultFn],
+        on_bytes: Optional[BytesFn],
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.jobs = max(1, int(jobs))
+        self.connect = connect
+        self.login = login
+        self.on_result = on_result
+        self.on_bytes = on_bytes
+        self.pool = SessionPool(max_per_key=self.jobs)
+        self._mu = threading.Lock()
+
+    def session(self):
+        return self.pool.session(
+            self.host,
+            self.port,
+            self.user,
+            self.password,
+            connect=self.connect,
+            login=self.login,
+        )
+
+    def progress(self) -> Callable[[int], None]:
+        """Per-file callback turning cumulative byte counts into deltas."""
+
+        last = [0]
+
+        def _cb(done: int) -> None:
+            delta = done - last[0]
+            last[0] = done
+            if delta and self.on_bytes is not None:
+                with self._mu:
+                    self.on_bytes(delta)
+
+        return _cb
+
+    def run(self, items: List[Any], one: Callable[[Any], BulkResult]) -> BulkReport:
+        report = BulkReport()
+        t0 = time.perf_counter()
+
+        def _task(item: Any) -> BulkResult:
+            res = one(item)
+            with self._mu:
+                report.results.append(res)
+                if self.on_result is not None:
+                    self.on_result(res)
+            return res
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.jobs, thread_name_prefix="drlms-bulk"
+            ) as ex:
+                list(ex.map(_task, items))
+        finally:
+            report.elapsed = time.perf_counter() - t0
+            self.pool.close_all()
+        return report
+
+
+def _failed(name: str, err: BaseException, size: int = 0) -> BulkResult:
+    return BulkResult(name=name, status="failed", size=size, error=str(err))
+
+
+def bulk_upload(
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    files: Iterable[Union[str, Path]],
+    *,
+    jobs: int = DEFAULT_JOBS,
+    connect: Optional[ConnectFn] = None,
+    login: Optional[LoginFn] = None,
+    on_result: Optional[ResultFn] = None,
+    on_bytes: Optional[BytesFn] = None,
+) -> BulkReport:
+    """Upload many files concurrently over at most ``jobs`` logged-in connections.
+
+    先 LIST 一次得到已存在的文件名，只对同名文件发 STAT 比较 SHA-256：一致则跳过，
+    不一致则记为失败（服务器不允许覆盖）。服务器端文件名取本地 basename。
+
+    Args:
+        host (str): 服务器地址
+        port (int): 端口
+        user (str): 用户名
+        password (str): 密码
+        files: 本地文件列表
+        jobs (int): 并发连接数
+        connect: 可选的建连函数 (host, port) -> conn
+        login: 可选的登录函数 (conn, user, password) -> bool
+        on_result: 每个文件完成后的回调
+        on_bytes: 已传输字节增量回调（跨线程串行调用）
+
+    Returns:
+        BulkReport: 逐文件结果与汇总吞吐
+
+    Raises:
+        LoginFailed: 服务器拒绝登录
+    """
+
+    runner = _Runner(
+        host,
+        port,
+        user,
+        password,
+        jobs=jobs,
+        connect=connect,
+        login=login,
+        on_result=on_result,
+        on_bytes=on_bytes,
+    )
+    # 首次登录在主线程完成：凭据错误直接抛出，而不是每个文件各失败一次
+    with runner.session() as sess:
+        remote: Set[str] = set(list_files(sess.conn))
+
+    def _one(path: Path) -> BulkResult:
+        name = path.name
+        try:
+            size, sha = file_sha256(path)
+        except OSError as e:
+            return _failed(name, e)
+        try:
+            with runner.session() as sess:
+                try:
+                    if name in remote:
+                        st = stat_file(sess.conn, name)
+                        if st is not None and st[1] == sha:
+                            return BulkResult(name, "skipped", size, sha)
+                        if st is not None:
+                            return BulkResult(
+                                name,
+                                "failed",
+                                size,
+                                sha,
+                                "exists on server with different content",
+                            )
+                    got = upload_file(
+                        sess.conn,
+                        path,
+                        digest=(size, sha),
+                        progress=runner.progress(),
+                    )
+                except ProtocolError as e:
+                    # 协议层面的拒绝不破坏连接状态，会话照常归还
+                    return _failed(name, e, size)
+        except Exception as e:
+            return _failed(name, e, size)
+        return BulkResult(name, "ok", size, got)
+
+    return runner.run([Path(f) for f in files], _one)
+
+
+def bulk_download(
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    dest: Union[str, Path],
+    names: Optional[Iterable[str]] = None,
+    *,
+    match: Optional[Callable[[str], bool]] = None,
+    jobs: int = DEFAULT_JOBS,
+    connect: Optional[ConnectFn] = None,
+    login: Optional[LoginFn] = None,
+    on_result: Optional[ResultFn] = None,
+    on_bytes: Optional[BytesFn] = None,
+) -> BulkReport:
+    """Download many server files into ``dest`` concurrently.
+
+    ``names`` 为 None 时由 LIST 决定要下载的文件（可用 ``match`` 过滤）。本地已有
+    同名文件时先 STAT 比较 SHA-256，一致则跳过。
+
+    Args:
+        host (str): 服务器地址
+        port (int): 端口
+        user (str): 用户名
+        password (str): 密码
+        dest (Path): 本地目录，不存在时创建
+        names: 要下载的文件名；None 表示全部
+        match: 文件名过滤函数
+        jobs (int): 并发连接数
+        connect: 可选的建连函数 (host, port) -> conn
+        login: 可选的登录函数 (conn, user, password) -> bool
+        on_result: 每个文件完成后的回调
+        on_bytes: 已传输字节增量回调（跨线程串行调用）
+
+    Returns:
+        BulkReport: 逐文件结果与汇总吞吐
+
+    Raises:
+        LoginFailed: 服务器拒绝登录
+    """
+
+    out_dir = Path(dest)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    runner = _Runner(
+        host,
+        port,
+        user,
+        password,
+        jobs=jobs,
+        connect=connect,
+        login=login,
+        on_result=on_result,
+        on_bytes=on_bytes,
+    )
+    with runner.session() as sess:
+        todo = list(names) if names is not None else list_files(sess.conn)
+    if match is not None:
+        todo = [n for n in todo if match(n)]
+
+    def _one(name: str) -> BulkResult:
+        if not name or "/" in name or "\\" in name or name in (".", ".."):
+            return BulkResult(name, "failed", error="unsafe file name")
+        out = out_dir / name
+        try:
+            with runner.session() as sess:
+                try:
+                    if out.is_file():
+                        st = stat_file(sess.conn, name)
+                        if st is not None and st == file_sha256(out):
+                            return BulkResult(name, "skipped", st[0], st[1])
+                    size, sha = download_file(
+                        sess.conn, name, out, progress=runner.progress()
+                    )
+                except ProtocolError as e:
+                    return _failed(name, e)
+        except Exception as e:
+            return _failed(name, e)
+        return BulkResult(name, "ok", size, sha)
+
+    return runner.run(todo, _one)
+
+
+__all__ = [
+    "DEFAULT_JOBS",
+    "BulkResult",
+    "BulkReport",
+    "bulk_upload",
+    "bulk_download",
+]
@@ -1,12 +1,87 @@
 from __future__ import annotations
 
 import atexit
+from difflib import get_close_matches
+from typing import Any, Dict, List, Optional, Tuple
+
 from typing_extensions import Annotated
 import typer
+from typer.core import TyperGroup
 
 from .._version import __version__
 
-app = typer.Typer(help="ming-drlms: Pretty CLI for DRLMS server and client")
+# 顶层命令组按需导入：名称 -> (模块, 属性)。模块只在该命令被调用（或渲染
+# --help 列表）时才导入，`--version` 与单个子命令不再为所有命令组付出导入代价
+# （argon2、requests、yaml、rich.progress 等）。
+_LAZY_GROUPS: Dict[str, Tuple[str, str]] = {
+    "client": ("client", "client_app"),
+    "config": ("config", "config_app"),
+    "user": ("user", "user_app"),
+    "space": ("space", "space_app"),
+    "ipc": ("ipc", "ipc_app"),
+    "help": ("help", "help_app"),
+    "demo": ("demo", "demo_app"),
+    "server": ("server", "server_app"),
+    "dev": ("dev", "dev_app"),
+}
+
+# 向后兼容的顶层别名，由 server.register_top_level_aliases 注册
+_LAZY_ALIASES = ("server-up", "server-down", "server-status", "server-logs")
+
+try:  # 新版 typer 自带 click 副本（typer._click），其异常类不是 click 本身的
+    from typer._click.exceptions import UsageError as _UsageError
+except ImportError:
+    from click.exceptions import UsageError as _UsageError
+
+
+class LazyGroup(TyperGroup):
+    """Top-level group that imports subcommand modules on first use."""
+
+    def list_commands(self, ctx: typer.Context) -> List[str]:
+        eager = [n for n in self.commands if n not in _LAZY_GROUPS]
+        return [*_LAZY_ALIASES, *_LAZY_GROUPS, *eager]
+
+    def get_command(self, ctx: typer.Context, cmd_name: str) -> Optional[Any]:
+        cmd = self.commands.get(cmd_name)
+        if cmd is not None:
+            return cmd
+        if cmd_name in _LAZY_GROUPS:
+            mod_name, attr = _LAZY_GROUPS[cmd_name]
+            # 用 __import__ 而非 importlib.import_module：后者绕过解释器的
+            # 导入计时，`python -X importtime` 中将看不到这些模块
+            mod = __import__(mod_name, globals(), None, [attr], 1)
+            cmd = typer.main.get_group(getattr(mod, attr))
+            cmd.name = cmd_name
+        elif cmd_name in _LAZY_ALIASES:
+            from .server import register_top_level_aliases
+
+            aliases = typer.Typer()
+            register_top_level_aliases(aliases)
+            group = typer.main.get_group(aliases)
+            for name in _LAZY_ALIASES:
+                self.commands[name] = group.commands[name]
+            return self.commands[cmd_name]
+        else:
+            return None
+        self.commands[cmd_name] = cmd
+        return cmd
+
+    def resolve_command(self, ctx: typer.Context, args: List[str]):
+        try:
+            return super().resolve_command(ctx, args)
+        except _UsageError as e:
+            # TyperGroup 只在已加载的命令中找近似名，这里补上未导入的命令
+            if self.suggest_commands and args and "Did you mean" not in e.message:
+                matches = get_close_matches(args[0], self.list_commands(ctx))
+                if matches:
+                    suggestions = ", ".join(f"{m!r}" for m in matches)
+                    e.message = f"{e.message.rstrip('.')}. Did you mean {suggestions}?"
+            raise
+
+
+app = typer.Typer(
+    cls=LazyGroup, help="ming-drlms: Pretty CLI for DRLMS server and client"
+)
 
 
 def version_callback(value: bool):
@@ -32,37 +107,18 @@ def _app_entry(
     pass
 
 
-# Import and register top-level command groups
-from . import client as _client  # noqa: E402
-from . import user as _user  # noqa: E402
-from . import ipc as _ipc  # noqa: E402
-from . import space as _space  # noqa: E402
-from . import help as _help  # noqa: E402
-from . import demo as _demo  # noqa: E402
-from . import config as _config  # noqa: E402
-from . import server as _server  # noqa: E402  # registers server group & aliases
-
-app.add_typer(_client.client_app, name="client")
-app.add_typer(_config.config_app, name="config")
-app.add_typer(_user.user_app, name="user")
-app.add_typer(_space.space_app, name="space")
-app.add_typer(_ipc.ipc_app, name="ipc")
-app.add_typer(_help.help_app, name="help")
-app.add_typer(_demo.demo_app, name="demo")
-app.add_typer(_server.server_app, name="server")
-_server.register_top_level_aliases(app)
-
-
-# Import and register dev group (test/coverage/pkg/artifacts)
-from .dev import dev_app as _dev_app  # noqa: E402
-
-app.add_typer(_dev_app, name="dev")
+# atexit notification for new version (throttled)
+def _notify_exit() -> None:
+    # 直接使用 update_check，避免退出时为此导入 utils（config/protocol/session）
+    try:
+        from ..update_check import maybe_notify_new_version
 
+        maybe_notify_new_version(__version__)
+    except Exception:
+        pass
 
-# atexit notification for new version (throttled)
-from .utils import notify_exit  # noqa: E402
 
-atexit.register(notify_exit)
+atexit.register(_notify_exit)
 
 
-__all__ = ["app"]
+__all__ = ["app", "LazyGroup"]
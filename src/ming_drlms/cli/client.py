@@ -1,18 +1,79 @@
 from __future__ import annotations
 
-import subprocess
+import fnmatch
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
 import socket
 
 import typer
+from rich.console import Console
+from rich.progress import Progress, BarColumn, TimeRemainingColumn, TransferSpeedColumn
 
+from ..bulk import DEFAULT_JOBS, BulkReport, BulkResult, bulk_download, bulk_upload
 from ..i18n import t
-from .utils import BIN_AGENT, env_with
+from ..protocol import BufferedConnection, ProtocolError
+from ..session import LoginFailed
+from ..transfer import download_file, file_sha256, list_files, retrying, upload_file
+from .utils import login, recv_line, tcp_connect
 
 
 client_app = typer.Typer(help="client operations (list/upload/download/log)")
 
+# 进度条与吞吐统计走 stderr，stdout 保持与 log_agent 一致的可脚本化输出
+_err_console = Console(stderr=True, highlight=False)
+
+
+class _ClientError(Exception):
+    """Fatal client-side failure; message is printed to stderr and exits 1."""
+
+
+@contextmanager
+def _client_session(
+    host: str, port: int, user: str, password: str
+) -> Iterator[BufferedConnection]:
+    try:
+        conn = tcp_connect(host, port)
+    except OSError as e:
+        # 仍是 OSError：上传重试逻辑据此判断为可恢复的连接错误
+        raise ConnectionError(f"connect {host}:{port} failed: {e}") from e
+    try:
+        if not login(conn, user, password):
+            raise _ClientError("login failed")
+        yield conn
+    finally:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+def _fail(msg: str) -> None:
+    typer.echo(f"[client] {msg}", err=True)
+    raise typer.Exit(code=1)
+
+
+def _report(verb: str, name: str, size: int, elapsed: float) -> None:
+    mbps = size / max(elapsed, 1e-9) / (1024 * 1024)
+    _err_console.print(
+        f"{verb} {name}: {size} bytes in {elapsed:.2f}s ({mbps:.1f} MiB/s)",
+        markup=False,
+    )
+
+
+def _progress() -> Progress:
+    return Progress(
+        "[progress.description]{task.description}",
+        BarColumn(),
+        "{task.percentage:>3.0f}%",
+        TransferSpeedColumn(),
+        TimeRemainingColumn(),
+        console=_err_console,
+        transient=True,
+        disable=not _err_console.is_terminal,
+    )
+
 
 @client_app.command("list", help=t("HELP.CLIENT.LIST"))
 def client_list(
@@ -22,16 +83,22 @@ def client_list(
     password: str = typer.Option("password", "--password", "-P", help="password"),
 ):
     """List files on server (LOGIN -> LIST)."""
-    if not BIN_AGENT.exists():
-        typer.echo(
-            "[client] missing C binary 'log_agent' (run: make all) — skipping",
-            err=True,
-        )
-        raise typer.Exit(code=2)
-    env = env_with()
-    cmd = [str(BIN_AGENT), host, str(port), "login", user, password, "list"]
-    p = subprocess.run(cmd, env=env, check=False)
-    raise typer.Exit(code=p.returncode)
+    try:
+        with _client_session(host, port, user, password) as conn:
+            names = list_files(conn)
+    except (_ClientError, ProtocolError, OSError) as e:
+        _fail(str(e))
+    typer.echo("BEGIN")
+    for name in names:
+        typer.echo(name)
+    typer.echo("END")
+
+
+def _note_retry(n: int, err: BaseException, delay: float) -> None:
+    _err_console.print(
+        f"transfer interrupted ({err}); resuming in {delay:.0f}s (retry {n})",
+        markup=False,
+    )
 
 
 @client_app.command("upload", help=t("HELP.CLIENT.UPLOAD"))
@@ -41,27 +108,35 @@ def client_upload(
     port: int = typer.Option(8080, "--port", "-p", help="server port"),
     user: str = typer.Option("alice", "--user", "-u", help="username"),
     password: str = typer.Option("password", "--password", "-P", help="password"),
+    retries: int = typer.Option(
+        3, "--retries", help="reconnect and resume this many times"
+    ),
 ):
-    """Upload a file to server (LOGIN -> UPLOAD)."""
-    if not BIN_AGENT.exists():
-        typer.echo(
-            "[client] missing C binary 'log_agent' (run: make all) — skipping",
-            err=True,
-        )
-        raise typer.Exit(code=2)
-    env = env_with()
-    cmd = [
-        str(BIN_AGENT),
-        host,
-        str(port),
-        "login",
-        user,
-        password,
-        "upload",
-        str(file),
-    ]
-    p = subprocess.run(cmd, env=env, check=False)
-    raise typer.Exit(code=p.returncode)
+    """Upload a file to server (LOGIN -> UPLOAD), resuming after dropped links."""
+    if not file.is_file():
+        _fail(f"no such file: {file}")
+    size, sha = file_sha256(file)
+    try:
+        t0 = time.perf_counter()
+        with _progress() as progress:
+            task = progress.add_task("uploading", total=size)
+
+            def _attempt() -> str:
+                with _client_session(host, port, user, password) as conn:
+                    return upload_file(
+                        conn,
+                        file,
+                        digest=(size, sha),
+                        resume=True,
+                        progress=lambda n: progress.update(task, completed=n),
+                    )
+
+            got = retrying(_attempt, retries=retries, on_retry=_note_retry)
+        elapsed = time.perf_counter() - t0
+    except (_ClientError, ProtocolError, OSError) as e:
+        _fail(str(e))
+    typer.echo(f"OK|{got}")
+    _report("uploaded", file.name, size, elapsed)
 
 
 @client_app.command("download", help=t("HELP.CLIENT.DOWNLOAD"))
@@ -75,28 +150,125 @@ def client_download(
     user: str = typer.Option("alice", "--user", "-u", help="username"),
     password: str = typer.Option("password", "--password", "-P", help="password"),
 ):
-    """Download a file from server (LOGIN -> DOWNLOAD)."""
-    if not BIN_AGENT.exists():
-        typer.echo(
-            "[client] missing C binary 'log_agent' (run: make all) — skipping",
-            err=True,
-        )
-        raise typer.Exit(code=2)
-    env = env_with()
-    args = [
-        str(BIN_AGENT),
-        host,
-        str(port),
-        "login",
-        user,
-        password,
-        "download",
-        filename,
-    ]
-    if out is not None:
-        args.append(str(out))
-    p = subprocess.run(args, env=env, check=False)
-    raise typer.Exit(code=p.returncode)
+    """Download a file from server (LOGIN -> DOWNLOAD), verifying SHA-256."""
+    dest = out if out is not None else Path(filename)
+    try:
+        with _client_session(host, port, user, password) as conn:
+            t0 = time.perf_counter()
+            with _progress() as progress:
+                task = progress.add_task("downloading", total=None)
+
+                def _tick(n: int) -> None:
+                    progress.update(task, completed=n)
+
+                size, got = download_file(conn, filename, dest, progress=_tick)
+            elapsed = time.perf_counter() - t0
+    except (_ClientError, ProtocolError, OSError) as e:
+        _fail(str(e))
+    typer.echo(f"OK|{got}")
+    _report("downloaded", filename, size, elapsed)
+
+
+def _print_result(res: BulkResult) -> None:
+    if res.status == "ok":
+        line = f"OK|{res.name}|{res.sha}"
+    elif res.status == "skipped":
+        line = f"SKIP|{res.name}|{res.sha}"
+    else:
+        line = f"ERR|{res.name}|{res.error}"
+    typer.echo(line)
+
+
+def _run_bulk(verb: str, total: Optional[int], fn) -> BulkReport:
+    try:
+        with _progress() as progress:
+            task = progress.add_task(verb, total=total)
+
+            def _bytes(n: int) -> None:
+                progress.advance(task, n)
+
+            report = fn(_print_result, _bytes)
+    except LoginFailed:
+        _fail("login failed")
+    except (ProtocolError, OSError) as e:
+        _fail(str(e))
+    mbps = report.throughput / (1024 * 1024)
+    _err_console.print(
+        f"{verb}: {report.ok} ok, {report.skipped} skipped, {report.failed} failed; "
+        f"{report.bytes} bytes in {report.elapsed:.2f}s ({mbps:.1f} MiB/s)",
+        markup=False,
+    )
+    if report.failed:
+        raise typer.Exit(code=1)
+    return report
+
+
+@client_app.command("upload-dir", help=t("HELP.CLIENT.UPLOAD_DIR"))
+def client_upload_dir(
+    directory: Path = typer.Argument(..., help="local directory to upload"),
+    pattern: str = typer.Option("*", "--pattern", "-g", help="file name glob"),
+    jobs: int = typer.Option(DEFAULT_JOBS, "--jobs", "-j", help="parallel connections"),
+    host: str = typer.Option("127.0.0.1", "--host", "-H", help="server host"),
+    port: int = typer.Option(8080, "--port", "-p", help="server port"),
+    user: str = typer.Option("alice", "--user", "-u", help="username"),
+    password: str = typer.Option("password", "--password", "-P", help="password"),
+):
+    """Upload the regular, non-hidden files of a directory (not recursive)."""
+    if not directory.is_dir():
+        _fail(f"not a directory: {directory}")
+    files = sorted(
+        p
+        for p in directory.iterdir()
+        if p.is_file()
+        and not p.name.startswith(".")
+        and fnmatch.fnmatch(p.name, pattern)
+    )
+    if not files:
+        typer.echo(f"[client] no files match {pattern!r} in {directory}", err=True)
+        return
+    total = sum(p.stat().st_size for p in files)
+    _run_bulk(
+        "uploading",
+        total,
+        lambda on_result, on_bytes: bulk_upload(
+            host,
+            port,
+            user,
+            password,
+            files,
+            jobs=jobs,
+            on_result=on_result,
+            on_bytes=on_bytes,
+        ),
+    )
+
+
+@client_app.command("download-all", help=t("HELP.CLIENT.DOWNLOAD_ALL"))
+def client_download_all(
+    out: Path = typer.Option(Path("."), "--out", "-o", help="output directory"),
+    pattern: str = typer.Option("*", "--pattern", "-g", help="file name glob"),
+    jobs: int = typer.Option(DEFAULT_JOBS, "--jobs", "-j", help="parallel connections"),
+    host: str = typer.Option("127.0.0.1", "--host", "-H", help="server host"),
+    port: int = typer.Option(8080, "--port", "-p", help="server port"),
+    user: str = typer.Option("alice", "--user", "-u", help="username"),
+    password: str = typer.Option("password", "--password", "-P", help="password"),
+):
+    """Download every file listed by LIST (optionally filtered by --pattern)."""
+    _run_bulk(
+        "downloading",
+        None,
+        lambda on_result, on_bytes: bulk_download(
+            host,
+            port,
+            user,
+            password,
+            out,
+            match=lambda name: fnmatch.fnmatch(name, pattern),
+            jobs=jobs,
+            on_result=on_result,
+            on_bytes=on_bytes,
+        ),
+    )
 
 
 @client_app.command("log", help=t("HELP.CLIENT.LOG"))
@@ -109,18 +281,10 @@ def client_log(
 ):
     """Send a single LOG message (LOGIN -> LOG -> QUIT)."""
 
-    def recv_line(sock):
-        buf = bytearray()
-        while True:
-            ch = sock.recv(1)
-            if not ch or ch == b"\n":
-                break
-            buf.extend(ch)
-        return buf.decode(errors="ignore")
-
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.settimeout(3)
-    s.connect((host, port))
+    raw = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    raw.settimeout(3)
+    raw.connect((host, port))
+    s = BufferedConnection(raw)
     s.sendall(f"LOGIN|{user}|{password}\n".encode())
     resp = recv_line(s)
     if resp.startswith("ERR|"):
@@ -146,5 +310,7 @@ __all__ = [
     "client_list",
     "client_upload",
     "client_download",
+    "client_upload_dir",
+    "client_download_all",
     "client_log",
 ]
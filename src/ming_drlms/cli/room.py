@@ -6,11 +6,20 @@ from rich.table import Table
 
 from .utils import tcp_connect, recv_line, login
 from ..i18n import t
+from ..session import LoginFailed, get_pool
 
 
 room_app = typer.Typer(help="room manager: info/set-policy/transfer")
 
 _POLICY_NAME = {0: "retain", 1: "delegate", 2: "teardown"}
+_FANOUT_FIELDS = ("queued", "max_queue", "dropped", "kicked")
+
+
+def _session(host: str, port: int, user: str, password: str):
+    """Borrow a logged-in connection from the process-wide session pool."""
+    return get_pool().session(
+        host, port, user, password, connect=tcp_connect, login=login
+    )
 
 
 @room_app.command("info", help=t("HELP.ROOM.INFO"))
@@ -22,78 +31,79 @@ def room_info(
     password: str = typer.Option("password", "--password", "-P"),
     json_out: bool = typer.Option(False, "--json", "-j", help="以 JSON 方式输出"),
 ):
-    s = tcp_connect(host, port)
     try:
-        if not login(s, user, password):
-            print("login failed")
-            raise typer.Exit(code=1)
-        s.sendall(f"ROOMINFO|{room}\n".encode())
-        info_line = None
-        for _ in range(3):
-            line = recv_line(s)
-            if not line:
-                break
-            if line.startswith("OK|ROOMINFO|"):
-                info_line = line[3:]
-                break
-            if line.startswith("ROOMINFO|"):
-                info_line = line
-                break
-        if not info_line:
-            if line:
-                print(line)
-            print("[red]ROOMINFO not returned[/red]")
-            raise typer.Exit(code=2)
-        parts = info_line.split("|")
-        if len(parts) < 6:
-            print(info_line)
-            print("[red]malformed ROOMINFO line[/red]")
-            raise typer.Exit(code=2)
-        room_name = parts[1]
-        owner = parts[2]
-        try:
-            policy = int(parts[3])
-        except Exception:
-            policy = -1
-        try:
-            subs = int(parts[4])
-        except Exception:
-            subs = 0
-        try:
-            last_event_id = int(parts[5])
-        except Exception:
-            last_event_id = -1
-        data = {
-            "room": room_name,
-            "owner": owner,
-            "policy": policy,
-            "subs": subs,
-            "last_event_id": last_event_id,
-        }
-        if json_out:
-            import json
-
-            print(json.dumps(data, ensure_ascii=False))
-        else:
-            table = Table(title=f"ROOMINFO: {room_name}")
-            table.add_column("字段")
-            table.add_column("值")
-            table.add_row("owner", owner)
-            table.add_row("policy", str(policy))
-            table.add_row("policy_name", _POLICY_NAME.get(policy, "unknown"))
-            table.add_row("subs", str(subs))
-            table.add_row("last_event_id", str(last_event_id))
-            print(table)
-    finally:
-        try:
+        with _session(host, port, user, password) as sess:
+            s = sess.conn
+            s.sendall(f"ROOMINFO|{room}\n".encode())
+            info_line = None
+            for _ in range(3):
+                line = recv_line(s)
+                if not line:
+                    break
+                if line.startswith("OK|ROOMINFO|"):
+                    info_line = line[3:]
+                    break
+                if line.startswith("ROOMINFO|"):
+                    info_line = line
+                    break
+            if not info_line:
+                if line:
+                    print(line)
+                print("[red]ROOMINFO not returned[/red]")
+                raise typer.Exit(code=2)
+            parts = info_line.split("|")
+            if len(parts) < 6:
+                print(info_line)
+                print("[red]malformed ROOMINFO line[/red]")
+                raise typer.Exit(code=2)
+            room_name = parts[1]
+            owner = parts[2]
             try:
-                s.sendall(b"QUIT\n")
+                policy = int(parts[3])
             except Exception:
-                pass
-            _ = recv_line(s)
-            s.close()
-        except Exception:
-            pass
+                policy = -1
+            try:
+                subs = int(parts[4])
+            except Exception:
+                subs = 0
+            try:
+                last_event_id = int(parts[5])
+            except Exception:
+                last_event_id = -1
+            data = {
+                "room": room_name,
+                "owner": owner,
+                "policy": policy,
+                "subs": subs,
+                "last_event_id": last_event_id,
+            }
+            # 扇出计数（新版服务器追加）：排队事件数、最深队列、丢弃数、被断开的慢订阅者数
+            for i, key in enumerate(_FANOUT_FIELDS):
+                if len(parts) > 6 + i:
+                    try:
+                        data[key] = int(parts[6 + i])
+                    except ValueError:
+                        pass
+            if json_out:
+                import json
+
+                print(json.dumps(data, ensure_ascii=False))
+            else:
+                table = Table(title=f"ROOMINFO: {room_name}")
+                table.add_column("字段")
+                table.add_column("值")
+                table.add_row("owner", owner)
+                table.add_row("policy", str(policy))
+                table.add_row("policy_name", _POLICY_NAME.get(policy, "unknown"))
+                table.add_row("subs", str(subs))
+                table.add_row("last_event_id", str(last_event_id))
+                for key in _FANOUT_FIELDS:
+                    if key in data:
+                        table.add_row(key, str(data[key]))
+                print(table)
+    except LoginFailed:
+        print("login failed")
+        raise typer.Exit(code=1)
 
 
 @room_app.command("set-policy", help=t("HELP.ROOM.SETPOLICY"))
@@ -110,25 +120,19 @@ def room_set_policy(
     if pol not in allowed:
         print(f"[red]unknown policy[/red]: {policy}; expect one of {sorted(allowed)}")
         raise typer.Exit(code=2)
-    s = tcp_connect(host, port)
     try:
-        if not login(s, user, password):
-            print("login failed")
-            raise typer.Exit(code=1)
-        s.sendall(f"SETPOLICY|{room}|{pol}\n".encode())
-        resp = recv_line(s)
-        if resp.startswith("OK"):
-            print(resp if resp != "OK" else "OK|SETPOLICY")
-        else:
-            print(resp)
-            raise typer.Exit(code=1)
-    finally:
-        try:
-            s.sendall(b"QUIT\n")
-            _ = recv_line(s)
-            s.close()
-        except Exception:
-            pass
+        with _session(host, port, user, password) as sess:
+            s = sess.conn
+            s.sendall(f"SETPOLICY|{room}|{pol}\n".encode())
+            resp = recv_line(s)
+            if resp.startswith("OK"):
+                print(resp if resp != "OK" else "OK|SETPOLICY")
+            else:
+                print(resp)
+                raise typer.Exit(code=1)
+    except LoginFailed:
+        print("login failed")
+        raise typer.Exit(code=1)
 
 
 @room_app.command("transfer", help=t("HELP.ROOM.TRANSFER"))
@@ -140,6 +144,7 @@ def room_transfer(
     user: str = typer.Option("alice", "--user", "-u"),
     password: str = typer.Option("password", "--password", "-P"),
 ):
+    # 服务器在 TRANSFER 之后回复 OK|BYE 并关闭连接，因此不走会话池
     s = tcp_connect(host, port)
     try:
         if not login(s, user, password):
@@ -5,11 +5,21 @@ import signal
 import subprocess
 import time
 from pathlib import Path
+from typing import List, Optional
 import typer
 from rich import print
 
 from ..i18n import t
-from ..config import load_config
+from ..config import FSYNC_POLICIES, IO_MODES, SLOW_CONSUMER_POLICIES, load_config
+from ..segstore import (
+    DEFAULT_SEGMENT_BYTES,
+    SegmentError,
+    compact_room,
+    inspect_room,
+    migrate_room,
+    room_dirs,
+    verify_room,
+)
 from .utils import (
     ROOT,
     BIN_SERVER,
@@ -61,6 +71,21 @@ def server_up(
         raise typer.Exit(code=2)
     cfg = load_config(config)
     cfg.port, cfg.data_dir, cfg.strict, cfg.max_conn = port, data_dir, strict, max_conn
+    if cfg.fsync not in FSYNC_POLICIES:
+        print(
+            f"[red]invalid fsync policy {cfg.fsync!r}; expected one of {', '.join(FSYNC_POLICIES)}[/red]"
+        )
+        raise typer.Exit(code=2)
+    if cfg.io_mode not in IO_MODES:
+        print(
+            f"[red]invalid io mode {cfg.io_mode!r}; expected one of {', '.join(IO_MODES)}[/red]"
+        )
+        raise typer.Exit(code=2)
+    if cfg.slow_consumer not in SLOW_CONSUMER_POLICIES:
+        print(
+            f"[red]invalid slow consumer policy {cfg.slow_consumer!r}; expected one of {', '.join(SLOW_CONSUMER_POLICIES)}[/red]"
+        )
+        raise typer.Exit(code=2)
     env = env_with(
         DRLMS_PORT=cfg.port,
         DRLMS_DATA_DIR=str(cfg.data_dir),
@@ -69,7 +94,26 @@ def server_up(
         DRLMS_RATE_UP_BPS=cfg.rate_up_bps,
         DRLMS_RATE_DOWN_BPS=cfg.rate_down_bps,
         DRLMS_MAX_UPLOAD=cfg.max_upload,
+        DRLMS_FSYNC=cfg.fsync,
+        DRLMS_FSYNC_INTERVAL_MS=cfg.fsync_interval_ms,
+        DRLMS_IO_MODE=cfg.io_mode,
+        DRLMS_WORKERS=cfg.workers,
+        DRLMS_SLOW_CONSUMER=cfg.slow_consumer,
+        DRLMS_SUB_QUEUE_BYTES=cfg.sub_queue_bytes,
+        DRLMS_AUTH_CACHE_SIZE=cfg.auth_cache_size,
+        DRLMS_AUTH_CACHE_TTL=cfg.auth_cache_ttl,
+        DRLMS_SESSION_TTL=cfg.session_ttl,
+        DRLMS_UPGRADE_BATCH_MS=cfg.upgrade_batch_ms,
     )
+    if cfg.argon2_max_concurrent is not None:
+        env["DRLMS_ARGON2_MAX_CONCURRENT"] = str(cfg.argon2_max_concurrent)
+    for name, value in (
+        ("DRLMS_ARGON2_T_COST", cfg.argon2_t_cost),
+        ("DRLMS_ARGON2_M_COST", cfg.argon2_m_cost),
+        ("DRLMS_ARGON2_PARALLELISM", cfg.argon2_parallelism),
+    ):
+        if value is not None:
+            env[name] = str(value)
     cfg.data_dir.mkdir(exist_ok=True)
     with open(SERVER_LOG, "w") as lf:
         p = subprocess.Popen(
@@ -176,6 +220,162 @@ def server_logs(n: int = typer.Option(50, "-n")):
         print(line)
 
 
+store_app = typer.Typer(help="room event store: inspect/verify/compact/migrate")
+server_app.add_typer(store_app, name="store")
+
+
+def _store_rooms(data_dir: Path, room: Optional[str]) -> List[Path]:
+    try:
+        rooms = room_dirs(data_dir, room)
+    except ValueError as e:
+        print(f"[red]{e}[/red]")
+        raise typer.Exit(code=2)
+    missing = [r for r in rooms if not r.is_dir()]
+    if missing:
+        print(f"[red]room not found: {missing[0]}[/red]")
+        raise typer.Exit(code=2)
+    return rooms
+
+
+def _refuse_if_running(force: bool) -> None:
+    """Offline rewrites race with the server's appends: require it stopped."""
+    if force or not SERVER_PID.exists():
+        return
+    try:
+        os.kill(int(SERVER_PID.read_text().strip()), 0)
+    except PermissionError:
+        pass  # 进程存在但属于其他用户：仍视为运行中
+    except Exception:
+        return
+    print("[red]server is running; stop it first (server-down) or pass --force[/red]")
+    raise typer.Exit(code=2)
+
+
+@store_app.command("inspect", help=t("HELP.SERVER.STORE.INSPECT"))
+def store_inspect(
+    data_dir: Path = typer.Option(DATA_DIR, "--data-dir", "-d"),
+    room: Optional[str] = typer.Option(None, "--room", "-r", help="房间名；默认全部"),
+    json_out: bool = typer.Option(False, "--json", "-j", help="以 JSON 方式输出"),
+):
+    """Show per-segment event ranges and sizes."""
+    from rich.table import Table
+
+    out = []
+    for rd in _store_rooms(data_dir, room):
+        try:
+            out.append(inspect_room(rd))
+        except SegmentError as e:
+            print(f"[red]{rd.name}: {e}[/red]")
+            raise typer.Exit(code=1)
+    if json_out:
+        import json
+
+        data = [
+            {
+                "room": st.room,
+                "records": st.records,
+                "bytes": st.bytes,
+                "segments": [
+                    {
+                        "name": seg.path.name,
+                        "legacy": seg.legacy,
+                        "first_event_id": seg.first_event_id,
+                        "last_event_id": seg.last_event_id,
+                        "records": seg.records,
+                        "texts": seg.texts,
+                        "files": seg.files,
+                        "bytes": seg.bytes,
+                    }
+                    for seg in st.segments
+                ],
+            }
+            for st in out
+        ]
+        print(json.dumps(data, ensure_ascii=False))
+        return
+    for st in out:
+        table = Table(title=f"room {st.room}: {st.records} events, {st.bytes} bytes")
+        for col in ("segment", "events", "text", "file", "bytes"):
+            table.add_column(col)
+        for seg in st.segments:
+            name = seg.path.name + (" (legacy)" if seg.legacy else "")
+            span = f"{seg.first_event_id}-{seg.last_event_id}" if seg.records else "-"
+            table.add_row(name, span, str(seg.texts), str(seg.files), str(seg.bytes))
+        print(table)
+
+
+@store_app.command("verify", help=t("HELP.SERVER.STORE.VERIFY"))
+def store_verify(
+    data_dir: Path = typer.Option(DATA_DIR, "--data-dir", "-d"),
+    room: Optional[str] = typer.Option(None, "--room", "-r", help="房间名；默认全部"),
+):
+    """Check headers, ordering, checksums, payloads and indexes."""
+    bad = 0
+    for rd in _store_rooms(data_dir, room):
+        problems = verify_room(rd)
+        bad += len(problems)
+        for msg in problems:
+            print(f"[red]{rd.name}: {msg}[/red]")
+        if not problems:
+            print(f"[green]{rd.name}: ok[/green]")
+    if bad:
+        raise typer.Exit(code=1)
+
+
+@store_app.command("compact", help=t("HELP.SERVER.STORE.COMPACT"))
+def store_compact(
+    data_dir: Path = typer.Option(DATA_DIR, "--data-dir", "-d"),
+    room: Optional[str] = typer.Option(None, "--room", "-r", help="房间名；默认全部"),
+    segment_bytes: int = typer.Option(
+        DEFAULT_SEGMENT_BYTES, "--segment-bytes", "-s", help="段大小上限"
+    ),
+    retain_bytes: int = typer.Option(
+        0, "--retain-bytes", "-b", help="只保留最新的这么多字节（0=不限）"
+    ),
+    retain_secs: int = typer.Option(
+        0, "--retain-secs", "-t", help="丢弃早于这么多秒之前的事件（0=不限）"
+    ),
+    force: bool = typer.Option(False, "--force", "-f", help="服务器运行中也执行"),
+):
+    """Merge segments, apply retention and rebuild indexes (server stopped)."""
+    _refuse_if_running(force)
+    for rd in _store_rooms(data_dir, room):
+        try:
+            kept, dropped = compact_room(
+                rd,
+                segment_bytes=segment_bytes,
+                retain_bytes=retain_bytes,
+                retain_secs=retain_secs,
+            )
+        except SegmentError as e:
+            print(f"[red]{rd.name}: {e}[/red]")
+            raise typer.Exit(code=1)
+        print(f"[green]{rd.name}: kept {kept}, dropped {dropped}[/green]")
+
+
+@store_app.command("migrate", help=t("HELP.SERVER.STORE.MIGRATE"))
+def store_migrate(
+    data_dir: Path = typer.Option(DATA_DIR, "--data-dir", "-d"),
+    room: Optional[str] = typer.Option(None, "--room", "-r", help="房间名；默认全部"),
+    segment_bytes: int = typer.Option(
+        DEFAULT_SEGMENT_BYTES, "--segment-bytes", "-s", help="段大小上限"
+    ),
+    force: bool = typer.Option(False, "--force", "-f", help="服务器运行中也执行"),
+):
+    """Convert legacy events.log + texts/ rooms into segments (server stopped)."""
+    _refuse_if_running(force)
+    for rd in _store_rooms(data_dir, room):
+        try:
+            n = migrate_room(rd, segment_bytes=segment_bytes)
+        except SegmentError as e:
+            print(f"[red]{rd.name}: {e}[/red]")
+            raise typer.Exit(code=1)
+        if n:
+            print(f"[green]{rd.name}: migrated {n} events[/green]")
+        else:
+            print(f"{rd.name}: nothing to migrate")
+
+
 def register_top_level_aliases(app: typer.Typer) -> None:
     """Register backward-compatible top-level aliases: server-up/down/status/logs."""
     app.command("server-up")(server_up)
@@ -190,5 +390,6 @@ __all__ = [
     "server_down",
     "server_status",
     "server_logs",
+    "store_app",
     "register_top_level_aliases",
 ]
@@ -1,15 +1,34 @@
 from __future__ import annotations
 
+import asyncio
+import glob
 import hashlib
+import re
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Union
 
 import typer
+from rich.console import Console
+from rich.markup import escape
+from typing_extensions import Annotated
 from rich import print
 from rich.progress import Progress, BarColumn, TimeRemainingColumn, TransferSpeedColumn
 from rich.table import Table  # noqa: F401 (used in room table rendering references)
 
-from ..state import load_state, save_state, get_last_event_id, set_last_event_id
+from .. import aio
+from ..fetcher import FileFetcher
+from ..journal import DEFAULT_FSYNC_INTERVAL, DEFAULT_MAX_BYTES, EventJournal
+from ..protocol import Event, ProtocolError, parse_event_header
+from ..session import LoginFailed, get_pool
+from ..transfer import file_sha256, publish_file, retrying
+from ..state import (
+    CursorStore,
+    load_state,
+    save_state,
+    get_last_event_id,
+    set_last_event_id,
+)
 from .utils import (
     tcp_connect,
     recv_line,
@@ -22,9 +41,281 @@ from ..i18n import t
 space_app = typer.Typer(help="shared rooms: subscribe/publish/history")
 
 
+def _session(host: str, port: int, user: str, password: str):
+    """Borrow a logged-in connection from the process-wide session pool."""
+    return get_pool().session(
+        host, port, user, password, connect=tcp_connect, login=login
+    )
+
+
+_ROOM_NAME_RE = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def _read_room_names(path: Path) -> List[str]:
+    names: List[str] = []
+    for raw in path.read_text(errors="ignore").splitlines():
+        name = raw.split("#", 1)[0].strip()
+        if name:
+            names.append(name)
+    return names
+
+
+def _resolve_rooms(
+    room: Union[str, Iterable[str], None], rooms_file: Optional[str]
+) -> List[str]:
+    """Merge ``--room`` values and ``--rooms-file`` into a de-duplicated list.
+
+    Args:
+        room: 单个房间名或房间名列表（``--room`` 可重复）
+        rooms_file: 房间清单文件路径或 glob；每行一个房间名，``#`` 之后为注释
+
+    Returns:
+        List[str]: 按首次出现顺序去重后的房间名
+
+    Raises:
+        ValueError: 清单文件不存在或房间名不合法
+    """
+
+    names: List[str] = []
+    if isinstance(room, str):
+        names.append(room)
+    elif room:
+        names.extend(room)
+    if rooms_file:
+        if glob.has_magic(rooms_file):
+            paths = [Path(p) for p in sorted(glob.glob(rooms_file))]
+            if not paths:
+                raise ValueError(f"no rooms file matches: {rooms_file}")
+        else:
+            paths = [Path(rooms_file)]
+        for p in paths:
+            if not p.is_file():
+                raise ValueError(f"rooms file not found: {p}")
+            names.extend(_read_room_names(p))
+    seen = set()
+    rooms: List[str] = []
+    for name in names:
+        name = name.strip()
+        if not name or name in seen:
+            continue
+        if not _ROOM_NAME_RE.match(name):
+            raise ValueError(f"invalid room name: {name!r}")
+        seen.add(name)
+        rooms.append(name)
+    return rooms
+
+
+def _open_journal(
+    save_dir: Optional[Path], max_mb: int, fsync_interval: float
+) -> Optional[EventJournal]:
+    if save_dir is None:
+        return None
+    return EventJournal(
+        save_dir,
+        max_bytes=int(max_mb) * 1024 * 1024,
+        fsync_interval=fsync_interval,
+    )
+
+
+def _open_fetcher(
+    save_dir: Optional[Path],
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    workers: int,
+) -> Optional[FileFetcher]:
+    if save_dir is None or workers <= 0:
+        return None
+
+    def report(ev: Event, _path: Optional[Path], err: Optional[BaseException]):
+        if err is not None:
+            _err_console.print(
+                escape(f"fetch failed: {ev.room}/{ev.event_id} {ev.filename}: {err}")
+            )
+
+    return FileFetcher(
+        host,
+        port,
+        user,
+        password,
+        save_dir / "files",
+        workers=workers,
+        connect=tcp_connect,
+        login=login,
+        on_done=report,
+    )
+
+
+def _close_fetcher(fetcher: Optional[FileFetcher]) -> None:
+    if fetcher is None:
+        return
+    if fetcher.pending:
+        _err_console.print(f"waiting for {fetcher.pending} pending file downloads")
+    fetcher.close()
+
+
+# 合并事件流面向管道消费：不做自动折行，也不解析 markup/高亮
+_stream_console = Console(soft_wrap=True, highlight=False)
+_err_console = Console(stderr=True, soft_wrap=True, highlight=False)
+
+
+def _print_tagged(ev: Event, json_out: bool) -> None:
+    """Print one event of a merged multi-room stream."""
+
+    out = _stream_console.print
+    if json_out:
+        out(escape(ev.header))
+        if ev.kind == "TEXT":
+            txt = ev.text
+            out(escape(txt), end="" if txt.endswith("\n") else "\n")
+        return
+    body = ev.text if ev.kind == "TEXT" else ev.header
+    out(
+        escape(f"[{ev.room}] ") + escape(body),
+        end="" if body.endswith("\n") else "\n",
+    )
+
+
+async def _tail_rooms(
+    rooms: List[str],
+    cursors: Dict[str, int],
+    *,
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    store: CursorStore,
+    journal: Optional[EventJournal],
+    fetcher: Optional[FileFetcher],
+    json_out: bool,
+) -> None:
+    """One connection, SUB per room, until the server closes the stream."""
+
+    try:
+        client = await aio.connect(host, port, user, password)
+    except ProtocolError as e:
+        if e.code == "AUTH" or e.line.startswith("ERR|AUTH"):
+            raise LoginFailed(str(e)) from e
+        raise
+    try:
+        for r in rooms:
+            try:
+                await client.sub(r, cursors.get(r, 0))
+            except ProtocolError as e:
+                print(escape(e.line or str(e)))
+                raise typer.Exit(code=1)
+        async for ev in client.events():
+            _print_tagged(ev, json_out)
+            if journal is not None:
+                journal.append_event(ev)
+            if fetcher is not None and ev.kind == "FILE":
+                fetcher.submit(ev)
+            if ev.event_id > cursors.get(ev.room, 0) and ev.room in cursors:
+                cursors[ev.room] = ev.event_id
+                store.set(f"{host}:{port}:{ev.room}", ev.event_id)
+    finally:
+        await client.close()
+
+
+def _join_many(
+    rooms: List[str],
+    *,
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    since_id: int,
+    save_dir: Optional[Path],
+    json_out: bool,
+    reconnect: bool,
+    save_max_mb: int = DEFAULT_MAX_BYTES // (1024 * 1024),
+    save_fsync: float = DEFAULT_FSYNC_INTERVAL,
+    fetch_workers: int = 0,
+) -> None:
+    state = load_state()
+    cursors: Dict[str, int] = {}
+    for r in rooms:
+        if since_id == -1:
+            cursors[r] = get_last_event_id(state, f"{host}:{port}:{r}")
+        else:
+            cursors[r] = since_id
+    store = CursorStore(state)
+    journal = _open_journal(save_dir, save_max_mb, save_fsync)
+    fetcher = _open_fetcher(save_dir, host, port, user, password, fetch_workers)
+    try:
+        _tail_with_reconnect(
+            rooms,
+            cursors,
+            host=host,
+            port=port,
+            user=user,
+            password=password,
+            store=store,
+            journal=journal,
+            fetcher=fetcher,
+            json_out=json_out,
+            reconnect=reconnect,
+        )
+    finally:
+        _close_fetcher(fetcher)
+        if journal is not None:
+            journal.close()
+        store.close()
+
+
+def _tail_with_reconnect(
+    rooms: List[str],
+    cursors: Dict[str, int],
+    *,
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    store: CursorStore,
+    journal: Optional[EventJournal],
+    fetcher: Optional[FileFetcher],
+    json_out: bool,
+    reconnect: bool,
+) -> None:
+    backoff = 0.3
+    while True:
+        try:
+            asyncio.run(
+                _tail_rooms(
+                    rooms,
+                    cursors,
+                    host=host,
+                    port=port,
+                    user=user,
+                    password=password,
+                    store=store,
+                    journal=journal,
+                    fetcher=fetcher,
+                    json_out=json_out,
+                )
+            )
+            backoff = 0.3
+        except KeyboardInterrupt:
+            break
+        except LoginFailed:
+            print("login failed")
+            raise typer.Exit(code=1)
+        except (OSError, ConnectionError, ProtocolError, asyncio.TimeoutError):
+            if not reconnect:
+                raise
+        if not reconnect:
+            break
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 5.0)
+
+
 @space_app.command("join", help=t("HELP.SPACE.JOIN"))
 def space_join(
-    room: str = typer.Option(..., "--room", "-r"),
+    room: Annotated[
+        Optional[List[str]],
+        typer.Option("--room", "-r", help="room to join; repeat to follow many rooms"),
+    ] = None,
     host: str = typer.Option("127.0.0.1", "--host", "-H"),
     port: int = typer.Option(8080, "--port", "-p"),
     user: str = typer.Option("alice", "--user", "-u"),
@@ -45,122 +336,183 @@ def space_join(
         "-R",
         help="auto reconnect with backoff and resume from last id",
     ),
+    rooms_file: Annotated[
+        Optional[str],
+        typer.Option(
+            "--rooms-file",
+            "-F",
+            help="file (or glob of files) listing room names, one per line",
+        ),
+    ] = None,
+    save_max_mb: Annotated[
+        int,
+        typer.Option(
+            "--save-max-mb", help="rotate the --save-dir journal at this size (MiB)"
+        ),
+    ] = DEFAULT_MAX_BYTES // (1024 * 1024),
+    save_fsync: Annotated[
+        float,
+        typer.Option(
+            "--save-fsync", help="seconds between journal fsyncs (0 = every event)"
+        ),
+    ] = DEFAULT_FSYNC_INTERVAL,
+    fetch_workers: Annotated[
+        int,
+        typer.Option(
+            "--fetch-files",
+            help="download EVT|FILE payloads into --save-dir/files with N workers",
+        ),
+    ] = 0,
 ):
-    """Subscribe to a room and tail events, with optional resume and auto-save."""
+    """Subscribe to one or more rooms and tail events, with resume and auto-save.
+
+    单个房间走原有的阻塞式读取；多个房间时共用一条连接（asyncio 多路复用），
+    输出按到达顺序合并并带 ``[room]`` 前缀，每个房间的游标分别保存在 state 中。
+    """
+    try:
+        rooms = _resolve_rooms(room, rooms_file)
+    except ValueError as e:
+        print(f"[red]{e}[/red]")
+        raise typer.Exit(code=2)
+    if not rooms:
+        print("provide at least one --room or --rooms-file")
+        raise typer.Exit(code=2)
+    if fetch_workers > 0 and save_dir is None:
+        print("--fetch-files requires --save-dir")
+        raise typer.Exit(code=2)
+    if len(rooms) > 1:
+        _join_many(
+            rooms,
+            host=host,
+            port=port,
+            user=user,
+            password=password,
+            since_id=since_id,
+            save_dir=save_dir,
+            json_out=json_out,
+            reconnect=reconnect,
+            save_max_mb=save_max_mb,
+            save_fsync=save_fsync,
+            fetch_workers=fetch_workers,
+        )
+        return
+    room = rooms[0]
     state = load_state()
     room_key = f"{host}:{port}:{room}"
     if since_id == -1:
         since_id = get_last_event_id(state, room_key)
     backoff = 0.3
-    while True:
-        s = None
-        try:
-            s = tcp_connect(host, port)
-            if not login(s, user, password):
-                print("login failed")
-                raise typer.Exit(code=1)
-            if since_id > 0:
-                s.sendall(f"SUB|{room}|{since_id}\n".encode())
-            else:
-                s.sendall(f"SUB|{room}\n".encode())
-            resp = recv_line(s)
-            if resp.startswith("ERR|"):
-                print(resp)
-                s.close()
-                raise typer.Exit(code=1)
+    store = CursorStore(state)
+    journal = _open_journal(save_dir, save_max_mb, save_fsync)
+    fetcher = _open_fetcher(save_dir, host, port, user, password, fetch_workers)
+    try:
+        while True:
+            s = None
             try:
-                s.settimeout(None)
-            except Exception:
-                pass
-            while True:
-                line = recv_line(s)
-                if not line:
-                    break
-                if line.startswith("EVT|TEXT|"):
-                    parts = line.split("|")
-                    try:
-                        eid = int(parts[5])
-                        payload_len = int(parts[6])
-                    except Exception:
-                        if not json_out:
-                            print(line)
-                        else:
-                            print(line)
-                        continue
-                    payload = recv_exact(s, payload_len)
-                    if json_out:
-                        print(line)
+                s = tcp_connect(host, port)
+                if not login(s, user, password):
+                    print("login failed")
+                    raise typer.Exit(code=1)
+                if since_id > 0:
+                    s.sendall(f"SUB|{room}|{since_id}\n".encode())
+                else:
+                    s.sendall(f"SUB|{room}\n".encode())
+                resp = recv_line(s)
+                if resp.startswith("ERR|"):
+                    print(resp)
+                    s.close()
+                    raise typer.Exit(code=1)
+                try:
+                    s.settimeout(None)
+                except Exception:
+                    pass
+                while True:
+                    line = recv_line(s)
+                    if not line:
+                        break
+                    if line.startswith("EVT|TEXT|"):
+                        parts = line.split("|")
                         try:
-                            txt = payload.decode(errors="ignore")
-                            print(txt, end="" if txt.endswith("\n") else "\n")
+                            eid = int(parts[5])
+                            payload_len = int(parts[6])
                         except Exception:
-                            pass
-                    else:
+                            if not json_out:
+                                print(line)
+                            else:
+                                print(line)
+                            continue
+                        payload = recv_exact(s, payload_len)
+                        if json_out:
+                            print(line)
+                            try:
+                                txt = payload.decode(errors="ignore")
+                                print(txt, end="" if txt.endswith("\n") else "\n")
+                            except Exception:
+                                pass
+                        else:
+                            try:
+                                print(payload.decode(errors="ignore"), end="")
+                            except Exception:
+                                pass
+                        if journal is not None:
+                            journal.append(line, payload)
+                        if eid > since_id:
+                            since_id = eid
+                            store.set(room_key, eid)
+                    elif line.startswith("EVT|FILE|"):
+                        parts = line.split("|")
                         try:
-                            print(payload.decode(errors="ignore"), end="")
+                            eid = int(parts[5])
                         except Exception:
-                            pass
-                    if eid > since_id:
-                        since_id = eid
-                        set_last_event_id(state, room_key, eid)
-                        save_state(state)
-                elif line.startswith("EVT|FILE|"):
-                    parts = line.split("|")
-                    try:
-                        eid = int(parts[5])
-                    except Exception:
-                        eid = since_id
-                    if json_out:
-                        print(line)
+                            eid = since_id
+                        if json_out:
+                            print(line)
+                        else:
+                            print(line)
+                        if journal is not None and len(parts) >= 9:
+                            journal.append(line)
+                        if fetcher is not None:
+                            ev = parse_event_header(line)
+                            if ev is not None:
+                                fetcher.submit(ev)
+                        if eid > since_id:
+                            since_id = eid
+                            store.set(room_key, eid)
                     else:
                         print(line)
-                    if save_dir is not None and len(parts) >= 9:
-                        save_dir.mkdir(parents=True, exist_ok=True)
-                        logf = save_dir / "events.log"
-                        prev = ""
-                        if logf.exists():
-                            try:
-                                prev = logf.read_text(errors="ignore")
-                            except Exception:
-                                prev = ""
+                        if line.startswith("ERR|"):
+                            s.close()
+                            raise typer.Exit(code=1)
+            except KeyboardInterrupt:
+                break
+            except Exception:
+                if not reconnect:
+                    raise
+                try:
+                    import time as _t
+
+                    _t.sleep(backoff)
+                except Exception:
+                    pass
+                backoff = min(backoff * 2, 5.0)
+                continue
+            finally:
+                try:
+                    if s is not None:
                         try:
-                            logf.write_text(prev + line + "\n")
+                            s.sendall(b"QUIT\n")
                         except Exception:
                             pass
-                    if eid > since_id:
-                        since_id = eid
-                        set_last_event_id(state, room_key, eid)
-                        save_state(state)
-                else:
-                    print(line)
-                    if line.startswith("ERR|"):
                         s.close()
-                        raise typer.Exit(code=1)
-        except KeyboardInterrupt:
-            break
-        except Exception:
+                except Exception:
+                    pass
             if not reconnect:
-                raise
-            try:
-                import time as _t
-
-                _t.sleep(backoff)
-            except Exception:
-                pass
-            backoff = min(backoff * 2, 5.0)
-            continue
-        finally:
-            try:
-                if s is not None:
-                    try:
-                        s.sendall(b"QUIT\n")
-                    except Exception:
-                        pass
-                    s.close()
-            except Exception:
-                pass
-        if not reconnect:
-            break
+                break
+    finally:
+        _close_fetcher(fetcher)
+        if journal is not None:
+            journal.close()
+        store.close()
 
 
 @space_app.command("leave", help=t("HELP.SPACE.LEAVE"))
@@ -171,20 +523,19 @@ def space_leave(
     user: str = typer.Option("alice", "--user", "-u"),
     password: str = typer.Option("password", "--password", "-P"),
 ):
-    s = tcp_connect(host, port)
-    if not login(s, user, password):
+    try:
+        with _session(host, port, user, password) as sess:
+            s = sess.conn
+            s.sendall(f"UNSUB|{room}\n".encode())
+            resp = recv_line(s)
+            print(resp)
+            if resp.startswith("ERR|"):
+                raise typer.Exit(code=1)
+            if resp.startswith("OK"):
+                print(f"[green]Left room '{room}'.[/green]")
+    except LoginFailed:
         print("login failed")
         raise typer.Exit(code=1)
-    s.sendall(f"UNSUB|{room}\n".encode())
-    resp = recv_line(s)
-    print(resp)
-    if resp.startswith("ERR|"):
-        s.close()
-        raise typer.Exit(code=1)
-    if resp.startswith("OK"):
-        print(f"[green]Left room '{room}'.[/green]")
-    s.sendall(b"QUIT\n")
-    s.close()
 
 
 @space_app.command("history", help=t("HELP.SPACE.HISTORY"))
@@ -351,42 +702,69 @@ def space_send(
     port: int = typer.Option(8080, "--port", "-p"),
     user: str = typer.Option("alice", "--user", "-u"),
     password: str = typer.Option("password", "--password", "-P"),
+    retries: int = typer.Option(
+        3, "--retries", help="reconnect and resume a file upload this many times"
+    ),
 ):
     if (text is None) == (file is None):
         print("provide exactly one of --text or --file")
         raise typer.Exit(code=2)
-    s = tcp_connect(host, port)
-    if not login(s, user, password):
-        print("login failed")
-        raise typer.Exit(code=1)
-    if text is not None:
-        data = text.encode()
-        sha = hashlib.sha256(data).hexdigest()
-        s.sendall(f"PUBT|{room}|{len(data)}|{sha}\n".encode())
-        _ = recv_line(s)
-        s.sendall(data)
-        resp = recv_line(s)
-        print(resp)
-        if resp.startswith("OK|PUBT|"):
-            eid = int(resp.split("|")[-1])
+    try:
+        if text is not None:
+            with _session(host, port, user, password) as sess:
+                s = sess.conn
+                data = text.encode()
+                sha = hashlib.sha256(data).hexdigest()
+                s.sendall(f"PUBT|{room}|{len(data)}|{sha}\n".encode())
+                ready = recv_line(s)
+                if ready != "READY":
+                    print(ready)
+                    raise typer.Exit(code=1)
+                s.sendall(data)
+                resp = recv_line(s)
+                print(resp)
+                if resp.startswith("OK|PUBT|"):
+                    eid = int(resp.split("|")[-1])
+                    state = load_state()
+                    key = f"{host}:{port}:{room}"
+                    set_last_event_id(state, key, eid)
+                    save_state(state)
+        else:
+            eid = _publish_file_resumable(
+                host, port, user, password, room, file, retries
+            )
+            print(f"OK|PUBF|{eid}")
             state = load_state()
-            key = f"{host}:{port}:{room}"
-            set_last_event_id(state, key, eid)
+            set_last_event_id(state, f"{host}:{port}:{room}", eid)
             save_state(state)
-    else:
-        p = file
-        size = p.stat().st_size
-        h = hashlib.sha256()
-        with p.open("rb") as f:
-            while True:
-                buf = f.read(1024 * 1024)
-                if not buf:
-                    break
-                h.update(buf)
-        sha = h.hexdigest()
-        s.sendall(f"PUBF|{room}|{p.name}|{size}|{sha}\n".encode())
-        _ = recv_line(s)
-        sent = 0
+    except LoginFailed:
+        print("login failed")
+        raise typer.Exit(code=1)
+
+
+def _publish_file_resumable(
+    host: str,
+    port: int,
+    user: str,
+    password: str,
+    room: str,
+    path: Path,
+    retries: int,
+) -> int:
+    """PUBF with OFFSET-based resume; each retry reconnects through the pool."""
+
+    if not path.is_file():
+        print(f"no such file: {escape(str(path))}")
+        raise typer.Exit(code=1)
+    digest = file_sha256(path)
+
+    def _note(n: int, err: BaseException, delay: float) -> None:
+        _err_console.print(
+            f"upload interrupted ({err}); resuming in {delay:.0f}s (retry {n})",
+            markup=False,
+        )
+
+    try:
         with Progress(
             "[progress.description]{task.description}",
             BarColumn(),
@@ -394,23 +772,26 @@ def space_send(
             TransferSpeedColumn(),
             TimeRemainingColumn(),
         ) as progress:
-            task = progress.add_task("uploading", total=size)
-            with p.open("rb") as f:
-                while True:
-                    buf = f.read(1024 * 64)
-                    if not buf:
-                        break
-                    s.sendall(buf)
-                    sent += len(buf)
-                    progress.update(task, completed=sent)
-        resp = recv_line(s)
-        print(resp)
-        if resp.startswith("OK|PUBF|"):
-            eid = int(resp.split("|")[-1])
-            state = load_state()
-            key = f"{host}:{port}:{room}"
-            set_last_event_id(state, key, eid)
-            save_state(state)
+            task = progress.add_task("uploading", total=digest[0])
+
+            def _attempt() -> int:
+                with _session(host, port, user, password) as sess:
+                    return publish_file(
+                        sess.conn,
+                        room,
+                        path,
+                        digest=digest,
+                        resume=True,
+                        progress=lambda n: progress.update(task, completed=n),
+                    )
+
+            return retrying(_attempt, retries=retries, on_retry=_note)
+    except ProtocolError as e:
+        print(escape(e.line or str(e)))
+        raise typer.Exit(code=1)
+    except OSError as e:
+        print(escape(f"upload failed: {e}"))
+        raise typer.Exit(code=1)
 
 
 @space_app.command("chat", help=t("HELP.SPACE.CHAT"))
@@ -431,6 +812,7 @@ def space_chat(
     if since_id == -1:
         since_id = get_last_event_id(state, key)
     stop = threading.Event()
+    store = CursorStore(state)
 
     def recv_loop():
         nonlocal since_id
@@ -468,8 +850,7 @@ def space_chat(
                         pass
                     if eid > since_id:
                         since_id = eid
-                        set_last_event_id(state, key, eid)
-                        save_state(state)
+                        store.set(key, eid)
                 elif line.startswith("EVT|FILE|"):
                     print(line)
                 else:
@@ -492,18 +873,18 @@ def space_chat(
                 break
             data = data.rstrip("\n") + "\n"
             try:
-                sc = tcp_connect(host, port)
-                if not login(sc, user, password):
-                    sc.close()
-                    continue
-                blob = data.encode()
-                sha = hashlib.sha256(blob).hexdigest()
-                sc.sendall(f"PUBT|{room}|{len(blob)}|{sha}\n".encode())
-                _ = recv_line(sc)
-                sc.sendall(blob)
-                _ = recv_line(sc)
-                sc.sendall(b"QUIT\n")
-                sc.close()
+                # 同一会话跨行复用：只在首行（或连接失效后）登录一次
+                with _session(host, port, user, password) as sess:
+                    sc = sess.conn
+                    blob = data.encode()
+                    sha = hashlib.sha256(blob).hexdigest()
+                    sc.sendall(f"PUBT|{room}|{len(blob)}|{sha}\n".encode())
+                    ready = recv_line(sc)
+                    if ready != "READY":
+                        print(ready)
+                        continue
+                    sc.sendall(blob)
+                    _ = recv_line(sc)
             except Exception:
                 continue
 
@@ -518,7 +899,7 @@ def space_chat(
     except KeyboardInterrupt:
         pass
     stop.set()
-    pass
+    store.close()
 
 
 # room sub-app registered under space
@@ -1,29 +1,60 @@
 from __future__ import annotations
 
 import json
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional
 
 import typer
 from rich import print
 from rich.table import Table
 
+from ..config import load_config, update_config
+from ..hashbench import (
+    DEFAULT_M_MIB,
+    DEFAULT_MEM_BUDGET_MB,
+    DEFAULT_T_COSTS,
+    DEFAULT_TARGET_MS,
+    M_COST_KIB_RANGE,
+    PARALLELISM_RANGE,
+    T_COST_RANGE,
+    HashBenchResult,
+    default_workers,
+    recommend,
+    run_grid,
+)
 from ..i18n import t
 from ..users import (
+    DEFAULT_IMPORT_MEM_MB,
+    UserStore,
     users_file_path,
     validate_username,
-    parse_users,
     read_auth_params_from_env,
     generate_argon2id_hash,
-    write_users_atomic,
-    add_user as _add_user_record,
-    set_password as _set_password_record,
-    del_user as _del_user_record,
+    read_import_file,
+    import_workers,
+    hash_passwords,
+    migration_report,
+    verify_legacy,
 )
 from .utils import resolve_data_dir
 
 
-user_app = typer.Typer(help="user management (add/passwd/del/list)")
+def _auth_params(config: Optional[Path]) -> Dict[str, int]:
+    """Argon2 parameters: DRLMS_ARGON2_* env, then drlms.yaml, then defaults."""
+    params = read_auth_params_from_env()
+    cfg = load_config(config)
+    for key, value in (
+        ("time_cost", cfg.argon2_t_cost),
+        ("memory_cost", cfg.argon2_m_cost),
+        ("parallelism", cfg.argon2_parallelism),
+    ):
+        if value is not None:
+            params[key] = value
+    return params
+
+
+user_app = typer.Typer(help="user management (add/passwd/del/list/import/migrate)")
 
 
 @user_app.command("add", help=t("HELP.USER.ADD"))
@@ -47,8 +78,7 @@ def user_add(
         print(f"[red]{e}[/red]")
         raise typer.Exit(code=2)
     dd = resolve_data_dir(data_dir, config)
-    upath = users_file_path(dd)
-    records = parse_users(upath)
+    store = UserStore(users_file_path(dd))
     if password_from_stdin:
         try:
             import sys
@@ -67,7 +97,7 @@ def user_add(
         if pwd1 != pwd2:
             print("[red]passwords do not match[/red]")
             raise typer.Exit(code=2)
-    params = read_auth_params_from_env()
+    params = _auth_params(config)
     encoded = generate_argon2id_hash(
         pwd1,
         time_cost=params["time_cost"],
@@ -76,12 +106,12 @@ def user_add(
         hash_len=params["hash_len"],
         salt_len=params["salt_len"],
     )
+    store.refresh()
     try:
-        new_records = _add_user_record(records, username, encoded)
+        store.add(username, encoded)
     except KeyError:
         print(f"[red]user exists[/red]: {username}")
         raise typer.Exit(code=1)
-    write_users_atomic(upath, new_records)
     print(f"[green]user added[/green]: {username}")
 
 
@@ -99,9 +129,8 @@ def user_passwd(
 ):
     """Change password for existing user (Argon2id, interactive)."""
     dd = resolve_data_dir(data_dir, config)
-    upath = users_file_path(dd)
-    records = parse_users(upath)
-    if not any(u == username for u, _k, _e in records):
+    store = UserStore(users_file_path(dd))
+    if username not in store:
         print(f"[red]User '{username}' does not exist. Use 'user add' to create.[/red]")
         raise typer.Exit(code=1)
     if password_from_stdin:
@@ -122,7 +151,7 @@ def user_passwd(
         if pwd1 != pwd2:
             print("[red]passwords do not match[/red]")
             raise typer.Exit(code=2)
-    params = read_auth_params_from_env()
+    params = _auth_params(config)
     encoded = generate_argon2id_hash(
         pwd1,
         time_cost=params["time_cost"],
@@ -131,12 +160,12 @@ def user_passwd(
         hash_len=params["hash_len"],
         salt_len=params["salt_len"],
     )
+    store.refresh()
     try:
-        new_records = _set_password_record(records, username, encoded)
+        store.set_password(username, encoded)
     except KeyError:
         print(f"[red]User '{username}' does not exist. Use 'user add' to create.[/red]")
         raise typer.Exit(code=1)
-    write_users_atomic(upath, new_records)
     print(f"[green]password updated[/green]: {username}")
 
 
@@ -149,9 +178,8 @@ def user_del(
 ):
     """Delete a user record."""
     dd = resolve_data_dir(data_dir, config)
-    upath = users_file_path(dd)
-    records = parse_users(upath)
-    exists = any(u == username for u, _k, _e in records)
+    store = UserStore(users_file_path(dd))
+    exists = username in store
     if not exists and not force:
         print(f"[red]user not found[/red]: {username}")
         raise typer.Exit(code=1)
@@ -159,17 +187,297 @@ def user_del(
         print(f"[yellow]user not found, ignored[/yellow]: {username}")
         raise typer.Exit(code=0)
     try:
-        new_records = _del_user_record(records, username)
+        store.delete(username)
     except KeyError:
         if force:
             print(f"[yellow]user not found, ignored[/yellow]: {username}")
             raise typer.Exit(code=0)
         print(f"[red]user not found[/red]: {username}")
         raise typer.Exit(code=1)
-    write_users_atomic(upath, new_records)
     print(f"[green]user deleted[/green]: {username}")
 
 
+@user_app.command("import", help=t("HELP.USER.IMPORT"))
+def user_import(
+    file: Path = typer.Argument(..., help="CSV or JSONL file with username/password"),
+    data_dir: Optional[Path] = typer.Option(None, "--data-dir", "-d"),
+    config: Optional[Path] = typer.Option(None, "--config", "-c"),
+    fmt: str = typer.Option("auto", "--format", help="auto|csv|jsonl"),
+    existing: str = typer.Option(
+        "error", "--existing", "-e", help="existing users: error|skip|update"
+    ),
+    jobs: Optional[int] = typer.Option(
+        None, "--jobs", help="hashing processes (default: CPU count)"
+    ),
+    mem_budget: int = typer.Option(
+        DEFAULT_IMPORT_MEM_MB,
+        "--mem-budget",
+        help="memory budget for hashing processes in MiB (each uses m_cost KiB)",
+    ),
+):
+    """Create or update many users from a file with one atomic write."""
+    if existing not in ("error", "skip", "update"):
+        print(f"[red]invalid --existing[/red]: {existing}")
+        raise typer.Exit(code=2)
+    try:
+        items = read_import_file(file, fmt)
+    except (OSError, ValueError) as e:
+        print(f"[red]cannot read {file}[/red]: {e}")
+        raise typer.Exit(code=2)
+    seen = set()
+    for username, pwd in items:
+        try:
+            validate_username(username)
+        except ValueError as e:
+            print(f"[red]{e}[/red]: {username!r}")
+            raise typer.Exit(code=2)
+        if username in seen:
+            print(f"[red]duplicate user in input[/red]: {username}")
+            raise typer.Exit(code=2)
+        if pwd == "":
+            print(f"[red]empty password[/red]: {username}")
+            raise typer.Exit(code=2)
+        seen.add(username)
+    dd = resolve_data_dir(data_dir, config)
+    store = UserStore(users_file_path(dd))
+    clash = [u for u, _p in items if u in store]
+    if clash and existing == "error":
+        shown = ", ".join(clash[:5]) + (", ..." if len(clash) > 5 else "")
+        print(f"[red]user exists[/red]: {shown} ({len(clash)} total)")
+        raise typer.Exit(code=1)
+    if existing == "skip":
+        items = [(u, p) for u, p in items if u not in store]
+    # 先校验再哈希：冲突或格式错误不浪费 Argon2 计算
+    params = _auth_params(config)
+    workers = import_workers(params, jobs, mem_budget)
+    t0 = time.monotonic()
+    encoded = hash_passwords([p for _u, p in items], params, workers)
+    elapsed = time.monotonic() - t0
+    # 哈希期间文件可能被其他进程修改：重新读取后在一个批次内合并、一次写回
+    store.refresh()
+    try:
+        added, updated, _ = store.import_encoded(
+            zip([u for u, _p in items], encoded), existing
+        )
+    except KeyError as e:
+        print(f"[red]{e.args[0]}[/red]")
+        raise typer.Exit(code=1)
+    skipped = len(clash) if existing == "skip" else 0
+    rate = len(items) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"[green]imported[/green]: added={added} updated={updated} "
+        f"skipped={skipped} ({workers} workers, {rate:.1f} hashes/s)"
+    )
+
+
+@user_app.command("migrate", help=t("HELP.USER.MIGRATE"))
+def user_migrate(
+    data_dir: Optional[Path] = typer.Option(None, "--data-dir", "-d"),
+    config: Optional[Path] = typer.Option(None, "--config", "-c"),
+    json_out: bool = typer.Option(False, "--json", "-j", help="print JSON report"),
+    from_file: Optional[Path] = typer.Option(
+        None,
+        "--from",
+        help="CSV/JSONL of known passwords: convert matching legacy users now",
+    ),
+    fmt: str = typer.Option("auto", "--format", help="auto|csv|jsonl"),
+    jobs: Optional[int] = typer.Option(None, "--jobs", help="hashing processes"),
+    mem_budget: int = typer.Option(
+        DEFAULT_IMPORT_MEM_MB, "--mem-budget", help="hashing memory budget in MiB"
+    ),
+    check: bool = typer.Option(
+        False, "--check", help="exit 1 while legacy users remain"
+    ),
+):
+    """Report legacy SHA-256 users and optionally convert them to Argon2id."""
+    dd = resolve_data_dir(data_dir, config)
+    store = UserStore(users_file_path(dd))
+    params = _auth_params(config)
+    converted = mismatched = 0
+    if from_file is not None:
+        try:
+            items = read_import_file(from_file, fmt)
+        except (OSError, ValueError) as e:
+            print(f"[red]cannot read {from_file}[/red]: {e}")
+            raise typer.Exit(code=2)
+        # 只处理仍是旧格式、且口令与旧哈希一致的用户；先校验再哈希
+        todo = []
+        for username, pwd in items:
+            rec = store.get(username)
+            if rec is None or rec[1] != "legacy":
+                continue
+            if verify_legacy(pwd, rec[2]):
+                todo.append((username, pwd, rec))
+            else:
+                mismatched += 1
+                print(f"[yellow]password does not match[/yellow]: {username}")
+        workers = import_workers(params, jobs, mem_budget)
+        encoded = hash_passwords([p for _u, p, _r in todo], params, workers)
+        store.refresh()
+        with store.batch():
+            for (username, _p, rec), enc in zip(todo, encoded):
+                # 哈希期间可能已被服务器升级或被改密：仅替换未变化的记录
+                if store.get(username) == rec:
+                    store.set_password(username, enc)
+                    converted += 1
+    report = migration_report(store.records(), params)
+    if from_file is not None:
+        report.update(converted=converted, mismatched=mismatched)
+    if json_out:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        table = Table(title="users.txt migration")
+        table.add_column("item")
+        table.add_column("count", justify="right")
+        for key in ("total", "argon2", "legacy", "unknown", "outdated"):
+            table.add_row(key, str(report[key]))
+        if from_file is not None:
+            table.add_row("converted", str(converted))
+            table.add_row("mismatched", str(mismatched))
+        print(table)
+        if report["legacy_users"]:
+            names = report["legacy_users"]
+            more = f" (+{len(names) - 20} more)" if len(names) > 20 else ""
+            print(f"legacy: {', '.join(names[:20])}{more}")
+            print(
+                "[dim]legacy users are upgraded by the server on their next "
+                "successful LOGIN[/dim]"
+            )
+        if report["duplicates"]:
+            print(
+                f"[yellow]duplicate entries[/yellow]: {', '.join(report['duplicates'])}"
+            )
+    if check and report["legacy"]:
+        raise typer.Exit(code=1)
+    if mismatched:
+        raise typer.Exit(code=1)
+
+
+@user_app.command("bench-hash", help=t("HELP.USER.BENCH_HASH"))
+def user_bench_hash(
+    t_costs: List[int] = typer.Option(
+        list(DEFAULT_T_COSTS), "--t-cost", "-t", help="t_cost values (repeatable)"
+    ),
+    m_mib: List[int] = typer.Option(
+        list(DEFAULT_M_MIB), "--m-mib", "-m", help="m_cost values in MiB (repeatable)"
+    ),
+    parallelism: List[int] = typer.Option(
+        [1], "--parallelism", "-p", help="parallelism values (repeatable)"
+    ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-w",
+        help="concurrent hashes, i.e. server argon2_max_concurrent (default: config or CPU count)",
+    ),
+    count: int = typer.Option(3, "--count", "-n", help="hashes per worker"),
+    target_ms: float = typer.Option(
+        DEFAULT_TARGET_MS, "--target-ms", help="max p99 login hash latency"
+    ),
+    mem_budget: int = typer.Option(
+        DEFAULT_MEM_BUDGET_MB,
+        "--mem-budget",
+        help="memory for concurrent hashes in MiB (workers x m_cost)",
+    ),
+    config: Optional[Path] = typer.Option(None, "--config", "-c"),
+    write: bool = typer.Option(
+        False, "--write", help="write the recommendation into drlms.yaml"
+    ),
+    json_out: bool = typer.Option(False, "--json", "-j", help="print JSON"),
+):
+    """Calibrate Argon2id parameters on this machine."""
+    m_costs = [m * 1024 for m in m_mib]
+    for name, values, (lo, hi) in (
+        ("t_cost", t_costs, T_COST_RANGE),
+        ("m_cost", m_costs, M_COST_KIB_RANGE),
+        ("parallelism", parallelism, PARALLELISM_RANGE),
+    ):
+        bad = [v for v in values if not lo <= v <= hi]
+        if bad:
+            print(f"[red]{name} out of server range {lo}..{hi}[/red]: {bad}")
+            raise typer.Exit(code=2)
+    cfg = load_config(config)
+    if workers is None:
+        workers = cfg.argon2_max_concurrent or default_workers()
+    workers = max(1, workers)
+
+    def progress(r: HashBenchResult) -> None:
+        if not json_out:
+            state = r.skipped or f"p99 {r.p99_ms:.0f} ms"
+            print(
+                f"[dim]t={r.time_cost} m={r.memory_cost // 1024}MiB "
+                f"p={r.parallelism}: {state}[/dim]"
+            )
+
+    results = run_grid(
+        t_costs,
+        m_costs,
+        parallelism,
+        workers,
+        count,
+        target_ms,
+        mem_budget,
+        on_result=progress,
+    )
+    best = recommend(results, target_ms, mem_budget)
+    if json_out:
+        print(
+            json.dumps(
+                {
+                    "workers": workers,
+                    "target_ms": target_ms,
+                    "mem_budget_mb": mem_budget,
+                    "results": [r.__dict__ for r in results],
+                    "recommended": best.params() if best else None,
+                },
+                ensure_ascii=False,
+            )
+        )
+    else:
+        table = Table(title=f"argon2id with {workers} concurrent hashes")
+        for col in ("t", "m MiB", "p", "p50 ms", "p99 ms", "hashes/s", "peak MiB"):
+            table.add_column(col, justify="right")
+        for r in results:
+            if r.skipped:
+                continue
+            mark = "*" if r is best else ""
+            table.add_row(
+                f"{mark}{r.time_cost}",
+                str(r.memory_cost // 1024),
+                str(r.parallelism),
+                f"{r.p50_ms:.1f}",
+                f"{r.p99_ms:.1f}",
+                f"{r.hashes_per_sec:.1f}",
+                f"{r.peak_mb:.0f}",
+            )
+        print(table)
+    if best is None:
+        print(
+            f"[red]no parameters meet p99 <= {target_ms:g} ms within "
+            f"{mem_budget} MiB; lower --workers or try smaller values[/red]"
+        )
+        raise typer.Exit(code=1)
+    if not json_out:
+        print(
+            f"[green]recommended[/green]: t_cost={best.time_cost} "
+            f"m_cost={best.memory_cost} ({best.memory_cost // 1024} MiB) "
+            f"parallelism={best.parallelism}, argon2_max_concurrent={workers}"
+        )
+    if write:
+        path = config or Path("drlms.yaml")
+        update_config(
+            path,
+            {
+                "argon2_t_cost": best.time_cost,
+                "argon2_m_cost": best.memory_cost,
+                "argon2_parallelism": best.parallelism,
+                "argon2_max_concurrent": workers,
+            },
+        )
+        if not json_out:
+            print(f"[green]wrote[/green] argon2 parameters to {path}")
+
+
 @user_app.command("list", help=t("HELP.USER.LIST"))
 def user_list(
     data_dir: Optional[Path] = typer.Option(None, "--data-dir", "-d"),
@@ -178,8 +486,7 @@ def user_list(
 ):
     """List users (format only; no hashes)."""
     dd = resolve_data_dir(data_dir, config)
-    upath = users_file_path(dd)
-    records = parse_users(upath)
+    records = UserStore(users_file_path(dd)).records()
     items = [{"username": u, "format": k} for (u, k, _e) in records]
     if json_out:
         print(json.dumps(items, ensure_ascii=False))
@@ -192,4 +499,13 @@ def user_list(
     print(table)
 
 
-__all__ = ["user_app", "user_add", "user_passwd", "user_del", "user_list"]
+__all__ = [
+    "user_app",
+    "user_add",
+    "user_passwd",
+    "user_del",
+    "user_import",
+    "user_migrate",
+    "user_bench_hash",
+    "user_list",
+]
@@ -11,6 +11,8 @@ from rich import print  # noqa: F401
 
 from .._version import __version__
 from ..config import load_config
+from ..protocol import BufferedConnection, decode_line, open_connection
+from ..session import resume_or_login
 from ..update_check import maybe_notify_new_version
 
 
@@ -100,14 +102,15 @@ def is_listening(port: int, host: str = "127.0.0.1") -> bool:
             return False
 
 
-def tcp_connect(host: str, port: int, timeout: float = 5.0):
-    s = _socket.socket(_socket.AF_INET, _socket.SOCK_STREAM)
-    s.settimeout(timeout)
-    s.connect((host, port))
-    return s
+def tcp_connect(host: str, port: int, timeout: float = 5.0) -> BufferedConnection:
+    return open_connection(host, port, timeout)
 
 
-def recv_line(sock: _socket.socket) -> str:
+def recv_line(sock) -> str:
+    readline = getattr(sock, "readline", None)
+    if readline is not None:
+        return decode_line(readline())
+    # 兼容未包装的裸 socket：无法安全预读，只能逐字节读取
     buf = bytearray()
     while True:
         ch = sock.recv(1)
@@ -115,16 +118,13 @@ def recv_line(sock: _socket.socket) -> str:
             break
         buf.extend(ch)
     # 修剪 CRLF 文件可能遗存的尾随回车符
-    try:
-        s = buf.decode(errors="ignore")
-        if s.endswith("\r"):
-            return s[:-1]
-        return s
-    except Exception:
-        return buf.decode(errors="ignore")
+    return decode_line(bytes(buf))
 
 
-def recv_exact(sock: _socket.socket, nbytes: int) -> bytes:
+def recv_exact(sock, nbytes: int) -> bytes:
+    readexactly = getattr(sock, "readexactly", None)
+    if readexactly is not None:
+        return readexactly(nbytes)
     view = bytearray()
     need = nbytes
     while need > 0:
@@ -136,10 +136,8 @@ def recv_exact(sock: _socket.socket, nbytes: int) -> bytes:
     return bytes(view)
 
 
-def login(sock: _socket.socket, user: str, password: str) -> bool:
-    sock.sendall(f"LOGIN|{user}|{password}\n".encode())
-    resp = recv_line(sock)
-    return resp.startswith("OK|") or resp == "OK"
+def login(sock, user: str, password: str) -> bool:
+    return resume_or_login(sock, user, password, recv=recv_line)
 
 
 def gather_metadata() -> str:
@@ -206,6 +204,7 @@ __all__ = [
     "env_with",
     "resolve_data_dir",
     "is_listening",
+    "BufferedConnection",
     "tcp_connect",
     "recv_line",
     "recv_exact",
@@ -4,7 +4,17 @@ from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, Any, Dict
 import os
-import yaml
+
+
+# 服务器房间段追加的落盘策略（DRLMS_FSYNC）：none 交给内核；interval 后台每
+# fsync_interval_ms 毫秒 fdatasync；batch 发布等待落盘，并发发布共享一次刷盘
+FSYNC_POLICIES = ("none", "interval", "batch")
+# 连接引擎（DRLMS_IO_MODE）：thread 每连接一线程；epoll 事件循环 + workers 个
+# 工作线程，适合大量长连接的空闲订阅者（此时 max_conn 可调到数万）
+IO_MODES = ("thread", "epoll")
+# 订阅者出站队列超过 sub_queue_bytes 时的处理（DRLMS_SLOW_CONSUMER）：drop-oldest
+# 丢最旧事件；disconnect 断开（可凭 since_id 重新订阅补齐）；block 发布者限时等待
+SLOW_CONSUMER_POLICIES = ("drop-oldest", "disconnect", "block")
 
 
 @dataclass
@@ -16,6 +26,26 @@ class CLIConfig:
     rate_up_bps: int = 0
     rate_down_bps: int = 0
     max_upload: int = 100 * 1024 * 1024
+    fsync: str = "interval"
+    fsync_interval_ms: int = 1000
+    io_mode: str = "thread"
+    workers: int = 8
+    slow_consumer: str = "disconnect"
+    sub_queue_bytes: int = 1024 * 1024
+    # LOGIN 校验缓存：> 0 时缓存成功校验 auth_cache_ttl 秒，免去重复的 Argon2id 计算
+    auth_cache_size: int = 0
+    auth_cache_ttl: int = 300
+    # 同时进行的 Argon2 计算数上限：None 交给服务器按 CPU 数决定，0 不限
+    argon2_max_concurrent: Optional[int] = None
+    # LOGIN 签发的会话令牌有效秒数，客户端凭令牌 RESUME 重连免去 Argon2（0 不签发）
+    session_ttl: int = 900
+    # 旧格式用户 Argon2 升级合并写回 users.txt 的间隔毫秒（0 为登录时立即写回）
+    upgrade_batch_ms: int = 1000
+    # Argon2id 参数（m_cost 单位 KiB）：None 交给服务器与 CLI 的默认值
+    # （t=2, m=65536, p=1）；`user bench-hash --write` 按本机标定结果写入
+    argon2_t_cost: Optional[int] = None
+    argon2_m_cost: Optional[int] = None
+    argon2_parallelism: Optional[int] = None
 
 
 def _from_env(cfg: CLIConfig) -> CLIConfig:
@@ -29,6 +59,15 @@ def _from_env(cfg: CLIConfig) -> CLIConfig:
             return default
 
     strict_env = os.environ.get("DRLMS_AUTH_STRICT")
+    fsync_env = os.environ.get("DRLMS_FSYNC")
+    io_env = os.environ.get("DRLMS_IO_MODE")
+    slow_env = os.environ.get("DRLMS_SLOW_CONSUMER")
+    argon2_env = os.environ.get("DRLMS_ARGON2_MAX_CONCURRENT")
+
+    def getenv_opt(name: str, default: Optional[int]) -> Optional[int]:
+        v = getenv_int(name, 0)
+        return v if v > 0 else default
+
     return CLIConfig(
         port=getenv_int("DRLMS_PORT", cfg.port),
         data_dir=Path(os.environ.get("DRLMS_DATA_DIR", str(cfg.data_dir))),
@@ -41,6 +80,28 @@ def _from_env(cfg: CLIConfig) -> CLIConfig:
         rate_up_bps=getenv_int("DRLMS_RATE_UP_BPS", cfg.rate_up_bps),
         rate_down_bps=getenv_int("DRLMS_RATE_DOWN_BPS", cfg.rate_down_bps),
         max_upload=getenv_int("DRLMS_MAX_UPLOAD", cfg.max_upload),
+        fsync=fsync_env if fsync_env in FSYNC_POLICIES else cfg.fsync,
+        fsync_interval_ms=getenv_int("DRLMS_FSYNC_INTERVAL_MS", cfg.fsync_interval_ms),
+        io_mode=io_env if io_env in IO_MODES else cfg.io_mode,
+        workers=getenv_int("DRLMS_WORKERS", cfg.workers),
+        slow_consumer=(
+            slow_env if slow_env in SLOW_CONSUMER_POLICIES else cfg.slow_consumer
+        ),
+        sub_queue_bytes=getenv_int("DRLMS_SUB_QUEUE_BYTES", cfg.sub_queue_bytes),
+        auth_cache_size=getenv_int("DRLMS_AUTH_CACHE_SIZE", cfg.auth_cache_size),
+        auth_cache_ttl=getenv_int("DRLMS_AUTH_CACHE_TTL", cfg.auth_cache_ttl),
+        argon2_max_concurrent=(
+            getenv_int("DRLMS_ARGON2_MAX_CONCURRENT", 0)
+            if argon2_env
+            else cfg.argon2_max_concurrent
+        ),
+        session_ttl=getenv_int("DRLMS_SESSION_TTL", cfg.session_ttl),
+        upgrade_batch_ms=getenv_int("DRLMS_UPGRADE_BATCH_MS", cfg.upgrade_batch_ms),
+        argon2_t_cost=getenv_opt("DRLMS_ARGON2_T_COST", cfg.argon2_t_cost),
+        argon2_m_cost=getenv_opt("DRLMS_ARGON2_M_COST", cfg.argon2_m_cost),
+        argon2_parallelism=getenv_opt(
+            "DRLMS_ARGON2_PARALLELISM", cfg.argon2_parallelism
+        ),
     )
 
 
@@ -63,6 +124,9 @@ def load_config(path: Optional[Path]) -> CLIConfig:
         if default.exists():
             path = default
     if path and Path(path).exists():
+        # yaml 只在确有配置文件时导入（无 drlms.yaml 的调用省去其导入开销）
+        import yaml
+
         with open(path, "r") as f:
             y = yaml.safe_load(f) or {}
         cfg = _merge(cfg, y)
@@ -70,7 +134,31 @@ def load_config(path: Optional[Path]) -> CLIConfig:
     return cfg
 
 
+def update_config(path: Path, values: Dict[str, Any]) -> None:
+    """Set keys in a drlms.yaml, keeping the others; creates it from the template.
+
+    Args:
+        path (Path): 配置文件路径
+        values (dict): 要写入的键值
+    """
+
+    import yaml
+
+    path = Path(path)
+    if not path.exists():
+        write_template(path)
+    with open(path, "r") as f:
+        data = yaml.safe_load(f) or {}
+    data.update(values)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        yaml.safe_dump(data, f, sort_keys=False)
+    os.replace(tmp, path)
+
+
 def write_template(path: Path) -> None:
+    import yaml
+
     tpl = {
         "port": 8080,
         "data_dir": "server_files",
@@ -79,6 +167,16 @@ def write_template(path: Path) -> None:
         "rate_up_bps": 0,
         "rate_down_bps": 0,
         "max_upload": 104857600,
+        "fsync": "interval",
+        "fsync_interval_ms": 1000,
+        "io_mode": "thread",
+        "workers": 8,
+        "slow_consumer": "disconnect",
+        "sub_queue_bytes": 1048576,
+        "auth_cache_size": 0,
+        "auth_cache_ttl": 300,
+        "session_ttl": 900,
+        "upgrade_batch_ms": 1000,
     }
     path.parent.mkdir(parents=True, exist_ok=True)
     with open(path, "w") as f:
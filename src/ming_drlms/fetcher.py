@@ -0,0 +1,235 @@
+"""
+---------------------------------------------------------------
+File name:                  fetcher.py
+Author:                     Ignorant-lu
+Date created:               2026/10/18
+Description:                房间文件镜像：后台线程池通过 FETCH 取回 PUBF 发布的文件，
+                            分块流式写盘并增量计算 SHA-256，不阻塞事件实时尾随。
+----------------------------------------------------------------
+
+Changed history:
+                            2026/10/18: 初始创建;
+----
+"""
+
+from __future__ import annotations
+
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from .protocol import Event
+from .session import ConnectFn, LoginFn, SessionPool
+from .transfer import receive_framed
+
+
+CHUNK_SIZE = 256 * 1024
+
+DoneFn = Callable[[Event, Optional[Path], Optional[BaseException]], None]
+
+
+def _safe_name(filename: str) -> bool:
+    return (
+        bool(filename)
+        and filename not in (".", "..")
+        and "/" not in filename
+        and "\\" not in filename
+        and "\0" not in filename
+    )
+
+
+def fetch_file(
+    conn: Any,
+    room: str,
+    event_id: int,
+    filename: str,
+    out: Union[str, Path],
+    *,
+    expect_sha: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Tuple[int, str]:
+    """Fetch one room file over a logged-in connection.
+
+    ``FETCH|room|event_id|filename`` → ``SIZE|n|sha`` → ``READY`` → n 字节。
+    数据写入 ``<out>.part``，边收边算 SHA-256；与服务器给出的 sha 以及事件头中的
+    ``expect_sha`` 都一致时才原子改名为 ``out``。
+
+    Args:
+        conn: 已登录的 BufferedConnection（需 readline/readexactly/sendall）
+        room (str): 房间名
+        event_id (int): EVT|FILE 的事件 id
+        filename (str): 事件头中的文件名
+        out (Path): 目标路径
+        expect_sha (str | None): 事件头中的 sha，用于二次校验
+        chunk_size (int): 单次读取/写入的块大小
+
+    Returns:
+        tuple[int, str]: (size, sha256hex)
+
+    Raises:
+        ProtocolError: 服务器报错或校验失败（code == "CHECKSUM"）
+        ConnectionError: 传输中途断开
+    """
+
+    return receive_framed(
+        conn,
+        f"FETCH|{room}|{int(event_id)}|{filename}",
+        out,
+        expect_sha=expect_sha,
+        chunk_size=chunk_size,
+    )
+
+
+class FileFetcher:
+    """Background worker pool mirroring EVT|FILE payloads into a directory.
+
+    ``submit()`` 只把事件放入队列，立即返回；每个工作线程从私有会话池借用一条
+    已登录连接（订阅连接之外的独立连接）执行 FETCH。文件保存为
+    ``<dest>/<room>/<event_id>_<filename>``，已存在且大小一致时跳过。
+
+    Args:
+        host (str): 服务器地址
+        port (int): 端口
+        user (str): 用户名
+        password (str): 密码
+        dest (Path): 镜像根目录
+        workers (int): 并发下载线程数
+        chunk_size (int): 分块大小
+        connect: 可选的建连函数 (host, port) -> conn
+        login: 可选的登录函数 (conn, user, password) -> bool
+        on_done: 每个文件完成/失败后的回调 (event, path, error)
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        dest: Union[str, Path],
+        *,
+        workers: int = 2,
+        chunk_size: int = CHUNK_SIZE,
+        connect: Optional[ConnectFn] = None,
+        login: Optional[LoginFn] = None,
+        on_done: Optional[DoneFn] = None,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.dest = Path(dest)
+        self.chunk_size = int(chunk_size)
+        self.on_done = on_done
+        self._connect = connect
+        self._login = login
+        self._pool = SessionPool(max_per_key=max(1, int(workers)))
+        self._queue: "queue.Queue[Optional[Event]]" = queue.Queue()
+        self._mu = threading.Lock()
+        self.stats: Dict[str, int] = {"ok": 0, "skipped": 0, "failed": 0, "bytes": 0}
+        self._threads: List[threading.Thread] = []
+        for i in range(max(1, int(workers))):
+            t = threading.Thread(
+                target=self._worker, name=f"drlms-fetch-{i}", daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def target_path(self, ev: Event) -> Path:
+        return self.dest / ev.room / f"{ev.event_id}_{ev.filename}"
+
+    def submit(self, ev: Event) -> bool:
+        """Queue a FILE event for download; returns False when it is not fetchable."""
+
+        if ev.kind != "FILE" or ev.event_id <= 0 or not _safe_name(ev.filename):
+            return False
+        self._queue.put(ev)
+        return True
+
+    def _count(self, key: str, n: int = 1) -> None:
+        with self._mu:
+            self.stats[key] += n
+
+    def _worker(self) -> None:
+        while True:
+            ev = self._queue.get()
+            try:
+                if ev is None:
+                    return
+                self._fetch_one(ev)
+            finally:
+                self._queue.task_done()
+
+    def _fetch_one(self, ev: Event) -> None:
+        out = self.target_path(ev)
+        if out.exists() and out.stat().st_size == ev.size:
+            self._count("skipped")
+            self._notify(ev, out, None)
+            return
+        try:
+            out.parent.mkdir(parents=True, exist_ok=True)
+            with self._pool.session(
+                self.host,
+                self.port,
+                self.user,
+                self.password,
+                connect=self._connect,
+                login=self._login,
+            ) as sess:
+                size, _sha = fetch_file(
+                    sess.conn,
+                    ev.room,
+                    ev.event_id,
+                    ev.filename,
+                    out,
+                    expect_sha=ev.sha,
+                    chunk_size=self.chunk_size,
+                )
+        except Exception as e:
+            self._count("failed")
+            self._notify(ev, None, e)
+            return
+        self._count("ok")
+        self._count("bytes", size)
+        self._notify(ev, out, None)
+
+    def _notify(
+        self, ev: Event, path: Optional[Path], err: Optional[BaseException]
+    ) -> None:
+        if self.on_done is None:
+            return
+        try:
+            self.on_done(ev, path, err)
+        except Exception:
+            pass
+
+    def close(self, wait: bool = True) -> None:
+        """Stop the workers; by default after the queued downloads finish."""
+
+        if not wait:
+            try:
+                while True:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+            except queue.Empty:
+                pass
+        for _ in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        self._pool.close_all()
+
+    def __enter__(self) -> "FileFetcher":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+
+__all__ = ["CHUNK_SIZE", "fetch_file", "FileFetcher"]
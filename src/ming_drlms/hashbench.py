@@ -0,0 +1,229 @@
+"""
+---------------------------------------------------------------
+File name:                  hashbench.py
+Author:                     Ignorant-lu
+Date created:               2026/10/18
+Description:                Argon2id 参数标定：在本机以给定并发测量一组参数的
+                            单次哈希延迟、内存峰值与吞吐，并推荐满足目标登录
+                            延迟与内存预算的最强参数。
+----------------------------------------------------------------
+
+Changed history:
+                            2026/10/18: 初始创建;
+                            2026/10/18: 进程池按需导入，`user` 命令组启动不再加载 multiprocessing;
+----
+"""
+
+from __future__ import annotations
+
+import os
+import resource
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .users import generate_argon2id_hash
+
+# 与服务器 argon2_load_params_from_env 接受的取值范围一致
+T_COST_RANGE = (1, 10)
+M_COST_KIB_RANGE = (1024, 1048576)
+PARALLELISM_RANGE = (1, 8)
+
+DEFAULT_T_COSTS = (1, 2, 3, 4)
+DEFAULT_M_MIB = (16, 32, 64, 128)
+DEFAULT_TARGET_MS = 500
+DEFAULT_MEM_BUDGET_MB = 1024
+
+
+@dataclass
+class HashBenchResult:
+    """Measurement of one parameter set under ``workers`` concurrent hashers.
+
+    Attributes:
+        time_cost (int): t_cost
+        memory_cost (int): m_cost（KiB）
+        parallelism (int): p
+        workers (int): 并发哈希进程数（对应服务器同时进行的 Argon2 计算数）
+        p50_ms (float): 单次哈希延迟中位数
+        p99_ms (float): 单次哈希延迟 p99
+        hashes_per_sec (float): 所有进程合计吞吐
+        peak_mb (float): 各进程哈希期间内存峰值增量之和（MiB）
+        skipped (str): 未测量的原因（如超出内存预算），测量时为空
+    """
+
+    time_cost: int
+    memory_cost: int
+    parallelism: int
+    workers: int
+    p50_ms: float = 0.0
+    p99_ms: float = 0.0
+    hashes_per_sec: float = 0.0
+    peak_mb: float = 0.0
+    skipped: str = ""
+
+    def params(self) -> Dict[str, int]:
+        return {
+            "time_cost": self.time_cost,
+            "memory_cost": self.memory_cost,
+            "parallelism": self.parallelism,
+        }
+
+
+def _rss_kib(field: str) -> int:
+    """VmRSS / VmHWM of this process in KiB; falls back to ru_maxrss."""
+
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _worker(params: Dict[str, int], count: int, start: float) -> Tuple[List, int]:
+    """Hash ``count`` times once ``start`` (wall clock) is reached."""
+
+    base = _rss_kib("VmRSS")
+    try:
+        # 清零本进程的 VmHWM，使峰值只反映本轮哈希（Linux ≥ 4.0）
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+    delay = start - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    lat = []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        generate_argon2id_hash("calibrate", hash_len=32, salt_len=16, **params)
+        lat.append(time.perf_counter() - t0)
+    return lat, max(0, _rss_kib("VmHWM") - base)
+
+
+def bench_params(
+    time_cost: int,
+    memory_cost: int,
+    parallelism: int,
+    workers: int = 1,
+    count: int = 3,
+) -> HashBenchResult:
+    """Measure one parameter set with ``workers`` processes hashing at once.
+
+    每组参数使用新的进程池，内存峰值互不影响；各进程在同一时刻开始，
+    模拟服务器上 ``workers`` 个登录同时校验。
+
+    Args:
+        time_cost (int): t_cost
+        memory_cost (int): m_cost（KiB）
+        parallelism (int): p
+        workers (int): 并发进程数
+        count (int): 每个进程的哈希次数
+
+    Returns:
+        HashBenchResult: 测量结果
+    """
+
+    params = {
+        "time_cost": time_cost,
+        "memory_cost": memory_cost,
+        "parallelism": parallelism,
+    }
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = max(1, workers)
+    count = max(1, count)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # 预热：先让所有工作进程启动，避免进程创建计入延迟
+        list(pool.map(time.sleep, [0.0] * workers))
+        start = time.time() + 0.2
+        t0 = time.perf_counter()
+        futs = [pool.submit(_worker, params, count, start) for _ in range(workers)]
+        done = [f.result() for f in futs]
+        elapsed = time.perf_counter() - t0 - 0.2
+    lat = sorted(x for lst, _peak in done for x in lst)
+    return HashBenchResult(
+        time_cost=time_cost,
+        memory_cost=memory_cost,
+        parallelism=parallelism,
+        workers=workers,
+        p50_ms=lat[len(lat) // 2] * 1000.0,
+        p99_ms=lat[min(len(lat) - 1, int(len(lat) * 0.99))] * 1000.0,
+        hashes_per_sec=len(lat) / elapsed if elapsed > 0 else 0.0,
+        peak_mb=sum(peak for _lst, peak in done) / 1024.0,
+    )
+
+
+def run_grid(
+    t_costs: Iterable[int],
+    m_costs: Iterable[int],
+    parallelism: Iterable[int],
+    workers: int,
+    count: int,
+    target_ms: float,
+    mem_budget_mb: int,
+    on_result: Optional[Callable[[HashBenchResult], None]] = None,
+) -> List[HashBenchResult]:
+    """Benchmark every combination, skipping ones that cannot meet the limits.
+
+    ``workers × m_cost`` 超出内存预算的组合不运行（避免把机器压到 OOM）；
+    同一 (m, p) 下某个 t 的 p50 已超过目标 3 倍时，更大的 t 也跳过。
+
+    Returns:
+        list[HashBenchResult]: 按 (p, m, t) 顺序的结果（含跳过项）
+    """
+
+    results: List[HashBenchResult] = []
+    for p in parallelism:
+        for m in m_costs:
+            too_slow = False
+            for t in sorted(t_costs):
+                if workers * m > mem_budget_mb * 1024:
+                    r = HashBenchResult(t, m, p, workers, skipped="memory budget")
+                elif too_slow:
+                    r = HashBenchResult(t, m, p, workers, skipped="too slow")
+                else:
+                    r = bench_params(t, m, p, workers, count)
+                    too_slow = r.p50_ms > 3 * target_ms
+                results.append(r)
+                if on_result is not None:
+                    on_result(r)
+    return results
+
+
+def recommend(
+    results: Iterable[HashBenchResult], target_ms: float, mem_budget_mb: int
+) -> Optional[HashBenchResult]:
+    """Pick the strongest measured parameters within latency and memory limits.
+
+    条件：p99 ≤ target_ms，且 workers × m_cost ≤ 内存预算。强度按 m_cost × t_cost
+    （内存-时间乘积）比较，相同时取内存更大、并行度更小者（单线程攻击成本更高）。
+
+    Returns:
+        HashBenchResult|None: 没有满足条件的参数时返回 None
+    """
+
+    ok = [
+        r
+        for r in results
+        if not r.skipped
+        and r.p99_ms <= target_ms
+        and r.workers * r.memory_cost <= mem_budget_mb * 1024
+    ]
+    if not ok:
+        return None
+    return max(
+        ok,
+        key=lambda r: (r.memory_cost * r.time_cost, r.memory_cost, -r.parallelism),
+    )
+
+
+def default_workers() -> int:
+    """Server-side Argon2 concurrency: DRLMS_ARGON2_MAX_CONCURRENT or CPU count."""
+
+    v = os.environ.get("DRLMS_ARGON2_MAX_CONCURRENT", "")
+    if v.isdigit() and int(v) > 0:
+        return int(v)
+    return os.cpu_count() or 1
@@ -12,13 +12,20 @@ en_texts: Dict[str, str] = {
     "HELP.SERVER.UP": "Start server in background with health check.\n\nExamples:\n  ming-drlms server-up -p 8080 -d server_files --no-strict\n",
     "HELP.SERVER.DOWN": "Stop server via PID file; fallback to pkill.\n\nExamples:\n  ming-drlms server-down\n",
     "HELP.SERVER.STATUS": "Show server status and recent log tail.\n\nExamples:\n  ming-drlms server-status -p 8080\n",
+    "HELP.SERVER.STORE.INSPECT": "Show a room's event segments: event-id ranges, counts and sizes.\n\nExamples:\n  ming-drlms server store inspect -d server_files -r demo\n",
+    "HELP.SERVER.STORE.VERIFY": "Verify room segments: headers, event-id order, TEXT sha256, FILE payloads and sparse indexes.\n\nExamples:\n  ming-drlms server store verify -d server_files\n",
+    "HELP.SERVER.STORE.COMPACT": "Offline: merge a room's segments, apply retention and rebuild indexes. Stop the server first.\n\nExamples:\n  ming-drlms server store compact -d server_files -r demo --retain-secs 604800\n",
+    "HELP.SERVER.STORE.MIGRATE": "Offline: convert legacy events.log + texts/ rooms into segment files. Stop the server first.\n\nExamples:\n  ming-drlms server store migrate -d server_files\n",
     # User
     "HELP.USER.ADD": "Create a new user with Argon2id password (interactive or stdin).\n\nSecurity: avoid plain passwords in shell history; prefer stdin.\nExamples:\n  echo 'p@ss' | ming-drlms user add alice -d server_files -x\n",
     "HELP.USER.PASSWD": "Change password for an existing user (Argon2id).\n\nSecurity: avoid plain passwords in shell history; prefer stdin.\nExamples:\n  echo 'new' | ming-drlms user passwd alice -d server_files -x\n",
     "HELP.USER.LIST": "List users and formats (argon2/legacy).\n\nExamples:\n  ming-drlms user list -d server_files --json\n",
     "HELP.USER.DEL": "Delete a user. Use --force to ignore missing.\n\nExamples:\n  ming-drlms user del alice -d server_files\n  ming-drlms user del ghost -d server_files --force\n",
+    "HELP.USER.IMPORT": "Import users from CSV (username,password) or JSONL in one atomic write; passwords are hashed in parallel processes bounded by --mem-budget / m_cost.\n\nExamples:\n  ming-drlms user import users.csv -d server_files --jobs 4\n  ming-drlms user import users.jsonl -d server_files --existing update\n",
+    "HELP.USER.MIGRATE": "Report legacy SHA-256 users (the server upgrades them to Argon2id on their next LOGIN, in batched writes). With --from, convert legacy users whose passwords are known in one atomic write.\n\nExamples:\n  ming-drlms user migrate -d server_files\n  ming-drlms user migrate -d server_files --check\n  ming-drlms user migrate -d server_files --from known.csv\n",
+    "HELP.USER.BENCH_HASH": "Measure Argon2id latency, peak memory and hashes/s for a parameter grid with concurrent workers, and recommend the strongest parameters meeting --target-ms within --mem-budget. --write stores them in drlms.yaml (used by server up and user commands).\n\nExamples:\n  ming-drlms user bench-hash\n  ming-drlms user bench-hash -w 8 --target-ms 250 -m 32 -m 64 --write\n",
     # Space
-    "HELP.SPACE.JOIN": "Subscribe to a room and tail events (with resume).\n\nExamples:\n  ming-drlms space join -r demo -H 127.0.0.1 -p 8080 -R -j\n",
+    "HELP.SPACE.JOIN": "Subscribe to a room and tail events (with resume).\n\nExamples:\n  ming-drlms space join -r demo -H 127.0.0.1 -p 8080 -R -j\n  ming-drlms space join -r demo -r ops -F 'rooms.d/*.txt' -R\n",
     "HELP.SPACE.SEND": "Publish text or file into a room.\n\nExamples:\n  ming-drlms space send -r demo -t 'hello'\n  ming-drlms space send -r demo -f /path/to/file\n",
     "HELP.SPACE.HISTORY": "Fetch historical events for a room.\n\nExamples:\n  ming-drlms space history -r demo -n 10 -s 0\n",
     "HELP.SPACE.LEAVE": "Unsubscribe from a room.\n\nExamples:\n  ming-drlms space leave -r demo -H 127.0.0.1 -p 8080 -u alice -P password\n",
@@ -32,6 +39,8 @@ en_texts: Dict[str, str] = {
     "HELP.CLIENT.LIST": "List files on server (LOGIN -> LIST).\n\nExamples:\n  ming-drlms client list -H 127.0.0.1 -p 8080 -u alice -P password\n",
     "HELP.CLIENT.UPLOAD": "Upload a file to server (LOGIN -> UPLOAD).\n\nExamples:\n  ming-drlms client upload README.md -H 127.0.0.1 -p 8080 -u alice -P password\n",
     "HELP.CLIENT.DOWNLOAD": "Download a file from server (LOGIN -> DOWNLOAD).\n\nExamples:\n  ming-drlms client download README.md -o /tmp/README.md -H 127.0.0.1 -p 8080 -u alice -P password\n",
+    "HELP.CLIENT.UPLOAD_DIR": "Upload every file in a directory concurrently; files whose SHA-256 already matches on the server are skipped.\n\nExamples:\n  ming-drlms client upload-dir /var/log/app -g '*.log.*' -j 8 -H 127.0.0.1 -p 8080\n",
+    "HELP.CLIENT.DOWNLOAD_ALL": "Download all (or matching) server files concurrently; local files with the same SHA-256 are skipped.\n\nExamples:\n  ming-drlms client download-all -o ./mirror -g '*.log' -j 8 -H 127.0.0.1 -p 8080\n",
     "HELP.CLIENT.LOG": "Send a single LOG message.\n\nExamples:\n  ming-drlms client log "
     "hello"
     " -H 127.0.0.1 -p 8080 -u alice -P password\n",
@@ -0,0 +1,265 @@
+"""
+---------------------------------------------------------------
+File name:                  journal.py
+Author:                     Ignorant-lu
+Date created:               2026/10/18
+Description:                `space join --save-dir` 的追加式事件日志：文件只打开一次、
+                            缓冲追加、按时间间隔 fsync、按大小轮转。
+----------------------------------------------------------------
+
+Changed history:
+                            2026/10/18: 初始创建;
+----
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+from .protocol import Event, decode_line, parse_event_header
+
+
+DEFAULT_JOURNAL_NAME = "events.log"
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_FSYNC_INTERVAL = 1.0
+DEFAULT_BUFFER_SIZE = 256 * 1024
+
+
+class EventJournal:
+    """Append-only journal of room events.
+
+    记录格式与线协议一致，便于直接回放：
+
+    - TEXT: ``EVT|TEXT|...|len|sha\\n`` + len 字节负载 + ``\\n``（分隔符，读取时跳过）
+    - FILE: ``EVT|FILE|...\\n``（无负载）
+
+    当前文件为 ``<dir>/events.log``；超过 ``max_bytes`` 后重命名为
+    ``events.log.<seq>``（seq 递增，越大越新），再打开新的 events.log。
+
+    Args:
+        directory (Path): 保存目录，不存在时自动创建
+        name (str): 当前日志文件名
+        max_bytes (int): 轮转阈值；<=0 表示不轮转
+        backups (int): 保留的历史分段数；<=0 表示全部保留
+        fsync_interval (float): 两次 flush+fsync 的最小间隔秒数；<=0 表示每条都 fsync
+        buffer_size (int): 用户态写缓冲大小
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        name: str = DEFAULT_JOURNAL_NAME,
+        *,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backups: int = 0,
+        fsync_interval: float = DEFAULT_FSYNC_INTERVAL,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+    ):
+        self.directory = Path(directory)
+        self.name = name
+        self.max_bytes = int(max_bytes)
+        self.backups = int(backups)
+        self.fsync_interval = float(fsync_interval)
+        self.buffer_size = int(buffer_size)
+        self.records = 0
+        self.rotations = 0
+        self._fh: Optional[BinaryIO] = None
+        self._size = 0
+        self._last_sync = time.monotonic()
+        self._dirty = False
+        self._mu = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._open()
+        if self.fsync_interval > 0:
+            # 事件稀疏时也要按周期落盘，不能等到下一次 append
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name="drlms-journal-flush", daemon=True
+            )
+            self._flusher.start()
+
+    @property
+    def path(self) -> Path:
+        return self.directory / self.name
+
+    def _open(self) -> None:
+        self._fh = open(self.path, "ab", buffering=self.buffer_size)
+        self._size = self._fh.tell()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.fsync_interval):
+            with self._mu:
+                if self._dirty:
+                    self._flush_locked(True)
+
+    # --- 写入 ---------------------------------------------------------------
+
+    def append(self, header: str, payload: bytes = b"") -> None:
+        """Append one event record.
+
+        Args:
+            header (str): 事件头（不含换行）
+            payload (bytes): TEXT 事件的负载；FILE 事件为空
+        """
+
+        rec = header.encode("utf-8") + b"\n"
+        if header.startswith("EVT|TEXT|"):
+            rec += payload + b"\n"
+        with self._mu:
+            if self._fh is None:
+                raise ValueError("journal is closed")
+            if (
+                self.max_bytes > 0
+                and self._size
+                and self._size + len(rec) > self.max_bytes
+            ):
+                self._rotate_locked()
+            self._fh.write(rec)
+            self._size += len(rec)
+            self.records += 1
+            self._dirty = True
+            if time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._flush_locked(True)
+
+    def append_event(self, ev: Event) -> None:
+        self.append(ev.header, ev.payload if ev.kind == "TEXT" else b"")
+
+    def flush(self, fsync: bool = True) -> None:
+        """Flush the user-space buffer and (by default) fsync the file."""
+
+        with self._mu:
+            self._flush_locked(fsync)
+
+    def _flush_locked(self, fsync: bool) -> None:
+        if self._fh is None:
+            return
+        self._fh.flush()
+        if fsync and self._dirty:
+            try:
+                os.fsync(self._fh.fileno())
+            except OSError:
+                pass
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def rotate(self) -> Path:
+        """Close the current file, rename it to the next segment and reopen.
+
+        Returns:
+            Path: 轮转出去的分段路径
+        """
+
+        with self._mu:
+            return self._rotate_locked()
+
+    def _rotate_locked(self) -> Path:
+        self._flush_locked(True)
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        rotated = _rotated_segments(self.directory, self.name)
+        seq = _segment_seq(rotated[-1]) + 1 if rotated else 1
+        dest = self.directory / f"{self.name}.{seq}"
+        os.replace(self.path, dest)
+        self.rotations += 1
+        if self.backups > 0:
+            rotated.append(dest)
+            for p in rotated[: max(0, len(rotated) - self.backups)]:
+                try:
+                    p.unlink()
+                except OSError:
+                    pass
+        self._open()
+        return dest
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._mu:
+            if self._fh is None:
+                return
+            try:
+                self._flush_locked(True)
+            finally:
+                self._fh.close()
+                self._fh = None
+
+    def __enter__(self) -> "EventJournal":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+
+_SEGMENT_RE = re.compile(r"\.(\d+)$")
+
+
+def _segment_seq(p: Path) -> int:
+    m = _SEGMENT_RE.search(p.name)
+    return int(m.group(1)) if m else 0
+
+
+def _rotated_segments(directory: Path, name: str) -> List[Path]:
+    rotated = [
+        p
+        for p in directory.glob(f"{name}.*")
+        if p.is_file() and p.name[len(name) + 1 :].isdigit()
+    ]
+    rotated.sort(key=_segment_seq)
+    return rotated
+
+
+def journal_segments(
+    directory: Union[str, Path], name: str = DEFAULT_JOURNAL_NAME
+) -> List[Path]:
+    """List journal files oldest first: ``events.log.1 .. events.log.N, events.log``."""
+
+    d = Path(directory)
+    rotated = _rotated_segments(d, name)
+    current = d / name
+    if current.exists():
+        rotated.append(current)
+    return rotated
+
+
+def iter_journal(path: Union[str, Path]) -> Iterator[Event]:
+    """Replay events from one journal file (or every segment of a directory).
+
+    兼容旧版只写 ``EVT|FILE`` 行的 events.log；无法解析的行被跳过。
+    """
+
+    p = Path(path)
+    files = journal_segments(p) if p.is_dir() else [p]
+    for fp in files:
+        with open(fp, "rb") as f:
+            while True:
+                raw = f.readline()
+                if not raw:
+                    break
+                ev = parse_event_header(decode_line(raw.rstrip(b"\n")))
+                if ev is None:
+                    continue
+                if ev.kind == "TEXT":
+                    ev.payload = f.read(ev.length)
+                    if f.read(1) not in (b"\n", b""):
+                        # 负载与长度不符（截断/损坏）：回退一个字节继续按行扫描
+                        f.seek(-1, os.SEEK_CUR)
+                yield ev
+
+
+__all__ = [
+    "DEFAULT_JOURNAL_NAME",
+    "DEFAULT_MAX_BYTES",
+    "DEFAULT_FSYNC_INTERVAL",
+    "EventJournal",
+    "journal_segments",
+    "iter_journal",
+]
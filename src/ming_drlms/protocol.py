@@ -0,0 +1,329 @@
+"""
+---------------------------------------------------------------
+File name:                  protocol.py
+Author:                     Ignorant-lu
+Date created:               2026/10/18
+Description:                DRLMS 文本协议的缓冲连接对象：每个 socket 一个读缓冲，
+                            readline()/readexactly() 共享同一缓冲，避免逐字节 recv。
+----------------------------------------------------------------
+
+Changed history:
+                            2026/10/18: 初始创建;
+----
+"""
+
+from __future__ import annotations
+
+import socket as _socket
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+DEFAULT_READ_SIZE = 64 * 1024
+
+
+class BufferedConnection:
+    """Socket wrapper with a per-connection read buffer.
+
+    协议是"行头 + 定长负载"混合帧（如 ``EVT|TEXT|...|len|sha\\n`` 后跟 len 字节），
+    因此按行读取与按长度读取必须共享同一个缓冲区，否则一次 recv 读多的字节会丢失。
+    未覆盖的属性（settimeout/fileno/getpeername 等）透传给底层 socket。
+
+    Args:
+        sock: 已连接的 socket（或具备 recv/sendall/close 的对象）
+        read_size (int): 单次 recv 的最大字节数
+    """
+
+    def __init__(self, sock: Any, read_size: int = DEFAULT_READ_SIZE):
+        self.sock = sock
+        self.read_size = int(read_size)
+        self._buf = bytearray()
+        # 已确认不含换行的前缀长度，避免长行反复从头扫描
+        self._scanned = 0
+        self._eof = False
+
+    # --- 读取 ---------------------------------------------------------------
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self.sock.recv(self.read_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf.extend(chunk)
+        return True
+
+    def readline(self) -> bytes:
+        """Read one line, without the trailing ``\\n``.
+
+        在 EOF 时返回剩余的未终止数据（可能为空 bytes），与旧版 recv_line 行为一致。
+
+        Returns:
+            bytes: 去掉换行符的一行原始字节
+        """
+
+        while True:
+            idx = self._buf.find(b"\n", self._scanned)
+            if idx != -1:
+                line = bytes(self._buf[:idx])
+                del self._buf[: idx + 1]
+                self._scanned = 0
+                return line
+            self._scanned = len(self._buf)
+            if not self._fill():
+                line = bytes(self._buf)
+                self._buf.clear()
+                self._scanned = 0
+                return line
+
+    def readexactly(self, nbytes: int) -> bytes:
+        """Read exactly ``nbytes`` bytes (fewer only on EOF).
+
+        先消费缓冲区，剩余部分直接 recv_into 预分配的缓冲，避免大负载的多次拷贝。
+
+        Args:
+            nbytes (int): 需要读取的字节数
+
+        Returns:
+            bytes: 读取到的数据；对端提前关闭时长度小于 nbytes
+        """
+
+        need = int(nbytes)
+        if need <= 0:
+            return b""
+        if len(self._buf) >= need:
+            data = bytes(self._buf[:need])
+            del self._buf[:need]
+            self._scanned = 0
+            return data
+        out = bytearray(need)
+        have = len(self._buf)
+        out[:have] = self._buf
+        self._buf.clear()
+        self._scanned = 0
+        view = memoryview(out)
+        recv_into = getattr(self.sock, "recv_into", None)
+        while have < need and not self._eof:
+            if recv_into is not None:
+                n = recv_into(view[have:], need - have)
+            else:
+                chunk = self.sock.recv(need - have)
+                n = len(chunk)
+                view[have : have + n] = chunk
+            if not n:
+                self._eof = True
+                break
+            have += n
+        view.release()
+        if have < need:
+            del out[have:]
+        return bytes(out)
+
+    def read_into(self, view: memoryview, nbytes: Optional[int] = None) -> int:
+        """Read up to ``nbytes`` into ``view``; returns 0 only at EOF.
+
+        与 recv_into 语义一致（可能短读），供大文件流式接收复用调用方的固定缓冲。
+        """
+
+        n = len(view) if nbytes is None else min(int(nbytes), len(view))
+        if n <= 0:
+            return 0
+        if self._buf:
+            k = min(n, len(self._buf))
+            view[:k] = self._buf[:k]
+            del self._buf[:k]
+            self._scanned = 0
+            return k
+        if self._eof:
+            return 0
+        recv_into = getattr(self.sock, "recv_into", None)
+        if recv_into is not None:
+            k = recv_into(view[:n], n)
+        else:
+            chunk = self.sock.recv(n)
+            k = len(chunk)
+            view[:k] = chunk
+        if not k:
+            self._eof = True
+        return k
+
+    def recv(self, nbytes: int) -> bytes:
+        """Socket-compatible recv that drains buffered bytes first."""
+
+        if self._buf:
+            data = bytes(self._buf[:nbytes])
+            del self._buf[:nbytes]
+            self._scanned = 0
+            return data
+        if self._eof:
+            return b""
+        return self.sock.recv(nbytes)
+
+    @property
+    def buffered(self) -> int:
+        """Number of bytes read from the socket but not yet consumed."""
+
+        return len(self._buf)
+
+    @property
+    def at_eof(self) -> bool:
+        return self._eof and not self._buf
+
+    # --- 写入与生命周期 ------------------------------------------------------
+
+    def sendall(self, data: bytes) -> None:
+        self.sock.sendall(data)
+
+    def close(self) -> None:
+        try:
+            self.sock.close()
+        finally:
+            self._buf.clear()
+            self._scanned = 0
+
+    def __getattr__(self, name: str) -> Any:
+        # 仅在常规属性查找失败时触发：透传 settimeout/fileno 等
+        return getattr(self.sock, name)
+
+    def __enter__(self) -> "BufferedConnection":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
+
+
+class ProtocolError(RuntimeError):
+    """Server replied with ``ERR|CODE|message`` or an unexpected line.
+
+    Attributes:
+        line (str): 原始应答行
+        code (str): ERR 码（如 AUTH/FORMAT/CHECKSUM），非 ERR 行为空串
+    """
+
+    def __init__(self, line: str, message: Optional[str] = None):
+        super().__init__(message or line)
+        self.line = line
+        parts = line.split("|")
+        self.code = parts[1] if line.startswith("ERR|") and len(parts) > 1 else ""
+
+
+def decode_line(raw: bytes) -> str:
+    """Decode a protocol line, trimming a trailing CR left by CRLF peers."""
+
+    s = raw.decode(errors="ignore")
+    if s.endswith("\r"):
+        return s[:-1]
+    return s
+
+
+@dataclass
+class Event:
+    """A room event as framed by the server.
+
+    - TEXT: ``EVT|TEXT|room|ts|user|event_id|len|sha`` + len 字节负载
+    - FILE: ``EVT|FILE|room|ts|user|event_id|filename|size|sha``（无负载）
+    """
+
+    kind: str
+    room: str
+    ts: str
+    user: str
+    event_id: int
+    sha: str
+    length: int = 0
+    filename: str = ""
+    size: int = 0
+    payload: bytes = b""
+    header: str = ""
+
+    @property
+    def text(self) -> str:
+        return self.payload.decode(errors="ignore")
+
+
+def parse_event_header(line: str) -> Optional[Event]:
+    """Parse an ``EVT|TEXT|...`` / ``EVT|FILE|...`` header line.
+
+    Args:
+        line (str): 已解码、去掉换行的协议行
+
+    Returns:
+        Event | None: 解析结果；非事件行或字段不合法时返回 None
+    """
+
+    if line.startswith("EVT|TEXT|"):
+        parts = line.split("|")
+        if len(parts) < 8:
+            return None
+        try:
+            eid = int(parts[5])
+            length = int(parts[6])
+        except ValueError:
+            return None
+        return Event(
+            kind="TEXT",
+            room=parts[2],
+            ts=parts[3],
+            user=parts[4],
+            event_id=eid,
+            sha=parts[7],
+            length=max(length, 0),
+            header=line,
+        )
+    if line.startswith("EVT|FILE|"):
+        parts = line.split("|")
+        if len(parts) < 9:
+            return None
+        try:
+            eid = int(parts[5])
+            size = int(parts[7])
+        except ValueError:
+            return None
+        return Event(
+            kind="FILE",
+            room=parts[2],
+            ts=parts[3],
+            user=parts[4],
+            event_id=eid,
+            sha=parts[8],
+            filename=parts[6],
+            size=size,
+            header=line,
+        )
+    return None
+
+
+def open_connection(
+    host: str, port: int, timeout: Optional[float] = 5.0
+) -> BufferedConnection:
+    """Connect to a DRLMS server and wrap the socket in a BufferedConnection.
+
+    Args:
+        host (str): 服务器地址
+        port (int): 端口
+        timeout (float | None): 连接与读写超时（秒）
+
+    Returns:
+        BufferedConnection: 已连接的缓冲连接
+    """
+
+    s = _socket.socket(_socket.AF_INET, _socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect((host, port))
+    except Exception:
+        s.close()
+        raise
+    return BufferedConnection(s)
+
+
+__all__ = [
+    "DEFAULT_READ_SIZE",
+    "BufferedConnection",
+    "ProtocolError",
+    "decode_line",
+    "Event",
+    "parse_event_header",
+    "open_connection",
+]
@@ -0,0 +1,581 @@
+"""
+---------------------------------------------------------------
+File name:                  segstore.py
+Author:                     Ignorant-lu
+Date created:               2026/10/18
+Description:                服务器房间事件段存储的离线工具：检查、校验、压缩段文件，
+                            以及把旧布局（events.log + texts/）迁移为段文件。
+----------------------------------------------------------------
+
+Changed history:
+                            2026/10/18: 初始创建;
+----
+"""
+
+from __future__ import annotations
+
+import calendar
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+
+SEGMENTS_DIR = "segments"
+LEGACY_LOG = "events.log"
+LEGACY_INDEX = "events.idx"
+INDEX_MAGIC = b"DRLMSIX1"
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+DEFAULT_INDEX_STRIDE = 64
+
+_INDEX_POINT = struct.Struct("=QQ")
+_COMPACT_DIR = "segments.compact"
+_OLD_DIR = "segments.old"
+_COMPLETE = "COMPLETE"
+# 与服务器 rooms_valid_name 相同的房间名规则
+_ROOM_NAME_RE = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+PathLike = Union[str, Path]
+
+
+class SegmentError(Exception):
+    """A segment cannot be parsed.
+
+    Attributes:
+        path (Path): 段文件
+        offset (int): 出错记录在段内的偏移
+        truncated (bool): 是否只是末尾记录没有写完
+    """
+
+    def __init__(self, path: Path, offset: int, msg: str, truncated: bool = False):
+        super().__init__(f"{path.name}@{offset}: {msg}")
+        self.path = path
+        self.offset = offset
+        self.truncated = truncated
+
+
+@dataclass
+class Record:
+    """One room event as stored on disk.
+
+    Attributes:
+        event_id (int): 事件 id
+        kind (str): ``TEXT`` / ``FILE``
+        header (dict): 解析后的 JSON 头部
+        line (bytes): 原始头部行（含 ``\\n``）
+        offset (int): 头部行在段内的偏移
+        payload (bytes): TEXT 正文；FILE 为 None
+    """
+
+    event_id: int
+    kind: str
+    header: Dict[str, object]
+    line: bytes
+    offset: int
+    payload: Optional[bytes] = None
+
+    @property
+    def size(self) -> int:
+        """Bytes this record takes in a segment file."""
+
+        if self.kind == "TEXT" and self.payload is not None:
+            return len(self.line) + len(self.payload) + 1
+        return len(self.line)
+
+
+@dataclass
+class SegmentInfo:
+    """Summary of one segment (or of the legacy ``events.log``)."""
+
+    path: Path
+    first_event_id: int
+    legacy: bool = False
+    last_event_id: int = 0
+    records: int = 0
+    texts: int = 0
+    files: int = 0
+    bytes: int = 0
+    mtime: float = 0.0
+
+
+@dataclass
+class RoomStats:
+    """Summary of a room's event store."""
+
+    room: str
+    segments: List[SegmentInfo] = field(default_factory=list)
+
+    @property
+    def records(self) -> int:
+        return sum(s.records for s in self.segments)
+
+    @property
+    def bytes(self) -> int:
+        return sum(s.bytes for s in self.segments)
+
+    @property
+    def first_event_id(self) -> int:
+        return self.segments[0].first_event_id if self.segments else 0
+
+    @property
+    def last_event_id(self) -> int:
+        return max((s.last_event_id for s in self.segments), default=0)
+
+
+def segment_name(first_event_id: int) -> str:
+    """File name of the segment starting at ``first_event_id``."""
+
+    return f"{first_event_id:020d}.seg"
+
+
+def list_segments(room_dir: PathLike) -> List[SegmentInfo]:
+    """List a room's segments oldest first; the legacy log (if any) comes first.
+
+    只看文件名与旧日志首行，不读取段内容。
+    """
+
+    room = Path(room_dir)
+    out: List[SegmentInfo] = []
+    legacy = room / LEGACY_LOG
+    if legacy.is_file():
+        with open(legacy, "rb") as f:
+            first = _parse_header(f.readline())
+        if first is not None:
+            out.append(SegmentInfo(legacy, int(first["event_id"]), legacy=True))
+    seg_dir = room / SEGMENTS_DIR
+    if seg_dir.is_dir():
+        for p in seg_dir.iterdir():
+            if p.suffix == ".seg" and p.stem.isdigit():
+                out.append(SegmentInfo(p, int(p.stem)))
+    out.sort(key=lambda s: (s.first_event_id, not s.legacy))
+    return out
+
+
+def _parse_header(line: bytes) -> Optional[Dict[str, object]]:
+    if not line.startswith(b'{"event_id":'):
+        return None
+    try:
+        h = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(h, dict) or not isinstance(h.get("event_id"), int):
+        return None
+    return h
+
+
+def iter_segment(
+    path: PathLike, *, legacy: bool = False, tolerate_tail: bool = False
+) -> Iterator[Record]:
+    """Iterate the records of one segment file.
+
+    旧布局日志（``legacy=True``）中 TEXT 正文在 ``texts/<eid>.txt``，从那里读取；
+    缺失时 ``payload`` 为 None。
+
+    Args:
+        path (Path): 段文件
+        legacy (bool): 是否为旧布局 events.log
+        tolerate_tail (bool): 末尾写了一半的记录静默结束，而不是报错
+
+    Raises:
+        SegmentError: 头部无法解析或记录不完整
+    """
+
+    p = Path(path)
+    texts = p.parent / "texts"
+    with open(p, "rb") as f:
+        while True:
+            off = f.tell()
+            line = f.readline()
+            if not line:
+                return
+            if not line.endswith(b"\n"):
+                if tolerate_tail:
+                    return
+                raise SegmentError(p, off, "truncated header", truncated=True)
+            h = _parse_header(line)
+            if h is None:
+                raise SegmentError(p, off, "malformed header")
+            eid = int(h["event_id"])
+            kind = str(h.get("kind", ""))
+            payload: Optional[bytes] = None
+            if kind == "TEXT" and legacy:
+                try:
+                    payload = (texts / f"{eid}.txt").read_bytes()
+                except OSError:
+                    payload = None
+            elif kind == "TEXT":
+                n = int(h.get("len", 0))
+                body = f.read(n + 1)
+                if len(body) < n + 1:
+                    if tolerate_tail:
+                        return
+                    raise SegmentError(p, off, "truncated payload", truncated=True)
+                if body[-1:] != b"\n":
+                    raise SegmentError(p, off, "payload not terminated")
+                payload = body[:-1]
+            yield Record(eid, kind, h, line, off, payload)
+
+
+def iter_room(room_dir: PathLike, *, tolerate_tail: bool = False) -> Iterator[Record]:
+    """Iterate all records of a room, oldest segment first."""
+
+    for seg in list_segments(room_dir):
+        yield from iter_segment(
+            seg.path, legacy=seg.legacy, tolerate_tail=tolerate_tail
+        )
+
+
+def inspect_room(room_dir: PathLike) -> RoomStats:
+    """Per-segment record counts, event-id ranges and sizes.
+
+    Raises:
+        SegmentError: 段内容无法解析（末尾未写完的记录除外）
+    """
+
+    room = Path(room_dir)
+    stats = RoomStats(room.name)
+    for seg in list_segments(room):
+        st = seg.path.stat()
+        seg.mtime = st.st_mtime
+        for rec in iter_segment(seg.path, legacy=seg.legacy, tolerate_tail=True):
+            seg.records += 1
+            seg.last_event_id = rec.event_id
+            if rec.kind == "TEXT":
+                seg.texts += 1
+            elif rec.kind == "FILE":
+                seg.files += 1
+            seg.bytes += rec.size
+        stats.segments.append(seg)
+    return stats
+
+
+def _file_payload(room: Path, rec: Record) -> Path:
+    return room / "files" / f"{rec.event_id}_{rec.header.get('filename', '')}"
+
+
+def _text_path(room: Path, rec: Record) -> Path:
+    return room / "texts" / f"{rec.event_id}.txt"
+
+
+def _index_path(seg: SegmentInfo) -> Path:
+    if seg.legacy:
+        return seg.path.with_name(LEGACY_INDEX)
+    return seg.path.with_suffix(".idx")
+
+
+def _check_index(seg: SegmentInfo, offsets: Dict[int, int]) -> Optional[str]:
+    idx = _index_path(seg)
+    if not idx.is_file():
+        return None  # 服务器加载时重建
+    data = idx.read_bytes()
+    if not data.startswith(INDEX_MAGIC):
+        return f"{idx.name}: bad magic"
+    body = data[len(INDEX_MAGIC) :]
+    if len(body) % _INDEX_POINT.size:
+        return f"{idx.name}: truncated point"
+    for i, (eid, off) in enumerate(_INDEX_POINT.iter_unpack(body)):
+        if offsets.get(eid) != off:
+            return f"{idx.name}: point {i} (event {eid} @ {off}) does not match segment"
+        if i == 0 and off != 0:
+            return f"{idx.name}: first point is not the first record"
+    return None
+
+
+def verify_room(room_dir: PathLike) -> List[str]:
+    """Check a room's store; returns human-readable problems (empty when healthy).
+
+    检查项：头部可解析、event_id 严格递增、段文件名与首条记录一致、TEXT 正文
+    sha256、FILE 负载存在、稀疏索引点与段内容一致、没有未完成的压缩。
+    段末尾写了一半的记录也会报告（服务器下次加载活动段时会截掉）。
+    """
+
+    room = Path(room_dir)
+    problems: List[str] = []
+    for leftover in (_COMPACT_DIR, _OLD_DIR):
+        if (room / leftover).exists():
+            problems.append(f"{leftover}: unfinished compaction")
+    prev = 0
+    for seg in list_segments(room):
+        offsets: Dict[int, int] = {}
+        first = True
+        try:
+            for rec in iter_segment(seg.path, legacy=seg.legacy):
+                where = f"{seg.path.name}: event {rec.event_id}"
+                offsets[rec.event_id] = rec.offset
+                if first and not seg.legacy and rec.event_id < seg.first_event_id:
+                    problems.append(f"{where}: precedes segment name")
+                first = False
+                if rec.event_id <= prev:
+                    problems.append(f"{where}: event id not increasing")
+                prev = max(prev, rec.event_id)
+                if rec.kind == "TEXT":
+                    if rec.payload is None:
+                        problems.append(f"{where}: missing text body")
+                    elif hashlib.sha256(rec.payload).hexdigest() != rec.header.get(
+                        "sha"
+                    ):
+                        problems.append(f"{where}: sha256 mismatch")
+                elif rec.kind == "FILE":
+                    if not _file_payload(room, rec).is_file():
+                        problems.append(f"{where}: missing file payload")
+                else:
+                    problems.append(f"{where}: unknown kind {rec.kind!r}")
+        except SegmentError as e:
+            problems.append(str(e))
+        msg = _check_index(seg, offsets)
+        if msg:
+            problems.append(msg)
+    return problems
+
+
+def _parse_ts(ts: object) -> Optional[float]:
+    try:
+        return float(calendar.timegm(time.strptime(str(ts), "%Y-%m-%dT%H:%M:%SZ")))
+    except ValueError:
+        return None
+
+
+def _storage_line(rec: Record) -> bytes:
+    """Header line as written to a segment; legacy TEXT gets its real body length."""
+
+    if rec.kind != "TEXT" or rec.header.get("len") == len(rec.payload or b""):
+        return rec.line
+    h = dict(rec.header)
+    h["len"] = len(rec.payload or b"")
+    return json.dumps(h, ensure_ascii=False, separators=(",", ":")).encode() + b"\n"
+
+
+class _SegmentWriter:
+    """Write records into size-bounded segments plus their sparse indexes."""
+
+    def __init__(self, directory: Path, segment_bytes: int, stride: int):
+        self.directory = directory
+        self.segment_bytes = max(1, int(segment_bytes))
+        self.stride = max(1, int(stride))
+        self.written: List[Path] = []
+        self._seg = None
+        self._idx = None
+        self._size = 0
+        self._count = 0
+
+    def _roll(self, eid: int) -> None:
+        self._close()
+        p = self.directory / segment_name(eid)
+        self._seg = open(p, "wb")
+        self._idx = open(p.with_suffix(".idx"), "wb")
+        self._idx.write(INDEX_MAGIC)
+        self.written.append(p)
+        self._size = 0
+        self._count = 0
+
+    def write(self, rec: Record) -> None:
+        line = _storage_line(rec)
+        body = rec.payload if rec.kind == "TEXT" else None
+        n = len(line) + (len(body) + 1 if body is not None else 0)
+        if self._seg is None or (
+            self._size > 0 and self._size + n > self.segment_bytes
+        ):
+            self._roll(rec.event_id)
+        if self._count % self.stride == 0:
+            self._idx.write(_INDEX_POINT.pack(rec.event_id, self._size))
+        self._seg.write(line)
+        if body is not None:
+            self._seg.write(body)
+            self._seg.write(b"\n")
+        self._size += n
+        self._count += 1
+
+    def _close(self) -> None:
+        for f in (self._seg, self._idx):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+                f.close()
+        self._seg = self._idx = None
+
+    def close(self) -> None:
+        self._close()
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _finish_swap(room: Path) -> None:
+    """Move the old store aside and commit ``segments.compact`` as ``segments``."""
+
+    old = room / _OLD_DIR
+    old.mkdir(exist_ok=True)
+    for name in (SEGMENTS_DIR, LEGACY_LOG, LEGACY_INDEX, "texts"):
+        if (room / name).exists():
+            os.replace(room / name, old / name)
+    new = room / _COMPACT_DIR
+    (new / _COMPLETE).unlink(missing_ok=True)
+    os.replace(new, room / SEGMENTS_DIR)  # 提交点
+    _fsync_dir(room)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def recover_room(room_dir: PathLike) -> None:
+    """Finish or roll back a compaction interrupted by a crash.
+
+    ``segments.compact`` 写完后才会放入 COMPLETE 标记：有标记则继续提交，没有
+    则丢弃；只剩 ``segments.old`` 说明已经提交，删掉即可。
+    """
+
+    room = Path(room_dir)
+    new = room / _COMPACT_DIR
+    if new.is_dir():
+        if (new / _COMPLETE).exists():
+            _finish_swap(room)
+        else:
+            shutil.rmtree(new)
+    shutil.rmtree(room / _OLD_DIR, ignore_errors=True)
+
+
+def compact_room(
+    room_dir: PathLike,
+    *,
+    segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+    retain_bytes: int = 0,
+    retain_secs: float = 0,
+    stride: int = DEFAULT_INDEX_STRIDE,
+    now: Optional[float] = None,
+) -> Tuple[int, int]:
+    """Rewrite a room's store into full segments, applying retention.
+
+    所有段（含旧布局 events.log + texts/）按顺序合并为不超过 ``segment_bytes``
+    的新段并重建索引，写入 ``segments.compact/`` 后整体替换；被保留策略丢弃的
+    FILE 事件负载一并删除。必须在服务器停止时运行。
+
+    Args:
+        room_dir (Path): ``<data_dir>/rooms/<room>``
+        segment_bytes (int): 新段的大小上限
+        retain_bytes (int): 只保留最新的这么多字节的事件；0 表示不限
+        retain_secs (float): 丢弃 ts 早于这么多秒之前的事件；0 表示不限
+        stride (int): 索引点间隔（与服务器 DRLMS_HISTORY_INDEX_STRIDE 一致）
+        now (float): 当前时间（测试用）
+
+    Returns:
+        (kept, dropped): 保留与丢弃的事件数
+
+    Raises:
+        SegmentError: 段无法解析，或旧布局 TEXT 正文缺失
+    """
+
+    room = Path(room_dir)
+    recover_room(room)
+    segs = list_segments(room)
+    if not segs:
+        return 0, 0
+    cutoff = (time.time() if now is None else now) - retain_secs
+    skip_bytes = last = 0
+    if retain_bytes > 0 or retain_secs > 0:
+        total = 0
+        for r in iter_room(room, tolerate_tail=True):
+            total += r.size
+            last = r.event_id
+        if retain_bytes > 0:
+            skip_bytes = max(0, total - retain_bytes)
+    new = room / _COMPACT_DIR
+    new.mkdir()
+    writer = _SegmentWriter(new, segment_bytes, stride)
+    kept = dropped = 0
+    doomed: List[Path] = []
+    try:
+        for rec in iter_room(room, tolerate_tail=True):
+            if rec.kind == "TEXT" and rec.payload is None:
+                raise SegmentError(
+                    _text_path(room, rec), rec.offset, "missing text body"
+                )
+            old = retain_secs > 0 and (_parse_ts(rec.header.get("ts")) or 0) < cutoff
+            # 最新事件总是保留：服务器靠它恢复 last_event_id
+            if (skip_bytes > 0 or old) and rec.event_id != last:
+                skip_bytes -= rec.size
+                dropped += 1
+                if rec.kind == "FILE":
+                    doomed.append(_file_payload(room, rec))
+                continue
+            writer.write(rec)
+            kept += 1
+        writer.close()
+        _fsync_dir(new)
+        (new / _COMPLETE).touch()
+    except BaseException:
+        writer.close()
+        shutil.rmtree(new, ignore_errors=True)
+        raise
+    _finish_swap(room)
+    for p in doomed:
+        p.unlink(missing_ok=True)
+    return kept, dropped
+
+
+def migrate_room(
+    room_dir: PathLike,
+    *,
+    segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+    stride: int = DEFAULT_INDEX_STRIDE,
+) -> int:
+    """Convert a legacy ``events.log`` + ``texts/`` room into segments.
+
+    与已有段一起重写（等价于不带保留策略的 compact_room）；旧日志、索引与
+    texts/ 在提交后删除。没有旧日志时什么也不做。
+
+    Returns:
+        int: 迁移后的事件数；无需迁移时为 0
+    """
+
+    room = Path(room_dir)
+    if not (room / LEGACY_LOG).is_file():
+        return 0
+    kept, _ = compact_room(room, segment_bytes=segment_bytes, stride=stride)
+    return kept
+
+
+def room_dirs(data_dir: PathLike, room: Optional[str] = None) -> List[Path]:
+    """Room directories under ``<data_dir>/rooms`` (all, or just ``room``).
+
+    Raises:
+        ValueError: ``room`` is not a valid room name (e.g. ``../x``)
+    """
+
+    base = Path(data_dir) / "rooms"
+    if room is not None:
+        if not _ROOM_NAME_RE.fullmatch(room) or room in (".", ".."):
+            raise ValueError(f"invalid room name: {room!r}")
+        return [base / room]
+    if not base.is_dir():
+        return []
+    return sorted(p for p in base.iterdir() if p.is_dir())
+
+
+__all__ = [
+    "SEGMENTS_DIR",
+    "DEFAULT_SEGMENT_BYTES",
+    "DEFAULT_INDEX_STRIDE",
+    "SegmentError",
+    "Record",
+    "SegmentInfo",
+    "RoomStats",
+    "segment_name",
+    "list_segments",
+    "iter_segment",
+    "iter_room",
+    "inspect_room",
+    "verify_room",
+    "recover_room",
+    "compact_room",
+    "migrate_room",
+    "room_dirs",
+]
@@ -0,0 +1,391 @@
+"""
+---------------------------------------------------------------
+File name:                  session.py
+Author:                     Ignorant-lu
+Date created:               2026/10/18
+Description:                已登录连接的会话池：按 (host, port, user) 复用连接，
+                            避免每条命令/每行聊天都重新 LOGIN（Argon2id 开销）。
+----------------------------------------------------------------
+
+Changed history:
+                            2026/10/18: 初始创建;
+                            2026/10/18: LOGIN 签发的会话令牌缓存到 state.json，
+                                        重连先 RESUME|token;
+----
+"""
+
+from __future__ import annotations
+
+import atexit
+import hashlib
+import os
+import select
+import socket as _socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from . import state as _state
+from .protocol import decode_line, open_connection
+
+
+SessionKey = Tuple[str, int, str]
+ConnectFn = Callable[[str, int], Any]
+LoginFn = Callable[[Any, str, str], bool]
+
+
+class SessionError(RuntimeError):
+    """Base error for session pool failures."""
+
+
+class LoginFailed(SessionError):
+    """Raised when the server rejects LOGIN for a new session."""
+
+
+def _password_digest(password: str) -> str:
+    return hashlib.sha256(str(password).encode("utf-8")).hexdigest()
+
+
+def tokens_enabled() -> bool:
+    """Session tokens are used unless DRLMS_SESSION_TOKENS=0."""
+
+    return os.environ.get("DRLMS_SESSION_TOKENS", "1") not in ("0", "false", "False")
+
+
+def parse_welcome(resp: str) -> Optional[Tuple[str, int]]:
+    """Extract (token, ttl) from ``OK|WELCOME|token|ttl``; None for plain WELCOME."""
+
+    parts = resp.split("|")
+    if len(parts) < 4 or parts[:2] != ["OK", "WELCOME"] or not parts[2]:
+        return None
+    try:
+        return parts[2], int(parts[3])
+    except ValueError:
+        return None
+
+
+def _peer(conn: Any) -> Optional[Tuple[str, int]]:
+    try:
+        host, port = conn.getpeername()[:2]
+        return str(host), int(port)
+    except Exception:
+        return None
+
+
+def resume_or_login(
+    conn: Any,
+    user: str,
+    password: str,
+    *,
+    host: Optional[str] = None,
+    port: Optional[int] = None,
+    recv: Optional[Callable[[Any], str]] = None,
+) -> bool:
+    """Authenticate ``conn``: RESUME with a cached token, else LOGIN.
+
+    令牌按 (host, port, user) 存在 state.json 的 profiles 中，RESUME 时附带口令，
+    服务器只比对签发时记下的口令 HMAC（不做 Argon2），口令不符同样被拒；服务器拒绝令牌
+    （过期、users.txt 变更、服务器重启）时丢弃并回退到 LOGIN，LOGIN 应答中的
+    新令牌随即写回。未给出 host/port 时取连接的对端地址；recv 为读取一行应答
+    的函数，默认 ``conn.readline()``。
+
+    Returns:
+        bool: 认证成功为 True
+    """
+
+    if recv is None:
+
+        def recv(c: Any) -> str:
+            return decode_line(c.readline())
+
+    peer = (host, int(port)) if host is not None and port is not None else None
+    if peer is None and tokens_enabled():
+        peer = _peer(conn)
+    if peer is not None and tokens_enabled():
+        token = _state.get_session_token(peer[0], peer[1], user)
+        if token:
+            conn.sendall(f"RESUME|{token}|{password}\n".encode())
+            resp = recv(conn)
+            if resp.startswith("OK|") or resp == "OK":
+                return True
+            _state.drop_session_token(peer[0], peer[1], user)
+    conn.sendall(f"LOGIN|{user}|{password}\n".encode())
+    resp = recv(conn)
+    ok = resp.startswith("OK|") or resp == "OK"
+    issued = parse_welcome(resp) if ok else None
+    if issued is not None and peer is not None and tokens_enabled():
+        _state.save_session_token(peer[0], peer[1], user, issued[0], issued[1])
+    return ok
+
+
+def _default_login(conn: Any, user: str, password: str) -> bool:
+    return resume_or_login(conn, user, password)
+
+
+@dataclass
+class Session:
+    """A logged-in connection owned by a SessionPool."""
+
+    key: SessionKey
+    conn: Any
+    pw_digest: str
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    uses: int = 0
+
+    def alive(self) -> bool:
+        """Cheap health check without a protocol round-trip.
+
+        服务器没有 PING 命令，因此用非阻塞探测：可读且 peek 到 EOF 表示对端已关闭；
+        可读且有数据说明存在未消费的应答（连接状态不可信），同样判定为不健康。
+
+        Returns:
+            bool: 连接可安全复用时为 True
+        """
+
+        if getattr(self.conn, "buffered", 0):
+            return False
+        try:
+            fd = self.conn.fileno()
+        except Exception:
+            # 非真实 socket（如测试替身）：无法探测，按可用处理
+            return True
+        if fd is None or fd < 0:
+            return False
+        try:
+            readable, _w, _x = select.select([fd], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        if not readable:
+            return True
+        sock = getattr(self.conn, "sock", self.conn)
+        try:
+            sock.recv(1, _socket.MSG_PEEK | _socket.MSG_DONTWAIT)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except OSError:
+            return False
+        # peek 到 b""（EOF）或残留数据都不可复用
+        return False
+
+    def close(self, quit: bool = True) -> None:
+        try:
+            if quit:
+                try:
+                    self.conn.sendall(b"QUIT\n")
+                except Exception:
+                    pass
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class SessionPool:
+    """Pool of logged-in connections keyed by (host, port, user).
+
+    - 空闲超过 ``max_idle`` 秒的会话被淘汰（应小于服务器 DRLMS_RCV_TIMEOUT）
+    - 取出前做非阻塞健康检查，失效连接直接丢弃并重新登录
+    - 每个 key 最多保留 ``max_per_key`` 个空闲会话；并发使用时各自独占一个
+
+    Args:
+        max_idle (float): 空闲淘汰秒数
+        max_per_key (int): 每个 key 保留的空闲会话上限
+        connect_timeout (float): 新建连接的超时
+    """
+
+    def __init__(
+        self,
+        max_idle: float = 60.0,
+        max_per_key: int = 4,
+        connect_timeout: float = 5.0,
+    ):
+        self.max_idle = float(max_idle)
+        self.max_per_key = int(max_per_key)
+        self.connect_timeout = connect_timeout
+        self._idle: Dict[SessionKey, List[Session]] = {}
+        self._mu = threading.Lock()
+        self.stats = {"created": 0, "reused": 0, "evicted": 0, "unhealthy": 0}
+
+    def _take_idle(self, key: SessionKey, digest: str) -> Optional[Session]:
+        now = time.monotonic()
+        stale: List[Session] = []
+        found: Optional[Session] = None
+        with self._mu:
+            bucket = self._idle.get(key, [])
+            while bucket:
+                sess = bucket.pop()
+                if now - sess.last_used > self.max_idle:
+                    self.stats["evicted"] += 1
+                    stale.append(sess)
+                    continue
+                if sess.pw_digest != digest:
+                    stale.append(sess)
+                    continue
+                found = sess
+                break
+        for sess in stale:
+            sess.close()
+        if found is not None and not found.alive():
+            self.stats["unhealthy"] += 1
+            found.close(quit=False)
+            return None
+        return found
+
+    def acquire(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        *,
+        connect: Optional[ConnectFn] = None,
+        login: Optional[LoginFn] = None,
+    ) -> Session:
+        """Return a logged-in session, reusing an idle one when healthy.
+
+        Args:
+            host (str): 服务器地址
+            port (int): 端口
+            user (str): 用户名
+            password (str): 密码
+            connect: 可选的建连函数 (host, port) -> conn
+            login: 可选的登录函数 (conn, user, password) -> bool
+
+        Returns:
+            Session: 已登录会话；用完需 release()
+
+        Raises:
+            LoginFailed: 服务器拒绝登录
+        """
+
+        key: SessionKey = (host, port, user)
+        digest = _password_digest(password)
+        sess = self._take_idle(key, digest)
+        if sess is not None:
+            sess.uses += 1
+            self.stats["reused"] += 1
+            return sess
+        if connect is None:
+            conn = open_connection(host, port, self.connect_timeout)
+        else:
+            conn = connect(host, port)
+        do_login = login or _default_login
+        try:
+            ok = do_login(conn, user, password)
+        except Exception:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            raise
+        if not ok:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            raise LoginFailed(f"login failed: {user}@{host}:{port}")
+        self.stats["created"] += 1
+        return Session(key=key, conn=conn, pw_digest=digest, uses=1)
+
+    def release(self, sess: Session, reusable: bool = True) -> None:
+        """Return a session to the pool, or close it when not reusable."""
+
+        if not reusable:
+            sess.close(quit=False)
+            return
+        sess.last_used = time.monotonic()
+        with self._mu:
+            bucket = self._idle.setdefault(sess.key, [])
+            if len(bucket) < self.max_per_key:
+                bucket.append(sess)
+                return
+        sess.close()
+
+    @contextmanager
+    def session(
+        self,
+        host: str,
+        port: int,
+        user: str,
+        password: str,
+        *,
+        connect: Optional[ConnectFn] = None,
+        login: Optional[LoginFn] = None,
+    ) -> Iterator[Session]:
+        """Context manager around acquire()/release().
+
+        正常退出时归还会话；异常（含 typer.Exit）时关闭连接，避免复用半途状态。
+        """
+
+        sess = self.acquire(host, port, user, password, connect=connect, login=login)
+        ok = False
+        try:
+            yield sess
+            ok = True
+        finally:
+            self.release(sess, reusable=ok)
+
+    def evict_idle(self) -> int:
+        """Close idle sessions older than max_idle; returns how many were closed."""
+
+        now = time.monotonic()
+        victims: List[Session] = []
+        with self._mu:
+            for key, bucket in list(self._idle.items()):
+                keep = [s for s in bucket if now - s.last_used <= self.max_idle]
+                victims.extend(s for s in bucket if now - s.last_used > self.max_idle)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+            self.stats["evicted"] += len(victims)
+        for sess in victims:
+            sess.close()
+        return len(victims)
+
+    def idle_count(self) -> int:
+        with self._mu:
+            return sum(len(b) for b in self._idle.values())
+
+    def close_all(self) -> None:
+        with self._mu:
+            sessions = [s for b in self._idle.values() for s in b]
+            self._idle.clear()
+        for sess in sessions:
+            sess.close()
+
+
+_default_pool: Optional[SessionPool] = None
+_default_pool_mu = threading.Lock()
+
+
+def get_pool() -> SessionPool:
+    """Process-wide pool; DRLMS_SESSION_IDLE overrides the idle timeout."""
+
+    global _default_pool
+    with _default_pool_mu:
+        if _default_pool is None:
+            idle = 60.0
+            v = os.environ.get("DRLMS_SESSION_IDLE")
+            if v:
+                try:
+                    idle = float(v)
+                except Exception:
+                    pass
+            _default_pool = SessionPool(max_idle=idle)
+            atexit.register(_default_pool.close_all)
+        return _default_pool
+
+
+__all__ = [
+    "SessionError",
+    "LoginFailed",
+    "Session",
+    "SessionPool",
+    "get_pool",
+    "parse_welcome",
+    "resume_or_login",
+    "tokens_enabled",
+]
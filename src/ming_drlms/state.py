@@ -1,6 +1,17 @@
+import atexit
 import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Optional
+
+try:  # POSIX 建议锁；不可用时退化为仅进程内互斥
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None  # type: ignore[assignment]
 
 STATE_DIR = Path.home() / ".drlms"
 STATE_PATH = STATE_DIR / "state.json"
@@ -10,12 +21,11 @@ def _ensure_dirs() -> None:
     STATE_DIR.mkdir(parents=True, exist_ok=True)
 
 
-def load_state() -> Dict[str, Any]:
-    _ensure_dirs()
-    if not STATE_PATH.exists():
+def _read_state(path: Path) -> Dict[str, Any]:
+    if not path.exists():
         return {"profiles": {}, "rooms": {}}
     try:
-        data = json.loads(STATE_PATH.read_text(errors="ignore") or "{}")
+        data = json.loads(path.read_text(errors="ignore") or "{}")
         if not isinstance(data, dict):
             return {"profiles": {}, "rooms": {}}
         data.setdefault("profiles", {})
@@ -25,10 +35,104 @@ def load_state() -> Dict[str, Any]:
         return {"profiles": {}, "rooms": {}}
 
 
+def load_state() -> Dict[str, Any]:
+    _ensure_dirs()
+    return _read_state(STATE_PATH)
+
+
+_local_lock = threading.Lock()
+
+
+@contextmanager
+def _state_lock(path: Path) -> Iterator[None]:
+    """Serialize read-merge-write of the state file across threads and processes."""
+
+    with _local_lock:
+        if fcntl is None:
+            yield
+            return
+        lock_path = path.with_name(path.name + ".lock")
+        with open(lock_path, "a+") as lf:
+            fcntl.flock(lf.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lf.fileno(), fcntl.LOCK_UN)
+
+
+def _write_atomic(path: Path, state: Dict[str, Any]) -> None:
+    fd, tmp = tempfile.mkstemp(prefix=path.name + ".", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _merge_rooms(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
+    """Merge room cursors from ``src`` into ``dst``; the larger event id wins."""
+
+    rooms = dst.setdefault("rooms", {})
+    for key, entry in (src.get("rooms") or {}).items():
+        if not isinstance(entry, dict):
+            continue
+        cur = rooms.setdefault(key, {})
+        for k, v in entry.items():
+            if k != "last_event_id":
+                cur.setdefault(k, v)
+        eid = get_last_event_id(src, key)
+        if eid > get_last_event_id(dst, key):
+            cur["last_event_id"] = eid
+
+
+def _merge_sessions(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
+    """Take profile session tokens from ``src`` (the on-disk copy).
+
+    令牌只经 save_session_token/drop_session_token 在文件锁内读改写，磁盘版本
+    为准；内存里较早加载的 state 不应复活已作废的令牌或抹掉新签发的令牌。
+    """
+
+    profiles = dst.setdefault("profiles", {})
+    for prof in profiles.values():
+        if isinstance(prof, dict):
+            prof.pop("session", None)
+    for key, prof in (src.get("profiles") or {}).items():
+        if isinstance(prof, dict) and isinstance(prof.get("session"), dict):
+            cur = profiles.setdefault(key, {})
+            if isinstance(cur, dict):
+                cur["session"] = dict(prof["session"])
+
+
 def save_state(state: Dict[str, Any]) -> None:
+    """Write state.json atomically, merging room cursors with what is on disk.
+
+    多个 CLI 进程（如并行的 space join/send）各持一份内存 state；写入前在文件锁内
+    读取磁盘版本，房间游标取较大值，避免后写者回退或抹掉别人的游标。
+    """
+
     _ensure_dirs()
     try:
-        STATE_PATH.write_text(json.dumps(state, ensure_ascii=False, indent=2))
+        with _state_lock(STATE_PATH):
+            on_disk = _read_state(STATE_PATH)
+            merged = dict(state)
+            merged["rooms"] = {
+                k: dict(v) if isinstance(v, dict) else v
+                for k, v in (state.get("rooms") or {}).items()
+            }
+            merged["profiles"] = {
+                k: dict(v) if isinstance(v, dict) else v
+                for k, v in (state.get("profiles") or {}).items()
+            }
+            _merge_rooms(merged, on_disk)
+            _merge_sessions(merged, on_disk)
+            _write_atomic(STATE_PATH, merged)
     except Exception:
         pass
 
@@ -50,3 +154,172 @@ def set_last_event_id(state: Dict[str, Any], key: str, event_id: int) -> None:
     entry = rooms.setdefault(key, {})
     if int(entry.get("last_event_id", 0)) < int(event_id):
         entry["last_event_id"] = int(event_id)
+
+
+def profile_key(host: str, port: int, user: str) -> str:
+    return f"{host}:{port}:{user}"
+
+
+def get_session_token(host: str, port: int, user: str) -> Optional[str]:
+    """Return the cached, unexpired session token for (host, port, user)."""
+
+    try:
+        prof = _read_state(STATE_PATH)["profiles"].get(profile_key(host, port, user))
+        sess = prof.get("session") if isinstance(prof, dict) else None
+        if not isinstance(sess, dict):
+            return None
+        token = sess.get("token")
+        if not isinstance(token, str) or not token:
+            return None
+        # 留出余量：临近过期的令牌大概率在 RESUME 前失效，直接走 LOGIN
+        if float(sess.get("expires", 0)) <= time.time() + 5:
+            return None
+        return token
+    except Exception:
+        return None
+
+
+def _update_session(host: str, port: int, user: str, sess: Optional[dict]) -> None:
+    _ensure_dirs()
+    try:
+        with _state_lock(STATE_PATH):
+            on_disk = _read_state(STATE_PATH)
+            key = profile_key(host, port, user)
+            prof = on_disk["profiles"].setdefault(key, {})
+            if not isinstance(prof, dict):
+                prof = on_disk["profiles"][key] = {}
+            if sess is None:
+                if prof.pop("session", None) is None:
+                    return
+            else:
+                prof["session"] = sess
+            _write_atomic(STATE_PATH, on_disk)
+    except Exception:
+        pass
+
+
+def save_session_token(host: str, port: int, user: str, token: str, ttl: float) -> None:
+    """Cache a session token issued by LOGIN (``OK|WELCOME|token|ttl``)."""
+
+    _update_session(
+        host, port, user, {"token": token, "expires": time.time() + float(ttl)}
+    )
+
+
+def drop_session_token(host: str, port: int, user: str) -> None:
+    """Forget a token the server rejected (expired, revoked, server restart)."""
+
+    _update_session(host, port, user, None)
+
+
+class CursorStore:
+    """Batched, debounced persistence of room resume cursors.
+
+    ``set()`` 只更新内存；满足以下任一条件时才写盘（文件锁 + 原子替换 + 游标取大合并）：
+
+    - 累计 ``flush_every`` 次更新
+    - 距上次写盘超过 ``flush_interval`` 秒（后台线程保证空闲时也会落盘）
+    - ``flush()`` / ``close()``（进程退出时经 atexit 兜底）
+
+    Args:
+        state (dict | None): 复用已加载的 state；None 时从磁盘加载
+        flush_interval (float): 写盘最小间隔秒数；<=0 表示每次 set 都写
+        flush_every (int): 累计多少次更新强制写盘
+    """
+
+    def __init__(
+        self,
+        state: Optional[Dict[str, Any]] = None,
+        *,
+        flush_interval: float = 1.0,
+        flush_every: int = 500,
+    ):
+        self.state = load_state() if state is None else state
+        self.flush_interval = float(flush_interval)
+        self.flush_every = max(1, int(flush_every))
+        self.flushes = 0
+        self._pending: Dict[str, int] = {}
+        self._updates = 0
+        self._last_flush = time.monotonic()
+        self._mu = threading.Lock()
+        self._stop = threading.Event()
+        self._timer: Optional[threading.Thread] = None
+        if self.flush_interval > 0:
+            self._timer = threading.Thread(
+                target=self._flush_loop, name="drlms-cursor-flush", daemon=True
+            )
+            self._timer.start()
+        atexit.register(self.close)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def get(self, key: str) -> int:
+        return get_last_event_id(self.state, key)
+
+    def set(self, key: str, event_id: int) -> None:
+        """Advance the cursor for ``key``; never moves backwards."""
+
+        with self._mu:
+            if int(event_id) <= get_last_event_id(self.state, key):
+                return
+            set_last_event_id(self.state, key, event_id)
+            self._pending[key] = int(event_id)
+            self._updates += 1
+            due = (
+                self._updates >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+        if due:
+            self.flush()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            if self._pending:
+                self.flush()
+
+    def flush(self) -> bool:
+        """Persist pending cursors; returns True when the file was written."""
+
+        with self._mu:
+            if not self._pending:
+                return False
+            pending = self._pending
+            self._pending = {}
+            self._updates = 0
+            self._last_flush = time.monotonic()
+        _ensure_dirs()
+        try:
+            with _state_lock(STATE_PATH):
+                on_disk = _read_state(STATE_PATH)
+                for key, eid in pending.items():
+                    set_last_event_id(on_disk, key, eid)
+                _write_atomic(STATE_PATH, on_disk)
+        except Exception:
+            # 写盘失败：放回待写队列，下次再试
+            with self._mu:
+                for key, eid in pending.items():
+                    if eid > self._pending.get(key, 0):
+                        self._pending[key] = eid
+            return False
+        with self._mu:
+            # 顺带吸收其他进程推进的游标
+            _merge_rooms(self.state, on_disk)
+            self.flushes += 1
+        return True
+
+    def close(self) -> None:
+        atexit.unregister(self.close)
+        self._stop.set()
+        timer = self._timer
+        if timer is not None and timer is not threading.current_thread():
+            timer.join()
+        self._timer = None
+        self.flush()
+
+    def __enter__(self) -> "CursorStore":
+        return self
+
+    def __exit__(self, *_exc) -> None:
+        self.close()
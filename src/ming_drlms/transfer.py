@@ -0,0 +1,422 @@
+"""
+---------------------------------------------------------------
+File name:                  transfer.py
+Author:                     Ignorant-lu
+Date created:               2026/10/18
+Description:                基于缓冲协议层的同步 LIST/UPLOAD/DOWNLOAD：固定大小缓冲流式收发、
+                            增量 SHA-256，上传优先走 socket.sendfile 零拷贝。
+----------------------------------------------------------------
+
+Changed history:
+                            2026/10/18: 初始创建;
+----
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple, TypeVar, Union
+
+from .protocol import ProtocolError, decode_line
+
+
+CHUNK_SIZE = 256 * 1024
+# sendfile 每段的字节数：足够大以摊薄系统调用，又足够小以刷新进度
+SENDFILE_SLICE = 4 * 1024 * 1024
+
+ProgressFn = Callable[[int], None]
+RetryFn = Callable[[int, BaseException, float], None]
+T = TypeVar("T")
+
+# 可通过重连 + OFFSET 续传恢复的服务器错误码（ERR|SIZE|too large 等为永久拒绝，
+# 不重试；上传中途断流由服务器报 ERR|SHORT）
+RETRY_CODES = frozenset({"BUSY", "OFFSET", "SHORT"})
+
+
+def file_sha256(
+    path: Union[str, Path], chunk_size: int = 1024 * 1024
+) -> Tuple[int, str]:
+    """Return (size, sha256hex) of a local file, reading in fixed-size chunks."""
+
+    h = hashlib.sha256()
+    size = 0
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            h.update(view[:n])
+            size += n
+    view.release()
+    return size, h.hexdigest()
+
+
+def _line(conn: Any) -> str:
+    return decode_line(conn.readline())
+
+
+def list_files(conn: Any) -> List[str]:
+    """LIST → BEGIN ... END; returns the file names between the markers."""
+
+    conn.sendall(b"LIST\n")
+    names: List[str] = []
+    begun = False
+    while True:
+        line = _line(conn)
+        if line == "BEGIN":
+            begun = True
+            continue
+        if line == "END":
+            return names
+        if line.startswith("ERR|") and not begun:
+            raise ProtocolError(line)
+        if not line and getattr(conn, "at_eof", False):
+            raise ConnectionError("connection closed during LIST")
+        if line:
+            names.append(line)
+
+
+def stat_file(conn: Any, name: str) -> Optional[Tuple[int, str]]:
+    """STAT|name → ``OK|STAT|name|size|sha``; returns None when the file is absent.
+
+    Raises:
+        ProtocolError: 其他 ERR 应答（如旧服务器不支持 STAT 时的 FORMAT）
+    """
+
+    conn.sendall(f"STAT|{name}\n".encode())
+    resp = _line(conn)
+    if resp.startswith("OK|STAT|"):
+        parts = resp.split("|")
+        try:
+            return int(parts[-2]), parts[-1].lower()
+        except (IndexError, ValueError):
+            raise ProtocolError(resp, f"bad STAT reply: {resp!r}")
+    if resp.startswith("ERR|NOTFOUND"):
+        return None
+    raise ProtocolError(resp, f"STAT: {resp or 'EOF'}")
+
+
+def _send_body(
+    conn: Any,
+    path: Path,
+    size: int,
+    progress: Optional[ProgressFn],
+    chunk_size: int,
+    use_sendfile: bool,
+    offset: int = 0,
+) -> None:
+    sock = getattr(conn, "sock", conn)
+    with open(path, "rb") as f:
+        sent = offset
+        if progress is not None and offset:
+            progress(sent)
+        if use_sendfile and hasattr(sock, "sendfile") and hasattr(sock, "fileno"):
+            try:
+                while sent < size:
+                    n = sock.sendfile(f, sent, min(SENDFILE_SLICE, size - sent))
+                    if not n:
+                        break
+                    sent += n
+                    if progress is not None:
+                        progress(sent)
+                if sent >= size:
+                    return
+            except (OSError, ValueError, AttributeError):
+                # 非常规 socket（如测试替身、TLS 包装）：退回到缓冲循环，从 sent 处续发
+                pass
+        f.seek(sent)
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        try:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                conn.sendall(view[:n])
+                sent += n
+                if progress is not None:
+                    progress(sent)
+        finally:
+            view.release()
+
+
+def query_offset(conn: Any, sha: str, size: int) -> int:
+    """OFFSET|sha|size → bytes the server already holds for this content.
+
+    旧服务器不认识 OFFSET（``ERR|FORMAT``）时返回 0，即整文件上传。
+
+    Raises:
+        ProtocolError: ``ERR|BUSY``（上一次连接仍占用该部分文件）等
+    """
+
+    conn.sendall(f"OFFSET|{sha}|{size}\n".encode())
+    resp = _line(conn)
+    if resp.startswith("OK|OFFSET|"):
+        try:
+            return max(0, min(int(resp.rsplit("|", 1)[1]), size))
+        except ValueError:
+            raise ProtocolError(resp, f"bad OFFSET reply: {resp!r}")
+    err = ProtocolError(resp, f"OFFSET: {resp or 'EOF'}")
+    if err.code == "FORMAT":
+        return 0
+    raise err
+
+
+def _send_file(
+    conn: Any,
+    header: str,
+    path: Path,
+    size: int,
+    sha: str,
+    *,
+    resume: bool,
+    progress: Optional[ProgressFn],
+    chunk_size: int,
+    use_sendfile: bool,
+) -> str:
+    offset = query_offset(conn, sha, size) if resume and size else 0
+    cmd = f"{header}|{offset}" if offset else header
+    conn.sendall(f"{cmd}\n".encode())
+    ready = _line(conn)
+    if ready != "READY":
+        raise ProtocolError(ready, f"server: {ready or 'EOF'}")
+    _send_body(conn, path, size, progress, chunk_size, use_sendfile, offset)
+    resp = _line(conn)
+    if not resp.startswith("OK|"):
+        raise ProtocolError(resp, f"server: {resp or 'EOF'}")
+    return resp
+
+
+def upload_file(
+    conn: Any,
+    path: Union[str, Path],
+    *,
+    name: Optional[str] = None,
+    progress: Optional[ProgressFn] = None,
+    chunk_size: int = CHUNK_SIZE,
+    use_sendfile: bool = True,
+    digest: Optional[Tuple[int, str]] = None,
+    resume: bool = False,
+) -> str:
+    """UPLOAD|name|size|sha[|offset] → READY → bytes → OK|<sha>.
+
+    Args:
+        conn: 已登录的 BufferedConnection
+        path (Path): 本地文件
+        name (str | None): 服务器端文件名，默认取 basename
+        progress: 已发送字节数回调（续传时从 offset 开始）
+        chunk_size (int): 缓冲循环的块大小
+        use_sendfile (bool): 允许使用 socket.sendfile 零拷贝发送
+        digest (tuple | None): 预先算好的 (size, sha)，避免重复读文件
+        resume (bool): 先用 OFFSET 查询服务器已收到的字节数，只发送剩余部分
+
+    Returns:
+        str: 服务器确认的 sha256hex
+
+    Raises:
+        ProtocolError: 服务器拒绝或校验失败
+    """
+
+    p = Path(path)
+    size, sha = digest if digest is not None else file_sha256(p)
+    resp = _send_file(
+        conn,
+        f"UPLOAD|{name or p.name}|{size}|{sha}",
+        p,
+        size,
+        sha,
+        resume=resume,
+        progress=progress,
+        chunk_size=chunk_size,
+        use_sendfile=use_sendfile,
+    )
+    return resp.split("|", 1)[1]
+
+
+def publish_file(
+    conn: Any,
+    room: str,
+    path: Union[str, Path],
+    *,
+    progress: Optional[ProgressFn] = None,
+    chunk_size: int = CHUNK_SIZE,
+    use_sendfile: bool = True,
+    digest: Optional[Tuple[int, str]] = None,
+    resume: bool = False,
+) -> int:
+    """PUBF|room|name|size|sha[|offset] → READY → bytes → OK|PUBF|<event_id>.
+
+    参数同 ``upload_file``；返回房间事件 id。
+    """
+
+    p = Path(path)
+    size, sha = digest if digest is not None else file_sha256(p)
+    resp = _send_file(
+        conn,
+        f"PUBF|{room}|{p.name}|{size}|{sha}",
+        p,
+        size,
+        sha,
+        resume=resume,
+        progress=progress,
+        chunk_size=chunk_size,
+        use_sendfile=use_sendfile,
+    )
+    try:
+        return int(resp.rsplit("|", 1)[1])
+    except ValueError:
+        raise ProtocolError(resp, f"bad PUBF reply: {resp!r}")
+
+
+def retrying(
+    attempt: Callable[[], T],
+    *,
+    retries: int = 3,
+    backoff: float = 1.0,
+    on_retry: Optional[RetryFn] = None,
+    sleep: Callable[[float], None] = time.sleep,
+) -> T:
+    """Run ``attempt`` until it succeeds, retrying interrupted transfers.
+
+    连接类错误（OSError/ConnectionError）与 ``RETRY_CODES`` 中的服务器错误会在
+    指数退避后重试，最多 ``retries`` 次；``attempt`` 每次应重新建连并以
+    ``resume=True`` 续传。其他错误（如 AUTH、CHECKSUM、EXISTS）直接抛出。
+
+    Args:
+        attempt: 执行一次完整传输的函数
+        retries (int): 最大重试次数
+        backoff (float): 首次重试前的等待秒数，之后每次翻倍
+        on_retry: 重试前回调 (第几次重试, 异常, 等待秒数)
+        sleep: 等待函数（测试可替换）
+    """
+
+    n = 0
+    while True:
+        try:
+            return attempt()
+        except ProtocolError as e:
+            if e.code not in RETRY_CODES or n >= retries:
+                raise
+            err: BaseException = e
+        except OSError as e:
+            if n >= retries:
+                raise
+            err = e
+        n += 1
+        delay = backoff * (2 ** (n - 1))
+        if on_retry is not None:
+            on_retry(n, err, delay)
+        sleep(delay)
+
+
+def receive_framed(
+    conn: Any,
+    cmd: str,
+    out: Union[str, Path],
+    *,
+    expect_sha: Optional[str] = None,
+    progress: Optional[ProgressFn] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Tuple[int, str]:
+    """Send ``cmd`` and receive a ``SIZE|n|sha`` / ``READY`` / n-bytes reply.
+
+    数据写入 ``<out>.part``，边收边算 SHA-256；与服务器 sha（及 ``expect_sha``）
+    一致时才原子改名为 ``out``，否则删除临时文件并抛出 CHECKSUM 错误。
+
+    Returns:
+        tuple[int, str]: (size, sha256hex)
+
+    Raises:
+        ProtocolError: 服务器报错或校验失败（code == "CHECKSUM"）
+        ConnectionError: 传输中途断开
+    """
+
+    conn.sendall((cmd + "\n").encode())
+    resp = _line(conn)
+    if not resp.startswith("SIZE|"):
+        raise ProtocolError(resp, f"{cmd.split('|', 1)[0]}: {resp or 'EOF'}")
+    parts = resp.split("|")
+    try:
+        size = int(parts[1])
+        want = parts[2].lower()
+    except (IndexError, ValueError):
+        raise ProtocolError(resp, f"bad SIZE header: {resp!r}")
+    ready = _line(conn)
+    if ready != "READY":
+        raise ProtocolError(ready, f"expected READY, got {ready!r}")
+    out_path = Path(out)
+    part = out_path.with_name(out_path.name + ".part")
+    h = hashlib.sha256()
+    remain = size
+    buf = bytearray(chunk_size)
+    view = memoryview(buf)
+    try:
+        with open(part, "wb", buffering=0) as f:
+            while remain > 0:
+                want_n = min(chunk_size, remain)
+                n = _recv_into(conn, view, want_n)
+                if not n:
+                    raise ConnectionError("short read during transfer")
+                chunk = view[:n]
+                f.write(chunk)
+                h.update(chunk)
+                remain -= n
+                if progress is not None:
+                    progress(size - remain)
+        got = h.hexdigest()
+        if got != want or (expect_sha and got != expect_sha.lower()):
+            raise ProtocolError("ERR|CHECKSUM|mismatch")
+    except BaseException:
+        try:
+            part.unlink()
+        except OSError:
+            pass
+        raise
+    finally:
+        view.release()
+    os.replace(part, out_path)
+    return size, got
+
+
+def _recv_into(conn: Any, view: memoryview, nbytes: int) -> int:
+    read_into = getattr(conn, "read_into", None)
+    if read_into is not None:
+        return read_into(view, nbytes)
+    data = conn.readexactly(nbytes)
+    view[: len(data)] = data
+    return len(data)
+
+
+def download_file(
+    conn: Any,
+    name: str,
+    out: Union[str, Path],
+    *,
+    progress: Optional[ProgressFn] = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> Tuple[int, str]:
+    """DOWNLOAD|name → SIZE|n|sha → READY → n bytes, verified into ``out``."""
+
+    return receive_framed(
+        conn, f"DOWNLOAD|{name}", out, progress=progress, chunk_size=chunk_size
+    )
+
+
+__all__ = [
+    "CHUNK_SIZE",
+    "file_sha256",
+    "list_files",
+    "stat_file",
+    "upload_file",
+    "publish_file",
+    "query_offset",
+    "retrying",
+    "RETRY_CODES",
+    "download_file",
+    "receive_framed",
+]
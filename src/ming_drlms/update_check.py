@@ -6,10 +6,6 @@ import sys
 import time
 from pathlib import Path
 
-import requests
-from packaging import version as pkg_version
-from rich import print as rprint
-
 
 def _cache_dir() -> Path:
     xdg = os.environ.get("XDG_CACHE_HOME")
@@ -64,6 +60,11 @@ def maybe_notify_new_version(
     if now - last_ts < throttle_seconds:
         return
     try:
+        # 绝大多数调用在上面的节流处返回，网络相关依赖只在真正检查时导入
+        import requests
+        from packaging import version as pkg_version
+        from rich import print as rprint
+
         resp = requests.get("https://pypi.org/pypi/ming-drlms/json", timeout=2.0)
         if resp.status_code != 200:
             return
@@ -9,18 +9,28 @@ Description:                用户文件(users.txt)的解析、校验、Argon2id
 
 Changed history:
                             2025/09/22: 初始创建;
+                            2026/10/18: 批量导入：CSV/JSONL 读取、进程池并行
+                                        Argon2id 哈希、一次原子写入;
+                            2026/10/18: UserStore：dict 索引、按文件签名缓存解析、
+                                        批量修改一次写回；解析快速路径;
+                            2026/10/18: 旧格式迁移：报告、旧哈希校验、参数解析;
+                            2026/10/18: argon2 与进程池改为按需导入，加快 CLI 启动;
 ----
 """
 
 from __future__ import annotations
 
+import csv
+import hashlib
+import hmac
+import json
 import os
 import re
+from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Tuple
-
-from argon2 import low_level as argon2_ll
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 
 # 用户记录的内部表示： (username, kind, encoded)
@@ -47,6 +57,10 @@ class Argon2Params:
     salt_len: int = 16
 
 
+# 批量导入时 Argon2 工作进程的默认内存预算（MiB）
+DEFAULT_IMPORT_MEM_MB = 1024
+
+
 def users_file_path(data_dir: Path) -> Path:
     """Return users.txt path under given data_dir.
 
@@ -98,43 +112,42 @@ def parse_users(users_path: Path) -> List[Tuple[str, str, str]]:
         return records
     try:
         for raw in users_path.read_text(errors="ignore").splitlines():
-            # Trim whitespace and tolerate CRLF; keep internal spaces for robust regex
-            line = raw.strip().rstrip("\r")
-            if not line or line.startswith("#"):
-                continue
-            # 优先匹配新格式 user::<argon2id>
-            m_new = ARGON2_LINE_RE.match(line)
-            if m_new:
-                user = m_new.group("user").strip()
-                enc = m_new.group("enc").strip()
-                records.append((user, "argon2", enc))
-                continue
-            # 尝试旧格式 user:salt:shahex（严格判定）
-            # Allow optional internal spaces around ':' for legacy lines
-            # Normalize by removing spaces around ':' before matching
-            normalized = re.sub(r"\s*:\s*", ":", line)
-            m_old = LEGACY_LINE_RE.match(normalized)
-            if m_old:
-                user = m_old.group("user").strip()
-                salt = m_old.group("salt").strip()
-                shahex = m_old.group("hash").strip()
-                records.append((user, "legacy", f"{salt}:{shahex}"))
-                continue
-            # 兜底：unknown（尽量解析出 username:rest 的基本形态）
-            colon_idx = line.find(":")
-            if colon_idx != -1:
-                user = line[:colon_idx].strip()
-                right = line[colon_idx + 1 :].strip()
-            else:
-                user = line
-                right = ""
-            records.append((user, "unknown", right))
+            rec = _parse_line(raw)
+            if rec is not None:
+                records.append(rec)
     except Exception:
         # 解析错误时尽量返回已解析部分
         return records
     return records
 
 
+def _parse_line(raw: str) -> Optional[Tuple[str, str, str]]:
+    """Parse one users.txt line; None for blank and comment lines."""
+
+    # Trim whitespace and tolerate CRLF; keep internal spaces for robust regex
+    line = raw.strip().rstrip("\r")
+    if not line or line.startswith("#"):
+        return None
+    # 快速路径：user::$argon2id$...（第一个冒号即 "::"），与 ARGON2_LINE_RE 等价
+    colon_idx = line.find(":")
+    if colon_idx > 0 and line.startswith("::$argon2id$", colon_idx):
+        return (line[:colon_idx].strip(), "argon2", line[colon_idx + 2 :].strip())
+    # 尝试旧格式 user:salt:shahex（严格判定）；
+    # 直接匹配失败（如冒号两侧有空白）时才做 re.sub 归一化后再匹配
+    m_old = LEGACY_LINE_RE.match(line)
+    if m_old is None:
+        m_old = LEGACY_LINE_RE.match(re.sub(r"\s*:\s*", ":", line))
+    if m_old:
+        user = m_old.group("user").strip()
+        salt = m_old.group("salt").strip()
+        shahex = m_old.group("hash").strip()
+        return (user, "legacy", f"{salt}:{shahex}")
+    # 兜底：unknown（尽量解析出 username:rest 的基本形态）
+    if colon_idx != -1:
+        return (line[:colon_idx].strip(), "unknown", line[colon_idx + 1 :].strip())
+    return (line, "unknown", "")
+
+
 def read_auth_params_from_env() -> Dict[str, int]:
     """Read Argon2 parameters from environment with sane defaults.
 
@@ -188,6 +201,9 @@ def generate_argon2id_hash(
         str: 形如 "$argon2id$..." 的编码串
     """
 
+    # argon2 与进程池按需导入：`user list` 等只读命令无需为其付出启动开销
+    from argon2 import low_level as argon2_ll
+
     salt = os.urandom(int(salt_len))
     encoded = argon2_ll.hash_secret(
         password.encode("utf-8"),
@@ -327,3 +343,365 @@ def del_user(
     new_records = list(records)
     del new_records[idx]
     return new_records
+
+
+class UserStore:
+    """Indexed in-memory view of users.txt with batched atomic writes.
+
+    - 记录按文件顺序保存，另有 username → 位置 的 dict 索引（重名时第一条生效，
+      与服务器一致），查找/增/改/删均为 O(1)；删除先留空位，写回时压缩
+    - 解析结果按文件签名（inode/大小/mtime）缓存，文件未变化时 refresh() 不再解析
+    - 修改只作用于内存，save() 一次 write_users_atomic 写回；batch() 内的多次修改
+      在退出时合并为一次写入，出现异常则不写
+
+    Example:
+        store = UserStore(users_file_path(data_dir))
+        with store.batch():
+            store.add("alice", enc1)
+            store.delete("bob")
+    """
+
+    # 进程内解析缓存：路径 → (签名, 记录)；记录为只读元组，多个实例可共享
+    _cache: Dict[
+        str, Tuple[Tuple[int, int, int], Tuple[Tuple[str, str, str], ...]]
+    ] = {}
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._sig: Optional[Tuple[int, int, int]] = None
+        self._records: List[Optional[Tuple[str, str, str]]] = []
+        self._index: Dict[str, int] = {}
+        self._holes = 0
+        self._dirty = False
+        self._batch = 0
+        self.refresh()
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def refresh(self) -> None:
+        """Reload from disk if the file changed; discards unsaved edits."""
+
+        sig = self._stat()
+        if sig is not None and sig == self._sig and not self._dirty:
+            return
+        key = str(self.path)
+        cached = UserStore._cache.get(key)
+        if sig is None:
+            records: Tuple[Tuple[str, str, str], ...] = ()
+        elif cached is not None and cached[0] == sig:
+            records = cached[1]
+        else:
+            records = tuple(parse_users(self.path))
+            UserStore._cache[key] = (sig, records)
+        self._sig = sig
+        self._records = list(records)
+        self._index = {}
+        for i, rec in enumerate(self._records):
+            self._index.setdefault(rec[0], i)  # type: ignore[index]
+        self._holes = 0
+        self._dirty = False
+
+    def records(self) -> List[Tuple[str, str, str]]:
+        """Current records in file order (including duplicates)."""
+
+        return [r for r in self._records if r is not None]
+
+    def __len__(self) -> int:
+        return len(self._records) - self._holes
+
+    def __contains__(self, username: object) -> bool:
+        return username in self._index
+
+    def get(self, username: str) -> Optional[Tuple[str, str, str]]:
+        idx = self._index.get(username)
+        return None if idx is None else self._records[idx]
+
+    def _changed(self) -> None:
+        self._dirty = True
+        if self._batch == 0:
+            self.save()
+
+    def add(self, username: str, encoded: str) -> None:
+        """Add a new argon2 user. Raises KeyError if exists."""
+
+        validate_username(username)
+        if username in self._index:
+            raise KeyError(f"user exists: {username}")
+        self._index[username] = len(self._records)
+        self._records.append((username, "argon2", encoded))
+        self._changed()
+
+    def set_password(self, username: str, encoded: str) -> None:
+        """Replace the password of an existing user. Raises KeyError if missing."""
+
+        idx = self._index.get(username)
+        if idx is None:
+            raise KeyError(f"user not found: {username}")
+        self._records[idx] = (username, "argon2", encoded)
+        self._changed()
+
+    def delete(self, username: str) -> None:
+        """Delete a user (first entry if duplicated). Raises KeyError if missing."""
+
+        idx = self._index.pop(username, None)
+        if idx is None:
+            raise KeyError(f"user not found: {username}")
+        self._records[idx] = None
+        self._holes += 1
+        # 重名时后一条随之生效（罕见，线性查找即可）
+        for j in range(idx + 1, len(self._records)):
+            rec = self._records[j]
+            if rec is not None and rec[0] == username:
+                self._index[username] = j
+                break
+        self._changed()
+
+    def import_encoded(
+        self, encoded: Iterable[Tuple[str, str]], existing: str = "error"
+    ) -> Tuple[int, int, int]:
+        """Add or update many (username, encoded) pairs inside one batch.
+
+        Args:
+            encoded (Iterable[Tuple[str, str]]): (用户名, Argon2id 编码串).
+            existing (str): 已存在用户的处理方式：``error`` | ``skip`` | ``update``.
+
+        Returns:
+            tuple: (新增数, 更新数, 跳过数).
+
+        Raises:
+            KeyError: existing 为 ``error`` 且用户已存在时抛出（不写入任何记录）.
+        """
+
+        added = updated = skipped = 0
+        with self.batch():
+            for username, enc in encoded:
+                if username not in self._index:
+                    self.add(username, enc)
+                    added += 1
+                elif existing == "update":
+                    self.set_password(username, enc)
+                    updated += 1
+                elif existing == "skip":
+                    skipped += 1
+                else:
+                    raise KeyError(f"user exists: {username}")
+        return added, updated, skipped
+
+    @contextmanager
+    def batch(self) -> Iterator["UserStore"]:
+        """Group mutations into one atomic write; nothing is written on error."""
+
+        self._batch += 1
+        try:
+            yield self
+        except BaseException:
+            self._batch -= 1
+            if self._batch == 0 and self._dirty:
+                self.refresh()
+            raise
+        self._batch -= 1
+        if self._batch == 0 and self._dirty:
+            self.save()
+
+    def save(self) -> None:
+        """Write pending changes with write_users_atomic (no-op when clean)."""
+
+        if not self._dirty:
+            return
+        records = self.records()
+        write_users_atomic(self.path, records)
+        self._records = list(records)
+        self._index = {}
+        for i, rec in enumerate(records):
+            self._index.setdefault(rec[0], i)
+        self._holes = 0
+        self._dirty = False
+        self._sig = self._stat()
+        if self._sig is not None:
+            UserStore._cache[str(self.path)] = (self._sig, tuple(records))
+
+
+def read_import_file(path: Path, fmt: str = "auto") -> List[Tuple[str, str]]:
+    """Read (username, password) pairs from a CSV or JSONL file.
+
+    - csv：首行若含 ``username``/``password`` 列名则按列名取值，否则取前两列
+    - jsonl：每行一个对象 ``{"username": ..., "password": ...}``
+    - auto：``.jsonl`` / ``.json`` 后缀按 JSONL，其余按 CSV
+
+    空行与以 # 开头的行被忽略。
+
+    Args:
+        path (Path): 导入文件
+        fmt (str): ``auto`` | ``csv`` | ``jsonl``
+
+    Returns:
+        list[tuple[str,str]]: (username, password)
+
+    Raises:
+        ValueError: 格式错误时抛出（带行号）
+    """
+
+    path = Path(path)
+    if fmt == "auto":
+        fmt = "jsonl" if path.suffix.lower() in (".jsonl", ".json") else "csv"
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"unknown import format: {fmt}")
+    items: List[Tuple[str, str]] = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "jsonl":
+            for lineno, raw in enumerate(f, 1):
+                line = raw.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    obj = json.loads(line)
+                    items.append((str(obj["username"]), str(obj["password"])))
+                except (ValueError, KeyError, TypeError):
+                    raise ValueError(f"line {lineno}: expected username/password")
+            return items
+        rows = [
+            (n, r)
+            for n, r in enumerate(csv.reader(f), 1)
+            if r and r[0].strip() and not r[0].lstrip().startswith("#")
+        ]
+    cols = (0, 1)
+    if rows:
+        header = [c.strip().lower() for c in rows[0][1]]
+        if "username" in header and "password" in header:
+            cols = (header.index("username"), header.index("password"))
+            rows = rows[1:]
+    for lineno, row in rows:
+        if len(row) <= max(cols):
+            raise ValueError(f"line {lineno}: expected username,password")
+        items.append((row[cols[0]].strip(), row[cols[1]]))
+    return items
+
+
+def import_workers(
+    params: Dict[str, int],
+    jobs: Optional[int] = None,
+    mem_budget_mb: int = DEFAULT_IMPORT_MEM_MB,
+) -> int:
+    """Number of hashing processes that fit the CPU count and memory budget.
+
+    每次 Argon2id 计算占用 ``memory_cost`` KiB（由 ``DRLMS_ARGON2_M_COST`` 决定），
+    并发进程数不超过 ``mem_budget_mb`` 能容纳的份数，且至少为 1。
+
+    Args:
+        params (dict): read_auth_params_from_env() 的返回值
+        jobs (int|None): 期望进程数，None 为 CPU 数
+        mem_budget_mb (int): 哈希进程的总内存预算（MiB）
+
+    Returns:
+        int: 进程数
+    """
+
+    want = jobs if jobs and jobs > 0 else (os.cpu_count() or 1)
+    per_kib = max(1, int(params["memory_cost"]))
+    fit = (int(mem_budget_mb) * 1024) // per_kib
+    return max(1, min(want, fit))
+
+
+def hash_passwords(
+    passwords: List[str], params: Dict[str, int], workers: int = 1
+) -> List[str]:
+    """Hash many passwords with Argon2id, in parallel processes when workers>1.
+
+    每个工作进程各自分配 Argon2 内存区，进程数应由 import_workers() 按内存预算
+    给出；结果顺序与输入一致。
+
+    Args:
+        passwords (list[str]): 明文密码
+        params (dict): Argon2 参数（generate_argon2id_hash 的关键字参数）
+        workers (int): 进程数
+
+    Returns:
+        list[str]: 编码串，与 passwords 一一对应
+    """
+
+    fn = partial(generate_argon2id_hash, **params)
+    if workers <= 1 or len(passwords) <= 1:
+        return [fn(p) for p in passwords]
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunk = max(1, len(passwords) // (workers * 8))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, passwords, chunksize=chunk))
+
+
+def verify_legacy(password: str, payload: str) -> bool:
+    """Check a password against a legacy ``salt:sha256hex(password+salt)`` payload.
+
+    Args:
+        password (str): 明文密码
+        payload (str): parse_users 中 legacy 记录的 encoded 部分
+
+    Returns:
+        bool: 是否匹配（与服务器相同，十六进制不区分大小写）
+    """
+
+    salt, _, shahex = payload.partition(":")
+    digest = hashlib.sha256((password + salt).encode("utf-8")).hexdigest()
+    return hmac.compare_digest(digest, shahex.lower())
+
+
+def argon2_params_of(encoded: str) -> Optional[Dict[str, int]]:
+    """Extract time_cost/memory_cost/parallelism from an Argon2id encoded string.
+
+    Returns:
+        dict|None: 无法解析时返回 None
+    """
+
+    m = re.match(r"^\$argon2id\$v=\d+\$m=(\d+),t=(\d+),p=(\d+)\$", encoded)
+    if not m:
+        return None
+    return {
+        "memory_cost": int(m.group(1)),
+        "time_cost": int(m.group(2)),
+        "parallelism": int(m.group(3)),
+    }
+
+
+def migration_report(
+    records: List[Tuple[str, str, str]], params: Dict[str, int]
+) -> Dict[str, object]:
+    """Summarize how far users.txt is from all-Argon2id with current parameters.
+
+    只统计每个用户名的第一条记录（服务器生效的那条）；``outdated`` 为 Argon2id
+    参数与当前 DRLMS_ARGON2_* 不一致的用户（仅提示，下次改密时更新）。
+
+    Args:
+        records (List[Tuple[str, str, str]]): parse_users 的结果.
+        params (Dict[str, int]): read_auth_params_from_env() 的返回值.
+
+    Returns:
+        dict: total/argon2/legacy/unknown/outdated 计数与 legacy_users、
+        duplicates 用户名列表.
+    """
+
+    seen: Dict[str, Tuple[str, str]] = {}
+    duplicates: List[str] = []
+    for user, kind, enc in records:
+        if user in seen:
+            duplicates.append(user)
+        else:
+            seen[user] = (kind, enc)
+    legacy = [u for u, (k, _e) in seen.items() if k == "legacy"]
+    want = {k: params[k] for k in ("memory_cost", "time_cost", "parallelism")}
+    outdated = [
+        u for u, (k, e) in seen.items() if k == "argon2" and argon2_params_of(e) != want
+    ]
+    return {
+        "total": len(seen),
+        "argon2": sum(1 for k, _e in seen.values() if k == "argon2"),
+        "legacy": len(legacy),
+        "unknown": sum(1 for k, _e in seen.values() if k == "unknown"),
+        "outdated": len(outdated),
+        "legacy_users": legacy,
+        "duplicates": sorted(set(duplicates)),
+    }
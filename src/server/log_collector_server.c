@@ -17,13 +17,24 @@
 #include <signal.h>
 #include "../libipc/shared_buffer.h"
 #include <openssl/sha.h>
+#include <openssl/hmac.h>
+#include <openssl/crypto.h>
 #include "rooms.h"
 #include <argon2.h>
 #include <fcntl.h>
+#include <sys/file.h>
+#include <sys/epoll.h>
+#include <sys/resource.h>
+#include <stdint.h>
 
 typedef struct {
     int client_fd;
     struct sockaddr_in addr;
+    char peer_ip[64];
+    int authenticated;
+    char username[64];
+    char inbuf[4096]; // 尚未处理完的输入（不完整的命令行）
+    size_t inlen;
 } client_ctx_t;
 
 static char g_data_dir[PATH_MAX] = "server_files";
@@ -35,9 +46,12 @@ static long long g_rate_down_bps = 0; // download throttle (server->client)
 static int g_max_conn = 128;
 static pthread_mutex_t g_conn_mu = PTHREAD_MUTEX_INITIALIZER;
 static int g_active_conn = 0;
+static int g_io_epoll = 0; // DRLMS_IO_MODE=epoll：事件循环 + 工作线程池
+static int g_epoll_fd = -1;
 static long long g_max_upload = 100LL * 1024 * 1024; // default 100MB
 static int g_auth_strict = 0; // 0: accept any if users empty; 1: require file
-static int g_rcv_timeout_sec = 319; // default recv/send timeout seconds
+static int g_rcv_timeout_sec = 319;     // default recv/send timeout seconds
+static long long g_partial_ttl = 86400; // 未完成上传的保留秒数
 static pthread_mutex_t g_users_file_mu =
     PTHREAD_MUTEX_INITIALIZER; // protect users.txt writes
 // TCP keepalive tuning (env-overridable)
@@ -52,16 +66,6 @@ static int g_tcp_keepintvl = 10; // interval between probes
 static int g_tcp_keepcnt = 3; // number of probes
 #endif
 
-// users.txt cache
-typedef struct {
-    char user[64];
-    char salt[64];
-    char hash_str[256]; // supports full Argon2 encoded string or legacy hex
-} user_cred_t;
-
-static user_cred_t g_users[256];
-static int g_users_count = 0;
-
 // --- Argon2 configuration ---
 static int g_argon2_t_cost = 2;     // iterations
 static int g_argon2_m_cost = 65536; // KiB (64 MiB)
@@ -90,7 +94,257 @@ static void argon2_load_params_from_env(void) {
 
 // Forward declaration to avoid implicit external declaration before static
 // definition
-static int load_users_file(void);
+static int users_table_reload(void);
+
+// --- Argon2 并发限流 ---
+// 每次 argon2id 计算占用 m_cost KiB 内存；同时进行的计算数限制在
+// g_argon2_slots 以内，登录突发时排队等待而不是把内存打满（0 表示不限）
+static int g_argon2_slots = 0;
+static int g_argon2_busy = 0;
+static pthread_mutex_t g_argon2_mu = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t g_argon2_cv = PTHREAD_COND_INITIALIZER;
+
+static void argon2_slot_acquire(void) {
+    if (g_argon2_slots <= 0)
+        return;
+    pthread_mutex_lock(&g_argon2_mu);
+    while (g_argon2_busy >= g_argon2_slots)
+        pthread_cond_wait(&g_argon2_cv, &g_argon2_mu);
+    g_argon2_busy++;
+    pthread_mutex_unlock(&g_argon2_mu);
+}
+
+static void argon2_slot_release(void) {
+    if (g_argon2_slots <= 0)
+        return;
+    pthread_mutex_lock(&g_argon2_mu);
+    g_argon2_busy--;
+    pthread_cond_signal(&g_argon2_cv);
+    pthread_mutex_unlock(&g_argon2_mu);
+}
+
+// --- users.txt 变更代数 ---
+// 每次 stat users.txt，inode/大小/mtime 任一变化即代数 +1。登录校验缓存与
+// 会话令牌记录签发时的代数，代数变了（改密码、删用户）即视为失效。
+static struct {
+    dev_t dev;
+    ino_t ino;
+    off_t size;
+    struct timespec mtime;
+} g_users_sig;
+static unsigned long long g_users_gen = 0;
+static pthread_mutex_t g_users_sig_mu = PTHREAD_MUTEX_INITIALIZER;
+
+static unsigned long long users_file_gen(void) {
+    char path[PATH_MAX];
+    struct stat st;
+    if (snprintf(path, sizeof path, "%s/%s", g_data_dir, "users.txt") >=
+            (int)sizeof path ||
+        stat(path, &st) != 0)
+        memset(&st, 0, sizeof st);
+    pthread_mutex_lock(&g_users_sig_mu);
+    if (st.st_dev != g_users_sig.dev || st.st_ino != g_users_sig.ino ||
+        st.st_size != g_users_sig.size ||
+        st.st_mtim.tv_sec != g_users_sig.mtime.tv_sec ||
+        st.st_mtim.tv_nsec != g_users_sig.mtime.tv_nsec) {
+        g_users_sig.dev = st.st_dev;
+        g_users_sig.ino = st.st_ino;
+        g_users_sig.size = st.st_size;
+        g_users_sig.mtime = st.st_mtim;
+        g_users_gen++;
+    }
+    unsigned long long gen = g_users_gen;
+    pthread_mutex_unlock(&g_users_sig_mu);
+    return gen;
+}
+
+// 组相联表（auth cache 与会话令牌共用）：每组 CRED_WAYS 路，满时替换最早
+// 过期的条目；条目带 users.txt 代数，代数不符即视为不存在
+#define CRED_WAYS 4
+
+typedef struct {
+    unsigned char key[32];
+    char user[64];          // 仅会话令牌使用
+    unsigned char bind[32]; // 仅会话令牌使用：HMAC(密钥, 口令)
+    time_t expires;         // 0: 空
+    unsigned long long gen; // 写入时的 users.txt 代数
+} cred_ent_t;
+
+typedef struct {
+    cred_ent_t *ents;
+    size_t sets;
+    int ttl; // seconds
+    pthread_mutex_t mu;
+} cred_table_t;
+
+static int generate_random_bytes(unsigned char *buf, size_t len);
+static void to_hex(const unsigned char *in, size_t len, char *out_hex,
+                   size_t out_sz);
+
+static int cred_table_init(cred_table_t *t, long long entries, int ttl) {
+    if (entries <= 0 || ttl <= 0)
+        return -1;
+    size_t sets = 1;
+    while (sets * CRED_WAYS < (size_t)entries && sets < ((size_t)1 << 24))
+        sets <<= 1;
+    t->ents = calloc(sets * CRED_WAYS, sizeof *t->ents);
+    if (!t->ents)
+        return -1;
+    t->sets = sets;
+    t->ttl = ttl;
+    return 0;
+}
+
+static cred_ent_t *cred_set(cred_table_t *t, const unsigned char key[32]) {
+    size_t set = 0;
+    memcpy(&set, key, sizeof set);
+    return t->ents + (set & (t->sets - 1)) * CRED_WAYS;
+}
+
+// 命中返回 1，user 非空时拷出条目中的用户名；bind 非空时还须与条目一致
+static int cred_lookup(cred_table_t *t, const unsigned char key[32],
+                       unsigned long long gen, const unsigned char *bind,
+                       char *user, size_t user_sz) {
+    cred_ent_t *ways = cred_set(t, key);
+    time_t now = time(NULL);
+    int hit = 0;
+    pthread_mutex_lock(&t->mu);
+    for (int w = 0; w < CRED_WAYS; ++w) {
+        if (ways[w].expires > now && ways[w].gen == gen &&
+            CRYPTO_memcmp(ways[w].key, key, 32) == 0 &&
+            (!bind || CRYPTO_memcmp(ways[w].bind, bind, 32) == 0)) {
+            if (user)
+                snprintf(user, user_sz, "%s", ways[w].user);
+            hit = 1;
+            break;
+        }
+    }
+    pthread_mutex_unlock(&t->mu);
+    return hit;
+}
+
+static void cred_insert(cred_table_t *t, const unsigned char key[32],
+                        const char *user, const unsigned char *bind,
+                        unsigned long long gen) {
+    cred_ent_t *ways = cred_set(t, key);
+    pthread_mutex_lock(&t->mu);
+    int victim = 0;
+    for (int w = 1; w < CRED_WAYS; ++w) {
+        if (ways[w].expires < ways[victim].expires)
+            victim = w;
+    }
+    memcpy(ways[victim].key, key, 32);
+    snprintf(ways[victim].user, sizeof ways[victim].user, "%s",
+             user ? user : "");
+    if (bind)
+        memcpy(ways[victim].bind, bind, 32);
+    else
+        memset(ways[victim].bind, 0, 32);
+    ways[victim].expires = time(NULL) + t->ttl;
+    ways[victim].gen = gen;
+    pthread_mutex_unlock(&t->mu);
+}
+
+// --- 登录校验缓存（DRLMS_AUTH_CACHE_SIZE > 0 时启用）---
+// 只缓存校验成功的结果。键为 HMAC-SHA256(进程随机密钥, user \0 password)，
+// 内存中不保留口令本身；条目有 TTL，users.txt 变化后失效。
+static cred_table_t g_auth_cache = {.mu = PTHREAD_MUTEX_INITIALIZER};
+static unsigned char g_auth_cache_secret[32];
+
+static void auth_cache_init(long long entries, int ttl) {
+    if (entries <= 0 || ttl <= 0)
+        return;
+    if (generate_random_bytes(g_auth_cache_secret,
+                              sizeof g_auth_cache_secret) != 0) {
+        fprintf(stderr, "[warn] auth cache disabled: no random key\n");
+        return;
+    }
+    (void)cred_table_init(&g_auth_cache, entries, ttl);
+}
+
+// 命中返回 1。未命中时 key/gen 供校验成功后 auth_cache_insert 使用
+static int auth_cache_lookup(const char *user, const char *password,
+                             unsigned char key[32], unsigned long long *gen) {
+    if (!g_auth_cache.ents)
+        return 0;
+    size_t ulen = strlen(user), plen = strlen(password);
+    unsigned char msg[64 + 1 + 1024];
+    if (ulen >= 64 || plen > 1024)
+        return 0;
+    memcpy(msg, user, ulen);
+    msg[ulen] = '\0';
+    memcpy(msg + ulen + 1, password, plen);
+    unsigned int klen = 0;
+    unsigned char *ok =
+        HMAC(EVP_sha256(), g_auth_cache_secret, sizeof g_auth_cache_secret, msg,
+             ulen + 1 + plen, key, &klen);
+    OPENSSL_cleanse(msg, sizeof msg);
+    if (!ok || klen != 32)
+        return 0;
+    *gen = users_file_gen();
+    return cred_lookup(&g_auth_cache, key, *gen, NULL, NULL, 0);
+}
+
+static void auth_cache_insert(const unsigned char key[32],
+                              unsigned long long gen) {
+    if (!g_auth_cache.ents)
+        return;
+    // 校验期间 users.txt 变了：结果基于旧文件，不入缓存
+    if (gen == users_file_gen())
+        cred_insert(&g_auth_cache, key, NULL, NULL, gen);
+}
+
+// --- 会话令牌（LOGIN 成功时签发，RESUME|token 免口令重连）---
+// 令牌为 32 字节随机数的十六进制；表中只存其 SHA-256，带 TTL，users.txt
+// 变化（改密码、删用户）后全部失效。条目另存 HMAC(进程密钥, 口令)：客户端
+// 发 RESUME|token|password 时口令须与签发时一致（一次 HMAC，不算 Argon2），
+// 避免“有令牌就不看口令”。DRLMS_SESSION_TTL=0 关闭签发。
+static cred_table_t g_sessions = {.mu = PTHREAD_MUTEX_INITIALIZER};
+static unsigned char g_session_secret[32];
+
+static void session_init(long long entries, int ttl) {
+    if (entries <= 0 || ttl <= 0)
+        return;
+    if (generate_random_bytes(g_session_secret, sizeof g_session_secret) != 0) {
+        fprintf(stderr, "[warn] session tokens disabled: no random key\n");
+        return;
+    }
+    (void)cred_table_init(&g_sessions, entries, ttl);
+}
+
+static void session_bind(const char *password, unsigned char bind[32]) {
+    unsigned int blen = 0;
+    HMAC(EVP_sha256(), g_session_secret, sizeof g_session_secret,
+         (const unsigned char *)password, strlen(password), bind, &blen);
+}
+
+// 签发令牌写入 out（65 字节），失败或未启用返回 -1
+static int session_issue(const char *user, const char *password, char *out,
+                         size_t out_sz) {
+    unsigned char raw[32];
+    if (!g_sessions.ents || out_sz < sizeof raw * 2 + 1 ||
+        generate_random_bytes(raw, sizeof raw) != 0)
+        return -1;
+    to_hex(raw, sizeof raw, out, out_sz);
+    unsigned char key[32], bind[32];
+    SHA256((const unsigned char *)out, strlen(out), key);
+    session_bind(password, bind);
+    cred_insert(&g_sessions, key, user, bind, users_file_gen());
+    return 0;
+}
+
+// password 为 NULL 时只凭令牌
+static int session_resume(const char *token, const char *password, char *user,
+                          size_t user_sz) {
+    if (!g_sessions.ents || strlen(token) != 64)
+        return 0;
+    unsigned char key[32], bind[32];
+    SHA256((const unsigned char *)token, 64, key);
+    if (password)
+        session_bind(password, bind);
+    return cred_lookup(&g_sessions, key, users_file_gen(),
+                       password ? bind : NULL, user, user_sz);
+}
 
 static int is_argon2_encoded(const char *s) {
     if (!s)
@@ -124,114 +378,125 @@ static int hash_password_argon2(const char *password, char *out_encoded,
     unsigned char salt[16];
     if (generate_random_bytes(salt, sizeof salt) != 0)
         return -1;
+    argon2_slot_acquire();
     int rc = argon2id_hash_encoded(
         g_argon2_t_cost, g_argon2_m_cost, g_argon2_parallel, password,
         strlen(password), salt, sizeof salt, 32, out_encoded, out_sz);
+    argon2_slot_release();
     return (rc == ARGON2_OK) ? 0 : -1;
 }
 
-static int upgrade_user_password_to_argon2(const char *username,
-                                           const char *password) {
-    if (!username || !*username || !password)
-        return -1;
+// --- 旧格式用户的 Argon2 升级 ---
+// 旧格式（user:salt:shahex）用户登录成功后，登录线程只计算 Argon2 编码并入队；
+// 后台线程每 DRLMS_UPGRADE_BATCH_MS 毫秒（或攒满 DRLMS_UPGRADE_BATCH_MAX 条）
+// 把队列合并为一次 users.txt 原子重写。重启后的登录风暴不再是每个旧用户一次
+// 全文件重写。DRLMS_UPGRADE_BATCH_MS=0 时在登录线程中立即写回（旧行为）。
+typedef struct upgrade_ent {
+    struct upgrade_ent *next;
+    char user[64];
+    char *legacy; // 入队时的 "salt:shahex"；写回时文件中仍是它才替换
+    char encoded[256];
+    int done;
+} upgrade_ent_t;
+
+static pthread_mutex_t g_upgrade_mu = PTHREAD_MUTEX_INITIALIZER;
+static pthread_cond_t g_upgrade_cv = PTHREAD_COND_INITIALIZER;
+static upgrade_ent_t *g_upgrades = NULL; // 待写回队列
+static int g_upgrade_pending = 0;
+static int g_upgrade_stop = 0;
+static long long g_upgrade_batch_ms = 1000;
+static int g_upgrade_batch_max = 256;
+static pthread_t g_upgrade_tid;
+static int g_upgrade_running = 0;
+
+static void upgrade_list_free(upgrade_ent_t *e) {
+    while (e) {
+        upgrade_ent_t *next = e->next;
+        free(e->legacy);
+        free(e);
+        e = next;
+    }
+}
+
+// 把 list 中的升级合并写回 users.txt：每个用户只替换其第一条记录（服务器
+// 生效的那条），且该记录仍是入队时的旧格式凭据；期间被 CLI 改过的跳过。
+// 返回替换的条数，失败返回 -1
+static int users_file_apply_upgrades(upgrade_ent_t *list) {
     char path[PATH_MAX];
-    if (snprintf(path, sizeof path, "%s/%s", g_data_dir, "users.txt") >=
-        (int)sizeof path)
-        return -1;
-    // Prepare temp path in same dir
     char tmp_path[PATH_MAX];
-    if (snprintf(tmp_path, sizeof tmp_path, "%s/.users.txt.%d.tmp", g_data_dir,
+    if (snprintf(path, sizeof path, "%s/%s", g_data_dir, "users.txt") >=
+            (int)sizeof path ||
+        snprintf(tmp_path, sizeof tmp_path, "%s/.users.txt.%d.tmp", g_data_dir,
                  getpid()) >= (int)sizeof tmp_path)
         return -1;
-
-    fprintf(stderr, "[DEBUG] Attempting to upgrade password for user: %s\n",
-            username);
-    char encoded[256];
-    if (hash_password_argon2(password, encoded, sizeof encoded) != 0) {
-        fprintf(stderr,
-                "[DEBUG] FAILED to upgrade password for user: %s. Error: "
-                "argon2 encode failed\n",
-                username);
-        return -1;
-    }
-
     pthread_mutex_lock(&g_users_file_mu);
     FILE *fin = fopen(path, "r");
-    int created_new = 0;
     if (!fin) {
-        // If no file, we'll create a new one
-        created_new = 1;
-    }
-    int fd = open(tmp_path, O_WRONLY | O_CREAT | O_TRUNC, 0600);
-    if (fd < 0) {
-        if (fin)
-            fclose(fin);
+        // 文件已被删除：没有可升级的记录
         pthread_mutex_unlock(&g_users_file_mu);
-        fprintf(stderr,
-                "[DEBUG] FAILED to upgrade password for user: %s. Error: open "
-                "tmp failed\n",
-                username);
-        return -1;
+        return 0;
     }
-    FILE *fout = fdopen(fd, "w");
+    int fd = open(tmp_path, O_WRONLY | O_CREAT | O_TRUNC, 0600);
+    FILE *fout = fd >= 0 ? fdopen(fd, "w") : NULL;
     if (!fout) {
-        close(fd);
-        if (fin)
-            fclose(fin);
+        if (fd >= 0)
+            close(fd);
+        fclose(fin);
         pthread_mutex_unlock(&g_users_file_mu);
-        fprintf(stderr,
-                "[DEBUG] FAILED to upgrade password for user: %s. Error: "
-                "fdopen failed\n",
-                username);
+        fprintf(stderr, "[warn] users.txt upgrade: open tmp failed\n");
         return -1;
     }
-
-    if (!created_new) {
-        char line[512];
-        while (fgets(line, sizeof line, fin)) {
-            // Preserve comments and blank lines
-            if (line[0] == '#' || line[0] == '\n') {
-                fputs(line, fout);
-                continue;
-            }
-            char work[512];
-            snprintf(work, sizeof work, "%s", line);
-            char *nl = strchr(work, '\n');
-            if (nl)
-                *nl = '\0';
-            char *p1 = strchr(work, ':');
-            if (!p1) {
-                // keep original line as-is
-                fputs(line, fout);
-                continue;
+    int replaced = 0;
+    char *line = NULL;
+    size_t lcap = 0;
+    ssize_t len;
+    while ((len = getline(&line, &lcap, fin)) >= 0) {
+        upgrade_ent_t *hit = NULL;
+        char *p1 = line[0] == '#' ? NULL : strchr(line, ':');
+        // 与 users_table_load 一致：没有第二个冒号的行不是用户记录
+        if (p1 && !strchr(p1 + 1, ':'))
+            p1 = NULL;
+        if (p1) {
+            // 与 users_table_load 相同的切分：user 为首个冒号之前，
+            // 其后（去掉换行与回车）为旧格式的 "salt:shahex"
+            size_t ulen = (size_t)(p1 - line);
+            size_t rlen = (size_t)len - ulen - 1;
+            while (rlen > 0 && (p1[rlen] == '\n' || p1[rlen] == '\r'))
+                rlen--;
+            for (upgrade_ent_t *e = list; e && !hit; e = e->next) {
+                if (!e->done && strlen(e->user) == ulen &&
+                    memcmp(e->user, line, ulen) == 0)
+                    hit = e;
             }
-            *p1 = '\0';
-            const char *user = work;
-            if (strcmp(user, username) == 0) {
-                // overwrite with argon2 format: user::<encoded>
-                fprintf(fout, "%s::%s\n", username, encoded);
-            } else {
-                // keep original line as-is
-                fputs(line, fout);
+            if (hit) {
+                // 该用户的第一条记录：无论是否替换，之后的重名行都不再处理
+                hit->done = 1;
+                if (strlen(hit->legacy) != rlen ||
+                    memcmp(hit->legacy, p1 + 1, rlen) != 0)
+                    hit = NULL;
             }
         }
-        fclose(fin);
-    } else {
-        // Create only the upgraded user line
-        fprintf(fout, "%s::%s\n", username, encoded);
+        if (hit) {
+            fprintf(fout, "%s::%s\n", hit->user, hit->encoded);
+            replaced++;
+        } else {
+            fwrite(line, 1, (size_t)len, fout);
+        }
     }
-
+    free(line);
+    fclose(fin);
     fflush(fout);
     fsync(fd);
     fclose(fout);
-    // Atomic replace
+    if (replaced == 0) {
+        remove(tmp_path);
+        pthread_mutex_unlock(&g_users_file_mu);
+        return 0;
+    }
     if (rename(tmp_path, path) != 0) {
         remove(tmp_path);
         pthread_mutex_unlock(&g_users_file_mu);
-        fprintf(stderr,
-                "[DEBUG] FAILED to upgrade password for user: %s. Error: "
-                "rename failed\n",
-                username);
+        fprintf(stderr, "[warn] users.txt upgrade: rename failed\n");
         return -1;
     }
     // Ensure directory entry durability
@@ -241,11 +506,117 @@ static int upgrade_user_password_to_argon2(const char *username,
         close(dfd);
     }
     // Reload users cache
-    (void)load_users_file();
+    (void)users_table_reload();
     pthread_mutex_unlock(&g_users_file_mu);
-    fprintf(stderr,
-            "[DEBUG] Successfully wrote upgraded password for user: %s\n",
-            username);
+    fprintf(stderr, "[info] upgraded %d legacy user(s) to argon2\n", replaced);
+    return replaced;
+}
+
+static void upgrade_flush(upgrade_ent_t *list) {
+    if (list && users_file_apply_upgrades(list) < 0)
+        fprintf(stderr, "[warn] password upgrade to argon2 failed\n");
+    upgrade_list_free(list);
+}
+
+static void *upgrade_thread(void *arg) {
+    (void)arg;
+    pthread_mutex_lock(&g_upgrade_mu);
+    for (;;) {
+        while (!g_upgrade_stop && g_upgrade_pending == 0)
+            pthread_cond_wait(&g_upgrade_cv, &g_upgrade_mu);
+        // 第一条入队后最多再等一个周期，让同一波登录合并进同一次写回
+        struct timespec deadline;
+        clock_gettime(CLOCK_REALTIME, &deadline);
+        deadline.tv_sec += g_upgrade_batch_ms / 1000;
+        deadline.tv_nsec += (g_upgrade_batch_ms % 1000) * 1000000L;
+        if (deadline.tv_nsec >= 1000000000L) {
+            deadline.tv_sec++;
+            deadline.tv_nsec -= 1000000000L;
+        }
+        while (!g_upgrade_stop && g_upgrade_pending < g_upgrade_batch_max) {
+            if (pthread_cond_timedwait(&g_upgrade_cv, &g_upgrade_mu,
+                                       &deadline) == ETIMEDOUT)
+                break;
+        }
+        upgrade_ent_t *list = g_upgrades;
+        int stop = g_upgrade_stop;
+        g_upgrades = NULL;
+        g_upgrade_pending = 0;
+        pthread_mutex_unlock(&g_upgrade_mu);
+        upgrade_flush(list);
+        if (stop)
+            return NULL;
+        pthread_mutex_lock(&g_upgrade_mu);
+    }
+}
+
+static void upgrade_init(long long batch_ms, int batch_max) {
+    g_upgrade_batch_ms = batch_ms;
+    g_upgrade_batch_max = batch_max;
+    if (g_upgrade_batch_ms <= 0)
+        return;
+    if (pthread_create(&g_upgrade_tid, NULL, upgrade_thread, NULL) == 0)
+        g_upgrade_running = 1;
+    else
+        g_upgrade_batch_ms = 0;
+}
+
+// 退出前写回尚未落盘的升级
+static void upgrade_shutdown(void) {
+    if (!g_upgrade_running)
+        return;
+    pthread_mutex_lock(&g_upgrade_mu);
+    g_upgrade_stop = 1;
+    pthread_cond_signal(&g_upgrade_cv);
+    pthread_mutex_unlock(&g_upgrade_mu);
+    pthread_join(g_upgrade_tid, NULL);
+    g_upgrade_running = 0;
+}
+
+static int upgrade_is_pending(const char *username, const char *legacy) {
+    int found = 0;
+    pthread_mutex_lock(&g_upgrade_mu);
+    for (upgrade_ent_t *e = g_upgrades; e && !found; e = e->next)
+        found =
+            strcmp(e->user, username) == 0 && strcmp(e->legacy, legacy) == 0;
+    pthread_mutex_unlock(&g_upgrade_mu);
+    return found;
+}
+
+// 旧格式校验成功后调用：salt/cred 为该用户在当前用户表中的旧凭据
+static int upgrade_user_password_to_argon2(const char *username,
+                                           const char *password,
+                                           const char *salt, const char *cred) {
+    if (!username || !*username || strlen(username) >= 64 || !password)
+        return -1;
+    size_t llen = strlen(salt) + 1 + strlen(cred) + 1;
+    upgrade_ent_t *e = calloc(1, sizeof *e);
+    if (!e || !(e->legacy = malloc(llen))) {
+        free(e);
+        return -1;
+    }
+    snprintf(e->user, sizeof e->user, "%s", username);
+    snprintf(e->legacy, llen, "%s:%s", salt, cred);
+    // 已在队列中（同一用户在写回前再次登录）：不再重复计算 Argon2
+    if (g_upgrade_batch_ms > 0 && upgrade_is_pending(username, e->legacy)) {
+        upgrade_list_free(e);
+        return 0;
+    }
+    if (hash_password_argon2(password, e->encoded, sizeof e->encoded) != 0) {
+        upgrade_list_free(e);
+        return -1;
+    }
+    if (g_upgrade_batch_ms <= 0) {
+        int rc = users_file_apply_upgrades(e);
+        upgrade_list_free(e);
+        return rc < 0 ? -1 : 0;
+    }
+    pthread_mutex_lock(&g_upgrade_mu);
+    e->next = g_upgrades;
+    g_upgrades = e;
+    if (++g_upgrade_pending == 1 || g_upgrade_pending >= g_upgrade_batch_max)
+        pthread_cond_signal(&g_upgrade_cv);
+    pthread_mutex_unlock(&g_upgrade_mu);
     return 0;
 }
 
@@ -343,6 +714,13 @@ static int list_visible_files(int fd) {
             continue;
         if (strcmp(ent->d_name, "ops_audit.log") == 0)
             continue;
+        // 只列出普通文件：rooms/ 等子目录不能被 DOWNLOAD
+        char full[PATH_MAX];
+        struct stat st;
+        if (snprintf(full, sizeof full, "%s/%s", g_data_dir, ent->d_name) >=
+                (int)sizeof full ||
+            stat(full, &st) != 0 || !S_ISREG(st.st_mode))
+            continue;
         char line[PATH_MAX + 8];
         snprintf(line, sizeof line, "%s\n", ent->d_name);
         send(fd, line, strlen(line), 0);
@@ -449,313 +827,757 @@ static int hex_equal_nocase(const char *a, const char *b) {
     return 1;
 }
 
+// 读取至多 want 字节（可能短读），并按上行限速节流；返回值同 recv。
+static ssize_t recv_some(int fd, unsigned char *buf, size_t want) {
+    ssize_t n = recv(fd, (char *)buf, want, 0);
+    if (n > 0 && g_rate_up_bps > 0) {
+        // 简单节流：按读取字节估算睡眠时间
+        useconds_t us =
+            (useconds_t)(((double)n / (double)g_rate_up_bps) * 1000000.0);
+        if (us > 0)
+            usleep(us);
+    }
+    return n;
+}
+
 static int recv_exact(int fd, unsigned char *buf, size_t need) {
     size_t got = 0;
     while (got < need) {
-        ssize_t n = recv(fd, (char *)buf + got, need - got, 0);
+        ssize_t n = recv_some(fd, buf + got, need - got);
         if (n <= 0)
             return -1;
         got += (size_t)n;
-        if (g_rate_up_bps > 0) {
-            // 简单节流：按读取字节估算睡眠时间
-            useconds_t us =
-                (useconds_t)(((double)n / (double)g_rate_up_bps) * 1000000.0);
-            if (us > 0)
-                usleep(us);
-        }
     }
     return 0;
 }
 
-static int load_users_file(void) {
-    char path[PATH_MAX];
-    if (snprintf(path, sizeof path, "%s/%s", g_data_dir, "users.txt") >=
-        (int)sizeof path)
+static int is_sha256_hex(const char *s) {
+    size_t i = 0;
+    for (; s[i]; ++i) {
+        if (i >= SHA256_DIGEST_LENGTH * 2 || !isxdigit((unsigned char)s[i]))
+            return 0;
+    }
+    return i == SHA256_DIGEST_LENGTH * 2;
+}
+
+// 未完成的上传按内容 sha 存放：<data>/.partial/<sha>.part。
+// 连接中断后保留已写入部分，客户端用 OFFSET 查询后带 offset 重发 UPLOAD/PUBF
+// 续传。
+static int partial_path(const char *sha_hex, char *out, size_t out_sz) {
+    char dir[PATH_MAX];
+    if (snprintf(dir, sizeof dir, "%s/.partial", g_data_dir) >= (int)sizeof dir)
         return -1;
-    FILE *f = fopen(path, "r");
-    if (!f)
+    if (ensure_dir_mode(dir, 0700) != 0)
+        return -1;
+    char lower[SHA256_DIGEST_LENGTH * 2 + 1];
+    size_t i = 0;
+    for (; sha_hex[i] && i < sizeof lower - 1; ++i)
+        lower[i] = (char)tolower((unsigned char)sha_hex[i]);
+    lower[i] = '\0';
+    if (snprintf(out, out_sz, "%s/%s.part", dir, lower) >= (int)out_sz)
         return -1;
-    char line[512];
-    g_users_count = 0;
-    while (fgets(line, sizeof line, f)) {
-        if (line[0] == '#' || line[0] == '\n')
-            continue;
-        char *nl = strchr(line, '\n');
-        if (nl)
-            *nl = '\0';
-        // 修剪 CRLF 文件可能遗存的尾随回车符
-        size_t llen = strlen(line);
-        if (llen > 0 && line[llen - 1] == '\r')
-            line[--llen] = '\0';
-        char *p1 = strchr(line, ':');
-        if (!p1)
-            continue;
-        *p1 = '\0';
-        char *p2 = strchr(p1 + 1, ':');
-        if (!p2)
-            continue;
-        *p2 = '\0';
-        if (g_users_count >= (int)(sizeof g_users / sizeof g_users[0]))
-            break;
-        strncpy(g_users[g_users_count].user, line,
-                sizeof(g_users[g_users_count].user) - 1);
-        g_users[g_users_count].user[sizeof(g_users[g_users_count].user) - 1] =
-            '\0';
-        strncpy(g_users[g_users_count].salt, p1 + 1,
-                sizeof(g_users[g_users_count].salt) - 1);
-        g_users[g_users_count].salt[sizeof(g_users[g_users_count].salt) - 1] =
-            '\0';
-        strncpy(g_users[g_users_count].hash_str, p2 + 1,
-                sizeof(g_users[g_users_count].hash_str) - 1);
-        g_users[g_users_count]
-            .hash_str[sizeof(g_users[g_users_count].hash_str) - 1] = '\0';
-        g_users_count++;
-    }
-    fclose(f);
     return 0;
 }
 
-static int verify_password(const char *username, const char *password) {
-    if (g_users_count == 0) {
-        // 尝试按需加载如果 users.txt 存在且非空
-        char path[PATH_MAX];
-        if (snprintf(path, sizeof path, "%s/%s", g_data_dir, "users.txt") <
-            (int)sizeof path) {
-            struct stat st;
-            if (stat(path, &st) == 0 && (st.st_mode & S_IFMT) == S_IFREG &&
-                st.st_size > 0) {
-                (void)load_users_file();
-            }
-        }
-        if (g_users_count == 0) {
-            // 仍然没有配置用户
-            return g_auth_strict ? 0 : 1;
-        }
+// 打开 sha 对应的部分文件并加独占锁；返回 fd，被其他连接占用时返回 -2。
+static int open_partial_locked(const char *path, int create) {
+    int pfd = open(path, O_RDWR | (create ? O_CREAT : 0), 0600);
+    if (pfd < 0)
+        return -1;
+    if (flock(pfd, LOCK_EX | LOCK_NB) != 0) {
+        close(pfd);
+        return -2;
     }
-    for (int i = 0; i < g_users_count; ++i) {
-        if (strcmp(username, g_users[i].user) == 0) {
-            // Argon2 path
-            if (is_argon2_encoded(g_users[i].hash_str)) {
-                int rc = argon2id_verify(g_users[i].hash_str, password,
-                                         strlen(password));
-                return (rc == ARGON2_OK) ? 1 : 0;
-            }
-            // Legacy SHA256(password+salt)
-            unsigned char dg[SHA256_DIGEST_LENGTH];
-            SHA256_CTX ctx;
-            SHA256_Init(&ctx);
-            SHA256_Update(&ctx, (const unsigned char *)password,
-                          strlen(password));
-            SHA256_Update(&ctx, (const unsigned char *)g_users[i].salt,
-                          strlen(g_users[i].salt));
-            SHA256_Final(dg, &ctx);
-            char hx[SHA256_DIGEST_LENGTH * 2 + 1];
-            to_hex(dg, sizeof dg, hx, sizeof hx);
-            if (hex_equal_nocase(hx, g_users[i].hash_str)) {
-                // Transparent upgrade on success
-                if (upgrade_user_password_to_argon2(username, password) != 0) {
-                    fprintf(stderr,
-                            "[warn] password upgrade to argon2 failed for user "
-                            "%s\n",
-                            username);
-                }
-                return 1;
-            }
-            return 0;
+    return pfd;
+}
+
+static int write_all(int fd, const unsigned char *buf, size_t n) {
+    while (n > 0) {
+        ssize_t w = write(fd, buf, n);
+        if (w < 0) {
+            if (errno == EINTR)
+                continue;
+            return -1;
         }
+        buf += w;
+        n -= (size_t)w;
     }
     return 0;
 }
 
-static void append_central_log(const char *ip, const char *user,
-                               const char *msg) {
-    char path[PATH_MAX];
-    if (snprintf(path, sizeof path, "%s/%s", g_data_dir, "central.log") >=
-        (int)sizeof path)
-        return;
-    FILE *f = fopen(path, "a");
-    if (!f)
-        return;
-    char ts[64];
-    rfc3339_time(ts, sizeof ts);
-    // strip trailing newlines in msg for one-line log
-    size_t mlen = strlen(msg);
-    while (mlen > 0 && (msg[mlen - 1] == '\n' || msg[mlen - 1] == '\r'))
-        mlen--;
-    fprintf(f, "[%s %s %s] LOG: %.*s\n", ts, ip ? ip : "", user ? user : "",
-            (int)mlen, msg);
-    fclose(f);
-}
-
-// ADD: upload & download helpers
-static int handle_upload(int fd, const char *ip, const char *username,
-                         char *cmd) {
-    // cmd: UPLOAD|filename|size|sha256hex
-    char *p1 = strchr(cmd + 7, '|');
-    if (!p1) {
-        send_err(fd, "FORMAT", "UPLOAD fields");
-        return -1;
-    }
-    *p1 = '\0';
-    const char *filename = cmd + 7;
-    char *p2 = strchr(p1 + 1, '|');
-    if (!p2) {
-        send_err(fd, "FORMAT", "UPLOAD fields");
+// 接收上传正文（可从 offset 续传）到 sha 对应的部分文件，并校验整文件 SHA-256。
+// 成功返回 0，*lock_fd 仍持有部分文件的锁，调用方改名后关闭；
+// 校验失败返回 -2（已删除部分文件），其他失败返回 -1。失败时均已回复 ERR。
+static int receive_upload_body(int fd, const char *sha_hex, long long size,
+                               long long offset, char *part, size_t part_sz,
+                               char *dg_hex, size_t dg_hex_sz, int *lock_fd) {
+    if (!is_sha256_hex(sha_hex)) {
+        send_err(fd, "FORMAT", "bad sha");
         return -1;
     }
-    *p2 = '\0';
-    const char *size_s = p1 + 1;
-    const char *sha_hex = p2 + 1; // 行尾到此为止
-    long long size = atoll(size_s);
-    if (g_max_upload > 0 && size > g_max_upload) {
-        send_err(fd, "SIZE", "too large");
-        return -1;
-    }
-    if (!is_safe_filename(filename) || size < 0) {
-        send_err(fd, "FORMAT", "bad filename/size");
+    if (offset < 0 || offset > size) {
+        send_err(fd, "FORMAT", "bad offset");
         return -1;
     }
-
-    char tmp_path[PATH_MAX];
-    char final_path[PATH_MAX];
-    if (snprintf(final_path, sizeof final_path, "%s/%s", g_data_dir,
-                 filename) >= (int)sizeof final_path) {
-        send_err(fd, "FORMAT", "name too long");
+    if (partial_path(sha_hex, part, part_sz) != 0) {
+        send_err(fd, "INTERNAL", "partial dir");
         return -1;
     }
-    if (snprintf(tmp_path, sizeof tmp_path, "%s/.%s.part", g_data_dir,
-                 filename) >= (int)sizeof tmp_path) {
-        send_err(fd, "FORMAT", "name too long");
+    int pfd = open_partial_locked(part, 1);
+    if (pfd == -2) {
+        send_err(fd, "BUSY", "upload in progress");
         return -1;
     }
-
-    // 额外的路径安全检查
-    if (!is_safe_path(final_path) || !is_safe_path(tmp_path)) {
-        send_err(fd, "FORMAT", "unsafe path");
+    if (pfd < 0) {
+        send_err(fd, "INTERNAL", "open partial");
         return -1;
     }
-
-    // 不允许覆盖已存在文件
-    struct stat stf;
-    if (stat(final_path, &stf) == 0) {
-        send_err(fd, "EXISTS", "file exists");
+    struct stat st;
+    if (fstat(pfd, &st) != 0 || offset > (long long)st.st_size) {
+        char have[32];
+        snprintf(have, sizeof have, "%lld",
+                 fstat(pfd, &st) == 0 ? (long long)st.st_size : 0LL);
+        close(pfd);
+        send_err(fd, "OFFSET", have);
         return -1;
     }
-
-    send(fd, "READY\n", 6, 0);
-    FILE *f = fopen(tmp_path, "wb");
-    if (!f) {
-        send_err(fd, "INTERNAL", "open tmp");
+    const size_t BUF = 64 * 1024;
+    unsigned char *buf = (unsigned char *)malloc(BUF);
+    if (!buf || ftruncate(pfd, (off_t)offset) != 0) {
+        free(buf);
+        close(pfd);
+        send_err(fd, "INTERNAL", "prepare partial");
         return -1;
     }
+    // 续传：先把已落盘的前缀重新计入摘要（本地磁盘读远比网络重传便宜）
     SHA256_CTX ctx;
     SHA256_Init(&ctx);
-    const size_t BUF = 8192;
-    unsigned char *buf = (unsigned char *)malloc(BUF);
-    if (!buf) {
-        fclose(f);
-        send_err(fd, "INTERNAL", "malloc failed");
-        return -1;
+    long long done = 0;
+    while (done < offset) {
+        size_t want =
+            (offset - done > (long long)BUF) ? BUF : (size_t)(offset - done);
+        ssize_t n = pread(pfd, buf, want, (off_t)done);
+        if (n <= 0) {
+            free(buf);
+            close(pfd);
+            send_err(fd, "INTERNAL", "read partial");
+            return -1;
+        }
+        SHA256_Update(&ctx, buf, (size_t)n);
+        done += n;
     }
-    long long remain = size;
+    lseek(pfd, (off_t)offset, SEEK_SET);
+    send(fd, "READY\n", 6, 0);
+    long long remain = size - offset;
     while (remain > 0) {
-        size_t chunk = (remain > (long long)BUF) ? BUF : (size_t)remain;
-        // 清空缓冲区，防止残留数据污染
-        memset(buf, 0, BUF);
-        if (recv_exact(fd, buf, chunk) != 0) {
-            fclose(f);
-            remove(tmp_path);
+        size_t want = (remain > (long long)BUF) ? BUF : (size_t)remain;
+        ssize_t n = recv_some(fd, buf, want);
+        if (n <= 0) {
+            // 连接中断：保留已收到的部分，供下次续传
+            fsync(pfd);
             free(buf);
-            send_err(fd, "SIZE", "short read");
+            close(pfd);
+            send_err(fd, "SHORT", "short read");
             return -1;
         }
-        size_t written = fwrite(buf, 1, chunk, f);
-        if (written != chunk) {
-            fclose(f);
-            remove(tmp_path);
+        if (write_all(pfd, buf, (size_t)n) != 0) {
             free(buf);
+            close(pfd);
             send_err(fd, "INTERNAL", "write failed");
             return -1;
         }
-        SHA256_Update(&ctx, buf, chunk);
-        remain -= chunk;
+        SHA256_Update(&ctx, buf, (size_t)n);
+        remain -= n;
     }
     free(buf);
-    fflush(f);
-    fsync(fileno(f));
-    fclose(f);
+    fsync(pfd);
     unsigned char dg[SHA256_DIGEST_LENGTH];
     SHA256_Final(dg, &ctx);
-    char dg_hex[SHA256_DIGEST_LENGTH * 2 + 1];
-    to_hex(dg, sizeof dg, dg_hex, sizeof dg_hex);
+    to_hex(dg, sizeof dg, dg_hex, dg_hex_sz);
     if (!hex_equal_nocase(dg_hex, sha_hex)) {
-        remove(tmp_path);
+        unlink(part);
+        close(pfd);
         send_err(fd, "CHECKSUM", "mismatch");
-        audit_log(ip, username, "UPLOAD", filename, "", 0, size, dg_hex, "ERR",
-                  "CHECKSUM");
-        return -1;
+        return -2;
     }
-    if (rename(tmp_path, final_path) != 0) {
-        remove(tmp_path);
-        send_err(fd, "INTERNAL", "rename");
+    *lock_fd = pfd;
+    return 0;
+}
+
+// 删除超过 g_partial_ttl 秒未更新的部分文件（启动时调用）。
+static void cleanup_partials(void) {
+    if (g_partial_ttl <= 0)
+        return;
+    char dir[PATH_MAX];
+    if (snprintf(dir, sizeof dir, "%s/.partial", g_data_dir) >= (int)sizeof dir)
+        return;
+    DIR *d = opendir(dir);
+    if (!d)
+        return;
+    time_t now = time(NULL);
+    const struct dirent *ent;
+    while ((ent = readdir(d)) != NULL) {
+        if (ent->d_name[0] == '.')
+            continue;
+        char path[PATH_MAX];
+        struct stat st;
+        if (snprintf(path, sizeof path, "%s/%s", dir, ent->d_name) >=
+                (int)sizeof path ||
+            stat(path, &st) != 0 || !S_ISREG(st.st_mode))
+            continue;
+        if ((long long)(now - st.st_mtime) > g_partial_ttl)
+            unlink(path);
+    }
+    closedir(d);
+}
+
+// --- users.txt 内存表 ---
+// 按用户名 FNV-1a 哈希的链式桶，字符串集中存放在 arena。表建好后只读、带引用
+// 计数：users.txt 变化（见 users_file_gen）时，发现变化的登录线程在锁外构建新表
+// 再原子替换全局指针；同时到达的其他登录继续使用旧表，不等待加载。旧表在最后
+// 一个持有者释放后回收。同名用户以文件中第一次出现的为准。
+#define USER_NIL UINT32_MAX
+
+typedef struct {
+    uint32_t hash;
+    uint32_t next; // 同桶下一条的下标，USER_NIL 结束
+    uint32_t user; // 以下为 arena 偏移
+    uint32_t salt;
+    uint32_t cred; // Argon2 编码串或 legacy hex
+} user_ent_t;
+
+typedef struct {
+    int refs;
+    unsigned long long gen; // 加载时的 users.txt 代数
+    user_ent_t *ents;
+    size_t n, cap;
+    uint32_t *buckets;
+    size_t nbuckets; // 2 的幂
+    char *arena;
+    size_t arena_len, arena_cap;
+} user_table_t;
+
+static user_table_t *g_user_table = NULL;
+static pthread_mutex_t g_user_table_mu =
+    PTHREAD_MUTEX_INITIALIZER; // 保护 g_user_table 指针与各表 refs
+static pthread_mutex_t g_user_reload_mu = PTHREAD_MUTEX_INITIALIZER;
+
+static uint32_t user_hash(const char *s) {
+    uint32_t h = 2166136261u;
+    for (; *s; ++s) {
+        h ^= (unsigned char)*s;
+        h *= 16777619u;
+    }
+    return h;
+}
+
+static void users_table_free(user_table_t *t) {
+    if (!t)
+        return;
+    free(t->ents);
+    free(t->buckets);
+    free(t->arena);
+    free(t);
+}
+
+static int users_arena_put(user_table_t *t, const char *s, uint32_t *off) {
+    size_t len = strlen(s) + 1;
+    if (t->arena_len + len > UINT32_MAX)
         return -1;
+    if (t->arena_len + len > t->arena_cap) {
+        size_t cap = t->arena_cap ? t->arena_cap : 4096;
+        while (cap < t->arena_len + len)
+            cap *= 2;
+        char *a = realloc(t->arena, cap);
+        if (!a)
+            return -1;
+        t->arena = a;
+        t->arena_cap = cap;
     }
-    send_ok(fd, dg_hex);
-    audit_log(ip, username, "UPLOAD", filename, "", 0, size, dg_hex, "OK", "");
+    memcpy(t->arena + t->arena_len, s, len);
+    *off = (uint32_t)t->arena_len;
+    t->arena_len += len;
     return 0;
 }
 
-static int handle_download(int fd, const char *ip, const char *username,
-                           char *cmd) {
-    // cmd: DOWNLOAD|filename
-    const char *filename = cmd + 9;
-    if (*filename == '|')
-        filename++;
-    if (!is_safe_filename(filename)) {
-        send_err(fd, "FORMAT", "bad filename");
+static const user_ent_t *users_table_find(const user_table_t *t,
+                                          const char *user) {
+    if (!t->nbuckets)
+        return NULL;
+    uint32_t h = user_hash(user);
+    for (uint32_t i = t->buckets[h & (t->nbuckets - 1)]; i != USER_NIL;
+         i = t->ents[i].next) {
+        if (t->ents[i].hash == h &&
+            strcmp(t->arena + t->ents[i].user, user) == 0)
+            return &t->ents[i];
+    }
+    return NULL;
+}
+
+static int users_table_add(user_table_t *t, const char *user, const char *salt,
+                           const char *cred) {
+    if (t->n == t->cap) {
+        size_t cap = t->cap ? t->cap * 2 : 64;
+        if (cap >= USER_NIL)
+            return -1;
+        user_ent_t *e = realloc(t->ents, cap * sizeof *e);
+        if (!e)
+            return -1;
+        t->ents = e;
+        t->cap = cap;
+    }
+    user_ent_t *e = &t->ents[t->n];
+    e->hash = user_hash(user);
+    e->next = USER_NIL;
+    if (users_arena_put(t, user, &e->user) != 0 ||
+        users_arena_put(t, salt, &e->salt) != 0 ||
+        users_arena_put(t, cred, &e->cred) != 0)
+        return -1;
+    t->n++;
+    return 0;
+}
+
+// 桶数取不小于用户数的 2 的幂；重复用户名只挂第一条
+static int users_table_index(user_table_t *t) {
+    size_t nb = 16;
+    while (nb < t->n)
+        nb <<= 1;
+    t->buckets = malloc(nb * sizeof *t->buckets);
+    if (!t->buckets)
+        return -1;
+    memset(t->buckets, 0xff, nb * sizeof *t->buckets);
+    t->nbuckets = nb;
+    for (size_t i = 0; i < t->n; ++i) {
+        user_ent_t *e = &t->ents[i];
+        if (users_table_find(t, t->arena + e->user))
+            continue;
+        uint32_t *head = &t->buckets[e->hash & (nb - 1)];
+        e->next = *head;
+        *head = (uint32_t)i;
+    }
+    return 0;
+}
+
+// 文件不存在时返回空表（未配置用户）；内存不足返回 NULL
+static user_table_t *users_table_load(unsigned long long gen) {
+    user_table_t *t = calloc(1, sizeof *t);
+    if (!t)
+        return NULL;
+    t->gen = gen;
+    char path[PATH_MAX];
+    FILE *f = NULL;
+    if (snprintf(path, sizeof path, "%s/%s", g_data_dir, "users.txt") <
+        (int)sizeof path)
+        f = fopen(path, "r");
+    int rc = 0;
+    if (f) {
+        char *line = NULL;
+        size_t lcap = 0;
+        ssize_t len;
+        while (rc == 0 && (len = getline(&line, &lcap, f)) >= 0) {
+            if (line[0] == '#' || line[0] == '\n')
+                continue;
+            // 修剪换行与 CRLF 文件可能遗存的尾随回车符
+            while (len > 0 && (line[len - 1] == '\n' || line[len - 1] == '\r'))
+                line[--len] = '\0';
+            char *p1 = strchr(line, ':');
+            if (!p1)
+                continue;
+            *p1 = '\0';
+            char *p2 = strchr(p1 + 1, ':');
+            if (!p2)
+                continue;
+            *p2 = '\0';
+            if (line[0] == '\0' || strlen(line) >= 64)
+                continue;
+            rc = users_table_add(t, line, p1 + 1, p2 + 1);
+        }
+        free(line);
+        fclose(f);
+    }
+    if (rc != 0 || users_table_index(t) != 0) {
+        users_table_free(t);
+        return NULL;
+    }
+    return t;
+}
+
+static void users_table_release(user_table_t *t) {
+    if (!t)
+        return;
+    pthread_mutex_lock(&g_user_table_mu);
+    int last = --t->refs == 0;
+    pthread_mutex_unlock(&g_user_table_mu);
+    if (last)
+        users_table_free(t);
+}
+
+// 调用方持有 g_user_reload_mu；加载失败保留旧表
+static int users_table_swap_locked(void) {
+    user_table_t *nt = users_table_load(users_file_gen());
+    if (!nt)
         return -1;
+    nt->refs = 1; // 全局指针持有的引用
+    pthread_mutex_lock(&g_user_table_mu);
+    user_table_t *old = g_user_table;
+    g_user_table = nt;
+    pthread_mutex_unlock(&g_user_table_mu);
+    users_table_release(old);
+    fprintf(stderr, "[info] users.txt loaded: %zu users\n", nt->n);
+    return 0;
+}
+
+static int users_table_reload(void) {
+    pthread_mutex_lock(&g_user_reload_mu);
+    int rc = users_table_swap_locked();
+    pthread_mutex_unlock(&g_user_reload_mu);
+    return rc;
+}
+
+static user_table_t *users_table_grab(void) {
+    pthread_mutex_lock(&g_user_table_mu);
+    user_table_t *t = g_user_table;
+    if (t)
+        t->refs++;
+    pthread_mutex_unlock(&g_user_table_mu);
+    return t;
+}
+
+// 取当前用户表（用完 users_table_release）。users.txt 已变化时由抢到重载锁
+// 的线程重建；其余线程若已有旧表则直接使用，不等待
+static user_table_t *users_table_acquire(void) {
+    unsigned long long gen = users_file_gen();
+    user_table_t *t = users_table_grab();
+    if (t && t->gen == gen)
+        return t;
+    if (t && pthread_mutex_trylock(&g_user_reload_mu) != 0)
+        return t;
+    if (!t)
+        pthread_mutex_lock(&g_user_reload_mu);
+    user_table_t *cur = users_table_grab();
+    if (!cur || cur->gen != users_file_gen())
+        (void)users_table_swap_locked();
+    pthread_mutex_unlock(&g_user_reload_mu);
+    users_table_release(cur);
+    users_table_release(t);
+    return users_table_grab();
+}
+
+static int verify_password(const char *username, const char *password) {
+    user_table_t *t = users_table_acquire();
+    if (!t || t->n == 0) {
+        // 没有配置用户
+        users_table_release(t);
+        return g_auth_strict ? 0 : 1;
     }
+    const user_ent_t *u = users_table_find(t, username);
+    int ok = 0;
+    if (!u) {
+        ok = 0;
+    } else if (is_argon2_encoded(t->arena + u->cred)) {
+        // Argon2 path
+        unsigned char key[32];
+        unsigned long long gen = 0;
+        if (auth_cache_lookup(username, password, key, &gen)) {
+            ok = 1;
+        } else {
+            argon2_slot_acquire();
+            int rc =
+                argon2id_verify(t->arena + u->cred, password, strlen(password));
+            argon2_slot_release();
+            ok = rc == ARGON2_OK;
+            if (ok)
+                auth_cache_insert(key, gen);
+        }
+    } else {
+        // Legacy SHA256(password+salt)
+        const char *salt = t->arena + u->salt;
+        unsigned char dg[SHA256_DIGEST_LENGTH];
+        SHA256_CTX ctx;
+        SHA256_Init(&ctx);
+        SHA256_Update(&ctx, (const unsigned char *)password, strlen(password));
+        SHA256_Update(&ctx, (const unsigned char *)salt, strlen(salt));
+        SHA256_Final(dg, &ctx);
+        char hx[SHA256_DIGEST_LENGTH * 2 + 1];
+        to_hex(dg, sizeof dg, hx, sizeof hx);
+        ok = hex_equal_nocase(hx, t->arena + u->cred);
+        // Transparent upgrade on success（批量写回，见 upgrade_thread）
+        if (ok && upgrade_user_password_to_argon2(username, password, salt,
+                                                  t->arena + u->cred) != 0) {
+            fprintf(stderr,
+                    "[warn] password upgrade to argon2 failed for user %s\n",
+                    username);
+        }
+    }
+    users_table_release(t);
+    return ok;
+}
+
+static void append_central_log(const char *ip, const char *user,
+                               const char *msg) {
     char path[PATH_MAX];
-    if (snprintf(path, sizeof path, "%s/%s", g_data_dir, filename) >=
-        (int)sizeof path) {
+    if (snprintf(path, sizeof path, "%s/%s", g_data_dir, "central.log") >=
+        (int)sizeof path)
+        return;
+    FILE *f = fopen(path, "a");
+    if (!f)
+        return;
+    char ts[64];
+    rfc3339_time(ts, sizeof ts);
+    // strip trailing newlines in msg for one-line log
+    size_t mlen = strlen(msg);
+    while (mlen > 0 && (msg[mlen - 1] == '\n' || msg[mlen - 1] == '\r'))
+        mlen--;
+    fprintf(f, "[%s %s %s] LOG: %.*s\n", ts, ip ? ip : "", user ? user : "",
+            (int)mlen, msg);
+    fclose(f);
+}
+
+// ADD: upload & download helpers
+static int handle_upload(int fd, const char *ip, const char *username,
+                         char *cmd) {
+    // cmd: UPLOAD|filename|size|sha256hex[|offset]
+    char *p1 = strchr(cmd + 7, '|');
+    if (!p1) {
+        send_err(fd, "FORMAT", "UPLOAD fields");
+        return -1;
+    }
+    *p1 = '\0';
+    const char *filename = cmd + 7;
+    char *p2 = strchr(p1 + 1, '|');
+    if (!p2) {
+        send_err(fd, "FORMAT", "UPLOAD fields");
+        return -1;
+    }
+    *p2 = '\0';
+    const char *size_s = p1 + 1;
+    char *sha_hex = p2 + 1;
+    long long offset = 0;
+    char *p3 = strchr(sha_hex, '|');
+    if (p3) {
+        *p3 = '\0';
+        offset = atoll(p3 + 1);
+    }
+    long long size = atoll(size_s);
+    if (g_max_upload > 0 && size > g_max_upload) {
+        send_err(fd, "SIZE", "too large");
+        return -1;
+    }
+    if (!is_safe_filename(filename) || size < 0) {
+        send_err(fd, "FORMAT", "bad filename/size");
+        return -1;
+    }
+
+    char final_path[PATH_MAX];
+    if (snprintf(final_path, sizeof final_path, "%s/%s", g_data_dir,
+                 filename) >= (int)sizeof final_path) {
         send_err(fd, "FORMAT", "name too long");
         return -1;
     }
 
     // 额外的路径安全检查
-    if (!is_safe_path(path)) {
+    if (!is_safe_path(final_path)) {
         send_err(fd, "FORMAT", "unsafe path");
         return -1;
     }
 
+    // 不允许覆盖已存在文件
+    struct stat stf;
+    if (stat(final_path, &stf) == 0) {
+        send_err(fd, "EXISTS", "file exists");
+        return -1;
+    }
+
+    char part[PATH_MAX];
+    char dg_hex[SHA256_DIGEST_LENGTH * 2 + 1];
+    int lock_fd = -1;
+    int rc = receive_upload_body(fd, sha_hex, size, offset, part, sizeof part,
+                                 dg_hex, sizeof dg_hex, &lock_fd);
+    if (rc == -2)
+        audit_log(ip, username, "UPLOAD", filename, "", 0, size, dg_hex, "ERR",
+                  "CHECKSUM");
+    if (rc != 0)
+        return -1;
+    // link 而非 rename：并发上传同名文件时不会互相覆盖
+    if (link(part, final_path) != 0) {
+        int exists = (errno == EEXIST);
+        close(lock_fd);
+        send_err(fd, exists ? "EXISTS" : "INTERNAL",
+                 exists ? "file exists" : "rename");
+        return -1;
+    }
+    unlink(part);
+    close(lock_fd);
+    send_ok(fd, dg_hex);
+    audit_log(ip, username, "UPLOAD", filename, "", 0, size, dg_hex, "OK", "");
+    return 0;
+}
+
+static int handle_pubf(int fd, const char *ip, const char *username,
+                       char *cmd) {
+    // cmd: PUBF|room|filename|size|sha[|offset]
+    char *fields[5] = {0};
+    int nf = 0;
+    char *cur = cmd + 5;
+    while (nf < 5) {
+        fields[nf++] = cur;
+        char *bar = strchr(cur, '|');
+        if (!bar)
+            break;
+        *bar = '\0';
+        cur = bar + 1;
+    }
+    if (nf < 4) {
+        send_err(fd, "FORMAT", "PUBF fields");
+        return -1;
+    }
+    const char *room = fields[0];
+    const char *filename = fields[1];
+    long long size = atoll(fields[2]);
+    const char *sha_hex = fields[3];
+    long long offset = nf == 5 ? atoll(fields[4]) : 0;
+    if (!rooms_valid_name(room) || !is_safe_filename(filename) || size < 0 ||
+        size > g_max_upload) {
+        send_err(fd, "FORMAT", "bad room/file/size");
+        return -1;
+    }
+    Room *r = rooms_get_or_create(room);
+    if (!r) {
+        send_err(fd, "INTERNAL", "room");
+        return -1;
+    }
+    rooms_assign_owner_if_empty(r, username);
+    char part[PATH_MAX];
+    char hx[SHA256_DIGEST_LENGTH * 2 + 1];
+    int lock_fd = -1;
+    int rc = receive_upload_body(fd, sha_hex, size, offset, part, sizeof part,
+                                 hx, sizeof hx, &lock_fd);
+    if (rc == -2)
+        audit_log(ip, username, "PUBF", "", room, 0, size, hx, "ERR",
+                  "CHECKSUM");
+    if (rc != 0)
+        return -1;
+    char ts[64];
+    rfc3339_time(ts, sizeof ts);
+    uint64_t event_id = 0;
+    int sf_rc = rooms_store_file(r, room, ts, username, filename, (size_t)size,
+                                 hx, part, &event_id);
+    close(lock_fd);
+    if (sf_rc != 0 || event_id == 0) {
+        send_err(fd, "INTERNAL", "store file");
+        return -1;
+    }
+    rooms_fanout_file(r, room, ts, username, event_id, filename, (size_t)size,
+                      hx, g_rate_down_bps);
+    char okbuf[128];
+    snprintf(okbuf, sizeof okbuf, "PUBF|%llu", (unsigned long long)event_id);
+    send_ok(fd, okbuf);
+    audit_log(ip, username, "PUBF", filename, room,
+              (unsigned long long)event_id, size, hx, "OK", "");
+    return 0;
+}
+
+static int handle_offset(int fd, char *cmd) {
+    // cmd: OFFSET|sha256hex|size -> OK|OFFSET|<已收到字节数>
+    char *sha_hex = cmd + 7;
+    char *p1 = strchr(sha_hex, '|');
+    if (!p1) {
+        send_err(fd, "FORMAT", "OFFSET fields");
+        return -1;
+    }
+    *p1 = '\0';
+    long long size = atoll(p1 + 1);
+    if (!is_sha256_hex(sha_hex) || size < 0) {
+        send_err(fd, "FORMAT", "bad sha/size");
+        return -1;
+    }
+    char part[PATH_MAX];
+    if (partial_path(sha_hex, part, sizeof part) != 0) {
+        send_err(fd, "INTERNAL", "partial dir");
+        return -1;
+    }
+    long long have = 0;
+    int pfd = open_partial_locked(part, 0);
+    if (pfd == -2) {
+        // 上一次连接可能尚未被服务器察觉断开，客户端稍后重试
+        send_err(fd, "BUSY", "upload in progress");
+        return -1;
+    }
+    if (pfd >= 0) {
+        struct stat st;
+        if (fstat(pfd, &st) == 0)
+            have = (long long)st.st_size;
+        close(pfd);
+    }
+    if (have > size)
+        have = 0;
+    char msg[64];
+    snprintf(msg, sizeof msg, "OFFSET|%lld", have);
+    send_ok(fd, msg);
+    return 0;
+}
+
+// 以只读方式打开普通文件；不存在或不是普通文件（如目录）时回复 NOTFOUND。
+static FILE *open_regular_file(int fd, const char *path) {
     FILE *f = fopen(path, "rb");
-    if (!f) {
+    struct stat st;
+    if (!f || fstat(fileno(f), &st) != 0 || !S_ISREG(st.st_mode)) {
+        if (f)
+            fclose(f);
         send_err(fd, "NOTFOUND", "file");
-        return -1;
+        return NULL;
     }
+    return f;
+}
+
+// 从头计算整个文件的 SHA-256 与大小，完成后回到文件开头。
+static int hash_file(FILE *f, unsigned char *buf, size_t bufsz,
+                     long long *size_out, char *dg_hex, size_t dg_hex_sz) {
     SHA256_CTX ctx;
     SHA256_Init(&ctx);
-    fseek(f, 0, SEEK_END);
-    long long size = ftell(f);
+    long long size = 0;
     fseek(f, 0, SEEK_SET);
-    const size_t BUF = 8192;
-    unsigned char *buf = (unsigned char *)malloc(BUF);
-    if (!buf) {
-        fclose(f);
-        send_err(fd, "INTERNAL", "malloc failed");
-        return -1;
-    }
     for (;;) {
-        size_t n = fread(buf, 1, BUF, f);
+        size_t n = fread(buf, 1, bufsz, f);
         if (n == 0)
             break;
         SHA256_Update(&ctx, buf, n);
+        size += (long long)n;
     }
+    if (ferror(f))
+        return -1;
     unsigned char dg[SHA256_DIGEST_LENGTH];
     SHA256_Final(dg, &ctx);
-    char dg_hex[SHA256_DIGEST_LENGTH * 2 + 1];
-    to_hex(dg, sizeof dg, dg_hex, sizeof dg_hex);
+    to_hex(dg, sizeof dg, dg_hex, dg_hex_sz);
+    if (size_out)
+        *size_out = size;
     fseek(f, 0, SEEK_SET);
+    return 0;
+}
+
+// 先整文件计算 SHA-256，再按 SIZE|size|sha + READY + 字节 的帧格式发送。
+// DOWNLOAD 与 FETCH 共用；失败时已向客户端回复 ERR。
+static int send_file_framed(int fd, const char *path, long long *size_out,
+                            char *dg_hex, size_t dg_hex_sz) {
+    FILE *f = open_regular_file(fd, path);
+    if (!f)
+        return -1;
+    const size_t BUF = 8192;
+    unsigned char *buf = (unsigned char *)malloc(BUF);
+    if (!buf) {
+        fclose(f);
+        send_err(fd, "INTERNAL", "malloc failed");
+        return -1;
+    }
+    long long size = 0;
+    if (hash_file(f, buf, BUF, &size, dg_hex, dg_hex_sz) != 0) {
+        free(buf);
+        fclose(f);
+        send_err(fd, "INTERNAL", "read failed");
+        return -1;
+    }
+    if (size_out)
+        *size_out = size;
     char hdr[256];
     snprintf(hdr, sizeof hdr, "SIZE|%lld|%s\nREADY\n", size, dg_hex);
     send(fd, hdr, strlen(hdr), 0);
@@ -773,11 +1595,117 @@ static int handle_download(int fd, const char *ip, const char *username,
     }
     free(buf);
     fclose(f);
+    return 0;
+}
+
+// 校验文件名并拼出数据目录下的路径；失败时已向客户端回复 ERR。
+static int data_file_path(int fd, const char *filename, char *path,
+                          size_t path_sz) {
+    if (!is_safe_filename(filename)) {
+        send_err(fd, "FORMAT", "bad filename");
+        return -1;
+    }
+    if (snprintf(path, path_sz, "%s/%s", g_data_dir, filename) >=
+        (int)path_sz) {
+        send_err(fd, "FORMAT", "name too long");
+        return -1;
+    }
+
+    // 额外的路径安全检查
+    if (!is_safe_path(path)) {
+        send_err(fd, "FORMAT", "unsafe path");
+        return -1;
+    }
+    return 0;
+}
+
+static int handle_download(int fd, const char *ip, const char *username,
+                           char *cmd) {
+    // cmd: DOWNLOAD|filename
+    const char *filename = cmd + 9;
+    if (*filename == '|')
+        filename++;
+    char path[PATH_MAX];
+    if (data_file_path(fd, filename, path, sizeof path) != 0)
+        return -1;
+
+    long long size = 0;
+    char dg_hex[SHA256_DIGEST_LENGTH * 2 + 1];
+    if (send_file_framed(fd, path, &size, dg_hex, sizeof dg_hex) != 0)
+        return -1;
     audit_log(ip, username, "DOWNLOAD", filename, "", 0, size, dg_hex, "OK",
               "");
     return 0;
 }
 
+static int handle_stat(int fd, const char *ip, const char *username,
+                       char *cmd) {
+    // cmd: STAT|filename -> OK|STAT|filename|size|sha，供批量传输跳过相同文件
+    const char *filename = cmd + 5;
+    char path[PATH_MAX];
+    if (data_file_path(fd, filename, path, sizeof path) != 0)
+        return -1;
+    FILE *f = open_regular_file(fd, path);
+    if (!f)
+        return -1;
+    unsigned char buf[8192];
+    long long size = 0;
+    char dg_hex[SHA256_DIGEST_LENGTH * 2 + 1];
+    int rc = hash_file(f, buf, sizeof buf, &size, dg_hex, sizeof dg_hex);
+    fclose(f);
+    if (rc != 0) {
+        send_err(fd, "INTERNAL", "read failed");
+        return -1;
+    }
+    char msg[512];
+    snprintf(msg, sizeof msg, "STAT|%s|%lld|%s", filename, size, dg_hex);
+    send_ok(fd, msg);
+    audit_log(ip, username, "STAT", filename, "", 0, size, dg_hex, "OK", "");
+    return 0;
+}
+
+static int handle_fetch(int fd, const char *ip, const char *username,
+                        char *cmd) {
+    // cmd: FETCH|room|event_id|filename —— 取回 PUBF 发布到房间的文件
+    char *room = cmd + 6;
+    char *p1 = strchr(room, '|');
+    char *p2 = p1 ? strchr(p1 + 1, '|') : NULL;
+    if (!p1 || !p2) {
+        send_err(fd, "FORMAT", "FETCH fields");
+        return -1;
+    }
+    *p1 = '\0';
+    *p2 = '\0';
+    char *end = NULL;
+    unsigned long long eid = strtoull(p1 + 1, &end, 10);
+    const char *filename = p2 + 1;
+    if (end == p1 + 1 || *end != '\0' || eid == 0) {
+        send_err(fd, "FORMAT", "bad event id");
+        return -1;
+    }
+    if (!rooms_valid_name(room)) {
+        send_err(fd, "ROOM", "invalid");
+        return -1;
+    }
+    if (!is_safe_filename(filename)) {
+        send_err(fd, "FORMAT", "bad filename");
+        return -1;
+    }
+    char path[PATH_MAX];
+    if (rooms_file_path(room, (uint64_t)eid, filename, path, sizeof path) !=
+        0) {
+        send_err(fd, "NOTFOUND", "file");
+        return -1;
+    }
+    long long size = 0;
+    char dg_hex[SHA256_DIGEST_LENGTH * 2 + 1];
+    if (send_file_framed(fd, path, &size, dg_hex, sizeof dg_hex) != 0)
+        return -1;
+    audit_log(ip, username, "FETCH", filename, room, eid, size, dg_hex, "OK",
+              "");
+    return 0;
+}
+
 static int create_server_socket(int port) {
     int fd = socket(AF_INET, SOCK_STREAM, 0);
     if (fd < 0)
@@ -796,593 +1724,500 @@ static int create_server_socket(int port) {
     return fd;
 }
 
-static void *handle_client(void *arg) {
-    client_ctx_t *ctx = (client_ctx_t *)arg;
-    set_socket_timeouts(ctx->client_fd, g_rcv_timeout_sec);
-    char peer_ip[64];
-    inet_ntop(AF_INET, &ctx->addr.sin_addr, peer_ip, sizeof peer_ip);
-    int authenticated = 0;
-    char username[64] = {0};
-
-    char inbuf[4096];
-    size_t inlen = 0;
-    for (;;) {
-        ssize_t n =
-            recv(ctx->client_fd, inbuf + inlen, sizeof(inbuf) - 1 - inlen, 0);
-        if (n <= 0)
-            break;
-        inlen += (size_t)n;
-        inbuf[inlen] = '\0';
-        // 逐行处理
-        char *start = inbuf;
-        for (;;) {
-            char *nl = memchr(start, '\n', inbuf + inlen - start);
-            if (!nl)
-                break;
-            *nl = '\0';
-            // 解析命令
-            if (strncmp(start, "LOGIN|", 6) == 0) {
-                char *u = start + 6;
-                char *p = strchr(u, '|');
-                if (!p) {
-                    send_err(ctx->client_fd, "FORMAT", "LOGIN fields");
-                } else {
-                    *p = '\0';
-                    const char *user = u;
-                    char *pass_mut = p + 1;
-                    // 修剪 CRLF 文件可能遗存的尾随回车符
-                    size_t plen_tmp = strlen(pass_mut);
-                    if (plen_tmp > 0 && pass_mut[plen_tmp - 1] == '\r')
-                        pass_mut[--plen_tmp] = '\0';
-                    const char *pass = pass_mut;
-                    if (!*user || !*pass) {
-                        send_err(ctx->client_fd, "AUTH", "empty user or pass");
-                        audit_log(peer_ip, user, "LOGIN", "", "", 0, 0, "",
-                                  "ERR", "AUTH");
-                    } else if (!verify_password(user, pass)) {
-                        send_err(ctx->client_fd, "AUTH", "invalid credentials");
-                        audit_log(peer_ip, user, "LOGIN", "", "", 0, 0, "",
-                                  "ERR", "AUTH");
-                    } else {
-                        authenticated = 1;
-                        snprintf(username, sizeof username, "%s", user);
-                        send_ok(ctx->client_fd, "WELCOME");
-                        audit_log(peer_ip, username, "LOGIN", "", "", 0, 0, "",
-                                  "OK", "");
-                    }
-                }
-            } else if (strcmp(start, "LIST") == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
+// 处理一条命令行（已去掉 '\n'）。返回 1 表示应关闭连接。
+// 两种 I/O 模式共用：命令内部的正文收发（UPLOAD/PUBT/DOWNLOAD...）仍是
+// 带超时的阻塞读写，由执行该命令的线程完成。
+static int client_handle_line(client_ctx_t *ctx, char *start) {
+    if (strncmp(start, "LOGIN|", 6) == 0) {
+        char *u = start + 6;
+        char *p = strchr(u, '|');
+        if (!p) {
+            send_err(ctx->client_fd, "FORMAT", "LOGIN fields");
+        } else {
+            *p = '\0';
+            const char *user = u;
+            char *pass_mut = p + 1;
+            // 修剪 CRLF 文件可能遗存的尾随回车符
+            size_t plen_tmp = strlen(pass_mut);
+            if (plen_tmp > 0 && pass_mut[plen_tmp - 1] == '\r')
+                pass_mut[--plen_tmp] = '\0';
+            const char *pass = pass_mut;
+            if (!*user || !*pass) {
+                send_err(ctx->client_fd, "AUTH", "empty user or pass");
+                audit_log(ctx->peer_ip, user, "LOGIN", "", "", 0, 0, "", "ERR",
+                          "AUTH");
+            } else if (!verify_password(user, pass)) {
+                send_err(ctx->client_fd, "AUTH", "invalid credentials");
+                audit_log(ctx->peer_ip, user, "LOGIN", "", "", 0, 0, "", "ERR",
+                          "AUTH");
+            } else {
+                ctx->authenticated = 1;
+                snprintf(ctx->username, sizeof ctx->username, "%s", user);
+                // OK|WELCOME|<token>|<ttl>：客户端可凭令牌 RESUME 免口令重连
+                char token[65], welcome[128];
+                if (session_issue(ctx->username, pass, token, sizeof token) ==
+                    0) {
+                    snprintf(welcome, sizeof welcome, "WELCOME|%s|%d", token,
+                             g_sessions.ttl);
+                    send_ok(ctx->client_fd, welcome);
                 } else {
-                    list_visible_files(ctx->client_fd);
-                    audit_log(peer_ip, username, "LIST", "", "", 0, 0, "", "OK",
-                              "");
+                    send_ok(ctx->client_fd, "WELCOME");
                 }
-            } else if (strncmp(start, "LOG|", 4) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
+                audit_log(ctx->peer_ip, ctx->username, "LOGIN", "", "", 0, 0,
+                          "", "OK", "");
+            }
+        }
+    } else if (strncmp(start, "RESUME|", 7) == 0) {
+        // RESUME|token 或 RESUME|token|password（令牌定长，口令可含 '|'）
+        char *token = start + 7;
+        size_t tlen = strlen(token);
+        if (tlen > 0 && token[tlen - 1] == '\r')
+            token[--tlen] = '\0';
+        const char *rpass = NULL;
+        if (tlen > 64 && token[64] == '|') {
+            token[64] = '\0';
+            rpass = token + 65;
+        }
+        char user[64] = {0};
+        if (!session_resume(token, rpass, user, sizeof user)) {
+            send_err(ctx->client_fd, "AUTH", "invalid or expired token");
+            audit_log(ctx->peer_ip, "", "RESUME", "", "", 0, 0, "", "ERR",
+                      "AUTH");
+        } else {
+            ctx->authenticated = 1;
+            snprintf(ctx->username, sizeof ctx->username, "%s", user);
+            send_ok(ctx->client_fd, "WELCOME");
+            audit_log(ctx->peer_ip, ctx->username, "RESUME", "", "", 0, 0, "",
+                      "OK", "");
+        }
+    } else if (strcmp(start, "LIST") == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            list_visible_files(ctx->client_fd);
+            audit_log(ctx->peer_ip, ctx->username, "LIST", "", "", 0, 0, "",
+                      "OK", "");
+        }
+    } else if (strncmp(start, "LOG|", 4) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            const char *msg = start + 4;
+            shm_write((const unsigned char *)msg, strlen(msg));
+            append_central_log(ctx->peer_ip, ctx->username, msg);
+            send_ok(ctx->client_fd, NULL);
+        }
+    } else if (strncmp(start, "UPLOAD|", 7) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            handle_upload(ctx->client_fd, ctx->peer_ip, ctx->username, start);
+        }
+    } else if (strncmp(start, "DOWNLOAD|", 9) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            handle_download(ctx->client_fd, ctx->peer_ip, ctx->username, start);
+        }
+    } else if (strncmp(start, "STAT|", 5) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            handle_stat(ctx->client_fd, ctx->peer_ip, ctx->username, start);
+        }
+    } else if (strncmp(start, "FETCH|", 6) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            handle_fetch(ctx->client_fd, ctx->peer_ip, ctx->username, start);
+        }
+    } else if (strncmp(start, "SUB|", 4) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            // 解析: SUB|room[|since_id]
+            char *p1 = strchr(start + 4, '|');
+            unsigned long long since_id = 0ULL;
+            if (p1) {
+                *p1 = '\0';
+                since_id = strtoull(p1 + 1, NULL, 10);
+            }
+            const char *room = start + 4;
+            if (!rooms_valid_name(room)) {
+                send_err(ctx->client_fd, "ROOM", "invalid");
+                if (p1)
+                    *p1 = '|';
+            } else {
+                Room *r = rooms_get_or_create(room);
+                if (!r) {
+                    send_err(ctx->client_fd, "INTERNAL", "room");
+                    if (p1)
+                        *p1 = '|';
                 } else {
-                    const char *msg = start + 4;
-                    shm_write((const unsigned char *)msg, strlen(msg));
-                    append_central_log(peer_ip, username, msg);
-                    send_ok(ctx->client_fd, NULL);
+                    rooms_assign_owner_if_empty(r, ctx->username);
+                    // 回放截止到注册时的 last_event_id，之后的事件走实时扇出
+                    uint64_t upto = 0;
+                    rooms_add_subscriber_ex(r, ctx->client_fd, ctx->username,
+                                            &upto);
+                    {
+                        char okbuf[256];
+                        snprintf(okbuf, sizeof okbuf, "SUB|%s", room);
+                        send_ok(ctx->client_fd, okbuf);
+                    }
+                    // upto 为 0 表示房间尚无事件；until_id 传 0 意为不设上限
+                    if (upto > since_id)
+                        rooms_history_send(r, room, ctx->client_fd, since_id,
+                                           upto, 50, g_rate_down_bps);
+                    audit_log(ctx->peer_ip, ctx->username, "SUB", "", room, 0,
+                              0, "", "OK", "");
+                    if (p1)
+                        *p1 = '|';
                 }
-            } else if (strncmp(start, "UPLOAD|", 7) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
+            }
+        }
+    } else if (strncmp(start, "UNSUB|", 6) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            const char *room = start + 6;
+            if (!rooms_valid_name(room)) {
+                send_err(ctx->client_fd, "ROOM", "invalid");
+            } else {
+                Room *r = rooms_get_or_create(room);
+                if (!r) {
+                    send_err(ctx->client_fd, "INTERNAL", "room");
                 } else {
-                    handle_upload(ctx->client_fd, peer_ip, username, start);
+                    rooms_remove_subscriber(r, ctx->client_fd);
+                    {
+                        char okbuf[256];
+                        snprintf(okbuf, sizeof okbuf, "UNSUB|%s", room);
+                        send_ok(ctx->client_fd, okbuf);
+                    }
+                    audit_log(ctx->peer_ip, ctx->username, "UNSUB", "", room, 0,
+                              0, "", "OK", "");
                 }
-            } else if (strncmp(start, "DOWNLOAD|", 9) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
-                } else {
-                    handle_download(ctx->client_fd, peer_ip, username, start);
+            }
+        }
+    } else if (strncmp(start, "HISTORY|", 8) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            // HISTORY|room|limit[|since_id]
+            char *p1 = strchr(start + 8, '|');
+            if (!p1) {
+                send_err(ctx->client_fd, "FORMAT", "HISTORY fields");
+            } else {
+                *p1 = '\0';
+                const char *room = start + 8;
+                char *p2 = strchr(p1 + 1, '|');
+                const char *limit_s = p1 + 1;
+                long long limit = atoll(limit_s);
+                if (limit <= 0)
+                    limit = 50;
+                unsigned long long since_id = 0ULL;
+                if (p2) {
+                    *p2 = '\0';
+                    since_id = strtoull(p2 + 1, NULL, 10);
                 }
-            } else if (strncmp(start, "SUB|", 4) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
+                if (!rooms_valid_name(room)) {
+                    send_err(ctx->client_fd, "ROOM", "invalid");
                 } else {
-                    // 解析: SUB|room[|since_id]
-                    char *p1 = strchr(start + 4, '|');
-                    unsigned long long since_id = 0ULL;
-                    if (p1) {
-                        *p1 = '\0';
-                        since_id = strtoull(p1 + 1, NULL, 10);
-                    }
-                    const char *room = start + 4;
-                    if (!rooms_valid_name(room)) {
-                        send_err(ctx->client_fd, "ROOM", "invalid");
-                        if (p1)
-                            *p1 = '|';
+                    Room *r = rooms_get_or_create(room);
+                    if (!r) {
+                        send_err(ctx->client_fd, "INTERNAL", "room");
                     } else {
-                        Room *r = rooms_get_or_create(room);
-                        if (!r) {
-                            send_err(ctx->client_fd, "INTERNAL", "room");
-                            if (p1)
-                                *p1 = '|';
-                        } else {
-                            rooms_assign_owner_if_empty(r, username);
-                            rooms_add_subscriber_ex(r, ctx->client_fd,
-                                                    username);
-                            {
-                                char okbuf[256];
-                                snprintf(okbuf, sizeof okbuf, "SUB|%s", room);
-                                send_ok(ctx->client_fd, okbuf);
-                            }
-                            rooms_history_send(r, room, ctx->client_fd,
-                                               since_id, 50, g_rate_down_bps);
-                            audit_log(peer_ip, username, "SUB", "", room, 0, 0,
-                                      "", "OK", "");
-                            if (p1)
-                                *p1 = '|';
-                        }
+                        rooms_history_send(r, room, ctx->client_fd, since_id, 0,
+                                           (size_t)limit, g_rate_down_bps);
+                        send_ok(ctx->client_fd, "HISTORY");
                     }
                 }
-            } else if (strncmp(start, "UNSUB|", 6) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
+            }
+        }
+    } else if (strncmp(start, "PUBT|", 5) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            // PUBT|room|len|sha
+            char *p1 = strchr(start + 5, '|');
+            if (!p1) {
+                send_err(ctx->client_fd, "FORMAT", "PUBT fields");
+            } else {
+                *p1 = '\0';
+                const char *room = start + 5;
+                char *p2 = strchr(p1 + 1, '|');
+                if (!p2) {
+                    send_err(ctx->client_fd, "FORMAT", "PUBT fields");
                 } else {
-                    const char *room = start + 6;
-                    if (!rooms_valid_name(room)) {
-                        send_err(ctx->client_fd, "ROOM", "invalid");
+                    *p2 = '\0';
+                    long long len = atoll(p1 + 1);
+                    const char *sha_hex = p2 + 1;
+                    if (!rooms_valid_name(room) || len < 0 ||
+                        len > g_max_upload) {
+                        send_err(ctx->client_fd, "FORMAT", "bad room/len");
                     } else {
                         Room *r = rooms_get_or_create(room);
                         if (!r) {
                             send_err(ctx->client_fd, "INTERNAL", "room");
                         } else {
-                            rooms_remove_subscriber(r, ctx->client_fd);
-                            {
-                                char okbuf[256];
-                                snprintf(okbuf, sizeof okbuf, "UNSUB|%s", room);
-                                send_ok(ctx->client_fd, okbuf);
-                            }
-                            audit_log(peer_ip, username, "UNSUB", "", room, 0,
-                                      0, "", "OK", "");
-                        }
-                    }
-                }
-            } else if (strncmp(start, "HISTORY|", 8) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
-                } else {
-                    // HISTORY|room|limit[|since_id]
-                    char *p1 = strchr(start + 8, '|');
-                    if (!p1) {
-                        send_err(ctx->client_fd, "FORMAT", "HISTORY fields");
-                    } else {
-                        *p1 = '\0';
-                        const char *room = start + 8;
-                        char *p2 = strchr(p1 + 1, '|');
-                        const char *limit_s = p1 + 1;
-                        long long limit = atoll(limit_s);
-                        if (limit <= 0)
-                            limit = 50;
-                        unsigned long long since_id = 0ULL;
-                        if (p2) {
-                            *p2 = '\0';
-                            since_id = strtoull(p2 + 1, NULL, 10);
-                        }
-                        if (!rooms_valid_name(room)) {
-                            send_err(ctx->client_fd, "ROOM", "invalid");
-                        } else {
-                            Room *r = rooms_get_or_create(room);
-                            if (!r) {
-                                send_err(ctx->client_fd, "INTERNAL", "room");
-                            } else {
-                                rooms_history_send(r, room, ctx->client_fd,
-                                                   since_id, (size_t)limit,
-                                                   g_rate_down_bps);
-                                send_ok(ctx->client_fd, "HISTORY");
-                            }
-                        }
-                    }
-                }
-            } else if (strncmp(start, "PUBT|", 5) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
-                } else {
-                    // PUBT|room|len|sha
-                    char *p1 = strchr(start + 5, '|');
-                    if (!p1) {
-                        send_err(ctx->client_fd, "FORMAT", "PUBT fields");
-                    } else {
-                        *p1 = '\0';
-                        const char *room = start + 5;
-                        char *p2 = strchr(p1 + 1, '|');
-                        if (!p2) {
-                            send_err(ctx->client_fd, "FORMAT", "PUBT fields");
-                        } else {
-                            *p2 = '\0';
-                            long long len = atoll(p1 + 1);
-                            const char *sha_hex = p2 + 1;
-                            if (!rooms_valid_name(room) || len < 0 ||
-                                len > g_max_upload) {
-                                send_err(ctx->client_fd, "FORMAT",
-                                         "bad room/len");
+                            rooms_assign_owner_if_empty(r, ctx->username);
+                            send(ctx->client_fd, "READY\n", 6, 0);
+                            unsigned char *buf =
+                                (unsigned char *)malloc((size_t)len);
+                            if (!buf) {
+                                send_err(ctx->client_fd, "INTERNAL", "oom");
+                            } else if (recv_exact(ctx->client_fd, buf,
+                                                  (size_t)len) != 0) {
+                                free(buf);
+                                send_err(ctx->client_fd, "SIZE", "short");
                             } else {
-                                Room *r = rooms_get_or_create(room);
-                                if (!r) {
-                                    send_err(ctx->client_fd, "INTERNAL",
-                                             "room");
+                                unsigned char dg[SHA256_DIGEST_LENGTH];
+                                SHA256_CTX c;
+                                SHA256_Init(&c);
+                                SHA256_Update(&c, buf, (size_t)len);
+                                SHA256_Final(dg, &c);
+                                char hx[SHA256_DIGEST_LENGTH * 2 + 1];
+                                to_hex(dg, sizeof dg, hx, sizeof hx);
+                                if (!hex_equal_nocase(hx, sha_hex)) {
+                                    free(buf);
+                                    send_err(ctx->client_fd, "CHECKSUM",
+                                             "mismatch");
+                                    audit_log(ctx->peer_ip, ctx->username,
+                                              "PUBT", "", room, 0, len, hx,
+                                              "ERR", "CHECKSUM");
                                 } else {
-                                    rooms_assign_owner_if_empty(r, username);
-                                    send(ctx->client_fd, "READY\n", 6, 0);
-                                    unsigned char *buf =
-                                        (unsigned char *)malloc((size_t)len);
-                                    if (!buf) {
+                                    char ts[64];
+                                    rfc3339_time(ts, sizeof ts);
+                                    uint64_t event_id = 0;
+                                    int st_rc = rooms_store_text(
+                                        r, room, ts, ctx->username, buf,
+                                        (size_t)len, hx, &event_id);
+                                    if (st_rc != 0 || event_id == 0) {
                                         send_err(ctx->client_fd, "INTERNAL",
-                                                 "oom");
-                                    } else if (recv_exact(ctx->client_fd, buf,
-                                                          (size_t)len) != 0) {
-                                        free(buf);
-                                        send_err(ctx->client_fd, "SIZE",
-                                                 "short");
+                                                 "store text");
                                     } else {
-                                        unsigned char dg[SHA256_DIGEST_LENGTH];
-                                        SHA256_CTX c;
-                                        SHA256_Init(&c);
-                                        SHA256_Update(&c, buf, (size_t)len);
-                                        SHA256_Final(dg, &c);
-                                        char hx[SHA256_DIGEST_LENGTH * 2 + 1];
-                                        to_hex(dg, sizeof dg, hx, sizeof hx);
-                                        if (!hex_equal_nocase(hx, sha_hex)) {
-                                            free(buf);
-                                            send_err(ctx->client_fd, "CHECKSUM",
-                                                     "mismatch");
-                                            audit_log(peer_ip, username, "PUBT",
-                                                      "", room, 0, len, hx,
-                                                      "ERR", "CHECKSUM");
-                                        } else {
-                                            char ts[64];
-                                            rfc3339_time(ts, sizeof ts);
-                                            uint64_t event_id = 0;
-                                            int st_rc = rooms_store_text(
-                                                r, room, ts, username, buf,
-                                                (size_t)len, hx, &event_id);
-                                            if (st_rc != 0 || event_id == 0) {
-                                                send_err(ctx->client_fd,
-                                                         "INTERNAL",
-                                                         "store text");
-                                            } else {
-                                                rooms_fanout_text(
-                                                    r, room, ts, username,
-                                                    event_id, buf, (size_t)len,
-                                                    hx, g_rate_down_bps);
-                                                {
-                                                    char okbuf[128];
-                                                    snprintf(
-                                                        okbuf, sizeof okbuf,
-                                                        "PUBT|%llu",
-                                                        (unsigned long long)
-                                                            event_id);
-                                                    send_ok(ctx->client_fd,
-                                                            okbuf);
-                                                }
-                                                audit_log(peer_ip, username,
-                                                          "PUBT", "", room,
-                                                          (unsigned long long)
-                                                              event_id,
-                                                          len, hx, "OK", "");
-                                            }
-                                            free(buf);
+                                        rooms_fanout_text(
+                                            r, room, ts, ctx->username,
+                                            event_id, buf, (size_t)len, hx,
+                                            g_rate_down_bps);
+                                        {
+                                            char okbuf[128];
+                                            snprintf(
+                                                okbuf, sizeof okbuf,
+                                                "PUBT|%llu",
+                                                (unsigned long long)event_id);
+                                            send_ok(ctx->client_fd, okbuf);
                                         }
+                                        audit_log(ctx->peer_ip, ctx->username,
+                                                  "PUBT", "", room,
+                                                  (unsigned long long)event_id,
+                                                  len, hx, "OK", "");
                                     }
+                                    free(buf);
                                 }
                             }
                         }
                     }
                 }
-            } else if (strncmp(start, "PUBF|", 5) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
-                } else {
-                    // PUBF|room|filename|size|sha
-                    char *p1 = strchr(start + 5, '|');
-                    if (!p1) {
-                        send_err(ctx->client_fd, "FORMAT", "PUBF fields");
-                    } else {
-                        *p1 = '\0';
-                        const char *room = start + 5;
-                        char *p2 = strchr(p1 + 1, '|');
-                        if (!p2) {
-                            send_err(ctx->client_fd, "FORMAT", "PUBF fields");
-                        } else {
-                            *p2 = '\0';
-                            const char *filename = p1 + 1;
-                            char *p3 = strchr(p2 + 1, '|');
-                            if (!p3) {
-                                send_err(ctx->client_fd, "FORMAT",
-                                         "PUBF fields");
-                            } else {
-                                *p3 = '\0';
-                                long long size = atoll(p2 + 1);
-                                const char *sha_hex = p3 + 1;
-                                if (!rooms_valid_name(room) ||
-                                    !is_safe_filename(filename) || size < 0 ||
-                                    size > g_max_upload) {
-                                    send_err(ctx->client_fd, "FORMAT",
-                                             "bad room/file/size");
-                                } else {
-                                    Room *r = rooms_get_or_create(room);
-                                    if (!r) {
-                                        send_err(ctx->client_fd, "INTERNAL",
-                                                 "room");
-                                    } else {
-                                        rooms_assign_owner_if_empty(r,
-                                                                    username);
-                                        char tmp_path[PATH_MAX];
-                                        if (snprintf(tmp_path, sizeof tmp_path,
-                                                     "%s/.%s.part", g_data_dir,
-                                                     filename) >=
-                                            (int)sizeof(tmp_path)) {
-                                            send_err(ctx->client_fd, "FORMAT",
-                                                     "name too long");
-                                        } else {
-                                            send(ctx->client_fd, "READY\n", 6,
-                                                 0);
-                                            FILE *f = fopen(tmp_path, "wb");
-                                            if (!f) {
-                                                send_err(ctx->client_fd,
-                                                         "INTERNAL", "tmp");
-                                            } else {
-                                                SHA256_CTX c;
-                                                SHA256_Init(&c);
-                                                const size_t BUF = 8192;
-                                                unsigned char *buf =
-                                                    (unsigned char *)malloc(
-                                                        BUF);
-                                                long long remain = size;
-                                                int fail = 0;
-                                                while (remain > 0) {
-                                                    size_t chunk =
-                                                        (remain >
-                                                         (long long)BUF)
-                                                            ? BUF
-                                                            : (size_t)remain;
-                                                    if (recv_exact(
-                                                            ctx->client_fd, buf,
-                                                            chunk) != 0) {
-                                                        fail = 1;
-                                                        break;
-                                                    }
-                                                    fwrite(buf, 1, chunk, f);
-                                                    SHA256_Update(&c, buf,
-                                                                  chunk);
-                                                    remain -= chunk;
-                                                }
-                                                free(buf);
-                                                fflush(f);
-                                                fsync(fileno(f));
-                                                fclose(f);
-                                                if (fail) {
-                                                    remove(tmp_path);
-                                                    send_err(ctx->client_fd,
-                                                             "SIZE", "short");
-                                                } else {
-                                                    unsigned char dg
-                                                        [SHA256_DIGEST_LENGTH];
-                                                    SHA256_Final(dg, &c);
-                                                    char hx
-                                                        [SHA256_DIGEST_LENGTH *
-                                                             2 +
-                                                         1];
-                                                    to_hex(dg, sizeof dg, hx,
-                                                           sizeof hx);
-                                                    if (!hex_equal_nocase(
-                                                            hx, sha_hex)) {
-                                                        remove(tmp_path);
-                                                        send_err(ctx->client_fd,
-                                                                 "CHECKSUM",
-                                                                 "mismatch");
-                                                        audit_log(
-                                                            peer_ip, username,
-                                                            "PUBF", "", room, 0,
-                                                            size, hx, "ERR",
-                                                            "CHECKSUM");
-                                                    } else {
-                                                        char ts[64];
-                                                        rfc3339_time(ts,
-                                                                     sizeof ts);
-                                                        uint64_t event_id = 0;
-                                                        int sf_rc =
-                                                            rooms_store_file(
-                                                                r, room, ts,
-                                                                username,
-                                                                filename,
-                                                                (size_t)size,
-                                                                hx, tmp_path,
-                                                                &event_id);
-                                                        if (sf_rc != 0 ||
-                                                            event_id == 0) {
-                                                            send_err(
-                                                                ctx->client_fd,
-                                                                "INTERNAL",
-                                                                "store file");
-                                                        } else {
-                                                            rooms_fanout_file(
-                                                                r, room, ts,
-                                                                username,
-                                                                event_id,
-                                                                filename,
-                                                                (size_t)size,
-                                                                hx,
-                                                                g_rate_down_bps);
-                                                            {
-                                                                char okbuf[128];
-                                                                snprintf(
-                                                                    okbuf,
-                                                                    sizeof okbuf,
-                                                                    "PUBF|%llu",
-                                                                    (unsigned long long)
-                                                                        event_id);
-                                                                send_ok(
-                                                                    ctx->client_fd,
-                                                                    okbuf);
-                                                            }
-                                                            audit_log(
-                                                                peer_ip,
-                                                                username,
-                                                                "PUBF",
-                                                                filename, room,
-                                                                (unsigned long long)
-                                                                    event_id,
-                                                                size, hx, "OK",
-                                                                "");
-                                                        }
-                                                    }
-                                                }
-                                            }
-                                        }
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            } else if (strncmp(start, "ROOMINFO|", 9) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
+            }
+        }
+    } else if (strncmp(start, "OFFSET|", 7) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            handle_offset(ctx->client_fd, start);
+        }
+    } else if (strncmp(start, "PUBF|", 5) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            handle_pubf(ctx->client_fd, ctx->peer_ip, ctx->username, start);
+        }
+    } else if (strncmp(start, "ROOMINFO|", 9) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            const char *room = start + 9;
+            if (*room == '|')
+                room++;
+            if (!rooms_valid_name(room)) {
+                send_err(ctx->client_fd, "ROOM", "invalid");
+            } else {
+                Room *r = rooms_get_or_create(room);
+                if (!r) {
+                    send_err(ctx->client_fd, "INTERNAL", "room");
                 } else {
-                    const char *room = start + 9;
-                    if (*room == '|')
-                        room++;
-                    if (!rooms_valid_name(room)) {
-                        send_err(ctx->client_fd, "ROOM", "invalid");
-                    } else {
-                        Room *r = rooms_get_or_create(room);
-                        if (!r) {
-                            send_err(ctx->client_fd, "INTERNAL", "room");
-                        } else {
-                            char owner[64];
-                            int policy = 0;
-                            size_t subs = 0;
-                            unsigned long long last_eid = 0;
-                            time_t created = 0;
-                            rooms_get_info(r, owner, sizeof owner, &policy,
-                                           &subs, &last_eid, &created);
-                            char buf[256];
-                            snprintf(buf, sizeof buf,
-                                     "ROOMINFO|%s|%s|%d|%zu|%llu", room, owner,
-                                     policy, subs,
-                                     (unsigned long long)last_eid);
-                            send_ok(ctx->client_fd, buf);
-                        }
-                    }
+                    char owner[64];
+                    int policy = 0;
+                    size_t subs = 0;
+                    unsigned long long last_eid = 0;
+                    time_t created = 0;
+                    rooms_get_info(r, owner, sizeof owner, &policy, &subs,
+                                   &last_eid, &created);
+                    size_t queued = 0, max_depth = 0;
+                    unsigned long long dropped = 0, kicked = 0;
+                    rooms_get_fanout_stats(r, &queued, &max_depth, &dropped,
+                                           &kicked);
+                    char buf[320];
+                    snprintf(buf, sizeof buf,
+                             "ROOMINFO|%s|%s|%d|%zu|%llu|%zu|%zu|%llu|%llu",
+                             room, owner, policy, subs,
+                             (unsigned long long)last_eid, queued, max_depth,
+                             dropped, kicked);
+                    send_ok(ctx->client_fd, buf);
                 }
-            } else if (strncmp(start, "SETPOLICY|", 10) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
+            }
+        }
+    } else if (strncmp(start, "SETPOLICY|", 10) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            // SETPOLICY|room|retain|delegate|teardown
+            char *p1 = strchr(start + 10, '|');
+            if (!p1) {
+                send_err(ctx->client_fd, "FORMAT", "SETPOLICY fields");
+            } else {
+                *p1 = '\0';
+                const char *room = start + 10;
+                const char *pols = p1 + 1;
+                if (!rooms_valid_name(room)) {
+                    send_err(ctx->client_fd, "ROOM", "invalid");
                 } else {
-                    // SETPOLICY|room|retain|delegate|teardown
-                    char *p1 = strchr(start + 10, '|');
-                    if (!p1) {
-                        send_err(ctx->client_fd, "FORMAT", "SETPOLICY fields");
+                    Room *r = rooms_get_or_create(room);
+                    if (!r) {
+                        send_err(ctx->client_fd, "INTERNAL", "room");
                     } else {
-                        *p1 = '\0';
-                        const char *room = start + 10;
-                        const char *pols = p1 + 1;
-                        if (!rooms_valid_name(room)) {
-                            send_err(ctx->client_fd, "ROOM", "invalid");
+                        char owner[64];
+                        int policy = 0;
+                        size_t subs = 0;
+                        unsigned long long last_eid = 0;
+                        time_t created = 0;
+                        rooms_get_info(r, owner, sizeof owner, &policy, &subs,
+                                       &last_eid, &created);
+                        if (strcmp(owner, ctx->username) != 0) {
+                            send_err(ctx->client_fd, "PERM", "owner required");
                         } else {
-                            Room *r = rooms_get_or_create(room);
-                            if (!r) {
-                                send_err(ctx->client_fd, "INTERNAL", "room");
-                            } else {
-                                char owner[64];
-                                int policy = 0;
-                                size_t subs = 0;
-                                unsigned long long last_eid = 0;
-                                time_t created = 0;
-                                rooms_get_info(r, owner, sizeof owner, &policy,
-                                               &subs, &last_eid, &created);
-                                if (strcmp(owner, username) != 0) {
-                                    send_err(ctx->client_fd, "PERM",
-                                             "owner required");
-                                } else {
-                                    int newp = 0;
-                                    if (strcmp(pols, "retain") == 0)
-                                        newp = 0;
-                                    else if (strcmp(pols, "delegate") == 0)
-                                        newp = 1;
-                                    else if (strcmp(pols, "teardown") == 0)
-                                        newp = 2;
-                                    else {
-                                        send_err(ctx->client_fd, "FORMAT",
-                                                 "policy");
-                                        goto after_setpolicy;
-                                    }
-                                    rooms_set_policy(r, newp);
-                                    send_ok(ctx->client_fd, "SETPOLICY");
-                                }
+                            int newp = 0;
+                            if (strcmp(pols, "retain") == 0)
+                                newp = 0;
+                            else if (strcmp(pols, "delegate") == 0)
+                                newp = 1;
+                            else if (strcmp(pols, "teardown") == 0)
+                                newp = 2;
+                            else {
+                                send_err(ctx->client_fd, "FORMAT", "policy");
+                                goto after_setpolicy;
                             }
+                            rooms_set_policy(r, newp);
+                            send_ok(ctx->client_fd, "SETPOLICY");
                         }
                     }
                 }
-            after_setpolicy:;
-            } else if (strncmp(start, "TRANSFER|", 9) == 0) {
-                if (!authenticated) {
-                    send_err(ctx->client_fd, "PERM", "login required");
+            }
+        }
+    after_setpolicy:;
+    } else if (strncmp(start, "TRANSFER|", 9) == 0) {
+        if (!ctx->authenticated) {
+            send_err(ctx->client_fd, "PERM", "login required");
+        } else {
+            // TRANSFER|room|new_owner
+            char *p1 = strchr(start + 9, '|');
+            if (!p1) {
+                send_err(ctx->client_fd, "FORMAT", "TRANSFER fields");
+            } else {
+                *p1 = '\0';
+                const char *room = start + 9;
+                const char *new_owner = p1 + 1;
+                if (!rooms_valid_name(room) || !*new_owner) {
+                    send_err(ctx->client_fd, "FORMAT", "room/new_owner");
                 } else {
-                    // TRANSFER|room|new_owner
-                    char *p1 = strchr(start + 9, '|');
-                    if (!p1) {
-                        send_err(ctx->client_fd, "FORMAT", "TRANSFER fields");
+                    Room *r = rooms_get_or_create(room);
+                    if (!r) {
+                        send_err(ctx->client_fd, "INTERNAL", "room");
                     } else {
-                        *p1 = '\0';
-                        const char *room = start + 9;
-                        const char *new_owner = p1 + 1;
-                        if (!rooms_valid_name(room) || !*new_owner) {
-                            send_err(ctx->client_fd, "FORMAT",
-                                     "room/new_owner");
+                        char owner[64];
+                        int policy = 0;
+                        size_t subs = 0;
+                        unsigned long long last_eid = 0;
+                        time_t created = 0;
+                        rooms_get_info(r, owner, sizeof owner, &policy, &subs,
+                                       &last_eid, &created);
+                        if (strcmp(owner, ctx->username) != 0) {
+                            send_err(ctx->client_fd, "PERM", "owner required");
                         } else {
-                            Room *r = rooms_get_or_create(room);
-                            if (!r) {
-                                send_err(ctx->client_fd, "INTERNAL", "room");
-                            } else {
-                                char owner[64];
-                                int policy = 0;
-                                size_t subs = 0;
-                                unsigned long long last_eid = 0;
-                                time_t created = 0;
-                                rooms_get_info(r, owner, sizeof owner, &policy,
-                                               &subs, &last_eid, &created);
-                                if (strcmp(owner, username) != 0) {
-                                    send_err(ctx->client_fd, "PERM",
-                                             "owner required");
-                                } else {
-                                    rooms_set_owner(r, new_owner);
-                                    char okbuf[128];
-                                    snprintf(okbuf, sizeof okbuf, "TRANSFER|%s",
-                                             new_owner);
-                                    send_ok(ctx->client_fd, okbuf);
-                                }
-                            }
+                            rooms_set_owner(r, new_owner);
+                            char okbuf[128];
+                            snprintf(okbuf, sizeof okbuf, "TRANSFER|%s",
+                                     new_owner);
+                            send_ok(ctx->client_fd, okbuf);
                         }
                     }
                 }
-                send_ok(ctx->client_fd, "BYE");
-                goto done;
-            } else if (*start == '\0') {
-                // ignore empty line
-            } else {
-                send_err(ctx->client_fd, "FORMAT", "unknown command");
             }
-            start = nl + 1;
         }
-        // 压缩剩余未处理数据
-        size_t remain = (inbuf + inlen) - start;
-        memmove(inbuf, start, remain);
-        inlen = remain;
-        inbuf[inlen] = '\0';
+        send_ok(ctx->client_fd, "BYE");
+        return 1;
+    } else if (*start == '\0') {
+        // ignore empty line
+    } else {
+        send_err(ctx->client_fd, "FORMAT", "unknown command");
+    }
+    return 0;
+}
+
+// 处理 inbuf 中所有完整的命令行，剩余的不完整部分移到缓冲区开头。
+// 返回 1 表示应关闭连接。
+static int client_process_input(client_ctx_t *ctx) {
+    ctx->inbuf[ctx->inlen] = '\0';
+    char *start = ctx->inbuf;
+    int quit = 0;
+    for (;;) {
+        char *nl = memchr(start, '\n', ctx->inbuf + ctx->inlen - start);
+        if (!nl)
+            break;
+        *nl = '\0';
+        // 执行命令期间暂停向本连接扇出，事件留在队列中，不与应答交错
+        rooms_conn_lock(ctx->client_fd);
+        quit = client_handle_line(ctx, start);
+        rooms_conn_unlock(ctx->client_fd);
+        start = nl + 1;
+        if (quit)
+            break;
     }
-done:
+    // 压缩剩余未处理数据
+    size_t remain = (ctx->inbuf + ctx->inlen) - start;
+    memmove(ctx->inbuf, start, remain);
+    ctx->inlen = remain;
+    ctx->inbuf[ctx->inlen] = '\0';
+    return quit;
+}
+
+// 从 fd 读一次追加到 inbuf 并处理。返回 1 表示连接已结束（对端关闭、出错、
+// 超时、一行超过缓冲区或客户端请求断开）。
+static int client_read_and_process(client_ctx_t *ctx) {
+    if (ctx->inlen >= sizeof(ctx->inbuf) - 1)
+        return 1;
+    ssize_t n = recv(ctx->client_fd, ctx->inbuf + ctx->inlen,
+                     sizeof(ctx->inbuf) - 1 - ctx->inlen, 0);
+    if (n <= 0)
+        return 1;
+    ctx->inlen += (size_t)n;
+    return client_process_input(ctx);
+}
+
+static void client_init(client_ctx_t *ctx) {
+    set_socket_timeouts(ctx->client_fd, g_rcv_timeout_sec);
+    inet_ntop(AF_INET, &ctx->addr.sin_addr, ctx->peer_ip, sizeof ctx->peer_ip);
+    ctx->authenticated = 0;
+    ctx->username[0] = '\0';
+    ctx->inlen = 0;
+}
+
+static void client_close(client_ctx_t *ctx) {
     // remove this fd from all rooms to avoid stale subscriptions
     rooms_remove_fd_from_all(ctx->client_fd);
     // if this user is an owner of any room, apply policy on disconnect
-    if (username[0] != '\0') {
-        rooms_handle_owner_disconnect(username, g_rate_down_bps);
+    if (ctx->username[0] != '\0') {
+        rooms_handle_owner_disconnect(ctx->username, g_rate_down_bps);
     }
     close(ctx->client_fd);
     // decrement active connection counter
@@ -1391,9 +2226,72 @@ done:
         g_active_conn--;
     pthread_mutex_unlock(&g_conn_mu);
     free(ctx);
+}
+
+// thread 模式：每个连接一个线程，阻塞读直到连接结束
+static void *handle_client(void *arg) {
+    client_ctx_t *ctx = (client_ctx_t *)arg;
+    client_init(ctx);
+    while (!client_read_and_process(ctx)) {
+    }
+    client_close(ctx);
     return NULL;
 }
 
+// epoll 模式：连接以 EPOLLONESHOT 注册，就绪时由一个工作线程读一次并处理
+// 其中完整的命令，再重新挂回。空闲连接与订阅者不占线程；一个命令执行期间
+// （含正文收发）占用一个工作线程，与 thread 模式的语义相同。
+static int epoll_arm(client_ctx_t *ctx, int op) {
+    struct epoll_event ev;
+    memset(&ev, 0, sizeof ev);
+    ev.events = EPOLLIN | EPOLLRDHUP | EPOLLONESHOT;
+    ev.data.ptr = ctx;
+    return epoll_ctl(g_epoll_fd, op, ctx->client_fd, &ev);
+}
+
+static void *epoll_worker(void *arg) {
+    (void)arg;
+    for (;;) {
+        struct epoll_event ev;
+        // 每次只取一个事件：避免一个耗时命令拖住同批其它就绪连接
+        int n = epoll_wait(g_epoll_fd, &ev, 1, -1);
+        if (n < 0) {
+            if (errno == EINTR)
+                continue;
+            perror("epoll_wait");
+            break;
+        }
+        if (n == 0)
+            continue;
+        client_ctx_t *ctx = (client_ctx_t *)ev.data.ptr;
+        if (client_read_and_process(ctx) ||
+            epoll_arm(ctx, EPOLL_CTL_MOD) != 0) {
+            (void)epoll_ctl(g_epoll_fd, EPOLL_CTL_DEL, ctx->client_fd, NULL);
+            client_close(ctx);
+        }
+    }
+    return NULL;
+}
+
+static int epoll_start(int workers) {
+    // 数万连接需要同样多的 fd：软上限提到硬上限
+    struct rlimit rl;
+    if (getrlimit(RLIMIT_NOFILE, &rl) == 0 && rl.rlim_cur < rl.rlim_max) {
+        rl.rlim_cur = rl.rlim_max;
+        (void)setrlimit(RLIMIT_NOFILE, &rl);
+    }
+    g_epoll_fd = epoll_create1(EPOLL_CLOEXEC);
+    if (g_epoll_fd < 0)
+        return -1;
+    for (int i = 0; i < workers; ++i) {
+        pthread_t tid;
+        if (pthread_create(&tid, NULL, epoll_worker, NULL) != 0)
+            return -1;
+        pthread_detach(tid);
+    }
+    return 0;
+}
+
 static int getenv_int(const char *name, int defval) {
     const char *v = getenv(name);
     if (!v || !*v)
@@ -1424,11 +2322,17 @@ int main(void) {
         snprintf(g_data_dir, sizeof g_data_dir, "%s", dd);
     }
     g_auth_strict = getenv_int("DRLMS_AUTH_STRICT", 0) ? 1 : 0;
-    g_max_conn = getenv_int("DRLMS_MAX_CONN", 128);
+    const char *io_mode = getenv("DRLMS_IO_MODE");
+    g_io_epoll = io_mode && strcmp(io_mode, "epoll") == 0;
+    if (io_mode && *io_mode && !g_io_epoll && strcmp(io_mode, "thread") != 0)
+        fprintf(stderr, "unknown DRLMS_IO_MODE=%s, using thread\n", io_mode);
+    // epoll 模式下空闲连接不占线程，默认上限相应放宽
+    g_max_conn = getenv_int("DRLMS_MAX_CONN", g_io_epoll ? 50000 : 128);
     g_rate_up_bps = getenv_ll("DRLMS_RATE_UP_BPS", 0);
     g_rate_down_bps = getenv_ll("DRLMS_RATE_DOWN_BPS", 0);
     g_max_upload = getenv_ll("DRLMS_MAX_UPLOAD", 100LL * 1024 * 1024);
     g_rcv_timeout_sec = getenv_int("DRLMS_RCV_TIMEOUT", 319);
+    g_partial_ttl = getenv_ll("DRLMS_PARTIAL_TTL", 86400);
     // TCP keepalive tuning via env
     g_tcp_keepalive_enabled = getenv_int("DRLMS_TCP_KEEPALIVE", 1) ? 1 : 0;
 #ifdef TCP_KEEPIDLE
@@ -1461,21 +2365,81 @@ int main(void) {
     pos += fn_len;
     g_audit_path[pos] = '\0';
     // 尝试加载用户文件（可选）
-    (void)load_users_file();
+    (void)users_table_reload();
+    // 默认按 CPU 数限制同时进行的 argon2 计算；0 表示不限
+    long ncpu = sysconf(_SC_NPROCESSORS_ONLN);
+    g_argon2_slots =
+        (int)getenv_ll("DRLMS_ARGON2_MAX_CONCURRENT", ncpu > 0 ? ncpu : 4);
+    auth_cache_init(getenv_ll("DRLMS_AUTH_CACHE_SIZE", 0),
+                    getenv_int("DRLMS_AUTH_CACHE_TTL", 300));
+    // 会话令牌：默认 15 分钟有效，DRLMS_SESSION_TTL=0 关闭
+    session_init(getenv_ll("DRLMS_SESSION_MAX", 4096),
+                 (int)getenv_ll("DRLMS_SESSION_TTL", 900));
+    // 旧格式用户的 Argon2 升级默认每秒合并写回一次；0 为登录时立即写回
+    upgrade_init(getenv_ll("DRLMS_UPGRADE_BATCH_MS", 1000),
+                 getenv_int("DRLMS_UPGRADE_BATCH_MAX", 256));
     if (shm_init() != 0) {
         perror("shm_init");
         return 1;
     }
+    cleanup_partials();
     if (rooms_init(g_data_dir) != 0) {
         fprintf(stderr, "rooms_init failed\n");
         return 1;
     }
+    // 0 关闭事件段稀疏索引（HISTORY 退回顺序扫描）
+    long long stride = getenv_ll("DRLMS_HISTORY_INDEX_STRIDE", 64);
+    rooms_set_index_stride(stride > 1000000 ? 1000000u : (unsigned)stride);
+    // 每房间最近事件缓存的字节预算，0 关闭
+    rooms_set_cache_budget(
+        (size_t)getenv_ll("DRLMS_ROOM_CACHE_BYTES", 1024LL * 1024));
+    // 房间事件段大小与保留策略（0=不限），超出的最旧封存段整段删除
+    rooms_set_retention(
+        (uint64_t)getenv_ll("DRLMS_SEGMENT_BYTES", 16LL * 1024 * 1024),
+        (uint64_t)getenv_ll("DRLMS_ROOM_RETAIN_BYTES", 0),
+        getenv_ll("DRLMS_ROOM_RETAIN_SECS", 0));
+    // 房间段追加的落盘策略：none | interval（默认，后台定时 fdatasync）|
+    // batch（发布等待落盘，并发发布组提交）
+    const char *fsync_env = getenv("DRLMS_FSYNC");
+    int fsync_policy = ROOMS_FSYNC_INTERVAL;
+    if (fsync_env && strcmp(fsync_env, "none") == 0)
+        fsync_policy = ROOMS_FSYNC_NONE;
+    else if (fsync_env && strcmp(fsync_env, "batch") == 0)
+        fsync_policy = ROOMS_FSYNC_BATCH;
+    else if (fsync_env && *fsync_env && strcmp(fsync_env, "interval") != 0)
+        fprintf(stderr, "unknown DRLMS_FSYNC=%s, using interval\n", fsync_env);
+    if (rooms_set_fsync_policy(
+            fsync_policy, (long)getenv_ll("DRLMS_FSYNC_INTERVAL_MS", 1000)) !=
+        0) {
+        fprintf(stderr, "rooms_set_fsync_policy failed\n");
+        return 1;
+    }
+    // 订阅者出站队列上限与慢消费者策略：drop-oldest | disconnect（默认，
+    // 断开后可凭 since_id 重新订阅补齐）| block（发布者限时等待）
+    const char *slow_env = getenv("DRLMS_SLOW_CONSUMER");
+    int slow_policy = ROOMS_SLOW_DISCONNECT;
+    if (slow_env && strcmp(slow_env, "drop-oldest") == 0)
+        slow_policy = ROOMS_SLOW_DROP_OLDEST;
+    else if (slow_env && strcmp(slow_env, "block") == 0)
+        slow_policy = ROOMS_SLOW_BLOCK;
+    else if (slow_env && *slow_env && strcmp(slow_env, "disconnect") != 0)
+        fprintf(stderr, "unknown DRLMS_SLOW_CONSUMER=%s, using disconnect\n",
+                slow_env);
+    rooms_set_slow_consumer(
+        slow_policy, (size_t)getenv_ll("DRLMS_SUB_QUEUE_BYTES", 1024LL * 1024),
+        (long)getenv_ll("DRLMS_SUB_BLOCK_MS", 5000));
     int sfd = create_server_socket(port);
     if (sfd < 0) {
         perror("create_server_socket");
         return 1;
     }
     g_listen_fd = sfd;
+    if (g_io_epoll && epoll_start(getenv_int("DRLMS_WORKERS", 8)) != 0) {
+        perror("epoll_start");
+        return 1;
+    }
+    // 订阅者断开后扇出写入不应杀死进程
+    signal(SIGPIPE, SIG_IGN);
     signal(SIGINT, on_signal);
     signal(SIGTERM, on_signal);
     fprintf(stdout, "server listening on port %d\n", port);
@@ -1516,6 +2480,12 @@ int main(void) {
         ctx->client_fd = cfd;
         ctx->addr = cli;
         enable_tcp_keepalive(cfd);
+        if (g_io_epoll) {
+            client_init(ctx);
+            if (epoll_arm(ctx, EPOLL_CTL_ADD) != 0)
+                client_close(ctx);
+            continue;
+        }
         pthread_t tid;
         int rc = pthread_create(&tid, NULL, handle_client, ctx);
         if (rc != 0) {
@@ -1531,6 +2501,7 @@ int main(void) {
         pthread_detach(tid);
     }
     close(sfd);
+    upgrade_shutdown();
     shm_cleanup();
     return 0;
 }
@@ -9,10 +9,58 @@
 #include <arpa/inet.h>
 #include <sys/socket.h>
 #include <time.h>
+#include <dirent.h>
+#include <fcntl.h>
+#include <sys/uio.h>
+#include <errno.h>
+#include <poll.h>
+
+// 房间事件存储：rooms/<room>/segments/<首个 event_id>.seg 为若干段文件，
+// 每条记录是一行 JSON 头部，TEXT 记录紧跟 len 字节正文与 '\n'。活动段写满
+// g_segment_bytes 后开启新段；封存段按字节数/时间保留策略整段删除。旧布局的
+// events.log（正文在 texts/<eid>.txt）作为只读的第一段继续可读。
+// 每段旁有稀疏索引 <首个 event_id>.idx（旧日志为 events.idx）= 8 字节魔数 +
+// 若干 (event_id, 段内行首偏移) 记录（各 8 字节，主机字节序）：段的首条记录
+// 及此后每 g_index_stride 条记录一个索引点。
+#define ROOMS_INDEX_MAGIC "DRLMSIX1"
+#define ROOMS_INDEX_MAGIC_LEN 8
+
+typedef struct Segment {
+    uint64_t first_eid;
+    int legacy; // events.log + texts/
+} Segment;
+
+typedef struct RoomIndexEntry {
+    uint64_t event_id;
+    uint64_t offset;
+    uint64_t seg_first; // 所在段（仅内存中）
+} RoomIndexEntry;
+
+// 最近事件环形缓存（每房间一份，受字节预算约束）：头部已按 EVT 行格式化，
+// TEXT 小负载内联；超过内联上限的负载留在段文件中，发送时再读。
+// 环中事件的 event_id 连续，且最后一条总是房间最新事件。
+typedef struct RecentEvent {
+    uint64_t event_id;
+    int refs;             // 环本身持有 1；HISTORY 发送期间 +1（room->mu 保护）
+    int on_disk;          // 负载未内联
+    uint64_t seg_first;   // on_disk 时正文所在段
+    uint64_t payload_off; // 及段内偏移
+    size_t hdr_len;
+    size_t payload_len;
+    size_t cost; // 计入预算的字节数
+    char *hdr;
+    unsigned char *payload;
+} RecentEvent;
+
+typedef struct OutQueue OutQueue;
 
 typedef struct Subscriber {
     int fd;
     char user[64];
+    OutQueue *q; // 该连接的出站队列（按 fd 共享，连接结束时才释放）
+    // 订阅时房间的 last_event_id：不超过它的事件由 SUB 回放发送，扇出跳过，
+    // 避免发布恰好落在 SUB 注册与回放之间时同一事件收到两次
+    uint64_t replay_upto;
 } Subscriber;
 
 struct Room {
@@ -24,17 +72,675 @@ struct Room {
     char owner[64];
     int policy; // 0=retain,1=delegate,2=teardown
     time_t created_at;
+    char name[65];
+    int store_loaded;
+    int idx_ok;    // 0=停用（event_id 非递增、内存不足或已关闭）
+    Segment *segs; // 按 first_eid 升序；最后一段为活动段（非旧日志时）
+    size_t segs_len;
+    size_t segs_cap;
+    uint64_t active_size; // 活动段的有效长度
+    RoomIndexEntry *idx;  // 所有段的索引点，按 event_id 升序
+    size_t idx_len;
+    size_t idx_cap;
+    unsigned long long idx_tail;     // 最后一个索引点起（含）的记录条数
+    unsigned long long idx_last_eid; // 最后一条记录的 event_id
+    int seg_fd;                      // 活动段的追加 fd（常开），-1=未打开
+    unsigned long long write_seq;    // 已追加的记录数
+    unsigned long long synced_seq;   // 其中已 fdatasync 的记录数
+    int syncing;                     // 有线程正在组提交
+    pthread_cond_t synced_cv;
+    RecentEvent **recent; // 环形缓冲：recent_head 为最旧一条
+    size_t recent_head;
+    size_t recent_len;
+    size_t recent_cap;
+    size_t recent_bytes;
+    unsigned long long fanout_dropped; // drop-oldest 丢弃的消息数
+    unsigned long long fanout_kicked;  // 因队列满被断开的订阅者数
 };
 
+// 房间表：按名字哈希到 ROOMS_SHARDS 个分片，每片一把读写锁和独立的桶数组
+// （平均链长超过 1 时翻倍），查找只锁一个分片，与房间总数无关。房间创建后
+// 不删除，另串在 g_rooms 全量链表上供后台刷盘遍历（只在表头插入，取得表头
+// 后可无锁遍历）。
+#define ROOMS_SHARDS 64
+// 房主索引每个分片的桶数（固定）
+#define OWNER_BUCKETS 256
+
 typedef struct RoomNode {
     char *name;
+    uint32_t hash;
     Room room;
-    struct RoomNode *next;
+    struct RoomNode *next;        // g_rooms 全量链表
+    struct RoomNode *bucket_next; // 分片桶内链
 } RoomNode;
 
+typedef struct RoomShard {
+    pthread_rwlock_t mu;
+    RoomNode **buckets;
+    size_t nbuckets; // 2 的幂
+    size_t count;
+} RoomShard;
+
+// 房主索引：用户名 -> 其拥有的房间。owner 下线时只处理这些房间
+typedef struct OwnerEntry {
+    struct OwnerEntry *next;
+    uint32_t hash;
+    char user[64];
+    Room **rooms;
+    size_t len;
+    size_t cap;
+} OwnerEntry;
+
+typedef struct OwnerShard {
+    pthread_mutex_t mu;
+    OwnerEntry *buckets[OWNER_BUCKETS];
+} OwnerShard;
+
 static RoomNode *g_rooms = NULL;
 static char g_rooms_dir[1024] = {0};
-static pthread_mutex_t g_rooms_mu = PTHREAD_MUTEX_INITIALIZER;
+static pthread_mutex_t g_rooms_mu =
+    PTHREAD_MUTEX_INITIALIZER; // 仅保护 g_rooms 表头
+static RoomShard g_shards[ROOMS_SHARDS];
+static OwnerShard g_owner_shards[ROOMS_SHARDS];
+static pthread_once_t g_shards_once = PTHREAD_ONCE_INIT;
+static unsigned g_index_stride = 64;
+static size_t g_cache_budget = 1024 * 1024;
+static uint64_t g_segment_bytes = 16ULL * 1024 * 1024;
+static uint64_t g_retain_bytes = 0; // 0=不限
+static long long g_retain_secs = 0; // 0=不限
+static int g_fsync_policy = ROOMS_FSYNC_INTERVAL;
+static long g_fsync_interval_ms = 1000;
+static int g_flusher_started = 0;
+
+static void room_store_ensure_locked(Room *room);
+
+// 订阅者发送队列：每个订阅连接（按 fd，跨房间共享，保证顺序且只有一个写者）
+// 一条有界出站队列，由后台发送线程以非阻塞 send 排空。发布路径只入队，
+// 慢订阅者不再拖住发布者与同房间的其他订阅者。队列字节数超过
+// g_subq_bytes 时按 g_slow_policy 处理：丢最旧消息、断开该订阅者，或让
+// 发布者最多等待 g_block_ms 毫秒（超时后断开）。
+// 连接自身处理命令期间持有 wmu（rooms_conn_lock），发送线程此时不写该 fd，
+// 事件暂留队列，避免与命令应答在字节流中交错。
+typedef struct OutBuf {
+    int refs; // 原子计数：同一事件被所有订阅者队列共享
+    size_t len;
+    unsigned char data[];
+} OutBuf;
+
+typedef struct OutItem {
+    struct OutItem *next;
+    OutBuf *buf;
+} OutItem;
+
+struct OutQueue {
+    pthread_mutex_t mu;      // 保护队列结构与以下标志
+    pthread_mutex_t wmu;     // 写 fd 的权利：发送线程 trylock，连接自身 lock
+    pthread_cond_t space_cv; // block 策略：等待腾出空间
+    int fd;
+    int refs;        // 注册表 1 + 发送线程调度期间 1（原子）
+    int dead;        // 已断开/出错/连接结束：不再触碰 fd
+    int sched;       // 已交给发送线程（就绪、等待可写或限速中）
+    int held;        // 连接自身持有 wmu
+    int close_after; // 排空后 shutdown（teardown）
+    int waiters;     // block 策略下正在等待空间的发布者数（至多 1）
+    OutItem *head, *tail;
+    size_t off; // 队首消息已发送的字节数
+    size_t depth;
+    size_t bytes;
+    long long rate_bps;
+    struct timespec not_before; // 限速：下一次发送的最早时间
+    OutQueue *next;             // 发送线程就绪链表
+    Room **rooms; // 反向索引：该连接订阅过的房间（可能含已被摘除的，摘除幂等）
+    size_t nrooms;
+    size_t caprooms;
+};
+
+static OutQueue **g_outq = NULL; // 按 fd 索引
+static size_t g_outq_cap = 0;
+static pthread_mutex_t g_outq_mu = PTHREAD_MUTEX_INITIALIZER;
+static size_t g_subq_bytes = 1024 * 1024;
+static int g_slow_policy = ROOMS_SLOW_DISCONNECT;
+static long g_block_ms = 5000;
+static pthread_mutex_t g_send_mu = PTHREAD_MUTEX_INITIALIZER;
+static OutQueue *g_ready_head = NULL;
+static OutQueue *g_ready_tail = NULL;
+static int g_sender_sleeping = 0;
+static int g_wake_pipe[2] = {-1, -1};
+static pthread_once_t g_sender_once = PTHREAD_ONCE_INIT;
+
+static void *rooms_sender_main(void *arg);
+
+static void sender_start(void) {
+    if (pipe(g_wake_pipe) != 0) {
+        perror("sender pipe");
+        return;
+    }
+    for (int i = 0; i < 2; ++i) {
+        fcntl(g_wake_pipe[i], F_SETFL, O_NONBLOCK);
+        fcntl(g_wake_pipe[i], F_SETFD, FD_CLOEXEC);
+    }
+    pthread_t th;
+    if (pthread_create(&th, NULL, rooms_sender_main, NULL) != 0) {
+        perror("pthread_create sender");
+        return;
+    }
+    pthread_detach(th);
+}
+
+int rooms_set_slow_consumer(int policy, size_t queue_bytes, long block_ms) {
+    if (policy < ROOMS_SLOW_DROP_OLDEST || policy > ROOMS_SLOW_BLOCK)
+        return -1;
+    g_slow_policy = policy;
+    if (queue_bytes > 0)
+        g_subq_bytes = queue_bytes;
+    if (block_ms > 0)
+        g_block_ms = block_ms;
+    return 0;
+}
+
+static OutBuf *outbuf_new(const char *hdr, size_t hl,
+                          const unsigned char *payload, size_t len) {
+    OutBuf *b = (OutBuf *)malloc(sizeof(OutBuf) + hl + len);
+    if (!b)
+        return NULL;
+    b->refs = 1;
+    b->len = hl + len;
+    memcpy(b->data, hdr, hl);
+    if (len)
+        memcpy(b->data + hl, payload, len);
+    return b;
+}
+
+static void outbuf_release(OutBuf *b) {
+    if (b && __atomic_sub_fetch(&b->refs, 1, __ATOMIC_ACQ_REL) == 0)
+        free(b);
+}
+
+static void outq_pop_locked(OutQueue *q) {
+    OutItem *it = q->head;
+    q->head = it->next;
+    if (!q->head)
+        q->tail = NULL;
+    q->depth--;
+    q->bytes -= it->buf->len;
+    q->off = 0;
+    outbuf_release(it->buf);
+    free(it);
+}
+
+static void outq_clear_locked(OutQueue *q) {
+    while (q->head)
+        outq_pop_locked(q);
+    pthread_cond_broadcast(&q->space_cv);
+}
+
+static void outq_unref(OutQueue *q) {
+    if (__atomic_sub_fetch(&q->refs, 1, __ATOMIC_ACQ_REL) != 0)
+        return;
+    outq_clear_locked(q);
+    free(q->rooms);
+    pthread_mutex_destroy(&q->mu);
+    pthread_mutex_destroy(&q->wmu);
+    pthread_cond_destroy(&q->space_cv);
+    free(q);
+}
+
+static OutQueue *outq_lookup(int fd) {
+    OutQueue *q = NULL;
+    pthread_mutex_lock(&g_outq_mu);
+    if (fd >= 0 && (size_t)fd < g_outq_cap)
+        q = g_outq[fd];
+    pthread_mutex_unlock(&g_outq_mu);
+    return q;
+}
+
+// 取得（必要时创建）fd 的队列。只由该连接自己的处理线程调用，
+// 新建的队列由调用者持有 wmu，直到 rooms_conn_unlock。
+static OutQueue *outq_acquire(int fd) {
+    if (fd < 0)
+        return NULL;
+    pthread_once(&g_sender_once, sender_start);
+    pthread_mutex_lock(&g_outq_mu);
+    if ((size_t)fd >= g_outq_cap) {
+        size_t nc = g_outq_cap ? g_outq_cap : 64;
+        while (nc <= (size_t)fd)
+            nc *= 2;
+        OutQueue **nq = (OutQueue **)realloc(g_outq, nc * sizeof(OutQueue *));
+        if (!nq) {
+            pthread_mutex_unlock(&g_outq_mu);
+            return NULL;
+        }
+        memset(nq + g_outq_cap, 0, (nc - g_outq_cap) * sizeof(OutQueue *));
+        g_outq = nq;
+        g_outq_cap = nc;
+    }
+    OutQueue *q = g_outq[fd];
+    int created = 0;
+    if (!q) {
+        q = (OutQueue *)calloc(1, sizeof(OutQueue));
+        if (q) {
+            pthread_mutex_init(&q->mu, NULL);
+            pthread_mutex_init(&q->wmu, NULL);
+            pthread_cond_init(&q->space_cv, NULL);
+            q->fd = fd;
+            q->refs = 1;
+            q->held = 1;
+            g_outq[fd] = q;
+            created = 1;
+        }
+    }
+    pthread_mutex_unlock(&g_outq_mu);
+    // 新队列尚未加入任何房间，别的线程拿不到它，可在注册表锁外加 wmu
+    if (created)
+        pthread_mutex_lock(&q->wmu);
+    return q;
+}
+
+// 连接结束：摘除队列并丢弃未发送的消息；返回后发送线程不会再写该 fd
+static void outq_kill(int fd) {
+    OutQueue *q = NULL;
+    pthread_mutex_lock(&g_outq_mu);
+    if (fd >= 0 && (size_t)fd < g_outq_cap) {
+        q = g_outq[fd];
+        g_outq[fd] = NULL;
+    }
+    pthread_mutex_unlock(&g_outq_mu);
+    if (!q)
+        return;
+    pthread_mutex_lock(&q->mu);
+    q->dead = 1;
+    outq_clear_locked(q);
+    int held = q->held;
+    q->held = 0;
+    pthread_mutex_unlock(&q->mu);
+    if (held)
+        pthread_mutex_unlock(&q->wmu);
+    outq_unref(q);
+}
+
+// 交给发送线程（调用者持有 q->mu 且 !q->sched）
+static void outq_schedule_locked(OutQueue *q) {
+    q->sched = 1;
+    __atomic_add_fetch(&q->refs, 1, __ATOMIC_ACQ_REL);
+    pthread_mutex_lock(&g_send_mu);
+    q->next = NULL;
+    if (g_ready_tail)
+        g_ready_tail->next = q;
+    else
+        g_ready_head = q;
+    g_ready_tail = q;
+    int wake = g_sender_sleeping;
+    g_sender_sleeping = 0;
+    pthread_mutex_unlock(&g_send_mu);
+    if (wake && g_wake_pipe[1] >= 0) {
+        char c = 1;
+        ssize_t w = write(g_wake_pipe[1], &c, 1);
+        (void)w;
+    }
+}
+
+// 断开慢订阅者：连接的处理方读到 EOF 后统一清理
+static void outq_disconnect_locked(OutQueue *q) {
+    if (q->held) {
+        q->close_after = 1; // 连接正在执行命令：解锁后由发送线程关闭
+    } else {
+        shutdown(q->fd, SHUT_RDWR);
+        q->dead = 1;
+    }
+    outq_clear_locked(q);
+}
+
+// 入队一条事件（调用者不持有 room->mu：block 策略可能在此等待）。丢弃与断开
+// 分别计入 *dropped / *kicked。返回 -1 表示订阅者已失效，应从房间摘除
+static int outq_push(OutQueue *q, OutBuf *b, long long rate_bps,
+                     unsigned long long *dropped, unsigned long long *kicked) {
+    pthread_mutex_lock(&q->mu);
+    if (q->dead || q->close_after) {
+        pthread_mutex_unlock(&q->mu);
+        return -1;
+    }
+    struct timespec deadline = {0, 0};
+    int waiting = 0; // 本发布者占用了该队列唯一的等待名额
+    int rc = 0;
+    while (q->depth > 0 && q->bytes + b->len > g_subq_bytes) {
+        if (g_slow_policy == ROOMS_SLOW_DROP_OLDEST) {
+            // 已发出一部分的队首消息必须发完，从其后开始丢
+            if (q->off == 0) {
+                outq_pop_locked(q);
+            } else if (q->head->next) {
+                OutItem *it = q->head->next;
+                q->head->next = it->next;
+                if (q->tail == it)
+                    q->tail = q->head;
+                q->depth--;
+                q->bytes -= it->buf->len;
+                outbuf_release(it->buf);
+                free(it);
+            } else {
+                break;
+            }
+            (*dropped)++;
+            continue;
+        }
+        if (g_slow_policy == ROOMS_SLOW_BLOCK && !q->held &&
+            (waiting || q->waiters == 0)) {
+            // 连接自身正在执行命令时不等待（可能就是本次发布者，会自锁）；
+            // 每个队列同时只让一个发布者等待，慢订阅者不会拖住整个房间
+            if (!waiting) {
+                waiting = 1;
+                q->waiters++;
+                clock_gettime(CLOCK_REALTIME, &deadline);
+                deadline.tv_sec += g_block_ms / 1000;
+                deadline.tv_nsec += (g_block_ms % 1000) * 1000000L;
+                if (deadline.tv_nsec >= 1000000000L) {
+                    deadline.tv_sec++;
+                    deadline.tv_nsec -= 1000000000L;
+                }
+            }
+            if (pthread_cond_timedwait(&q->space_cv, &q->mu, &deadline) == 0) {
+                if (q->dead || q->close_after) {
+                    rc = -1;
+                    break;
+                }
+                continue;
+            }
+        } else if (g_slow_policy == ROOMS_SLOW_BLOCK &&
+                   q->bytes + b->len <= 2 * g_subq_bytes) {
+            // 持有者可能正是发布者，或已有发布者在等：放宽到两倍上限，再满才断开
+            break;
+        }
+        outq_disconnect_locked(q);
+        (*kicked)++;
+        rc = -1;
+        break;
+    }
+    if (waiting)
+        q->waiters--;
+    if (rc != 0) {
+        pthread_mutex_unlock(&q->mu);
+        return rc;
+    }
+    OutItem *it = (OutItem *)malloc(sizeof(OutItem));
+    if (!it) {
+        pthread_mutex_unlock(&q->mu);
+        return 0;
+    }
+    __atomic_add_fetch(&b->refs, 1, __ATOMIC_ACQ_REL);
+    it->buf = b;
+    it->next = NULL;
+    if (q->tail)
+        q->tail->next = it;
+    else
+        q->head = it;
+    q->tail = it;
+    q->depth++;
+    q->bytes += b->len;
+    q->rate_bps = rate_bps;
+    if (!q->sched && !q->held)
+        outq_schedule_locked(q);
+    pthread_mutex_unlock(&q->mu);
+    return 0;
+}
+
+enum { DRAIN_DONE = 0, DRAIN_BLOCKED = 1, DRAIN_PACED = 2 };
+
+static int ts_before(const struct timespec *a, const struct timespec *b) {
+    return a->tv_sec < b->tv_sec ||
+           (a->tv_sec == b->tv_sec && a->tv_nsec < b->tv_nsec);
+}
+
+// 发送线程：尽量发送队列中的消息（非阻塞）。DONE 时已放弃调度权
+static int outq_drain(OutQueue *q) {
+    pthread_mutex_lock(&q->mu);
+    int locked = 0;
+    if (!q->dead) {
+        if (pthread_mutex_trylock(&q->wmu) != 0) {
+            // 连接正在执行命令：暂停，解锁时重新调度
+            q->sched = 0;
+            pthread_mutex_unlock(&q->mu);
+            return DRAIN_DONE;
+        }
+        locked = 1;
+    }
+    int st = DRAIN_DONE;
+    while (!q->dead && q->head) {
+        struct timespec now;
+        clock_gettime(CLOCK_MONOTONIC, &now);
+        if (q->rate_bps > 0 && ts_before(&now, &q->not_before)) {
+            st = DRAIN_PACED;
+            break;
+        }
+        OutBuf *b = q->head->buf;
+        ssize_t x = send(q->fd, b->data + q->off, b->len - q->off,
+                         MSG_DONTWAIT | MSG_NOSIGNAL);
+        if (x < 0) {
+            if (errno == EINTR)
+                continue;
+            if (errno == EAGAIN || errno == EWOULDBLOCK) {
+                st = DRAIN_BLOCKED;
+                break;
+            }
+            q->dead = 1; // 对端已断开：下次发布时从房间摘除
+            outq_clear_locked(q);
+            break;
+        }
+        q->off += (size_t)x;
+        if (q->rate_bps > 0) {
+            long long ns = (long long)((double)x / (double)q->rate_bps * 1e9);
+            q->not_before = now;
+            q->not_before.tv_sec += ns / 1000000000LL;
+            q->not_before.tv_nsec += ns % 1000000000LL;
+            if (q->not_before.tv_nsec >= 1000000000L) {
+                q->not_before.tv_sec++;
+                q->not_before.tv_nsec -= 1000000000L;
+            }
+        }
+        if (q->off == b->len) {
+            outq_pop_locked(q);
+            pthread_cond_broadcast(&q->space_cv);
+        }
+    }
+    if (!q->dead && !q->head && q->close_after) {
+        shutdown(q->fd, SHUT_RDWR);
+        q->dead = 1;
+    }
+    if (locked)
+        pthread_mutex_unlock(&q->wmu);
+    if (st == DRAIN_DONE)
+        q->sched = 0;
+    pthread_mutex_unlock(&q->mu);
+    return st;
+}
+
+// 排空后关闭（teardown：先送达 ROOM|CLOSED）
+static void outq_close_after_drain(OutQueue *q) {
+    pthread_mutex_lock(&q->mu);
+    if (!q->dead && !q->close_after) {
+        q->close_after = 1;
+        if (!q->sched && !q->held)
+            outq_schedule_locked(q);
+    }
+    pthread_mutex_unlock(&q->mu);
+}
+
+static void *rooms_sender_main(void *arg) {
+    (void)arg;
+    OutQueue **waiting = NULL; // DRAIN_BLOCKED 或 DRAIN_PACED 的队列
+    size_t nwait = 0, capwait = 0;
+    struct pollfd *pfds = NULL;
+    size_t cappfd = 0;
+    for (;;) {
+        pthread_mutex_lock(&g_send_mu);
+        OutQueue *ready = g_ready_head;
+        g_ready_head = g_ready_tail = NULL;
+        pthread_mutex_unlock(&g_send_mu);
+        while (ready) {
+            OutQueue *q = ready;
+            ready = q->next;
+            int st = outq_drain(q);
+            if (st == DRAIN_DONE) {
+                outq_unref(q);
+                continue;
+            }
+            if (nwait == capwait) {
+                size_t nc = capwait ? capwait * 2 : 64;
+                OutQueue **nw =
+                    (OutQueue **)realloc(waiting, nc * sizeof(OutQueue *));
+                if (!nw) {
+                    // 内存不足：退回就绪链表稍后重试
+                    q->next = ready;
+                    ready = q;
+                    usleep(1000);
+                    continue;
+                }
+                waiting = nw;
+                capwait = nc;
+            }
+            waiting[nwait++] = q;
+        }
+        if (cappfd < nwait + 1) {
+            struct pollfd *np = (struct pollfd *)realloc(
+                pfds, (nwait + 1) * sizeof(struct pollfd));
+            if (!np) {
+                usleep(1000);
+                continue;
+            }
+            pfds = np;
+            cappfd = nwait + 1;
+        }
+        // 等待：可写、限速到期或有新的就绪队列
+        struct timespec now;
+        clock_gettime(CLOCK_MONOTONIC, &now);
+        long timeout = -1;
+        pfds[0].fd = g_wake_pipe[0];
+        pfds[0].events = POLLIN;
+        for (size_t i = 0; i < nwait; ++i) {
+            OutQueue *q = waiting[i];
+            pthread_mutex_lock(&q->mu);
+            int paced =
+                !q->dead && q->rate_bps > 0 && ts_before(&now, &q->not_before);
+            long ms =
+                paced
+                    ? (long)((q->not_before.tv_sec - now.tv_sec) * 1000 +
+                             (q->not_before.tv_nsec - now.tv_nsec) / 1000000) +
+                          1
+                    : 0;
+            int dead = q->dead;
+            pthread_mutex_unlock(&q->mu);
+            pfds[i + 1].fd = (paced || dead) ? -1 : q->fd;
+            pfds[i + 1].events = POLLOUT;
+            pfds[i + 1].revents = 0;
+            if (dead)
+                timeout = 0;
+            else if (paced && (timeout < 0 || ms < timeout))
+                timeout = ms;
+        }
+        pthread_mutex_lock(&g_send_mu);
+        if (g_ready_head)
+            timeout = 0;
+        else
+            g_sender_sleeping = 1;
+        pthread_mutex_unlock(&g_send_mu);
+        int n = poll(pfds, nwait + 1,
+                     timeout > INT32_MAX ? INT32_MAX : (int)timeout);
+        pthread_mutex_lock(&g_send_mu);
+        g_sender_sleeping = 0;
+        pthread_mutex_unlock(&g_send_mu);
+        if (n > 0 && (pfds[0].revents & POLLIN)) {
+            char drain[64];
+            while (read(g_wake_pipe[0], drain, sizeof drain) > 0) {
+            }
+        }
+        // 可写、出错、限速到期或已失效的队列重新排空
+        clock_gettime(CLOCK_MONOTONIC, &now);
+        size_t keep = 0;
+        for (size_t i = 0; i < nwait; ++i) {
+            OutQueue *q = waiting[i];
+            int again = pfds[i + 1].fd < 0 ? 1 : pfds[i + 1].revents != 0;
+            if (again && pfds[i + 1].fd < 0) {
+                pthread_mutex_lock(&q->mu);
+                again = q->dead || !ts_before(&now, &q->not_before);
+                pthread_mutex_unlock(&q->mu);
+            }
+            if (again) {
+                q->next = ready;
+                ready = q;
+            } else {
+                waiting[keep++] = q;
+            }
+        }
+        nwait = keep;
+        if (ready) {
+            pthread_mutex_lock(&g_send_mu);
+            OutQueue *last = ready;
+            while (last->next)
+                last = last->next;
+            last->next = g_ready_head;
+            if (!g_ready_head)
+                g_ready_tail = last;
+            g_ready_head = ready;
+            pthread_mutex_unlock(&g_send_mu);
+        }
+    }
+    return NULL;
+}
+
+int rooms_conn_lock(int fd) {
+    OutQueue *q = outq_lookup(fd);
+    if (!q)
+        return 0;
+    pthread_mutex_lock(&q->wmu);
+    pthread_mutex_lock(&q->mu);
+    q->held = 1;
+    // 发送线程停在一条消息中间：先由本线程（阻塞）发完，字节流回到消息边界
+    OutBuf *b = NULL;
+    size_t off = q->off;
+    if (!q->dead && q->head && off > 0) {
+        b = q->head->buf;
+        __atomic_add_fetch(&b->refs, 1, __ATOMIC_ACQ_REL);
+    }
+    pthread_mutex_unlock(&q->mu);
+    if (!b)
+        return 0;
+    size_t done = off;
+    while (done < b->len) {
+        ssize_t x = send(fd, b->data + done, b->len - done, MSG_NOSIGNAL);
+        if (x <= 0)
+            break;
+        done += (size_t)x;
+    }
+    pthread_mutex_lock(&q->mu);
+    if (q->head && q->head->buf == b && q->off == off) {
+        if (done == b->len) {
+            outq_pop_locked(q);
+            pthread_cond_broadcast(&q->space_cv);
+        } else {
+            // 发不完说明连接已坏：断开，避免应答落在半条消息之后
+            shutdown(fd, SHUT_RDWR);
+            q->dead = 1;
+            outq_clear_locked(q);
+        }
+    }
+    pthread_mutex_unlock(&q->mu);
+    outbuf_release(b);
+    return 0;
+}
+
+void rooms_conn_unlock(int fd) {
+    OutQueue *q = outq_lookup(fd);
+    if (!q)
+        return;
+    pthread_mutex_lock(&q->mu);
+    if (!q->held) {
+        pthread_mutex_unlock(&q->mu);
+        return;
+    }
+    q->held = 0;
+    pthread_mutex_unlock(&q->wmu);
+    if (!q->sched && !q->dead && (q->head || q->close_after))
+        outq_schedule_locked(q);
+    pthread_mutex_unlock(&q->mu);
+}
 
 static int ensure_dir(const char *path, mode_t mode) {
     struct stat st;
@@ -59,6 +765,40 @@ int rooms_init(const char *base_dir) {
     return 0;
 }
 
+void rooms_set_index_stride(unsigned stride) {
+    g_index_stride = stride;
+}
+
+void rooms_set_cache_budget(size_t bytes) {
+    g_cache_budget = bytes;
+}
+
+void rooms_set_retention(uint64_t segment_bytes, uint64_t retain_bytes,
+                         long long retain_secs) {
+    if (segment_bytes > 0)
+        g_segment_bytes = segment_bytes;
+    g_retain_bytes = retain_bytes;
+    g_retain_secs = retain_secs;
+}
+
+static void *rooms_flusher_main(void *arg);
+
+int rooms_set_fsync_policy(int policy, long interval_ms) {
+    if (policy < ROOMS_FSYNC_NONE || policy > ROOMS_FSYNC_BATCH)
+        return -1;
+    g_fsync_policy = policy;
+    if (interval_ms > 0)
+        g_fsync_interval_ms = interval_ms;
+    if (policy == ROOMS_FSYNC_INTERVAL && !g_flusher_started) {
+        pthread_t th;
+        if (pthread_create(&th, NULL, rooms_flusher_main, NULL) != 0)
+            return -1;
+        pthread_detach(th);
+        g_flusher_started = 1;
+    }
+    return 0;
+}
+
 int rooms_valid_name(const char *name) {
     if (!name || !*name)
         return 0;
@@ -74,21 +814,94 @@ int rooms_valid_name(const char *name) {
     return 1;
 }
 
+static uint32_t name_hash(const char *s) {
+    uint32_t h = 2166136261u; // FNV-1a
+    for (; *s; ++s) {
+        h ^= (unsigned char)*s;
+        h *= 16777619u;
+    }
+    return h;
+}
+
+static void shards_init(void) {
+    for (size_t i = 0; i < ROOMS_SHARDS; ++i) {
+        pthread_rwlock_init(&g_shards[i].mu, NULL);
+        pthread_mutex_init(&g_owner_shards[i].mu, NULL);
+    }
+}
+
+static RoomNode *shard_find_locked(const RoomShard *sh, const char *name,
+                                   uint32_t h) {
+    if (!sh->nbuckets)
+        return NULL;
+    RoomNode *n = sh->buckets[(h / ROOMS_SHARDS) & (sh->nbuckets - 1)];
+    for (; n; n = n->bucket_next) {
+        if (n->hash == h && strcmp(n->name, name) == 0)
+            return n;
+    }
+    return NULL;
+}
+
+static int shard_insert_locked(RoomShard *sh, RoomNode *node) {
+    if (sh->count >= sh->nbuckets) {
+        size_t nc = sh->nbuckets ? sh->nbuckets * 2 : 16;
+        RoomNode **nb = (RoomNode **)calloc(nc, sizeof(RoomNode *));
+        if (!nb)
+            return -1;
+        for (size_t i = 0; i < sh->nbuckets; ++i) {
+            RoomNode *n = sh->buckets[i];
+            while (n) {
+                RoomNode *next = n->bucket_next;
+                size_t b = (n->hash / ROOMS_SHARDS) & (nc - 1);
+                n->bucket_next = nb[b];
+                nb[b] = n;
+                n = next;
+            }
+        }
+        free(sh->buckets);
+        sh->buckets = nb;
+        sh->nbuckets = nc;
+    }
+    size_t b = (node->hash / ROOMS_SHARDS) & (sh->nbuckets - 1);
+    node->bucket_next = sh->buckets[b];
+    sh->buckets[b] = node;
+    sh->count++;
+    return 0;
+}
+
 Room *rooms_get_or_create(const char *name) {
     if (!rooms_valid_name(name))
         return NULL;
-    pthread_mutex_lock(&g_rooms_mu);
-    RoomNode *cur = g_rooms;
-    while (cur) {
-        if (strcmp(cur->name, name) == 0) {
-            pthread_mutex_unlock(&g_rooms_mu);
-            return &cur->room;
-        }
-        cur = cur->next;
+    pthread_once(&g_shards_once, shards_init);
+    uint32_t h = name_hash(name);
+    RoomShard *sh = &g_shards[h % ROOMS_SHARDS];
+    pthread_rwlock_rdlock(&sh->mu);
+    RoomNode *found = shard_find_locked(sh, name, h);
+    pthread_rwlock_unlock(&sh->mu);
+    if (found)
+        return &found->room;
+    pthread_rwlock_wrlock(&sh->mu);
+    found = shard_find_locked(sh, name, h); // 持写锁复查，避免并发重复创建
+    if (found) {
+        pthread_rwlock_unlock(&sh->mu);
+        return &found->room;
     }
     RoomNode *node = (RoomNode *)calloc(1, sizeof(RoomNode));
+    if (!node) {
+        pthread_rwlock_unlock(&sh->mu);
+        return NULL;
+    }
     node->name = strdup(name);
+    node->hash = h;
+    if (!node->name || shard_insert_locked(sh, node) != 0) {
+        pthread_rwlock_unlock(&sh->mu);
+        free(node->name);
+        free(node);
+        return NULL;
+    }
     pthread_mutex_init(&node->room.mu, NULL);
+    pthread_cond_init(&node->room.synced_cv, NULL);
+    node->room.seg_fd = -1;
     node->room.subs = NULL;
     node->room.subs_len = 0;
     node->room.subs_cap = 0;
@@ -96,23 +909,143 @@ Room *rooms_get_or_create(const char *name) {
     node->room.owner[0] = '\0';
     node->room.policy = 0; // retain by default
     node->room.created_at = time(NULL);
+    snprintf(node->room.name, sizeof node->room.name, "%s", name);
+    pthread_mutex_lock(&g_rooms_mu);
     node->next = g_rooms;
     g_rooms = node;
+    pthread_mutex_unlock(&g_rooms_mu);
     // ensure room dir exists
     char path[1024];
     int m = snprintf(path, sizeof path, "%s/%s", g_rooms_dir, name);
     if (m < 0 || (size_t)m >= sizeof path) {
-        pthread_mutex_unlock(&g_rooms_mu);
+        pthread_rwlock_unlock(&sh->mu);
         return &node->room; // 跳过创建，避免截断导致未定义行为
     }
     (void)ensure_dir(path, 0700);
-    pthread_mutex_unlock(&g_rooms_mu);
+    pthread_rwlock_unlock(&sh->mu);
     return &node->room;
 }
 
-int rooms_add_subscriber_ex(Room *room, int fd, const char *username) {
+// 房主索引维护：调用者持有 room->mu
+static void owner_index_update_locked(Room *room, const char *old_owner,
+                                      const char *new_owner) {
+    pthread_once(&g_shards_once, shards_init);
+    if (old_owner && *old_owner) {
+        uint32_t h = name_hash(old_owner);
+        OwnerShard *sh = &g_owner_shards[h % ROOMS_SHARDS];
+        pthread_mutex_lock(&sh->mu);
+        OwnerEntry *e = sh->buckets[(h / ROOMS_SHARDS) % OWNER_BUCKETS];
+        while (e && !(e->hash == h && strcmp(e->user, old_owner) == 0))
+            e = e->next;
+        for (size_t i = 0; e && i < e->len; ++i) {
+            if (e->rooms[i] == room) {
+                e->rooms[i] = e->rooms[--e->len];
+                break;
+            }
+        }
+        pthread_mutex_unlock(&sh->mu);
+    }
+    if (new_owner && *new_owner) {
+        uint32_t h = name_hash(new_owner);
+        OwnerShard *sh = &g_owner_shards[h % ROOMS_SHARDS];
+        pthread_mutex_lock(&sh->mu);
+        OwnerEntry **slot = &sh->buckets[(h / ROOMS_SHARDS) % OWNER_BUCKETS];
+        OwnerEntry *e = *slot;
+        while (e && !(e->hash == h && strcmp(e->user, new_owner) == 0))
+            e = e->next;
+        if (!e && (e = (OwnerEntry *)calloc(1, sizeof(OwnerEntry))) != NULL) {
+            e->hash = h;
+            snprintf(e->user, sizeof e->user, "%s", new_owner);
+            e->next = *slot;
+            *slot = e;
+        }
+        if (e && e->len == e->cap) {
+            size_t nc = e->cap ? e->cap * 2 : 4;
+            Room **nr = (Room **)realloc(e->rooms, nc * sizeof(Room *));
+            if (nr) {
+                e->rooms = nr;
+                e->cap = nc;
+            }
+        }
+        if (e && e->len < e->cap)
+            e->rooms[e->len++] = room;
+        pthread_mutex_unlock(&sh->mu);
+    }
+}
+
+// 复制 owner 名下的房间列表（调用者 free）
+static Room **owner_index_snapshot(const char *owner, size_t *n_out) {
+    *n_out = 0;
+    pthread_once(&g_shards_once, shards_init);
+    uint32_t h = name_hash(owner);
+    OwnerShard *sh = &g_owner_shards[h % ROOMS_SHARDS];
+    Room **out = NULL;
+    pthread_mutex_lock(&sh->mu);
+    OwnerEntry *e = sh->buckets[(h / ROOMS_SHARDS) % OWNER_BUCKETS];
+    while (e && !(e->hash == h && strcmp(e->user, owner) == 0))
+        e = e->next;
+    if (e && e->len) {
+        out = (Room **)malloc(e->len * sizeof(Room *));
+        if (out) {
+            memcpy(out, e->rooms, e->len * sizeof(Room *));
+            *n_out = e->len;
+        }
+    }
+    pthread_mutex_unlock(&sh->mu);
+    return out;
+}
+
+// fd -> 房间反向索引：调用者持有 room->mu
+static void outq_note_room(OutQueue *q, Room *room) {
+    pthread_mutex_lock(&q->mu);
+    size_t i = 0;
+    while (i < q->nrooms && q->rooms[i] != room)
+        ++i;
+    if (i == q->nrooms) {
+        if (q->nrooms == q->caprooms) {
+            size_t nc = q->caprooms ? q->caprooms * 2 : 4;
+            Room **nr = (Room **)realloc(q->rooms, nc * sizeof(Room *));
+            if (nr) {
+                q->rooms = nr;
+                q->caprooms = nc;
+            }
+        }
+        if (q->nrooms < q->caprooms)
+            q->rooms[q->nrooms++] = room;
+    }
+    pthread_mutex_unlock(&q->mu);
+}
+
+static void outq_forget_room(OutQueue *q, Room *room) {
+    pthread_mutex_lock(&q->mu);
+    for (size_t i = 0; i < q->nrooms; ++i) {
+        if (q->rooms[i] == room) {
+            q->rooms[i] = q->rooms[--q->nrooms];
+            break;
+        }
+    }
+    pthread_mutex_unlock(&q->mu);
+}
+
+static void room_drop_fd_locked(Room *room, int fd) {
+    for (size_t i = 0; i < room->subs_len;) {
+        if (room->subs[i].fd == fd) {
+            room->subs[i] = room->subs[room->subs_len - 1];
+            room->subs_len--;
+            // do not increment i to re-check the swapped element
+            continue;
+        }
+        ++i;
+    }
+}
+
+int rooms_add_subscriber_ex(Room *room, int fd, const char *username,
+                            uint64_t *replay_upto_out) {
     if (!room)
         return -1;
+    OutQueue *q = outq_acquire(fd);
+    if (!q)
+        return -1;
     pthread_mutex_lock(&room->mu);
     if (room->subs_len == room->subs_cap) {
         size_t nc = room->subs_cap ? room->subs_cap * 2 : 8;
@@ -125,7 +1058,12 @@ int rooms_add_subscriber_ex(Room *room, int fd, const char *username) {
         room->subs = ns;
         room->subs_cap = nc;
     }
+    room_store_ensure_locked(room); // 确保 last_event_id 已从磁盘恢复
     room->subs[room->subs_len].fd = fd;
+    room->subs[room->subs_len].q = q;
+    room->subs[room->subs_len].replay_upto = room->last_event_id;
+    if (replay_upto_out)
+        *replay_upto_out = room->last_event_id;
     if (username && *username) {
         snprintf(room->subs[room->subs_len].user,
                  sizeof room->subs[room->subs_len].user, "%s", username);
@@ -133,6 +1071,7 @@ int rooms_add_subscriber_ex(Room *room, int fd, const char *username) {
         room->subs[room->subs_len].user[0] = '\0';
     }
     room->subs_len++;
+    outq_note_room(q, room);
     pthread_mutex_unlock(&room->mu);
     return 0;
 }
@@ -143,6 +1082,8 @@ int rooms_remove_subscriber(Room *room, int fd) {
     pthread_mutex_lock(&room->mu);
     for (size_t i = 0; i < room->subs_len; ++i) {
         if (room->subs[i].fd == fd) {
+            if (room->subs[i].q)
+                outq_forget_room(room->subs[i].q, room);
             room->subs[i] = room->subs[room->subs_len - 1];
             room->subs_len--;
             break;
@@ -153,23 +1094,26 @@ int rooms_remove_subscriber(Room *room, int fd) {
 }
 
 int rooms_remove_fd_from_all(int fd) {
-    pthread_mutex_lock(&g_rooms_mu);
-    RoomNode *cur = g_rooms;
-    while (cur) {
-        pthread_mutex_lock(&cur->room.mu);
-        for (size_t i = 0; i < cur->room.subs_len;) {
-            if (cur->room.subs[i].fd == fd) {
-                cur->room.subs[i] = cur->room.subs[cur->room.subs_len - 1];
-                cur->room.subs_len--;
-                // do not increment i to re-check the swapped element
-                continue;
-            }
-            ++i;
-        }
-        pthread_mutex_unlock(&cur->room.mu);
-        cur = cur->next;
+    // 只访问该连接订阅过的房间（反向索引），与房间总数无关。队列只会被
+    // 本连接的线程摘除，这里无需额外引用
+    OutQueue *q = outq_lookup(fd);
+    if (!q)
+        return 0;
+    pthread_mutex_lock(&q->mu);
+    size_t n = q->nrooms;
+    Room **rooms = n ? (Room **)malloc(n * sizeof(Room *)) : NULL;
+    if (rooms)
+        memcpy(rooms, q->rooms, n * sizeof(Room *));
+    else
+        n = 0;
+    pthread_mutex_unlock(&q->mu);
+    for (size_t k = 0; k < n; ++k) {
+        pthread_mutex_lock(&rooms[k]->mu);
+        room_drop_fd_locked(rooms[k], fd);
+        pthread_mutex_unlock(&rooms[k]->mu);
     }
-    pthread_mutex_unlock(&g_rooms_mu);
+    free(rooms);
+    outq_kill(fd);
     return 0;
 }
 
@@ -179,6 +1123,7 @@ void rooms_assign_owner_if_empty(Room *room, const char *user) {
     pthread_mutex_lock(&room->mu);
     if (room->owner[0] == '\0') {
         snprintf(room->owner, sizeof room->owner, "%s", user);
+        owner_index_update_locked(room, NULL, room->owner);
     }
     pthread_mutex_unlock(&room->mu);
 }
@@ -195,7 +1140,11 @@ void rooms_set_owner(Room *room, const char *user) {
     if (!room || !user)
         return;
     pthread_mutex_lock(&room->mu);
+    char old[64];
+    snprintf(old, sizeof old, "%s", room->owner);
     snprintf(room->owner, sizeof room->owner, "%s", user);
+    if (strcmp(old, room->owner) != 0)
+        owner_index_update_locked(room, old, room->owner);
     pthread_mutex_unlock(&room->mu);
 }
 
@@ -206,6 +1155,7 @@ void rooms_get_info(Room *room, char *owner_out, size_t owner_cap,
     if (!room)
         return;
     pthread_mutex_lock(&room->mu);
+    room_store_ensure_locked(room);
     if (owner_out && owner_cap > 0) {
         snprintf(owner_out, owner_cap, "%s", room->owner);
     }
@@ -245,8 +1195,11 @@ static void rooms_clear_all_subscribers(Room *room, int close_fds) {
     pthread_mutex_lock(&room->mu);
     if (close_fds) {
         for (size_t i = 0; i < room->subs_len; ++i) {
-            if (room->subs[i].fd >= 0)
-                close(room->subs[i].fd);
+            // 只 shutdown 不 close：fd 归连接的处理方所有，由它读到 EOF 后
+            // 统一清理（close 会让 epoll 模式的连接永远收不到事件）。
+            // 发送线程先送完队列中的事件（含 ROOM|CLOSED）再 shutdown
+            if (room->subs[i].q)
+                outq_close_after_drain(room->subs[i].q);
         }
     }
     room->subs_len = 0;
@@ -256,20 +1209,18 @@ static void rooms_clear_all_subscribers(Room *room, int close_fds) {
 void rooms_handle_owner_disconnect(const char *owner, long long rate_bps) {
     if (!owner || !*owner)
         return;
-    pthread_mutex_lock(&g_rooms_mu);
-    RoomNode *cur = g_rooms;
-    pthread_mutex_unlock(&g_rooms_mu);
-
-    // We iterate without holding the global list lock to avoid long-held locks
-    // during fanout.
-    for (RoomNode *node = cur; node; node = node->next) {
+    // 房主索引给出 owner 名下的房间；逐个复查 owner，索引快照后可能已转移
+    size_t nrooms = 0;
+    Room **owned = owner_index_snapshot(owner, &nrooms);
+    for (size_t k = 0; k < nrooms; ++k) {
+        Room *room = owned[k];
         int policy = 0;
         char room_owner[64] = {0};
         size_t subs = 0;
         unsigned long long last_eid = 0;
         time_t created = 0;
-        rooms_get_info(&node->room, room_owner, sizeof room_owner, &policy,
-                       &subs, &last_eid, &created);
+        rooms_get_info(room, room_owner, sizeof room_owner, &policy, &subs,
+                       &last_eid, &created);
         if (strcmp(room_owner, owner) != 0)
             continue;
         if (policy == 0) {
@@ -279,18 +1230,18 @@ void rooms_handle_owner_disconnect(const char *owner, long long rate_bps) {
             // delegate: pick the first non-empty subscriber username not equal
             // to owner
             char new_owner[64] = {0};
-            pthread_mutex_lock(&node->room.mu);
-            for (size_t i = 0; i < node->room.subs_len; ++i) {
-                if (node->room.subs[i].user[0] != '\0' &&
-                    strcmp(node->room.subs[i].user, owner) != 0) {
+            pthread_mutex_lock(&room->mu);
+            for (size_t i = 0; i < room->subs_len; ++i) {
+                if (room->subs[i].user[0] != '\0' &&
+                    strcmp(room->subs[i].user, owner) != 0) {
                     snprintf(new_owner, sizeof new_owner, "%s",
-                             node->room.subs[i].user);
+                             room->subs[i].user);
                     break;
                 }
             }
-            pthread_mutex_unlock(&node->room.mu);
+            pthread_mutex_unlock(&room->mu);
             if (new_owner[0] != '\0') {
-                rooms_set_owner(&node->room, new_owner);
+                rooms_set_owner(room, new_owner);
                 // broadcast owner changed notification
                 char ts[64];
                 rfc3339_time_local(ts, sizeof ts);
@@ -298,7 +1249,7 @@ void rooms_handle_owner_disconnect(const char *owner, long long rate_bps) {
                 snprintf(msg, sizeof msg, "OWNER|CHANGED|%s", new_owner);
                 char hx[65];
                 dummy_sha256_hex(hx, sizeof hx);
-                rooms_fanout_text(&node->room, node->name, ts, "system", 0,
+                rooms_fanout_text(room, room->name, ts, "system", 0,
                                   (const unsigned char *)msg, strlen(msg), hx,
                                   rate_bps);
             }
@@ -309,12 +1260,13 @@ void rooms_handle_owner_disconnect(const char *owner, long long rate_bps) {
             const char *msg = "ROOM|CLOSED";
             char hx[65];
             dummy_sha256_hex(hx, sizeof hx);
-            rooms_fanout_text(&node->room, node->name, ts, "system", 0,
+            rooms_fanout_text(room, room->name, ts, "system", 0,
                               (const unsigned char *)msg, strlen(msg), hx,
                               rate_bps);
-            rooms_clear_all_subscribers(&node->room, 1 /*close fds*/);
+            rooms_clear_all_subscribers(room, 1 /*close fds*/);
         }
     }
+    free(owned);
 }
 
 static void throttle_down(size_t bytes, long long rate_bps) {
@@ -326,6 +1278,74 @@ static void throttle_down(size_t bytes, long long rate_bps) {
         usleep(us);
 }
 
+// 事件入队到房间内每个订阅者的发送队列；失效的订阅者顺带摘除。
+// room->mu 内只取队列快照（各持一个引用），入队在锁外进行：block 策略等待
+// 慢订阅者期间，本房间的发布、HISTORY、SUB/UNSUB、ROOMINFO 与组提交不受影响
+static int room_fanout(Room *room, uint64_t event_id, OutBuf *b,
+                       long long rate_bps) {
+    OutQueue *local[16];
+    OutQueue **qs = local;
+    size_t n = 0;
+    int prune = 0;
+    pthread_mutex_lock(&room->mu);
+    if (room->subs_len > sizeof local / sizeof local[0]) {
+        qs = (OutQueue **)malloc(room->subs_len * sizeof(OutQueue *));
+        if (!qs) {
+            pthread_mutex_unlock(&room->mu);
+            outbuf_release(b);
+            return -1;
+        }
+    }
+    for (size_t i = 0; i < room->subs_len; ++i) {
+        OutQueue *q = room->subs[i].q;
+        // 该订阅者的 SUB 回放已包含此事件（event_id 0 为系统通知，总是发送）
+        if (event_id != 0 && event_id <= room->subs[i].replay_upto)
+            continue;
+        if (!q) {
+            prune = 1;
+            continue;
+        }
+        __atomic_add_fetch(&q->refs, 1, __ATOMIC_ACQ_REL);
+        qs[n++] = q;
+    }
+    pthread_mutex_unlock(&room->mu);
+
+    // 失效的队列换到 qs 前部（共 nfail 个）
+    size_t nfail = 0;
+    unsigned long long dropped = 0, kicked = 0;
+    for (size_t i = 0; i < n; ++i) {
+        if (outq_push(qs[i], b, rate_bps, &dropped, &kicked) != 0) {
+            OutQueue *t = qs[nfail];
+            qs[nfail++] = qs[i];
+            qs[i] = t;
+        }
+    }
+    if (prune || nfail || dropped || kicked) {
+        pthread_mutex_lock(&room->mu);
+        room->fanout_dropped += dropped;
+        room->fanout_kicked += kicked;
+        for (size_t i = 0; i < room->subs_len; ++i) {
+            OutQueue *q = room->subs[i].q;
+            int dead = !q;
+            for (size_t j = 0; j < nfail && !dead; ++j)
+                dead = qs[j] == q;
+            if (dead) {
+                // prune dead subscriber
+                room->subs[i] = room->subs[room->subs_len - 1];
+                room->subs_len--;
+                --i;
+            }
+        }
+        pthread_mutex_unlock(&room->mu);
+    }
+    for (size_t i = 0; i < n; ++i)
+        outq_unref(qs[i]);
+    if (qs != local)
+        free(qs);
+    outbuf_release(b);
+    return 0;
+}
+
 int rooms_fanout_text(Room *room, const char *room_name, const char *ts,
                       const char *user, uint64_t event_id,
                       const unsigned char *payload, size_t len,
@@ -338,35 +1358,43 @@ int rooms_fanout_text(Room *room, const char *room_name, const char *ts,
                  ts, user, (unsigned long long)event_id, len, sha_hex);
     if (hl <= 0)
         return -1;
+    OutBuf *b = outbuf_new(hdr, (size_t)hl, payload, len);
+    if (!b)
+        return -1;
+    return room_fanout(room, event_id, b, rate_bps);
+}
+
+void rooms_get_fanout_stats(Room *room, size_t *queued_out,
+                            size_t *max_depth_out,
+                            unsigned long long *dropped_out,
+                            unsigned long long *kicked_out) {
+    size_t queued = 0, max_depth = 0;
+    if (!room)
+        return;
     pthread_mutex_lock(&room->mu);
     for (size_t i = 0; i < room->subs_len; ++i) {
-        int fd = room->subs[i].fd;
-        ssize_t x = send(fd, hdr, (size_t)hl, 0);
-        if (x <= 0) {
-            // prune dead subscriber
-            room->subs[i] = room->subs[room->subs_len - 1];
-            room->subs_len--;
-            --i;
+        OutQueue *q = room->subs[i].q;
+        if (!q)
             continue;
-        }
-        if (len > 0) {
-            x = send(fd, payload, len, 0);
-            if (x <= 0) {
-                room->subs[i] = room->subs[room->subs_len - 1];
-                room->subs_len--;
-                --i;
-                continue;
-            }
-            throttle_down(len, rate_bps);
-        }
+        pthread_mutex_lock(&q->mu);
+        queued += q->depth;
+        if (q->depth > max_depth)
+            max_depth = q->depth;
+        pthread_mutex_unlock(&q->mu);
     }
+    if (queued_out)
+        *queued_out = queued;
+    if (max_depth_out)
+        *max_depth_out = max_depth;
+    if (dropped_out)
+        *dropped_out = room->fanout_dropped;
+    if (kicked_out)
+        *kicked_out = room->fanout_kicked;
     pthread_mutex_unlock(&room->mu);
-    return 0;
 }
 
 static int ensure_room_paths(const char *room_name, char *dir_buf,
-                             size_t dir_sz, char *files_dir, size_t files_sz,
-                             char *log_path, size_t log_sz) {
+                             size_t dir_sz, char *files_dir, size_t files_sz) {
     if (!room_name)
         return -1;
     int n = snprintf(dir_buf, dir_sz, "%s/%s", g_rooms_dir, room_name);
@@ -379,9 +1407,6 @@ static int ensure_room_paths(const char *room_name, char *dir_buf,
         return -1;
     if (ensure_dir(files_dir, 0700) != 0)
         return -1;
-    n = snprintf(log_path, log_sz, "%s/events.log", dir_buf);
-    if (n < 0 || (size_t)n >= log_sz)
-        return -1;
     return 0;
 }
 
@@ -403,44 +1428,766 @@ static int ensure_texts_dir(const char *room_name, char *texts_dir,
     return 0;
 }
 
+// 单个 TEXT 负载超过预算的 1/16 时不内联，避免少数大消息挤掉整个环
+static size_t cache_inline_max(void) {
+    return g_cache_budget / 16;
+}
+
+static void recent_release_locked(RecentEvent *ev) {
+    if (ev && --ev->refs == 0)
+        free(ev);
+}
+
+static RecentEvent *recent_at(const Room *room, size_t i) {
+    return room->recent[(room->recent_head + i) % room->recent_cap];
+}
+
+static void recent_drop_oldest_locked(Room *room) {
+    RecentEvent *ev = room->recent[room->recent_head];
+    room->recent[room->recent_head] = NULL;
+    room->recent_head = (room->recent_head + 1) % room->recent_cap;
+    room->recent_len--;
+    room->recent_bytes -= ev->cost;
+    recent_release_locked(ev);
+}
+
+static void recent_clear_locked(Room *room) {
+    while (room->recent_len > 0)
+        recent_drop_oldest_locked(room);
+    room->recent_head = 0;
+}
+
+// 新事件入环；调用方持有 room->mu，且 eid 刚由 last_event_id 分配。
+// payload 为 NULL 表示 FILE 事件（只有头部）；seg_first/payload_off
+// 是正文在段文件中的位置，供未内联的大正文回放时读取。
+static void room_cache_push_locked(Room *room, uint64_t eid, const char *hdr,
+                                   size_t hdr_len, const unsigned char *payload,
+                                   size_t len, uint64_t seg_first,
+                                   uint64_t payload_off) {
+    if (g_cache_budget == 0)
+        return;
+    if (room->recent_len > 0 &&
+        recent_at(room, room->recent_len - 1)->event_id + 1 != eid)
+        recent_clear_locked(room); // 出现空洞（落盘失败）：保持连续性
+    int on_disk = payload && len > cache_inline_max();
+    size_t inl = (payload && !on_disk) ? len : 0;
+    size_t cost = sizeof(RecentEvent) + hdr_len + inl;
+    if (cost > g_cache_budget) {
+        recent_clear_locked(room);
+        return;
+    }
+    RecentEvent *ev = (RecentEvent *)malloc(cost);
+    if (!ev) {
+        recent_clear_locked(room);
+        return;
+    }
+    ev->event_id = eid;
+    ev->refs = 1;
+    ev->on_disk = on_disk;
+    ev->seg_first = seg_first;
+    ev->payload_off = payload_off;
+    ev->hdr_len = hdr_len;
+    ev->payload_len = payload ? len : 0;
+    ev->cost = cost;
+    ev->hdr = (char *)(ev + 1);
+    memcpy(ev->hdr, hdr, hdr_len);
+    ev->payload = (unsigned char *)ev->hdr + hdr_len;
+    if (inl)
+        memcpy(ev->payload, payload, inl);
+    while (room->recent_len > 0 && room->recent_bytes + cost > g_cache_budget)
+        recent_drop_oldest_locked(room);
+    if (room->recent_len == room->recent_cap) {
+        size_t nc = room->recent_cap ? room->recent_cap * 2 : 64;
+        RecentEvent **nr = (RecentEvent **)malloc(nc * sizeof(RecentEvent *));
+        if (!nr) {
+            free(ev);
+            recent_clear_locked(room);
+            return;
+        }
+        for (size_t i = 0; i < room->recent_len; ++i)
+            nr[i] = recent_at(room, i);
+        free(room->recent);
+        room->recent = nr;
+        room->recent_cap = nc;
+        room->recent_head = 0;
+    }
+    room->recent[(room->recent_head + room->recent_len) % room->recent_cap] =
+        ev;
+    room->recent_len++;
+    room->recent_bytes += cost;
+}
+
+// 缓存覆盖 since_id 之后的全部事件时，取出（加引用）至多 limit 条并返回 1；
+// 游标早于缓存最旧事件时返回 0，由调用方回退到磁盘。调用方持有 room->mu。
+static int room_cache_take_locked(Room *room, uint64_t since_id, size_t limit,
+                                  RecentEvent ***out, size_t *out_len) {
+    *out = NULL;
+    *out_len = 0;
+    if (room->recent_len == 0)
+        return 0;
+    uint64_t first = recent_at(room, 0)->event_id;
+    if (since_id + 1 < first)
+        return 0;
+    size_t skip = (size_t)(since_id + 1 - first);
+    if (skip >= room->recent_len)
+        return 1; // 已追上最新事件
+    size_t n = room->recent_len - skip;
+    if (n > limit)
+        n = limit;
+    RecentEvent **v = (RecentEvent **)malloc(n * sizeof(RecentEvent *));
+    if (!v)
+        return 0;
+    for (size_t i = 0; i < n; ++i) {
+        v[i] = recent_at(room, skip + i);
+        v[i]->refs++;
+    }
+    *out = v;
+    *out_len = n;
+    return 1;
+}
+
+// HISTORY 回放的发送缓冲：把成批的小头部合并成少量 send()
+typedef struct SendBuf {
+    int fd;
+    int failed;
+    long long rate_bps;
+    size_t len;
+    char data[64 * 1024];
+} SendBuf;
+
+static void sendbuf_flush(SendBuf *sb) {
+    size_t off = 0;
+    while (!sb->failed && off < sb->len) {
+        ssize_t x = send(sb->fd, sb->data + off, sb->len - off, MSG_NOSIGNAL);
+        if (x <= 0)
+            sb->failed = 1;
+        else
+            off += (size_t)x;
+    }
+    throttle_down(sb->len, sb->rate_bps);
+    sb->len = 0;
+}
+
+static void sendbuf_put(SendBuf *sb, const void *p, size_t n) {
+    const char *c = (const char *)p;
+    while (n > 0 && !sb->failed) {
+        size_t room = sizeof sb->data - sb->len;
+        size_t k = n < room ? n : room;
+        memcpy(sb->data + sb->len, c, k);
+        sb->len += k;
+        c += k;
+        n -= k;
+        if (sb->len == sizeof sb->data)
+            sendbuf_flush(sb);
+    }
+}
+
+// 从 f 的当前位置读至多 n 字节写入发送缓冲；返回实际写入的字节数
+static uint64_t sendbuf_put_file(SendBuf *sb, FILE *f, uint64_t n) {
+    uint64_t total = 0;
+    char buf[16 * 1024];
+    while (total < n && !sb->failed) {
+        size_t want = sizeof buf;
+        if (n - total < want)
+            want = (size_t)(n - total);
+        size_t got = fread(buf, 1, want, f);
+        if (got == 0)
+            break;
+        sendbuf_put(sb, buf, got);
+        total += got;
+    }
+    return total;
+}
+
+// 把 texts/<eid>.txt（旧布局）的内容写入发送缓冲；返回写入的字节数
+static uint64_t sendbuf_put_text(SendBuf *sb, const char *text_path) {
+    FILE *tf = fopen(text_path, "rb");
+    if (!tf)
+        return 0;
+    uint64_t total = sendbuf_put_file(sb, tf, UINT64_MAX);
+    fclose(tf);
+    return total;
+}
+
+static int room_path(const Room *room, const char *leaf, char *out, size_t sz) {
+    int n = snprintf(out, sz, "%s/%s/%s", g_rooms_dir, room->name, leaf);
+    return (n < 0 || (size_t)n >= sz) ? -1 : 0;
+}
+
+// 段文件（ext="seg"）或其索引（ext="idx"）的路径
+static int segment_path(const Room *room, const Segment *seg, const char *ext,
+                        char *out, size_t sz) {
+    char leaf[64];
+    if (seg->legacy)
+        snprintf(leaf, sizeof leaf, "events.%s",
+                 strcmp(ext, "seg") == 0 ? "log" : "idx");
+    else
+        snprintf(leaf, sizeof leaf, "segments/%020llu.%s",
+                 (unsigned long long)seg->first_eid, ext);
+    return room_path(room, leaf, out, sz);
+}
+
+// 记录头格式 {"event_id":E,...}：只认行首的 event_id
+static int parse_line_event_id(const char *line, unsigned long long *out) {
+    static const char key[] = "{\"event_id\":";
+    if (strncmp(line, key, sizeof key - 1) != 0)
+        return -1;
+    char *end = NULL;
+    *out = strtoull(line + sizeof key - 1, &end, 10);
+    return (end && *end == ',') ? 0 : -1;
+}
+
+static unsigned long long json_u64(const char *line, const char *key) {
+    const char *p = strstr(line, key);
+    return p ? strtoull(p + strlen(key), NULL, 10) : 0;
+}
+
+// 记录头之后的正文字节数：.seg 中的 TEXT 为 len + 1（末尾 '\n'），其余为 0
+static uint64_t record_body_len(const Segment *seg, const char *line) {
+    if (seg->legacy || !strstr(line, "\"kind\":\"TEXT\""))
+        return 0;
+    return json_u64(line, "\"len\":") + 1;
+}
+
+static int room_index_push(Room *room, uint64_t eid, uint64_t off,
+                           uint64_t seg_first) {
+    if (room->idx_len == room->idx_cap) {
+        size_t nc = room->idx_cap ? room->idx_cap * 2 : 64;
+        RoomIndexEntry *ni =
+            (RoomIndexEntry *)realloc(room->idx, nc * sizeof(RoomIndexEntry));
+        if (!ni)
+            return -1;
+        room->idx = ni;
+        room->idx_cap = nc;
+    }
+    room->idx[room->idx_len].event_id = eid;
+    room->idx[room->idx_len].offset = off;
+    room->idx[room->idx_len].seg_first = seg_first;
+    room->idx_len++;
+    return 0;
+}
+
+static void segment_index_write(const char *idx_path,
+                                const RoomIndexEntry *ents, size_t n) {
+    if (n == 0)
+        return;
+    FILE *xf = fopen(idx_path, "ab");
+    if (!xf)
+        return;
+    if (fseeko(xf, 0, SEEK_END) == 0 && ftello(xf) == 0)
+        (void)fwrite(ROOMS_INDEX_MAGIC, 1, ROOMS_INDEX_MAGIC_LEN, xf);
+    for (size_t i = 0; i < n; ++i) {
+        uint64_t rec[2] = {ents[i].event_id, ents[i].offset};
+        (void)fwrite(rec, sizeof rec, 1, xf);
+    }
+    fclose(xf);
+}
+
+// 记录一条刚写入段的事件；first_in_seg 表示它是该段的首条记录。
+// 调用方持有 room->mu。返回 1 表示新增了索引点（位于 room->idx 末尾）。
+static int room_index_note_locked(Room *room, const Segment *seg, uint64_t eid,
+                                  uint64_t off, int first_in_seg) {
+    if (!room->idx_ok)
+        return 0;
+    if (room->idx_len > 0 && eid <= room->idx_last_eid) {
+        // 旧版本重启后 event_id 可能回绕：二分前提不成立，退回顺序扫描
+        room->idx_ok = 0;
+        return 0;
+    }
+    room->idx_last_eid = eid;
+    if (first_in_seg || room->idx_len == 0 ||
+        room->idx_tail >= g_index_stride) {
+        if (room_index_push(room, eid, off, seg->first_eid) != 0) {
+            room->idx_ok = 0;
+            return 0;
+        }
+        room->idx_tail = 1;
+        return 1;
+    }
+    room->idx_tail++;
+    return 0;
+}
+
+// 加载一个段：读入并校验其索引（最后一个点必须正是对应事件的行首），再从该点
+// 扫描到段尾补齐；索引缺失、损坏或段被截断时整段重建。同时恢复
+// last_event_id。活动段末尾写了一半的记录会被截掉。返回段的有效长度。
+static uint64_t segment_load_locked(Room *room, const Segment *seg,
+                                    int active) {
+    char segp[1024], idxp[1024];
+    if (segment_path(room, seg, "seg", segp, sizeof segp) != 0 ||
+        segment_path(room, seg, "idx", idxp, sizeof idxp) != 0)
+        return 0;
+    FILE *f = fopen(segp, "r");
+    if (!f) {
+        (void)unlink(idxp);
+        return 0;
+    }
+    struct stat st;
+    uint64_t seg_size = (fstat(fileno(f), &st) == 0) ? (uint64_t)st.st_size : 0;
+    size_t base = room->idx_len;
+    if (room->idx_ok) {
+        FILE *xf = fopen(idxp, "rb");
+        if (xf) {
+            char magic[ROOMS_INDEX_MAGIC_LEN];
+            uint64_t rec[2];
+            int ok = fread(magic, 1, sizeof magic, xf) == sizeof magic &&
+                     memcmp(magic, ROOMS_INDEX_MAGIC, sizeof magic) == 0;
+            while (ok && fread(rec, sizeof rec, 1, xf) == 1) {
+                const RoomIndexEntry *prev =
+                    room->idx_len > 0 ? &room->idx[room->idx_len - 1] : NULL;
+                if (rec[1] >= seg_size || (room->idx_len == base && rec[1]) ||
+                    (prev && rec[0] <= prev->event_id) ||
+                    (room->idx_len > base && rec[1] <= prev->offset) ||
+                    room_index_push(room, rec[0], rec[1], seg->first_eid) != 0)
+                    ok = 0;
+            }
+            fclose(xf);
+            if (!ok)
+                room->idx_len = base;
+        }
+    }
+    char *line = NULL;
+    size_t cap = 0;
+    ssize_t n;
+    uint64_t start = 0;
+    if (room->idx_len > base) {
+        const RoomIndexEntry *last = &room->idx[room->idx_len - 1];
+        unsigned long long eid = 0;
+        int prev = '\n';
+        if (last->offset > 0 &&
+            fseeko(f, (off_t)last->offset - 1, SEEK_SET) == 0)
+            prev = fgetc(f);
+        if (prev == '\n' && fseeko(f, (off_t)last->offset, SEEK_SET) == 0 &&
+            getline(&line, &cap, f) > 0 &&
+            parse_line_event_id(line, &eid) == 0 && eid == last->event_id) {
+            start = last->offset;
+        } else {
+            room->idx_len = base;
+        }
+    }
+    if (room->idx_len == base)
+        (void)unlink(idxp);
+    size_t first_new = room->idx_len;
+    int at_last_point = room->idx_len > base; // 起点即已有的最后一个索引点
+    uint64_t good_end = start;
+    if (fseeko(f, (off_t)start, SEEK_SET) == 0) {
+        uint64_t off = start;
+        while ((n = getline(&line, &cap, f)) > 0) {
+            uint64_t rec_off = off;
+            if (line[n - 1] != '\n')
+                break; // 写了一半的尾行
+            uint64_t body = record_body_len(seg, line);
+            off += (uint64_t)n + body;
+            if (off > seg_size ||
+                (body > 0 && fseeko(f, (off_t)off, SEEK_SET) != 0))
+                break; // 正文不完整
+            good_end = off;
+            unsigned long long eid = 0;
+            if (parse_line_event_id(line, &eid) != 0)
+                continue;
+            if (eid > room->last_event_id)
+                room->last_event_id = eid;
+            if (at_last_point) {
+                at_last_point = 0;
+                room->idx_last_eid = eid;
+                room->idx_tail = 1;
+                continue;
+            }
+            (void)room_index_note_locked(room, seg, eid, rec_off, rec_off == 0);
+        }
+    }
+    free(line);
+    fclose(f);
+    if (active && good_end < seg_size && truncate(segp, (off_t)good_end) != 0)
+        perror("truncate segment");
+    if (room->idx_ok)
+        segment_index_write(idxp, room->idx + first_new,
+                            room->idx_len - first_new);
+    return good_end;
+}
+
+static int room_segments_push(Room *room, uint64_t first_eid, int legacy) {
+    if (room->segs_len == room->segs_cap) {
+        size_t nc = room->segs_cap ? room->segs_cap * 2 : 8;
+        Segment *ns = (Segment *)realloc(room->segs, nc * sizeof(Segment));
+        if (!ns)
+            return -1;
+        room->segs = ns;
+        room->segs_cap = nc;
+    }
+    room->segs[room->segs_len].first_eid = first_eid;
+    room->segs[room->segs_len].legacy = legacy;
+    room->segs_len++;
+    return 0;
+}
+
+static int cmp_segment(const void *a, const void *b) {
+    const Segment *x = (const Segment *)a;
+    const Segment *y = (const Segment *)b;
+    if (x->first_eid != y->first_eid)
+        return x->first_eid < y->first_eid ? -1 : 1;
+    return y->legacy - x->legacy;
+}
+
+// 删除一个段及其引用的负载：FILE 事件的 files/<eid>_<name>，
+// 旧布局 TEXT 事件的 texts/<eid>.txt
+static void segment_drop_files(const Room *room, const Segment *seg) {
+    char segp[1024], idxp[1024], path[1024], leaf[512];
+    if (segment_path(room, seg, "seg", segp, sizeof segp) != 0 ||
+        segment_path(room, seg, "idx", idxp, sizeof idxp) != 0)
+        return;
+    FILE *f = fopen(segp, "r");
+    if (f) {
+        char *line = NULL;
+        size_t cap = 0;
+        while (getline(&line, &cap, f) > 0) {
+            unsigned long long eid = 0;
+            uint64_t body = record_body_len(seg, line);
+            if (parse_line_event_id(line, &eid) == 0) {
+                char fname[256] = {0};
+                const char *fp = strstr(line, "\"filename\":\"");
+                int m = -1;
+                if (strstr(line, "\"kind\":\"FILE\"") && fp &&
+                    sscanf(fp + 12, "%255[^\"]", fname) == 1)
+                    m = snprintf(leaf, sizeof leaf, "files/%llu_%s", eid,
+                                 fname);
+                else if (seg->legacy && strstr(line, "\"kind\":\"TEXT\""))
+                    m = snprintf(leaf, sizeof leaf, "texts/%llu.txt", eid);
+                if (m > 0 && (size_t)m < sizeof leaf &&
+                    room_path(room, leaf, path, sizeof path) == 0)
+                    (void)unlink(path);
+            }
+            if (body > 0 && fseeko(f, (off_t)body, SEEK_CUR) != 0)
+                break;
+        }
+        free(line);
+        fclose(f);
+    }
+    (void)unlink(segp);
+    (void)unlink(idxp);
+}
+
+// 按保留策略删除最旧的封存段（活动段永不删除）：总字节数超过
+// g_retain_bytes，或段的最后写入时间早于 g_retain_secs 秒前。
+// 调用方持有 room->mu。
+static void room_apply_retention_locked(Room *room) {
+    if ((g_retain_bytes == 0 && g_retain_secs <= 0) || room->segs_len < 2)
+        return;
+    char segp[1024];
+    struct stat st;
+    uint64_t total = 0;
+    for (size_t i = 0; i < room->segs_len; ++i) {
+        if (segment_path(room, &room->segs[i], "seg", segp, sizeof segp) == 0 &&
+            stat(segp, &st) == 0)
+            total += (uint64_t)st.st_size;
+    }
+    time_t now = time(NULL);
+    while (room->segs_len > 1) {
+        Segment seg = room->segs[0];
+        uint64_t size = 0;
+        time_t mtime = 0;
+        if (segment_path(room, &seg, "seg", segp, sizeof segp) == 0 &&
+            stat(segp, &st) == 0) {
+            size = (uint64_t)st.st_size;
+            mtime = st.st_mtime;
+        }
+        int drop = (g_retain_bytes > 0 && total > g_retain_bytes) ||
+                   (g_retain_secs > 0 && mtime + g_retain_secs < now);
+        if (!drop)
+            break;
+        segment_drop_files(room, &seg);
+        total -= size;
+        memmove(room->segs, room->segs + 1,
+                (room->segs_len - 1) * sizeof(Segment));
+        room->segs_len--;
+        size_t k = 0;
+        while (k < room->idx_len && room->idx[k].seg_first == seg.first_eid)
+            k++;
+        memmove(room->idx, room->idx + k,
+                (room->idx_len - k) * sizeof(RoomIndexEntry));
+        room->idx_len -= k;
+        uint64_t keep_from = room->segs[0].first_eid;
+        while (room->recent_len > 0 && recent_at(room, 0)->event_id < keep_from)
+            recent_drop_oldest_locked(room);
+    }
+}
+
+// 关闭活动段的追加 fd；fsync 策略不是 none 时先把其中尚未落盘的记录刷下去，
+// 之后的组提交只需覆盖新段。调用方持有 room->mu。
+static void room_close_active_locked(Room *room) {
+    if (room->seg_fd < 0)
+        return;
+    if (g_fsync_policy != ROOMS_FSYNC_NONE &&
+        room->synced_seq < room->write_seq && fdatasync(room->seg_fd) != 0)
+        perror("fdatasync segment");
+    room->synced_seq = room->write_seq;
+    close(room->seg_fd);
+    room->seg_fd = -1;
+}
+
+// 首次使用房间时加载存储：列出旧布局 events.log 与 segments/*.seg，逐段加载
+// 索引并恢复 last_event_id（重启后 event_id 继续递增），再执行保留策略。
+// 调用方持有 room->mu。
+static void room_store_ensure_locked(Room *room) {
+    if (room->store_loaded)
+        return;
+    room->store_loaded = 1;
+    room_close_active_locked(room);
+    room->idx_ok = g_index_stride > 0;
+    room->segs_len = 0;
+    room->idx_len = 0;
+    room->idx_tail = 0;
+    room->idx_last_eid = 0;
+    room->active_size = 0;
+    char path[1024];
+    if (room_path(room, "events.log", path, sizeof path) == 0) {
+        FILE *f = fopen(path, "r");
+        if (f) {
+            char line[256];
+            unsigned long long eid = 0;
+            if (fgets(line, sizeof line, f) &&
+                parse_line_event_id(line, &eid) == 0)
+                (void)room_segments_push(room, eid, 1);
+            fclose(f);
+        }
+    }
+    if (room_path(room, "segments", path, sizeof path) == 0) {
+        DIR *d = opendir(path);
+        if (d) {
+            struct dirent *de;
+            while ((de = readdir(d)) != NULL) {
+                char *end = NULL;
+                unsigned long long first = strtoull(de->d_name, &end, 10);
+                if (end != de->d_name && strcmp(end, ".seg") == 0)
+                    (void)room_segments_push(room, first, 0);
+            }
+            closedir(d);
+        }
+    }
+    qsort(room->segs, room->segs_len, sizeof(Segment), cmp_segment);
+    for (size_t i = 0; i < room->segs_len; ++i) {
+        int active = i + 1 == room->segs_len && !room->segs[i].legacy;
+        uint64_t end = segment_load_locked(room, &room->segs[i], active);
+        if (active)
+            room->active_size = end;
+    }
+    room_apply_retention_locked(room);
+}
+
+// 为 eid 选定可追加的段：没有段、最后一段是旧日志，或活动段再写 rec_len
+// 字节将超过 g_segment_bytes 时，开启以 eid 命名的新段并执行保留策略。
+static Segment *room_active_segment_locked(Room *room, uint64_t eid,
+                                           uint64_t rec_len) {
+    Segment *last = room->segs_len ? &room->segs[room->segs_len - 1] : NULL;
+    if (last && !last->legacy &&
+        (room->active_size == 0 ||
+         room->active_size + rec_len <= g_segment_bytes))
+        return last;
+    room_close_active_locked(room);
+    char dir[1024];
+    if (room_path(room, "segments", dir, sizeof dir) != 0 ||
+        ensure_dir(dir, 0700) != 0 || room_segments_push(room, eid, 0) != 0)
+        return NULL;
+    room->active_size = 0;
+    room_apply_retention_locked(room);
+    return &room->segs[room->segs_len - 1];
+}
+
+// 追加一条记录（头部行 + 可选 TEXT 正文）并更新索引。调用方在分配 event_id
+// 后一直持有 room->mu，保证段内顺序与 event_id 一致、索引偏移准确。
+// *seg_first/*payload_off 返回正文所在的段与段内偏移。
+static int room_append_record_locked(Room *room, uint64_t eid, const char *line,
+                                     size_t line_len,
+                                     const unsigned char *payload, size_t len,
+                                     uint64_t *seg_first,
+                                     uint64_t *payload_off) {
+    uint64_t rec_len = line_len + (payload ? (uint64_t)len + 1 : 0);
+    Segment *seg = room_active_segment_locked(room, eid, rec_len);
+    char segp[1024], idxp[1024];
+    if (!seg || segment_path(room, seg, "seg", segp, sizeof segp) != 0 ||
+        segment_path(room, seg, "idx", idxp, sizeof idxp) != 0)
+        return -1;
+    uint64_t off = room->active_size;
+    if (room->seg_fd < 0) {
+        room->seg_fd =
+            open(segp, O_WRONLY | O_APPEND | O_CREAT | O_CLOEXEC, 0600);
+        if (room->seg_fd < 0)
+            return -1;
+        if (off == 0 && g_fsync_policy == ROOMS_FSYNC_BATCH) {
+            // 新段的目录项也要落盘，否则崩溃后整段可能消失
+            char dir[1024];
+            int dfd = -1;
+            if (room_path(room, "segments", dir, sizeof dir) == 0 &&
+                (dfd = open(dir, O_RDONLY | O_CLOEXEC)) >= 0) {
+                (void)fsync(dfd);
+                close(dfd);
+            }
+        }
+    }
+    // 头部、正文与分隔符一次 writev 追加：每条记录一个系统调用，无 open/close
+    static const char nl = '\n';
+    struct iovec iov[3] = {{(void *)line, line_len},
+                           {(void *)payload, payload ? len : 0},
+                           {(void *)&nl, payload ? 1 : 0}};
+    struct iovec *cur = iov;
+    int iovcnt = 3;
+    uint64_t done = 0;
+    while (done < rec_len) {
+        ssize_t x = writev(room->seg_fd, cur, iovcnt);
+        if (x <= 0)
+            break;
+        done += (uint64_t)x;
+        while (iovcnt > 0 && (size_t)x >= cur->iov_len) {
+            x -= (ssize_t)cur->iov_len;
+            cur++;
+            iovcnt--;
+        }
+        if (iovcnt > 0) {
+            cur->iov_base = (char *)cur->iov_base + x;
+            cur->iov_len -= (size_t)x;
+        }
+    }
+    if (done < rec_len) {
+        // 截掉写了一半的记录，保持段可解析；截断失败则下次使用时重新加载
+        if (ftruncate(room->seg_fd, (off_t)off) != 0) {
+            room->store_loaded = 0;
+            close(room->seg_fd);
+            room->seg_fd = -1;
+        }
+        return -1;
+    }
+    room->write_seq++;
+    room->active_size = off + rec_len;
+    if (room_index_note_locked(room, seg, eid, off, off == 0))
+        segment_index_write(idxp, &room->idx[room->idx_len - 1], 1);
+    if (seg_first)
+        *seg_first = seg->first_eid;
+    if (payload_off)
+        *payload_off = off + line_len;
+    return 0;
+}
+
+// 回放起点：最后一个 event_id <= since_id 的索引点所在的段与段内偏移；
+// 索引不可用时从第一段开头顺序扫描。返回起始段下标，没有任何段时返回 -1。
+static long room_seek_locked(const Room *room, uint64_t since_id,
+                             uint64_t *off) {
+    *off = 0;
+    if (room->segs_len == 0)
+        return -1;
+    if (!room->idx_ok || room->idx_len == 0)
+        return 0;
+    size_t lo = 0, hi = room->idx_len;
+    while (lo < hi) {
+        size_t mid = lo + (hi - lo) / 2;
+        if (room->idx[mid].event_id <= since_id)
+            lo = mid + 1;
+        else
+            hi = mid;
+    }
+    if (lo == 0)
+        return 0;
+    const RoomIndexEntry *e = &room->idx[lo - 1];
+    for (size_t i = 0; i < room->segs_len; ++i) {
+        if (room->segs[i].first_eid == e->seg_first) {
+            *off = e->offset;
+            return (long)i;
+        }
+    }
+    return 0;
+}
+
+// 组提交：等待第 seq 条及之前追加的记录落盘。同一时刻只有一个线程执行
+// fdatasync，它覆盖发起时已追加的全部记录；其余调用者在条件变量上等待，
+// 并发发布共享一次刷盘。wait=0 时有人正在刷盘就直接返回（后台定时刷盘）。
+static void room_sync(Room *room, unsigned long long seq, int wait) {
+    pthread_mutex_lock(&room->mu);
+    while (room->synced_seq < seq) {
+        if (room->syncing) {
+            if (!wait)
+                break;
+            pthread_cond_wait(&room->synced_cv, &room->mu);
+            continue;
+        }
+        unsigned long long target = room->write_seq;
+        // dup 一份：刷盘期间活动段可能换段并关闭原 fd
+        int fd = room->seg_fd >= 0 ? dup(room->seg_fd) : -1;
+        room->syncing = 1;
+        pthread_mutex_unlock(&room->mu);
+        if (fd >= 0) {
+            if (fdatasync(fd) != 0)
+                perror("fdatasync segment");
+            close(fd);
+        }
+        pthread_mutex_lock(&room->mu);
+        room->syncing = 0;
+        if (target > room->synced_seq)
+            room->synced_seq = target;
+        pthread_cond_broadcast(&room->synced_cv);
+    }
+    pthread_mutex_unlock(&room->mu);
+}
+
+static void *rooms_flusher_main(void *arg) {
+    (void)arg;
+    for (;;) {
+        struct timespec ts = {g_fsync_interval_ms / 1000,
+                              (g_fsync_interval_ms % 1000) * 1000000L};
+        nanosleep(&ts, NULL);
+        if (g_fsync_policy != ROOMS_FSYNC_INTERVAL)
+            continue;
+        // 房间节点只增不删：取得链表头后无需持有全局锁遍历
+        pthread_mutex_lock(&g_rooms_mu);
+        RoomNode *cur = g_rooms;
+        pthread_mutex_unlock(&g_rooms_mu);
+        for (; cur; cur = cur->next) {
+            pthread_mutex_lock(&cur->room.mu);
+            unsigned long long seq = cur->room.write_seq;
+            int dirty = seq > cur->room.synced_seq;
+            pthread_mutex_unlock(&cur->room.mu);
+            if (dirty)
+                room_sync(&cur->room, seq, 0);
+        }
+    }
+    return NULL;
+}
+
 int rooms_store_text(Room *room, const char *room_name, const char *ts,
                      const char *user, const unsigned char *payload, size_t len,
                      const char *sha_hex, uint64_t *out_event_id) {
     if (!room || !room_name || !ts || !user || !payload || !sha_hex)
         return -1;
-    char dir[1024], files[1024], logp[1024];
-    if (ensure_room_paths(room_name, dir, sizeof dir, files, sizeof files, logp,
-                          sizeof logp) != 0)
+    char dir[1024], files[1024];
+    if (ensure_room_paths(room_name, dir, sizeof dir, files, sizeof files) != 0)
         return -1;
     pthread_mutex_lock(&room->mu);
+    room_store_ensure_locked(room);
     unsigned long long eid = ++room->last_event_id;
+    // 事件头与正文写入同一段文件，不再为每条消息单独建文件
+    char rec[1024];
+    int rl = snprintf(rec, sizeof rec,
+                      "{\"event_id\":%llu,\"ts\":\"%s\",\"user\":\"%s\","
+                      "\"kind\":\"TEXT\",\"len\":%zu,\"sha\":\"%s\"}\n",
+                      eid, ts, user, len, sha_hex);
+    uint64_t seg_first = 0, payload_off = 0;
+    int rc =
+        (rl > 0 && (size_t)rl < sizeof rec)
+            ? room_append_record_locked(room, eid, rec, (size_t)rl, payload,
+                                        len, &seg_first, &payload_off)
+            : -1;
+    unsigned long long seq = room->write_seq;
+    if (rc == 0) {
+        char hdr[512];
+        int hl = snprintf(hdr, sizeof hdr, "EVT|TEXT|%s|%s|%s|%llu|%zu|%s\n",
+                          room_name, ts, user, eid, len, sha_hex);
+        if (hl > 0 && (size_t)hl < sizeof hdr)
+            room_cache_push_locked(room, eid, hdr, (size_t)hl, payload, len,
+                                   seg_first, payload_off);
+    }
     pthread_mutex_unlock(&room->mu);
-    // 写事件日志
-    FILE *f = fopen(logp, "a");
-    if (!f)
-        return -1;
-    fprintf(f,
-            "{\"event_id\":%llu,\"ts\":\"%s\",\"user\":\"%s\",\"kind\":"
-            "\"TEXT\",\"len\":%zu,\"sha\":\"%s\"}\n",
-            eid, ts, user, len, sha_hex);
-    fflush(f);
-    fclose(f);
-    // 文本 payload 按事件落地，便于 HISTORY 回放正文
-    char texts_dir[1024];
-    if (ensure_texts_dir(room_name, texts_dir, sizeof texts_dir) != 0)
-        return -1;
-    char text_path[1024];
-    if (snprintf(text_path, sizeof text_path, "%s/%llu.txt", texts_dir, eid) >=
-        (int)sizeof text_path)
-        return -1;
-    FILE *tf = fopen(text_path, "wb");
-    if (!tf)
-        return -1;
-    size_t wr = fwrite(payload, 1, len, tf);
-    fflush(tf);
-    fclose(tf);
-    if (wr != len)
+    if (rc != 0)
         return -1;
+    if (g_fsync_policy == ROOMS_FSYNC_BATCH)
+        room_sync(room, seq, 1); // 落盘后才回复 OK 并扇出
     if (out_event_id)
         *out_event_id = (uint64_t)eid;
     return 0;
@@ -453,33 +2200,58 @@ int rooms_store_file(Room *room, const char *room_name, const char *ts,
     if (!room || !room_name || !ts || !user || !filename || !sha_hex ||
         !tmp_path)
         return -1;
-    char dir[1024], files[1024], logp[1024];
-    if (ensure_room_paths(room_name, dir, sizeof dir, files, sizeof files, logp,
-                          sizeof logp) != 0)
+    char dir[1024], files[1024];
+    if (ensure_room_paths(room_name, dir, sizeof dir, files, sizeof files) != 0)
         return -1;
     // 目标文件名: files/<eid>_<filename>
     pthread_mutex_lock(&room->mu);
+    room_store_ensure_locked(room);
     unsigned long long eid = ++room->last_event_id;
-    pthread_mutex_unlock(&room->mu);
     char final_path[1024];
+    char rec[1024];
+    int rl = snprintf(rec, sizeof rec,
+                      "{\"event_id\":%llu,\"ts\":\"%s\",\"user\":\"%s\","
+                      "\"kind\":\"FILE\",\"filename\":\"%s\",\"size\":%zu,"
+                      "\"sha\":\"%s\"}\n",
+                      eid, ts, user, filename, size, sha_hex);
+    int rc = -1;
     if (snprintf(final_path, sizeof final_path, "%s/%llu_%s", files, eid,
-                 filename) >= (int)sizeof final_path)
-        return -1;
-    if (rename(tmp_path, final_path) != 0)
-        return -1;
-    FILE *f = fopen(logp, "a");
-    if (!f)
+                 filename) < (int)sizeof final_path &&
+        rl > 0 && (size_t)rl < sizeof rec && rename(tmp_path, final_path) == 0)
+        rc = room_append_record_locked(room, eid, rec, (size_t)rl, NULL, 0,
+                                       NULL, NULL);
+    unsigned long long seq = room->write_seq;
+    if (rc == 0) {
+        char hdr[512];
+        int hl = snprintf(hdr, sizeof hdr, "EVT|FILE|%s|%s|%s|%llu|%s|%zu|%s\n",
+                          room_name, ts, user, eid, filename, size, sha_hex);
+        if (hl > 0 && (size_t)hl < sizeof hdr)
+            room_cache_push_locked(room, eid, hdr, (size_t)hl, NULL, 0, 0, 0);
+    }
+    pthread_mutex_unlock(&room->mu);
+    if (rc != 0)
         return -1;
-    fprintf(f,
-            "{\"event_id\":%llu,\"ts\":\"%s\",\"user\":\"%s\",\"kind\":"
-            "\"FILE\",\"filename\":\"%s\",\"size\":%zu,\"sha\":\"%s\"}\n",
-            eid, ts, user, filename, size, sha_hex);
-    fclose(f);
+    if (g_fsync_policy == ROOMS_FSYNC_BATCH)
+        room_sync(room, seq, 1);
     if (out_event_id)
         *out_event_id = (uint64_t)eid;
     return 0;
 }
 
+int rooms_file_path(const char *room_name, uint64_t event_id,
+                    const char *filename, char *out, size_t out_sz) {
+    if (!room_name || !filename || !out || !rooms_valid_name(room_name))
+        return -1;
+    int n = snprintf(out, out_sz, "%s/%s/files/%llu_%s", g_rooms_dir, room_name,
+                     (unsigned long long)event_id, filename);
+    if (n < 0 || (size_t)n >= out_sz)
+        return -1;
+    struct stat st;
+    if (stat(out, &st) != 0 || !S_ISREG(st.st_mode))
+        return -1;
+    return 0;
+}
+
 int rooms_fanout_file(Room *room, const char *room_name, const char *ts,
                       const char *user, uint64_t event_id, const char *filename,
                       size_t size, const char *sha_hex, long long rate_bps) {
@@ -491,38 +2263,61 @@ int rooms_fanout_file(Room *room, const char *room_name, const char *ts,
                       filename, size, sha_hex);
     if (hl <= 0)
         return -1;
-    pthread_mutex_lock(&room->mu);
-    for (size_t i = 0; i < room->subs_len; ++i) {
-        int fd = room->subs[i].fd;
-        ssize_t x = send(fd, hdr, (size_t)hl, 0);
-        if (x <= 0) {
-            // prune dead subscriber
-            room->subs[i] = room->subs[room->subs_len - 1];
-            room->subs_len--;
-            --i;
+    OutBuf *b = outbuf_new(hdr, (size_t)hl, NULL, 0);
+    if (!b)
+        return -1;
+    return room_fanout(room, event_id, b, rate_bps);
+}
+
+// 从缓存回放：room_cache_take_locked 已为每条事件加了引用
+static void history_send_cached(Room *room, SendBuf *sb, RecentEvent **evs,
+                                size_t n) {
+    for (size_t i = 0; i < n && !sb->failed; ++i) {
+        RecentEvent *ev = evs[i];
+        sendbuf_put(sb, ev->hdr, ev->hdr_len);
+        if (!ev->on_disk) {
+            sendbuf_put(sb, ev->payload, ev->payload_len);
             continue;
         }
-        throttle_down(hl, rate_bps);
+        Segment seg = {ev->seg_first, 0};
+        char segp[1024];
+        uint64_t got = 0;
+        FILE *f = NULL;
+        if (segment_path(room, &seg, "seg", segp, sizeof segp) == 0 &&
+            (f = fopen(segp, "rb")) != NULL &&
+            fseeko(f, (off_t)ev->payload_off, SEEK_SET) == 0)
+            got = sendbuf_put_file(sb, f, ev->payload_len);
+        if (f)
+            fclose(f);
+        if (got != ev->payload_len)
+            sb->failed = 1; // 段已被删除：帧已无法对齐，停止回放
     }
+    pthread_mutex_lock(&room->mu);
+    for (size_t i = 0; i < n; ++i)
+        recent_release_locked(evs[i]);
     pthread_mutex_unlock(&room->mu);
-    return 0;
 }
 
-int rooms_history_send(Room *room, const char *room_name, int fd,
-                       uint64_t since_id, size_t limit, long long rate_bps) {
-    (void)room;
-    (void)rate_bps;
-    // 简化实现：顺序扫描 events.log 并筛选 event_id>since_id，最多 limit 条
-    char dir[1024], files[1024], logp[1024];
-    if (ensure_room_paths(room_name, dir, sizeof dir, files, sizeof files, logp,
-                          sizeof logp) != 0)
-        return -1;
-    FILE *f = fopen(logp, "r");
+// 从一个段回放 since_id < event_id <= until_id（0 为不设上限）的记录，
+// *sent 累计已发送条数；越过 until_id 时返回 1
+static int history_send_segment(const Room *room, const char *room_name,
+                                const Segment *seg, uint64_t start, SendBuf *sb,
+                                uint64_t since_id, uint64_t until_id,
+                                size_t limit, size_t *sent) {
+    char segp[1024];
+    if (segment_path(room, seg, "seg", segp, sizeof segp) != 0)
+        return 0;
+    FILE *f = fopen(segp, "r");
     if (!f)
-        return 0; // no history yet
+        return 0; // 已被保留策略删除
+    int done = 0;
+    if (start > 0 && fseeko(f, (off_t)start, SEEK_SET) != 0)
+        rewind(f);
     char line[2048];
-    size_t sent = 0;
-    while (fgets(line, sizeof line, f)) {
+    while (*sent < limit && !sb->failed && fgets(line, sizeof line, f)) {
+        size_t ll = strlen(line);
+        if (ll == 0 || line[ll - 1] != '\n')
+            break; // 尚未写完的尾行
         unsigned long long eid = 0;
         char kind[16] = {0};
         char ts[64] = {0};
@@ -546,18 +2341,40 @@ int rooms_history_send(Room *room, const char *room_name, int fd,
         const char *sp = strstr(line, "\"sha\":\"");
         if (sp)
             sscanf(sp + 7, "%127[^\"]", sha);
-        if (eid <= since_id)
+        uint64_t body = record_body_len(seg, line);
+        if (until_id && eid > until_id) {
+            done = 1;
+            break;
+        }
+        if (eid <= since_id) {
+            if (body > 0 && fseeko(f, (off_t)body, SEEK_CUR) != 0)
+                break;
             continue;
-        if (strcmp(kind, "TEXT") == 0) {
-            // 原日志中的 len
+        }
+        if (strcmp(kind, "TEXT") == 0 && !seg->legacy) {
+            // 正文必须已完整写入：写者持锁追加，读者不持锁
+            struct stat st;
+            off_t here = ftello(f);
+            if (here < 0 || fstat(fileno(f), &st) != 0 ||
+                (uint64_t)here + body > (uint64_t)st.st_size)
+                break;
+            char hdr[512];
+            int hl = snprintf(hdr, sizeof hdr,
+                              "EVT|TEXT|%s|%s|%s|%llu|%llu|%s\n", room_name, ts,
+                              user, eid, (unsigned long long)(body - 1), sha);
+            sendbuf_put(sb, hdr, (size_t)hl);
+            if (sendbuf_put_file(sb, f, body - 1) != body - 1) {
+                sb->failed = 1;
+                break;
+            }
+            (void)fgetc(f); // 正文后的 '\n'
+        } else if (strcmp(kind, "TEXT") == 0) {
+            // 旧布局：原日志中的 len
             // 可能因历史版本而不准确；优先用落地文本文件的实际大小
-            size_t len = 0;
-            const char *lp = strstr(line, "\"len\":");
-            if (lp)
-                len = (size_t)strtoull(lp + 7, NULL, 10);
+            size_t len = (size_t)json_u64(line, "\"len\":");
             size_t actual_len = 0;
             char texts_dir[1024];
-            char text_path[1024];
+            char text_path[1024] = {0};
             if (ensure_texts_dir(room_name, texts_dir, sizeof texts_dir) == 0) {
                 if (snprintf(text_path, sizeof text_path, "%s/%llu.txt",
                              texts_dir, eid) < (int)sizeof text_path) {
@@ -573,37 +2390,86 @@ int rooms_history_send(Room *room, const char *room_name, int fd,
             int hl =
                 snprintf(hdr, sizeof hdr, "EVT|TEXT|%s|%s|%s|%llu|%zu|%s\n",
                          room_name, ts, user, eid, hdr_len, sha);
-            (void)send(fd, hdr, (size_t)hl, 0);
+            sendbuf_put(sb, hdr, (size_t)hl);
             // 回放正文（使用文件内容）
-            if (actual_len && text_path[0] != '\0') {
-                FILE *tf = fopen(text_path, "rb");
-                if (tf) {
-                    char buf[1024];
-                    size_t n;
-                    while ((n = fread(buf, 1, sizeof buf, tf)) > 0) {
-                        (void)send(fd, buf, n, 0);
-                        throttle_down(n, rate_bps);
-                    }
-                    fclose(tf);
-                }
-            }
+            if (actual_len && text_path[0] != '\0')
+                (void)sendbuf_put_text(sb, text_path);
         } else if (strcmp(kind, "FILE") == 0) {
             const char *fp = strstr(line, "\"filename\":\"");
             if (fp)
                 sscanf(fp + 12, "%255[^\"]", filename);
-            size_t sizev = 0;
-            const char *szp = strstr(line, "\"size\":");
-            if (szp)
-                sizev = (size_t)strtoull(szp + 7, NULL, 10);
+            size_t sizev = (size_t)json_u64(line, "\"size\":");
             char hdr[512];
             int hl =
                 snprintf(hdr, sizeof hdr, "EVT|FILE|%s|%s|%s|%llu|%s|%zu|%s\n",
                          room_name, ts, user, eid, filename, sizev, sha);
-            (void)send(fd, hdr, (size_t)hl, 0);
+            sendbuf_put(sb, hdr, (size_t)hl);
+        } else {
+            if (body > 0 && fseeko(f, (off_t)body, SEEK_CUR) != 0)
+                break;
+            continue;
         }
-        if (++sent >= limit)
-            break;
+        ++*sent;
     }
     fclose(f);
+    return done;
+}
+
+int rooms_history_send(Room *room, const char *room_name, int fd,
+                       uint64_t since_id, uint64_t until_id, size_t limit,
+                       long long rate_bps) {
+    if (!room || !room_name)
+        return -1;
+    SendBuf *sb = (SendBuf *)malloc(sizeof(SendBuf));
+    if (!sb)
+        return -1;
+    sb->fd = fd;
+    sb->failed = 0;
+    sb->rate_bps = rate_bps;
+    sb->len = 0;
+    // 游标落在最近事件缓存内时直接从内存回放，不碰磁盘
+    RecentEvent **cached = NULL;
+    size_t ncached = 0;
+    Segment *segs = NULL;
+    size_t nsegs = 0;
+    uint64_t start = 0;
+    if (until_id && until_id <= since_id) {
+        free(sb); // 游标已在上限之后：没有要回放的事件
+        return 0;
+    }
+    // 事件 id 连续分配，缓存中 (since_id, until_id] 至多 until_id - since_id 条
+    if (until_id && until_id - since_id < limit)
+        limit = (size_t)(until_id - since_id);
+    pthread_mutex_lock(&room->mu);
+    room_store_ensure_locked(room);
+    int hit = room_cache_take_locked(room, since_id, limit, &cached, &ncached);
+    if (!hit) {
+        // 否则借助稀疏索引定位到 since_id
+        // 所在的段与偏移，只顺序扫描其后的记录； 段列表复制一份，发送期间不持锁
+        long k0 = room_seek_locked(room, since_id, &start);
+        if (k0 >= 0) {
+            nsegs = room->segs_len - (size_t)k0;
+            segs = (Segment *)malloc(nsegs * sizeof(Segment));
+            if (segs)
+                memcpy(segs, room->segs + k0, nsegs * sizeof(Segment));
+            else
+                nsegs = 0;
+        }
+    }
+    pthread_mutex_unlock(&room->mu);
+    if (hit) {
+        history_send_cached(room, sb, cached, ncached);
+        free(cached);
+    } else {
+        size_t sent = 0;
+        for (size_t k = 0; k < nsegs && sent < limit && !sb->failed; ++k)
+            if (history_send_segment(room, room_name, &segs[k],
+                                     k == 0 ? start : 0, sb, since_id, until_id,
+                                     limit, &sent))
+                break;
+        free(segs);
+    }
+    sendbuf_flush(sb);
+    free(sb);
     return 0;
 }
@@ -12,6 +12,53 @@ typedef struct Room Room;
 // exists.
 int rooms_init(const char *base_dir);
 
+// Sparse segment index granularity: one (event_id, offset) point every
+// `stride` events in <room>/segments/<first_eid>.idx next to each .seg (the
+// legacy events.log keeps its events.idx). 0 disables the index (HISTORY then
+// scans whole segments). Call before serving.
+void rooms_set_index_stride(unsigned stride);
+
+// Per-room byte budget of the in-memory ring of recent events that HISTORY
+// replays from before touching the segment files. 0 disables the cache.
+void rooms_set_cache_budget(size_t bytes);
+
+// Room event store layout: events and TEXT bodies are appended to
+// <room>/segments/<first_eid>.seg; a new segment starts once the active one
+// would exceed `segment_bytes` (0 keeps the current value). Sealed segments
+// are dropped oldest-first while the room holds more than `retain_bytes` or
+// when last written more than `retain_secs` ago (0 = unlimited).
+void rooms_set_retention(uint64_t segment_bytes, uint64_t retain_bytes,
+                         long long retain_secs);
+
+// Durability of room segment appends. NONE leaves flushing to the kernel;
+// INTERVAL fdatasyncs dirty rooms every `interval_ms` from a background
+// thread; BATCH makes each publish wait until its record is on disk, with
+// concurrent publishers sharing one fdatasync (group commit). interval_ms <= 0
+// keeps the current interval. Returns 0 on success.
+enum { ROOMS_FSYNC_NONE = 0, ROOMS_FSYNC_INTERVAL = 1, ROOMS_FSYNC_BATCH = 2 };
+int rooms_set_fsync_policy(int policy, long interval_ms);
+
+// Fanout is asynchronous: every subscribed connection has one bounded
+// outbound queue (shared across its rooms) drained by a background sender
+// thread with non-blocking writes. When a queue would exceed `queue_bytes`
+// the slow-consumer policy applies: DROP_OLDEST discards the oldest queued
+// events, DISCONNECT shuts the subscriber down, BLOCK makes the publisher wait
+// up to `block_ms` for space and then disconnects. 0 keeps the current
+// queue_bytes / block_ms. Returns 0 on success.
+enum {
+    ROOMS_SLOW_DROP_OLDEST = 0,
+    ROOMS_SLOW_DISCONNECT = 1,
+    ROOMS_SLOW_BLOCK = 2
+};
+int rooms_set_slow_consumer(int policy, size_t queue_bytes, long block_ms);
+
+// Bracket a connection's own writes (command replies, HISTORY replay): while
+// held, the sender thread leaves that fd alone so queued events never
+// interleave with a reply. Must be called from the thread serving `fd`;
+// rooms_add_subscriber_ex may only be called between the two.
+int rooms_conn_lock(int fd);
+void rooms_conn_unlock(int fd);
+
 // Validate room name: ^[A-Za-z0-9._-]{1,64}$
 int rooms_valid_name(const char *name);
 
@@ -19,12 +66,16 @@ int rooms_valid_name(const char *name);
 Room *rooms_get_or_create(const char *name);
 
 // Add/remove subscriber fd to/from room. Returns 0 on success.
-// Extended: add with username (preferred when available)
-int rooms_add_subscriber_ex(Room *room, int fd, const char *username);
+// Extended: add with username (preferred when available). The room's last
+// event_id at registration is stored in *replay_upto_out (may be NULL): live
+// fanout skips events up to it, so the SUB replay must cover exactly
+// (since_id, *replay_upto_out] (see rooms_history_send until_id).
+int rooms_add_subscriber_ex(Room *room, int fd, const char *username,
+                            uint64_t *replay_upto_out);
 int rooms_remove_subscriber(Room *room, int fd);
 
-// Remove a subscriber fd from all rooms (used when a client disconnects
-// unexpectedly).
+// Remove a subscriber fd from all rooms and drop its outbound queue (used
+// when a client disconnects). Call before closing fd.
 int rooms_remove_fd_from_all(int fd);
 
 // Owner/policy helpers
@@ -39,22 +90,33 @@ void rooms_get_info(Room *room, char *owner_out, size_t owner_cap,
 // retain/delegate/teardown)
 void rooms_handle_owner_disconnect(const char *owner, long long rate_bps);
 
-// Fanout a TEXT event to all subscribers in the room.
+// Fanout counters: events currently queued for the room's subscribers, the
+// deepest single queue, events dropped (DROP_OLDEST) and subscribers
+// disconnected for falling behind.
+void rooms_get_fanout_stats(Room *room, size_t *queued_out,
+                            size_t *max_depth_out,
+                            unsigned long long *dropped_out,
+                            unsigned long long *kicked_out);
+
+// Fanout a TEXT event to all subscribers in the room (queued, see
+// rooms_set_slow_consumer).
 // The server composes header like: EVT|TEXT|room|ts|user|event_id|len|sha\n and
 // then payload bytes. For now event_id can be 0 (no persistence yet). rate_bps
-// can be 0 for unlimited.
+// paces each subscriber's queue; 0 for unlimited.
 int rooms_fanout_text(Room *room, const char *room_name, const char *ts,
                       const char *user, uint64_t event_id,
                       const unsigned char *payload, size_t len,
                       const char *sha_hex, long long rate_bps);
 
-// Store text event to disk (events log + payload file). Returns 0 and
-// out_event_id on success.
+// Store text event to disk (event record + body appended to the active
+// segments/*.seg, index point to its .idx). Returns 0 and out_event_id on
+// success.
 int rooms_store_text(Room *room, const char *room_name, const char *ts,
                      const char *user, const unsigned char *payload, size_t len,
                      const char *sha_hex, uint64_t *out_event_id);
 
-// Store file event (rename tmp_path into files/) and record events log.
+// Store file event (rename tmp_path into files/) and append its record to the
+// active segments/*.seg.
 int rooms_store_file(Room *room, const char *room_name, const char *ts,
                      const char *user, const char *filename, size_t size,
                      const char *sha_hex, const char *tmp_path,
@@ -65,9 +127,18 @@ int rooms_fanout_file(Room *room, const char *room_name, const char *ts,
                       const char *user, uint64_t event_id, const char *filename,
                       size_t size, const char *sha_hex, long long rate_bps);
 
-// Send history since event_id (exclusive), up to limit entries, to a single fd.
+// Resolve the stored payload of a FILE event: rooms/<room>/files/<eid>_<name>.
+// Writes the path into out and returns 0 when it exists as a regular file.
+// filename must already be validated by the caller (no path separators).
+int rooms_file_path(const char *room_name, uint64_t event_id,
+                    const char *filename, char *out, size_t out_sz);
+
+// Send history since event_id (exclusive) up to until_id (inclusive, 0 for no
+// upper bound), up to limit entries, to a single fd.
 // For TEXT events sends header+payload; for FILE events sends header only.
+// Served from the recent-events cache when it covers since_id, else from disk.
 int rooms_history_send(Room *room, const char *room_name, int fd,
-                       uint64_t since_id, size_t limit, long long rate_bps);
+                       uint64_t since_id, uint64_t until_id, size_t limit,
+                       long long rate_bps);
 
 #endif // DRLMS_ROOMS_H
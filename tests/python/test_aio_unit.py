@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from ming_drlms import aio
+from ming_drlms.protocol import ProtocolError
+
+
+FILE_BODY = b"line-1\nline-2\n" * 100
+
+
+def _text_evt(room: str, eid: int, body: bytes) -> bytes:
+    sha = hashlib.sha256(body).hexdigest()
+    return f"EVT|TEXT|{room}|ts|bob|{eid}|{len(body)}|{sha}\n".encode() + body
+
+
+async def _fake_server(reader, writer):
+    """Minimal line-protocol double of log_collector_server."""
+    while True:
+        raw = await reader.readline()
+        if not raw:
+            break
+        line = raw.decode().rstrip("\n")
+        if line.startswith("LOGIN|"):
+            ok = line.split("|")[2] == "pw"
+            writer.write(b"OK|WELCOME\n" if ok else b"ERR|AUTH|invalid credentials\n")
+        elif line.startswith("SUB|"):
+            room = line.split("|")[1]
+            # an event from another room may race ahead of the SUB ack
+            writer.write(_text_evt("other", 9, b"early"))
+            writer.write(f"OK|SUB|{room}\n".encode())
+            writer.write(_text_evt(room, 1, b"no newline"))
+            writer.write(f"EVT|FILE|{room}|ts|bob|2|f.txt|3|abc\n".encode())
+        elif line.startswith("ROOMINFO|"):
+            writer.write(b"OK|ROOMINFO|r1|bob|0|1|2|3|3|5|1\n")
+        elif line.startswith("PUBT|"):
+            _, _room, n, _sha = line.split("|")
+            writer.write(b"READY\n")
+            await writer.drain()
+            await reader.readexactly(int(n))
+            writer.write(b"OK|PUBT|7\n")
+        elif line.startswith("HISTORY|"):
+            writer.write(_text_evt("r1", 1, b"a\nb"))
+            writer.write(_text_evt("r1", 2, b""))
+            writer.write(b"OK|HISTORY\n")
+        elif line == "LIST":
+            writer.write(b"BEGIN\nx.log\ny.log\nEND\n")
+        elif line.startswith(("DOWNLOAD|", "FETCH|")):
+            name = line.split("|")[-1]
+            body = FILE_BODY
+            sha = hashlib.sha256(body).hexdigest()
+            if name == "bad.log":
+                sha = "0" * 64
+            writer.write(f"SIZE|{len(body)}|{sha}\nREADY\n".encode() + body)
+        elif line == "QUIT":
+            break
+        else:
+            writer.write(b"ERR|FORMAT|unknown command\n")
+        await writer.drain()
+    writer.close()
+
+
+def run_with_server(scenario):
+    async def main():
+        server = await asyncio.start_server(_fake_server, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await scenario(port)
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    return asyncio.run(main())
+
+
+def test_login_failure_raises_protocol_error():
+    async def scenario(port):
+        with pytest.raises(ProtocolError) as ei:
+            await aio.connect("127.0.0.1", port, "alice", "nope")
+        assert ei.value.code == "AUTH"
+
+    run_with_server(scenario)
+
+
+def test_request_response_commands(tmp_path: Path):
+    async def scenario(port):
+        c = await aio.connect("127.0.0.1", port, "alice", "pw")
+        try:
+            assert await c.list_files() == ["x.log", "y.log"]
+            info = await c.roominfo("r1")
+            assert info["owner"] == "bob" and info["last_event_id"] == 2
+            assert (info["queued"], info["dropped"], info["kicked"]) == (3, 5, 1)
+            assert await c.pubt("r1", "hello") == 7
+            hist = await c.history("r1", 10)
+            assert [e.event_id for e in hist] == [1, 2]
+            assert hist[0].payload == b"a\nb"
+            out = tmp_path / "x.log"
+            size, _sha = await c.download("x.log", out)
+            assert size == len(FILE_BODY) and out.read_bytes() == FILE_BODY
+            with pytest.raises(ProtocolError):
+                await c.download("bad.log", tmp_path / "bad.log")
+            assert not (tmp_path / "bad.log").exists()
+            assert not (tmp_path / "bad.log.part").exists()
+            size, _sha = await c.fetch("r1", 3, "f.txt", tmp_path / "f.txt")
+            assert (tmp_path / "f.txt").read_bytes() == FILE_BODY
+        finally:
+            await c.close()
+
+    run_with_server(scenario)
+
+
+def test_subscription_demuxes_events_and_responses():
+    async def scenario(port):
+        c = await aio.connect("127.0.0.1", port, "alice", "pw")
+        try:
+            assert await c.sub("r1") == "OK|SUB|r1"
+            assert c.subscribed and c.rooms == {"r1"}
+            # commands keep working while events stream in
+            assert await c.pubt("r1", "x") == 7
+            got = [await c.next_event(timeout=2) for _ in range(3)]
+            assert [(e.room, e.kind, e.event_id) for e in got] == [
+                ("other", "TEXT", 9),
+                ("r1", "TEXT", 1),
+                ("r1", "FILE", 2),
+            ]
+            assert got[1].text == "no newline"
+            assert got[2].filename == "f.txt"
+            with pytest.raises(ProtocolError):
+                await c.history("r1")
+        finally:
+            await c.close()
+
+    run_with_server(scenario)
@@ -1,60 +1,161 @@
 from __future__ import annotations
 
-from pathlib import Path
+import hashlib
+import os
+import socket
+import threading
 
 import pytest
 from typer.testing import CliRunner
 
 from ming_drlms.main import app
+from ming_drlms.bulk import bulk_upload
 from ming_drlms.cli import client as client_mod
+from ming_drlms.session import LoginFailed
+from ming_drlms.protocol import BufferedConnection
+
+
+class _FakeServer:
+    """Threaded TCP double of log_collector_server for LIST/UPLOAD/DOWNLOAD."""
+
+    def __init__(self):
+        self.files = {"a.log": b"a", "b.log": b"b"}
+        self.logins = 0
+        self.mu = threading.Lock()
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(8)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                c, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(c,), daemon=True).start()
+
+    def _serve(self, raw):
+        conn = BufferedConnection(raw)
+        try:
+            while True:
+                line = conn.readline().decode().rstrip("\n")
+                if not line:
+                    return
+                parts = line.split("|")
+                if parts[0] == "QUIT":
+                    return
+                if parts[0] == "LOGIN":
+                    with self.mu:
+                        self.logins += 1
+                    ok = parts[2] == "password"
+                    conn.sendall(b"OK|WELCOME\n" if ok else b"ERR|AUTH|bad\n")
+                elif parts[0] == "LIST":
+                    names = "".join(f"{n}\n" for n in sorted(self.files))
+                    conn.sendall(f"BEGIN\n{names}END\n".encode())
+                elif parts[0] == "UPLOAD":
+                    _, name, size, sha = parts
+                    if name in self.files:
+                        conn.sendall(b"ERR|EXISTS|file exists\n")
+                        continue
+                    conn.sendall(b"READY\n")
+                    body = conn.readexactly(int(size))
+                    got = hashlib.sha256(body).hexdigest()
+                    if got != sha:
+                        conn.sendall(b"ERR|CHECKSUM|mismatch\n")
+                        continue
+                    self.files[name] = body
+                    conn.sendall(f"OK|{got}\n".encode())
+                elif parts[0] == "STAT":
+                    body = self.files.get(parts[1])
+                    if body is None:
+                        conn.sendall(b"ERR|NOTFOUND|file\n")
+                        continue
+                    sha = hashlib.sha256(body).hexdigest()
+                    conn.sendall(f"OK|STAT|{parts[1]}|{len(body)}|{sha}\n".encode())
+                elif parts[0] == "DOWNLOAD":
+                    body = self.files.get(parts[1])
+                    if body is None:
+                        conn.sendall(b"ERR|NOTFOUND|no such file\n")
+                        continue
+                    sha = hashlib.sha256(body).hexdigest()
+                    conn.sendall(f"SIZE|{len(body)}|{sha}\nREADY\n".encode() + body)
+                else:
+                    conn.sendall(b"ERR|FORMAT|unknown\n")
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def fake_server():
+    srv = _FakeServer()
+    yield srv
+    srv.close()
+
+
+def _run(app_args, port):
+    runner = CliRunner()
+    return runner.invoke(app, ["client", *app_args, "-p", str(port)])
 
 
-def test_client_list_missing_agent(monkeypatch):
-    runner = CliRunner()
-    monkeypatch.setattr(client_mod, "BIN_AGENT", Path("/non/existent/agent"))
-    res = runner.invoke(app, ["client", "list"])  # noqa: E501
-    assert res.exit_code == 2
-    assert "missing C binary" in res.output
+def test_client_list_native(fake_server):
+    res = _run(["list"], fake_server.port)
+    assert res.exit_code == 0
+    assert res.output.splitlines()[:4] == ["BEGIN", "a.log", "b.log", "END"]
 
 
-def test_client_upload_missing_file(monkeypatch, tmp_path):
-    # when agent exists, but file does not, ensure process attempts and returns code 0 (subprocess not check)
-    runner = CliRunner()
-    # fake agent path to a benign binary (use /bin/true if exists; else skip)
-    agent = Path("/bin/true")
-    if not agent.exists():
-        pytest.skip("/bin/true not available in env")
-    monkeypatch.setattr(client_mod, "BIN_AGENT", agent)
-    res = runner.invoke(app, ["client", "upload", str(tmp_path / "nope.txt")])
-    # underlying agent will ignore args; but CLI should not crash
-    assert res.exit_code in (0, None)
+def test_client_list_login_failure(fake_server):
+    res = _run(["list", "-P", "nope"], fake_server.port)
+    assert res.exit_code == 1
+    assert "login failed" in res.output
 
 
-def test_client_download_out_path(monkeypatch, tmp_path):
-    runner = CliRunner()
-    agent = Path("/bin/true")
-    if not agent.exists():
-        pytest.skip("/bin/true not available in env")
-    monkeypatch.setattr(client_mod, "BIN_AGENT", agent)
+def test_client_upload_roundtrip(fake_server, tmp_path):
+    src = tmp_path / "up.bin"
+    body = os.urandom(300_000)
+    src.write_bytes(body)
+    res = _run(["upload", str(src)], fake_server.port)
+    assert res.exit_code == 0, res.output
+    assert f"OK|{hashlib.sha256(body).hexdigest()}" in res.output
+    assert fake_server.files["up.bin"] == body
+
+
+def test_client_upload_missing_file(fake_server, tmp_path):
+    res = _run(["upload", str(tmp_path / "nope.txt")], fake_server.port)
+    assert res.exit_code == 1
+    assert "no such file" in res.output
+
+
+def test_client_download_out_path(fake_server, tmp_path):
+    fake_server.files["f.txt"] = b"hello\n" * 1000
     out = tmp_path / "out.txt"
-    res = runner.invoke(app, ["client", "download", "f.txt", "-o", str(out)])
-    assert res.exit_code in (0, None)
+    res = _run(["download", "f.txt", "-o", str(out)], fake_server.port)
+    assert res.exit_code == 0, res.output
+    assert out.read_bytes() == b"hello\n" * 1000
 
 
-def test_client_upload_missing_agent(monkeypatch, tmp_path):
-    runner = CliRunner()
-    monkeypatch.setattr(client_mod, "BIN_AGENT", Path("/no/agent"))
-    res = runner.invoke(app, ["client", "upload", str(tmp_path / "x.txt")])
-    assert res.exit_code == 2
-    assert "missing C binary" in res.output
+def test_client_download_missing_remote(fake_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    res = _run(["download", "a.txt"], fake_server.port)
+    assert res.exit_code == 1
+    assert "ERR|NOTFOUND" in res.output
+    assert not (tmp_path / "a.txt").exists()
 
 
-def test_client_download_missing_agent(monkeypatch):
-    runner = CliRunner()
-    monkeypatch.setattr(client_mod, "BIN_AGENT", Path("/no/agent"))
-    res = runner.invoke(app, ["client", "download", "a.txt"])  # default out path
-    assert res.exit_code == 2
-    assert "missing C binary" in res.output
+def test_client_connect_refused(tmp_path):
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    res = _run(["list"], port)
+    assert res.exit_code == 1
+    assert "connect" in res.output
 
 
 def test_client_log_sends_and_quit(monkeypatch, capsys):
@@ -94,3 +195,61 @@ def test_client_log_sends_and_quit(monkeypatch, capsys):
     assert res.exit_code == 0
     out = res.output
     assert "OK" in out
+
+
+def test_client_upload_dir_skips_matching_and_flags_conflicts(fake_server, tmp_path):
+    d = tmp_path / "logs"
+    d.mkdir()
+    for i in range(6):
+        (d / f"app.log.{i}").write_bytes(os.urandom(10_000 + i))
+    (d / "a.log").write_bytes(b"a")  # identical to the server copy
+    (d / "b.log").write_bytes(b"changed")  # same name, different content
+    (d / ".hidden").write_bytes(b"x")
+    res = _run(["upload-dir", str(d), "-j", "3"], fake_server.port)
+    assert res.exit_code == 1
+    assert "SKIP|a.log|" in res.output
+    assert "ERR|b.log|exists on server with different content" in res.output
+    assert "6 ok, 1 skipped, 1 failed" in res.output
+    for i in range(6):
+        assert fake_server.files[f"app.log.{i}"] == (d / f"app.log.{i}").read_bytes()
+    assert ".hidden" not in fake_server.files
+    # only the app.* files this time: all already there
+    res = _run(["upload-dir", str(d), "-g", "app.*"], fake_server.port)
+    assert res.exit_code == 0
+    assert "0 ok, 6 skipped, 0 failed" in res.output
+
+
+def test_client_download_all_with_pattern_and_skip(fake_server, tmp_path):
+    fake_server.files.update({f"r{i}.log": os.urandom(5000) for i in range(5)})
+    out = tmp_path / "mirror"
+    res = _run(["download-all", "-o", str(out), "-g", "r*.log"], fake_server.port)
+    assert res.exit_code == 0, res.output
+    assert sorted(p.name for p in out.iterdir()) == [f"r{i}.log" for i in range(5)]
+    (out / "r0.log").write_bytes(b"stale")
+    res = _run(["download-all", "-o", str(out), "-g", "r*.log"], fake_server.port)
+    assert "1 ok, 4 skipped, 0 failed" in res.output
+    assert (out / "r0.log").read_bytes() == fake_server.files["r0.log"]
+
+
+def test_bulk_upload_bounds_connections_and_fails_fast_on_login(fake_server, tmp_path):
+    files = []
+    for i in range(12):
+        p = tmp_path / f"f{i}.bin"
+        p.write_bytes(os.urandom(2000))
+        files.append(p)
+    seen = []
+    report = bulk_upload(
+        "127.0.0.1",
+        fake_server.port,
+        "u",
+        "password",
+        files,
+        jobs=3,
+        on_bytes=seen.append,
+    )
+    assert (report.ok, report.skipped, report.failed) == (12, 0, 0)
+    assert report.bytes == sum(seen) == 12 * 2000
+    # one login for the initial LIST plus at most one per worker connection
+    assert fake_server.logins <= 1 + 3
+    with pytest.raises(LoginFailed):
+        bulk_upload("127.0.0.1", fake_server.port, "u", "bad", files)
@@ -139,3 +139,10 @@ def test_update_check_throttled_and_nonblocking(monkeypatch, runner):
     result = runner.invoke(app, ["server-status", "-p", "65500"])  # port likely closed
     assert result.exit_code == 0
     # No exception and no forced output required
+
+
+def test_unknown_command_suggests_lazy_command(runner):
+    # 拼错的子命令尚未导入，也应给出近似名提示
+    result = runner.invoke(app, ["clinet"])
+    assert result.exit_code == 2
+    assert "Did you mean 'client'?" in result.output
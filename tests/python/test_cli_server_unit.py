@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+import typer
+
+from ming_drlms.cli import server as server_cli
+
+
+def _pidfile(tmp_path: Path, monkeypatch) -> None:
+    pid = tmp_path / "server.pid"
+    pid.write_text("4242")
+    monkeypatch.setattr(server_cli, "SERVER_PID", pid)
+
+
+def test_refuse_if_running_treats_eperm_as_running(tmp_path: Path, monkeypatch):
+    _pidfile(tmp_path, monkeypatch)
+
+    def kill(pid, sig):
+        raise PermissionError(1, "Operation not permitted")
+
+    monkeypatch.setattr(os, "kill", kill)
+    with pytest.raises(typer.Exit) as ei:
+        server_cli._refuse_if_running(False)
+    assert ei.value.exit_code == 2
+    server_cli._refuse_if_running(True)
+
+
+def test_refuse_if_running_ignores_stale_pidfile(tmp_path: Path, monkeypatch):
+    _pidfile(tmp_path, monkeypatch)
+
+    def kill(pid, sig):
+        raise ProcessLookupError(3, "No such process")
+
+    monkeypatch.setattr(os, "kill", kill)
+    server_cli._refuse_if_running(False)
+
+
+def test_store_rejects_room_outside_data_dir(tmp_path: Path):
+    from typer.testing import CliRunner
+
+    (tmp_path / "x").mkdir()
+    res = CliRunner().invoke(
+        server_cli.server_app,
+        ["store", "inspect", "-d", str(tmp_path / "data"), "-r", "../../x"],
+    )
+    assert res.exit_code == 2
+    assert "invalid room name" in res.output
@@ -6,9 +6,18 @@ from pathlib import Path
 import pytest
 import click
 
+from ming_drlms import state as state_mod
 from ming_drlms.cli import space as space_mod
 
 
+@pytest.fixture
+def tmp_state(monkeypatch, tmp_path: Path) -> Path:
+    """Point ~/.drlms/state.json at a temp dir; returns the state file path."""
+    monkeypatch.setattr(state_mod, "STATE_DIR", tmp_path / ".drlms")
+    monkeypatch.setattr(state_mod, "STATE_PATH", tmp_path / ".drlms" / "state.json")
+    return tmp_path / ".drlms" / "state.json"
+
+
 class DummySock:
     def __init__(self, lines: list[str]):
         self._lines = list(lines)
@@ -78,18 +87,11 @@ def test_space_history_text_with_payload_and_tail(capsys, monkeypatch):
 
 
 def test_space_join_basic_text_and_file_updates_state(
-    capsys, monkeypatch, tmp_path: Path
+    capsys, monkeypatch, tmp_path: Path, tmp_state: Path
 ):
     # prepare state monkeypatch
     state = {}
     monkeypatch.setattr(space_mod, "load_state", lambda: state)
-    saved = {"last": []}
-
-    def set_last(s, key, eid):
-        saved["last"].append((key, eid))
-
-    monkeypatch.setattr(space_mod, "set_last_event_id", set_last)
-    monkeypatch.setattr(space_mod, "save_state", lambda s: None)
 
     # sequence: SUB ack, EVT TEXT (eid=3, len=4), payload, EVT FILE with eid=4, then EOF
     lines = [
@@ -119,9 +121,10 @@ def test_space_join_basic_text_and_file_updates_state(
         reconnect=False,
     )
     assert "data" in capsys.readouterr().out
-    # two updates for eid=3 and eid=4
+    # cursor advanced through eid=3 and eid=4, flushed on exit
     key = "h:1:r"
-    assert saved["last"][-1] == (key, 4)
+    assert state["rooms"][key]["last_event_id"] == 4
+    assert state_mod.get_last_event_id(state_mod.load_state(), key) == 4
     assert sock.closed
 
 
@@ -164,3 +167,81 @@ def test_space_chat_quick_exit(capsys, monkeypatch):
     capsys.readouterr().out
     # should not hang and should have printed SUB ack not necessarily
     assert sock.closed
+
+
+def test_resolve_rooms_merges_options_and_files(tmp_path: Path):
+    (tmp_path / "a.rooms").write_text("r2\n# comment\nr3  # trailing\n\n")
+    (tmp_path / "b.rooms").write_text("r1\nr4\n")
+    rooms = space_mod._resolve_rooms(["r1", "r2"], str(tmp_path / "*.rooms"))
+    assert rooms == ["r1", "r2", "r3", "r4"]
+    assert space_mod._resolve_rooms("solo", None) == ["solo"]
+    with pytest.raises(ValueError):
+        space_mod._resolve_rooms(["bad|room"], None)
+    with pytest.raises(ValueError):
+        space_mod._resolve_rooms(None, str(tmp_path / "missing.txt"))
+
+
+class FakeAsyncClient:
+    def __init__(self, events):
+        self._events = list(events)
+        self.subs = []
+        self.closed = False
+
+    async def sub(self, room, since_id=0):
+        self.subs.append((room, since_id))
+        return f"OK|SUB|{room}"
+
+    async def events(self):
+        for ev in self._events:
+            yield ev
+
+    async def close(self, quit=True):
+        self.closed = True
+
+
+def test_space_join_multi_room_merges_tagged_stream(
+    capsys, monkeypatch, tmp_path: Path, tmp_state: Path
+):
+    from ming_drlms.protocol import parse_event_header
+
+    def text_evt(room, eid, body):
+        ev = parse_event_header(f"EVT|TEXT|{room}|ts|u|{eid}|{len(body)}|sha")
+        ev.payload = body
+        return ev
+
+    events = [
+        text_evt("r1", 5, b"one"),
+        parse_event_header("EVT|FILE|r2|ts|u|8|f.txt|3|sha"),
+        text_evt("r1", 6, b"[two]\n"),
+    ]
+    client = FakeAsyncClient(events)
+
+    async def fake_connect(host, port, user, password):
+        return client
+
+    state = {"rooms": {"h:1:r2": {"last_event_id": 7}}}
+    monkeypatch.setattr(space_mod, "load_state", lambda: state)
+    monkeypatch.setattr(space_mod.aio, "connect", fake_connect)
+
+    space_mod.space_join(
+        room=["r1", "r2"],
+        host="h",
+        port=1,
+        user="u",
+        password="p",
+        since_id=-1,
+        save_dir=tmp_path,
+        json_out=False,
+        reconnect=False,
+    )
+    out = capsys.readouterr().out.splitlines()
+    assert out == [
+        "[r1] one",
+        "[r2] EVT|FILE|r2|ts|u|8|f.txt|3|sha",
+        "[r1] [two]",
+    ]
+    assert client.subs == [("r1", 0), ("r2", 7)]
+    assert client.closed
+    assert state["rooms"]["h:1:r1"]["last_event_id"] == 6
+    assert state["rooms"]["h:1:r2"]["last_event_id"] == 8
+    assert "EVT|FILE|r2" in (tmp_path / "events.log").read_text()
@@ -0,0 +1,117 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+_SRC = Path(__file__).resolve().parents[2] / "src"
+
+# 任一命令都不应在 --version 时导入的模块
+HEAVY = (
+    "ming_drlms.cli.client",
+    "ming_drlms.cli.user",
+    "ming_drlms.cli.space",
+    "ming_drlms.cli.room",
+    "ming_drlms.cli.server",
+    "ming_drlms.cli.dev",
+    "ming_drlms.cli.utils",
+    "requests",
+    "argon2",
+    "yaml",
+    "rich.progress",
+    "concurrent.futures.process",
+)
+
+
+def importtime(args, tmp_path: Path, env=None):
+    """Run the CLI under ``-X importtime``; return {module: cumulative µs}."""
+    e = dict(os.environ)
+    e["PYTHONPATH"] = os.pathsep.join([str(_SRC), e.get("PYTHONPATH", "")])
+    e["DRLMS_UPDATE_CHECK"] = "0"
+    e.pop("DRLMS_ROOT", None)
+    e.update(env or {})
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "ming_drlms.main", *args],
+        cwd=str(tmp_path),
+        env=e,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    mods = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cum, name = line[len("import time:") :].split("|")
+        mods[name.strip()] = int(cum)
+    return mods
+
+
+def test_version_skips_subcommand_modules(tmp_path: Path):
+    mods = importtime(["--version"], tmp_path)
+    assert "ming_drlms.cli" in mods
+    assert not [m for m in HEAVY if m in mods]
+
+
+def test_version_throttled_update_check_skips_requests(tmp_path: Path):
+    # 更新检查未关闭但处于节流期：退出时不应导入 requests/packaging
+    cache = tmp_path / "cache" / "ming-drlms"
+    cache.mkdir(parents=True)
+    (cache / "last_check.json").write_text(json.dumps({"ts": time.time()}))
+    mods = importtime(
+        ["--version"],
+        tmp_path,
+        env={"DRLMS_UPDATE_CHECK": "1", "XDG_CACHE_HOME": str(tmp_path / "cache")},
+    )
+    assert "requests" not in mods
+    assert "packaging.version" not in mods
+
+
+@pytest.mark.parametrize(
+    "args, loaded, absent",
+    [
+        (
+            ["user", "list"],
+            ["ming_drlms.cli.user"],
+            ["ming_drlms.cli.client", "ming_drlms.cli.space", "requests", "argon2"],
+        ),
+        (
+            ["client", "list", "--help"],
+            ["ming_drlms.cli.client"],
+            ["ming_drlms.cli.user", "ming_drlms.cli.space", "argon2"],
+        ),
+        (
+            ["server-status", "--help"],
+            ["ming_drlms.cli.server"],
+            ["ming_drlms.cli.client", "ming_drlms.cli.user", "argon2"],
+        ),
+        (
+            ["config", "--help"],
+            ["ming_drlms.cli.config"],
+            ["ming_drlms.cli.client", "ming_drlms.cli.server", "yaml"],
+        ),
+    ],
+)
+def test_subcommand_imports_only_its_group(tmp_path: Path, args, loaded, absent):
+    env = {"DRLMS_DATA_DIR": str(tmp_path / "data")}
+    mods = importtime(args, tmp_path, env=env)
+    assert all(m in mods for m in loaded)
+    assert not [m for m in absent if m in mods]
+
+
+def test_version_imports_only_core_package_modules(tmp_path: Path):
+    # 以导入的模块集合而非墙钟时间约束启动开销：--version 只应加载 CLI 入口本身，
+    # 任何子命令或其依赖被提前导入都会让集合变大
+    mods = importtime(["--version"], tmp_path)
+    ours = {m for m in mods if m.split(".")[0] == "ming_drlms"}
+    assert ours <= {
+        "ming_drlms",
+        "ming_drlms._version",
+        "ming_drlms.cli",
+        "ming_drlms.main",
+        "ming_drlms.update_check",
+    }, sorted(ours)
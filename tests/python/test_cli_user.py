@@ -166,3 +166,187 @@ def test_list_legacy_with_crlf_is_detected(tmp_path: Path, runner: CliRunner):
     assert any(
         it["username"] == "legacy_user_crlf" and it["format"] == "legacy" for it in arr
     )
+
+
+def test_user_import_csv_and_jsonl(tmp_path: Path, runner: CliRunner, monkeypatch):
+    monkeypatch.setenv("DRLMS_ARGON2_T_COST", "1")
+    monkeypatch.setenv("DRLMS_ARGON2_M_COST", "8")
+    data_dir = tmp_path / "srv"
+    _ = runner.invoke(
+        app, ["user", "add", "alice", "-d", str(data_dir)], input="p\np\n"
+    )
+    before = dict((u, e) for u, _k, e in parse_users(data_dir / "users.txt"))
+    src = tmp_path / "users.csv"
+    src.write_text("username,password\nbob,b1\ncarol,c1\nalice,a2\n")
+    # 已存在用户默认报错，且不写入任何记录
+    res = runner.invoke(app, ["user", "import", str(src), "-d", str(data_dir)])
+    assert res.exit_code == 1 and "user exists" in res.output
+    assert "alice (1 total)" in res.output
+    assert len(parse_users(data_dir / "users.txt")) == 1
+
+    res = runner.invoke(
+        app,
+        ["user", "import", str(src), "-d", str(data_dir), "-e", "skip", "--jobs", "2"],
+    )
+    assert res.exit_code == 0, res.output
+    assert "added=2" in res.output and "skipped=1" in res.output
+    recs = {u: e for u, _k, e in parse_users(data_dir / "users.txt")}
+    assert list(recs) == ["alice", "bob", "carol"] and recs["alice"] == before["alice"]
+    assert "$m=8,t=1," in recs["bob"]
+
+    src = tmp_path / "more.jsonl"
+    src.write_text('{"username": "alice", "password": "a2"}\n{"username": "dave"}\n')
+    res = runner.invoke(app, ["user", "import", str(src), "-d", str(data_dir)])
+    assert res.exit_code == 2
+    src.write_text('{"username": "alice", "password": "a2"}\n')
+    res = runner.invoke(
+        app, ["user", "import", str(src), "-d", str(data_dir), "-e", "update"]
+    )
+    assert res.exit_code == 0 and "updated=1" in res.output
+    recs = {u: e for u, _k, e in parse_users(data_dir / "users.txt")}
+    assert recs["alice"] != before["alice"]
+
+    # 冲突较多时只列出前 5 个，并给出总数
+    src = tmp_path / "many.csv"
+    src.write_text("".join(f"u{i},p{i}\n" for i in range(7)))
+    res = runner.invoke(app, ["user", "import", str(src), "-d", str(data_dir)])
+    assert res.exit_code == 0, res.output
+    res = runner.invoke(app, ["user", "import", str(src), "-d", str(data_dir)])
+    assert res.exit_code == 1
+    assert "u0, u1, u2, u3, u4, ... (7 total)" in res.output
+
+
+def test_import_workers_respects_memory_budget():
+    from ming_drlms.users import import_workers
+
+    params = {"memory_cost": 65536}
+    assert import_workers(params, jobs=16, mem_budget_mb=256) == 4
+    assert import_workers(params, jobs=2, mem_budget_mb=4096) == 2
+    assert import_workers(params, jobs=8, mem_budget_mb=16) == 1
+
+
+def test_user_store_index_cache_and_batch(tmp_path: Path, monkeypatch):
+    from ming_drlms import users as users_mod
+    from ming_drlms.users import UserStore
+
+    path = tmp_path / "users.txt"
+    enc = "$argon2id$v=19$m=8,t=1,p=1$YmFzZTY0$YWJjZGVm"
+    sha = "0123456789abcdef" * 4
+    path.write_text(f"alice::{enc}\nbob:salt:{sha}\nalice::{enc}x\n")
+    store = UserStore(path)
+    assert len(store) == 3 and store.get("alice")[2] == enc  # 重名时第一条生效
+    assert store.get("bob")[1] == "legacy"
+
+    # 文件未变化时不再解析
+    calls = []
+    monkeypatch.setattr(
+        users_mod,
+        "parse_users",
+        lambda p: calls.append(p) or [],  # type: ignore
+    )
+    UserStore(path).refresh()
+    assert calls == []
+    monkeypatch.undo()
+
+    writes = []
+    real_write = users_mod.write_users_atomic
+    monkeypatch.setattr(
+        users_mod,
+        "write_users_atomic",
+        lambda p, r: writes.append(len(r)) or real_write(p, r),
+    )
+    with store.batch():
+        store.add("carol", enc)
+        store.set_password("bob", enc)
+        store.delete("alice")
+    assert writes == [3]
+    assert store.get("alice")[2] == enc + "x"  # 删除第一条后第二条生效
+    recs = parse_users(path)
+    assert [u for u, _k, _e in recs] == ["bob", "alice", "carol"]
+    assert recs[0][1] == "argon2"
+
+    # 批次中出错则不写入，内存状态回到磁盘内容
+    with pytest.raises(KeyError):
+        with store.batch():
+            store.add("dave", enc)
+            store.add("carol", enc)
+    assert writes == [3] and "dave" not in store
+
+
+def test_user_migrate_report_and_convert(
+    tmp_path: Path, runner: CliRunner, monkeypatch
+):
+    import hashlib
+
+    monkeypatch.setenv("DRLMS_ARGON2_T_COST", "1")
+    monkeypatch.setenv("DRLMS_ARGON2_M_COST", "8")
+    data_dir = tmp_path / "srv"
+    data_dir.mkdir()
+    users = data_dir / "users.txt"
+    sha = lambda pw, salt: hashlib.sha256((pw + salt).encode()).hexdigest()  # noqa: E731
+    users.write_text(
+        f"bob:s1:{sha('b', 's1')}\n"
+        f"carol:s2:{sha('c', 's2').upper()}\n"
+        "dave::$argon2id$v=19$m=65536,t=2,p=1$YmFzZTY0$YWJjZGVm\n"
+    )
+    res = runner.invoke(app, ["user", "migrate", "-d", str(data_dir), "--json"])
+    assert res.exit_code == 0, res.output
+    rep = json.loads(res.output)
+    assert (rep["legacy"], rep["argon2"], rep["outdated"]) == (2, 1, 1)
+    assert rep["legacy_users"] == ["bob", "carol"]
+    res = runner.invoke(app, ["user", "migrate", "-d", str(data_dir), "--check"])
+    assert res.exit_code == 1
+
+    known = tmp_path / "known.csv"
+    known.write_text("bob,b\ncarol,wrong\ndave,d\n")
+    res = runner.invoke(
+        app, ["user", "migrate", "-d", str(data_dir), "--from", str(known), "-j"]
+    )
+    assert res.exit_code == 1  # carol 的口令不匹配
+    rep = json.loads(res.output[res.output.index("{") :])
+    assert (rep["converted"], rep["mismatched"], rep["legacy_users"]) == (
+        1,
+        1,
+        ["carol"],
+    )
+    kinds = {u: k for u, k, _e in parse_users(users)}
+    assert kinds == {"bob": "argon2", "carol": "legacy", "dave": "argon2"}
+
+
+def test_user_bench_hash_recommends_and_writes(tmp_path: Path, runner: CliRunner):
+    import yaml
+
+    from ming_drlms.config import load_config
+
+    cfg_path = tmp_path / "drlms.yaml"
+    args = ["user", "bench-hash", "-t", "1", "-t", "2", "-m", "1", "-n", "1"]
+    res = runner.invoke(app, [*args, "-w", "2", "-c", str(cfg_path), "--write"])
+    assert res.exit_code == 0, res.output
+    data = yaml.safe_load(cfg_path.read_text())
+    # 模板中的其他键保留；两组参数都满足默认目标时取更强的 t=2
+    assert data["port"] == 8080
+    assert (data["argon2_t_cost"], data["argon2_m_cost"]) == (2, 1024)
+    assert data["argon2_max_concurrent"] == 2
+    assert load_config(cfg_path).argon2_m_cost == 1024
+
+    res = runner.invoke(app, [*args, "-w", "1", "--target-ms", "0.001", "-j"])
+    assert res.exit_code == 1
+    res = runner.invoke(app, ["user", "bench-hash", "-m", "4096"])
+    assert res.exit_code == 2
+
+
+def test_hashbench_recommend_respects_latency_and_memory():
+    from ming_drlms.hashbench import HashBenchResult, recommend
+
+    rs = [
+        HashBenchResult(2, 65536, 1, 4, p99_ms=200.0),
+        HashBenchResult(3, 65536, 1, 4, p99_ms=320.0),
+        HashBenchResult(1, 262144, 1, 4, p99_ms=250.0),
+        HashBenchResult(4, 65536, 1, 4, skipped="too slow"),
+    ]
+    best = recommend(rs, target_ms=300, mem_budget_mb=2048)
+    assert best is not None and (best.time_cost, best.memory_cost) == (1, 262144)
+    # 4 × 256 MiB 超出预算时退回 64 MiB 中满足延迟的最大 t
+    best = recommend(rs, target_ms=300, mem_budget_mb=512)
+    assert (best.time_cost, best.memory_cost) == (2, 65536)
+    assert recommend(rs, target_ms=100, mem_budget_mb=4096) is None
@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import yaml
+
+from ming_drlms.config import load_config, write_template
+
+
+def test_fsync_policy_from_yaml_and_env(tmp_path: Path, monkeypatch):
+    monkeypatch.delenv("DRLMS_FSYNC", raising=False)
+    monkeypatch.delenv("DRLMS_FSYNC_INTERVAL_MS", raising=False)
+    path = tmp_path / "drlms.yaml"
+    write_template(path)
+    tpl = yaml.safe_load(path.read_text())
+    assert (tpl["fsync"], tpl["fsync_interval_ms"]) == ("interval", 1000)
+
+    path.write_text(yaml.safe_dump({"fsync": "batch", "fsync_interval_ms": 50}))
+    cfg = load_config(path)
+    assert (cfg.fsync, cfg.fsync_interval_ms) == ("batch", 50)
+
+    monkeypatch.setenv("DRLMS_FSYNC", "none")
+    assert load_config(path).fsync == "none"
+    # 未知取值被忽略，保留配置文件中的策略
+    monkeypatch.setenv("DRLMS_FSYNC", "sometimes")
+    assert load_config(path).fsync == "batch"
+
+
+def test_io_mode_from_yaml_and_env(tmp_path: Path, monkeypatch):
+    monkeypatch.delenv("DRLMS_IO_MODE", raising=False)
+    monkeypatch.delenv("DRLMS_WORKERS", raising=False)
+    path = tmp_path / "drlms.yaml"
+    write_template(path)
+    cfg = load_config(path)
+    assert (cfg.io_mode, cfg.workers) == ("thread", 8)
+
+    path.write_text(yaml.safe_dump({"io_mode": "epoll", "max_conn": 50000}))
+    cfg = load_config(path)
+    assert (cfg.io_mode, cfg.max_conn) == ("epoll", 50000)
+
+    monkeypatch.setenv("DRLMS_IO_MODE", "thread")
+    monkeypatch.setenv("DRLMS_WORKERS", "4")
+    cfg = load_config(path)
+    assert (cfg.io_mode, cfg.workers) == ("thread", 4)
+    monkeypatch.setenv("DRLMS_IO_MODE", "kqueue")
+    assert load_config(path).io_mode == "epoll"
+
+
+def test_slow_consumer_policy_from_yaml_and_env(tmp_path: Path, monkeypatch):
+    monkeypatch.delenv("DRLMS_SLOW_CONSUMER", raising=False)
+    monkeypatch.delenv("DRLMS_SUB_QUEUE_BYTES", raising=False)
+    path = tmp_path / "drlms.yaml"
+    write_template(path)
+    cfg = load_config(path)
+    assert (cfg.slow_consumer, cfg.sub_queue_bytes) == ("disconnect", 1 << 20)
+
+    path.write_text(yaml.safe_dump({"slow_consumer": "drop-oldest"}))
+    assert load_config(path).slow_consumer == "drop-oldest"
+    monkeypatch.setenv("DRLMS_SLOW_CONSUMER", "block")
+    monkeypatch.setenv("DRLMS_SUB_QUEUE_BYTES", "65536")
+    cfg = load_config(path)
+    assert (cfg.slow_consumer, cfg.sub_queue_bytes) == ("block", 65536)
+
+
+def test_auth_cache_from_yaml_and_env(tmp_path: Path, monkeypatch):
+    for name in (
+        "DRLMS_AUTH_CACHE_SIZE",
+        "DRLMS_AUTH_CACHE_TTL",
+        "DRLMS_ARGON2_MAX_CONCURRENT",
+        "DRLMS_SESSION_TTL",
+        "DRLMS_UPGRADE_BATCH_MS",
+        "DRLMS_ARGON2_T_COST",
+        "DRLMS_ARGON2_M_COST",
+    ):
+        monkeypatch.delenv(name, raising=False)
+    path = tmp_path / "drlms.yaml"
+    write_template(path)
+    cfg = load_config(path)
+    # 缓存默认关闭；并发上限留给服务器按 CPU 数决定
+    assert (cfg.auth_cache_size, cfg.auth_cache_ttl) == (0, 300)
+    assert (cfg.argon2_max_concurrent, cfg.session_ttl) == (None, 900)
+    assert cfg.upgrade_batch_ms == 1000
+
+    path.write_text(
+        yaml.safe_dump({"auth_cache_size": 4096, "argon2_max_concurrent": 2})
+    )
+    cfg = load_config(path)
+    assert (cfg.auth_cache_size, cfg.argon2_max_concurrent) == (4096, 2)
+    monkeypatch.setenv("DRLMS_AUTH_CACHE_TTL", "60")
+    monkeypatch.setenv("DRLMS_ARGON2_MAX_CONCURRENT", "0")
+    cfg = load_config(path)
+    assert (cfg.auth_cache_ttl, cfg.argon2_max_concurrent) == (60, 0)
+    assert cfg.argon2_m_cost is None
+    path.write_text(yaml.safe_dump({"argon2_t_cost": 3, "argon2_m_cost": 131072}))
+    monkeypatch.setenv("DRLMS_ARGON2_M_COST", "32768")
+    cfg = load_config(path)
+    assert (cfg.argon2_t_cost, cfg.argon2_m_cost) == (3, 32768)
+    monkeypatch.setenv("DRLMS_SESSION_TTL", "0")
+    monkeypatch.setenv("DRLMS_UPGRADE_BATCH_MS", "0")
+    cfg = load_config(path)
+    assert (cfg.session_ttl, cfg.upgrade_batch_ms) == (0, 0)
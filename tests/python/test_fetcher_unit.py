@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import hashlib
+import socket
+import threading
+from pathlib import Path
+
+import pytest
+
+from ming_drlms.fetcher import FileFetcher, fetch_file
+from ming_drlms.protocol import BufferedConnection, ProtocolError, parse_event_header
+
+
+BLOBS = {
+    ("r1", 1, "a.bin"): b"A" * 300_000,
+    ("r2", 4, "b.txt"): b"hello\n",
+}
+
+
+def _serve(peer: socket.socket, corrupt: bool = False) -> None:
+    conn = BufferedConnection(peer)
+    while True:
+        line = conn.readline().decode()
+        if not line or line == "QUIT":
+            break
+        _, room, eid, name = line.split("|")
+        body = BLOBS.get((room, int(eid), name))
+        if body is None:
+            peer.sendall(b"ERR|NOTFOUND|file\n")
+            continue
+        sha = hashlib.sha256(body).hexdigest()
+        if corrupt:
+            body = body[:-1] + b"!"
+        peer.sendall(f"SIZE|{len(body)}|{sha}\nREADY\n".encode() + body)
+    peer.close()
+
+
+class FakeServer:
+    def __init__(self, corrupt: bool = False):
+        self.corrupt = corrupt
+        self.connects = 0
+
+    def connect(self, host, port):
+        self.connects += 1
+        a, b = socket.socketpair()
+        threading.Thread(target=_serve, args=(a, self.corrupt), daemon=True).start()
+        return BufferedConnection(b)
+
+    @staticmethod
+    def login(conn, user, password):
+        return True
+
+
+def _file_evt(room: str, eid: int, name: str) -> str:
+    body = BLOBS[(room, eid, name)]
+    sha = hashlib.sha256(body).hexdigest()
+    return f"EVT|FILE|{room}|ts|u|{eid}|{name}|{len(body)}|{sha}"
+
+
+def test_fetch_file_streams_and_verifies(tmp_path: Path):
+    srv = FakeServer()
+    conn = srv.connect("h", 1)
+    out = tmp_path / "a.bin"
+    size, sha = fetch_file(conn, "r1", 1, "a.bin", out, chunk_size=4096)
+    assert size == 300_000 and out.read_bytes() == BLOBS[("r1", 1, "a.bin")]
+    assert sha == hashlib.sha256(out.read_bytes()).hexdigest()
+    with pytest.raises(ProtocolError) as ei:
+        fetch_file(conn, "r1", 2, "nope", tmp_path / "nope")
+    assert ei.value.code == "NOTFOUND"
+    # header sha that disagrees with the payload is rejected
+    with pytest.raises(ProtocolError):
+        fetch_file(conn, "r2", 4, "b.txt", tmp_path / "b.txt", expect_sha="0" * 64)
+    assert not (tmp_path / "b.txt").exists()
+    assert not (tmp_path / "b.txt.part").exists()
+    conn.close()
+
+
+def test_file_fetcher_mirrors_in_background(tmp_path: Path):
+    srv = FakeServer()
+    done = []
+    fetcher = FileFetcher(
+        "h",
+        1,
+        "u",
+        "p",
+        tmp_path,
+        workers=2,
+        connect=srv.connect,
+        login=srv.login,
+        on_done=lambda ev, path, err: done.append((ev.event_id, err)),
+    )
+    for room, eid, name in BLOBS:
+        assert fetcher.submit(parse_event_header(_file_evt(room, eid, name)))
+    bad = parse_event_header("EVT|FILE|r1|ts|u|3|../x|1|sha")
+    assert not fetcher.submit(bad)
+    fetcher.close()
+    assert fetcher.stats["ok"] == 2 and fetcher.stats["failed"] == 0
+    assert (tmp_path / "r1" / "1_a.bin").stat().st_size == 300_000
+    assert (tmp_path / "r2" / "4_b.txt").read_bytes() == b"hello\n"
+    assert sorted(e for e, _ in done) == [1, 4]
+
+    # 已存在且大小一致的文件跳过下载
+    again = FileFetcher(
+        "h", 1, "u", "p", tmp_path, connect=srv.connect, login=srv.login
+    )
+    again.submit(parse_event_header(_file_evt("r2", 4, "b.txt")))
+    again.close()
+    assert again.stats["skipped"] == 1
+
+
+def test_file_fetcher_counts_checksum_failures(tmp_path: Path):
+    srv = FakeServer(corrupt=True)
+    fetcher = FileFetcher(
+        "h", 1, "u", "p", tmp_path, connect=srv.connect, login=srv.login
+    )
+    fetcher.submit(parse_event_header(_file_evt("r2", 4, "b.txt")))
+    fetcher.close()
+    assert fetcher.stats["failed"] == 1
+    assert not list(tmp_path.rglob("*.part"))
+    assert not (tmp_path / "r2" / "4_b.txt").exists()
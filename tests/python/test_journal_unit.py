@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from ming_drlms.journal import EventJournal, iter_journal, journal_segments
+
+
+def _text_header(eid: int, body: bytes) -> str:
+    return f"EVT|TEXT|r|ts|u|{eid}|{len(body)}|sha"
+
+
+def test_journal_roundtrip_text_and_file(tmp_path: Path):
+    with EventJournal(tmp_path, fsync_interval=0) as j:
+        j.append(_text_header(1, b"a\nb"), b"a\nb")
+        j.append("EVT|FILE|r|ts|u|2|f.txt|3|sha")
+        j.append(_text_header(3, b""), b"")
+    evs = list(iter_journal(tmp_path / "events.log"))
+    assert [(e.kind, e.event_id) for e in evs] == [
+        ("TEXT", 1),
+        ("FILE", 2),
+        ("TEXT", 3),
+    ]
+    assert evs[0].payload == b"a\nb"
+    assert evs[1].filename == "f.txt"
+
+
+def test_journal_appends_across_reopen_and_reads_legacy_lines(tmp_path: Path):
+    (tmp_path / "events.log").write_text("EVT|FILE|r|ts|u|1|old.txt|1|sha\n")
+    with EventJournal(tmp_path) as j:
+        j.append(_text_header(2, b"new"), b"new")
+    evs = list(iter_journal(tmp_path))
+    assert [e.event_id for e in evs] == [1, 2]
+
+
+def test_journal_rotates_by_size_and_prunes_backups(tmp_path: Path):
+    body = b"x" * 100
+    with EventJournal(tmp_path, max_bytes=300, backups=2) as j:
+        for eid in range(1, 11):
+            j.append(_text_header(eid, body), body)
+        assert j.rotations > 2
+    segs = journal_segments(tmp_path)
+    assert segs[-1].name == "events.log"
+    assert len(segs) == 3
+    ids = [e.event_id for e in iter_journal(tmp_path)]
+    # 最旧的分段被清理，其余按时间顺序回放
+    assert ids == sorted(ids) and ids[-1] == 10
+    for p in segs:
+        assert p.stat().st_size <= 300
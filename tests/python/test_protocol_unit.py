@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import socket
+
+from ming_drlms.protocol import BufferedConnection
+from ming_drlms.cli.utils import recv_line, recv_exact, login
+
+
+class CountingSock:
+    """Feeds a fixed byte stream and counts recv calls."""
+
+    def __init__(self, data: bytes, chunk: int = 1 << 16):
+        self._data = bytearray(data)
+        self._chunk = chunk
+        self.calls = 0
+        self.sent = []
+
+    def recv(self, n):
+        self.calls += 1
+        take = min(n, self._chunk, len(self._data))
+        out = bytes(self._data[:take])
+        del self._data[:take]
+        return out
+
+    def sendall(self, b):
+        self.sent.append(b)
+
+    def close(self):
+        pass
+
+
+def test_readline_and_readexactly_share_buffer():
+    stream = b"EVT|TEXT|r|ts|u|1|5|sha\nhelloEVT|TEXT|r|ts|u|2|3|sha\nbyeOK|HISTORY\n"
+    conn = BufferedConnection(CountingSock(stream))
+    assert conn.readline() == b"EVT|TEXT|r|ts|u|1|5|sha"
+    assert conn.readexactly(5) == b"hello"
+    assert conn.readline() == b"EVT|TEXT|r|ts|u|2|3|sha"
+    assert conn.readexactly(3) == b"bye"
+    assert conn.readline() == b"OK|HISTORY"
+    assert conn.readline() == b""
+    assert conn.at_eof
+    # whole stream fits in one recv plus the EOF probe
+    assert conn.sock.calls == 2
+
+
+def test_readexactly_large_payload_across_small_chunks():
+    payload = bytes(range(256)) * 40
+    conn = BufferedConnection(CountingSock(b"HDR\n" + payload + b"tail\n", chunk=7))
+    assert conn.readline() == b"HDR"
+    assert conn.readexactly(len(payload)) == payload
+    assert conn.readline() == b"tail"
+
+
+def test_readexactly_short_on_eof():
+    conn = BufferedConnection(CountingSock(b"abc"))
+    assert conn.readexactly(10) == b"abc"
+    assert conn.readexactly(1) == b""
+
+
+def test_recv_drains_buffer_first():
+    conn = BufferedConnection(CountingSock(b"L1\nrest"))
+    assert conn.readline() == b"L1"
+    assert conn.recv(2) == b"re"
+    assert conn.recv(10) == b"st"
+
+
+def test_utils_helpers_over_socketpair():
+    a, b = socket.socketpair()
+    try:
+        a.sendall(b"OK|WELCOME\r\nEVT|TEXT|r|t|u|7|4|x\ndata")
+        conn = BufferedConnection(b)
+        assert login(conn, "u", "p") is True
+        assert recv_line(conn) == "EVT|TEXT|r|t|u|7|4|x"
+        assert recv_exact(conn, 4) == b"data"
+        assert a.recv(64) == b"LOGIN|u|p\n"
+    finally:
+        a.close()
+        b.close()
+
+
+def test_recv_line_raw_socket_fallback():
+    a, b = socket.socketpair()
+    try:
+        a.sendall(b"OK\nnext\n")
+        assert recv_line(b) == "OK"
+        assert recv_line(b) == "next"
+    finally:
+        a.close()
+        b.close()
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import struct
+from pathlib import Path
+
+import pytest
+
+from ming_drlms import segstore
+
+
+def _header(eid: int, **kw) -> bytes:
+    h = {"event_id": eid, "ts": kw.pop("ts", "2026-01-01T00:00:00Z"), "user": "u"}
+    h.update(kw)
+    return json.dumps(h, separators=(",", ":")).encode() + b"\n"
+
+
+def _text(eid: int, body: bytes, **kw) -> bytes:
+    sha = hashlib.sha256(body).hexdigest()
+    return _header(eid, kind="TEXT", len=len(body), sha=sha, **kw) + body + b"\n"
+
+
+def _file(room: Path, eid: int, name: str) -> bytes:
+    (room / "files").mkdir(parents=True, exist_ok=True)
+    (room / "files" / f"{eid}_{name}").write_bytes(b"data")
+    return _header(eid, kind="FILE", filename=name, size=4, sha="0" * 64)
+
+
+def _room(tmp_path: Path) -> Path:
+    room = tmp_path / "rooms" / "r1"
+    seg = room / "segments"
+    seg.mkdir(parents=True)
+    (seg / segstore.segment_name(1)).write_bytes(
+        _text(1, b"a\nb") + _file(room, 2, "f.bin") + _text(3, b"")
+    )
+    (seg / segstore.segment_name(4)).write_bytes(_text(4, b"x" * 100))
+    return room
+
+
+def test_iter_room_reads_inline_bodies_across_segments(tmp_path: Path):
+    room = _room(tmp_path)
+    recs = list(segstore.iter_room(room))
+    assert [(r.event_id, r.kind) for r in recs] == [
+        (1, "TEXT"),
+        (2, "FILE"),
+        (3, "TEXT"),
+        (4, "TEXT"),
+    ]
+    assert recs[0].payload == b"a\nb" and recs[2].payload == b""
+    st = segstore.inspect_room(room)
+    assert (st.records, st.first_event_id, st.last_event_id) == (4, 1, 4)
+    assert [s.records for s in st.segments] == [3, 1]
+    assert st.bytes == sum(p.stat().st_size for p in (room / "segments").iterdir())
+
+
+def test_verify_reports_corruption_and_torn_tail(tmp_path: Path):
+    room = _room(tmp_path)
+    assert segstore.verify_room(room) == []
+    seg = room / "segments" / segstore.segment_name(4)
+    data = seg.read_bytes()
+    seg.write_bytes(data.replace(b"x" * 100, b"y" * 100) + _header(5)[:10])
+    (room / "files" / "2_f.bin").unlink()
+    problems = segstore.verify_room(room)
+    assert any("missing file payload" in p for p in problems)
+    assert any("sha256 mismatch" in p for p in problems)
+    assert any("truncated header" in p for p in problems)
+    # 末尾未写完的记录不影响读取其余事件
+    assert segstore.inspect_room(room).records == 4
+
+
+def test_compact_merges_segments_and_writes_index(tmp_path: Path):
+    room = _room(tmp_path)
+    kept, dropped = segstore.compact_room(room, segment_bytes=1 << 20, stride=2)
+    assert (kept, dropped) == (4, 0)
+    seg = room / "segments" / segstore.segment_name(1)
+    assert sorted(p.name for p in seg.parent.iterdir()) == [
+        seg.with_suffix(".idx").name,
+        seg.name,
+    ]
+    raw = seg.with_suffix(".idx").read_bytes()
+    assert raw[:8] == b"DRLMSIX1"
+    points = list(struct.iter_unpack("=QQ", raw[8:]))
+    offsets = {r.event_id: r.offset for r in segstore.iter_room(room)}
+    assert points == [(1, 0), (3, offsets[3])]
+    assert segstore.verify_room(room) == []
+
+
+def test_compact_retention_drops_old_events_and_file_payloads(tmp_path: Path):
+    room = _room(tmp_path)
+    seg = room / "segments" / segstore.segment_name(4)
+    seg.write_bytes(_text(4, b"new", ts="2026-06-01T00:00:00Z"))
+    now = segstore._parse_ts("2026-06-02T00:00:00Z")
+    kept, dropped = segstore.compact_room(room, retain_secs=7 * 86400, now=now)
+    assert (kept, dropped) == (1, 3)
+    assert [r.event_id for r in segstore.iter_room(room)] == [4]
+    assert not (room / "files" / "2_f.bin").exists()
+    # 最新事件总是保留，服务器据此恢复 event_id
+    segstore.compact_room(room, retain_bytes=1)
+    assert [r.event_id for r in segstore.iter_room(room)] == [4]
+
+
+def test_migrate_legacy_layout(tmp_path: Path):
+    room = tmp_path / "rooms" / "old"
+    (room / "texts").mkdir(parents=True)
+    lines = []
+    for eid in range(1, 6):
+        body = f"msg {eid}".encode()
+        (room / "texts" / f"{eid}.txt").write_bytes(body)
+        lines.append(
+            _header(eid, kind="TEXT", len=99, sha=hashlib.sha256(body).hexdigest())
+        )
+    (room / "events.log").write_bytes(b"".join(lines))
+    (room / "events.idx").write_bytes(b"DRLMSIX1")
+    assert segstore.list_segments(room)[0].legacy
+    assert segstore.migrate_room(room, segment_bytes=120) == 5
+    assert sorted(p.name for p in room.iterdir()) == ["segments"]
+    recs = list(segstore.iter_room(room))
+    assert [r.payload for r in recs] == [f"msg {i}".encode() for i in range(1, 6)]
+    # 旧日志中不准确的 len 按正文实际长度改写
+    assert all(r.header["len"] == len(r.payload) for r in recs)
+    assert len(segstore.list_segments(room)) > 1
+    assert segstore.verify_room(room) == []
+    assert segstore.migrate_room(room) == 0
+
+
+def test_recover_discards_unfinished_compaction(tmp_path: Path):
+    room = _room(tmp_path)
+    (room / "segments.compact").mkdir()
+    (room / "segments.compact" / segstore.segment_name(1)).write_bytes(b"junk")
+    assert "segments.compact: unfinished compaction" in segstore.verify_room(room)
+    segstore.recover_room(room)
+    assert not (room / "segments.compact").exists()
+    assert [r.event_id for r in segstore.iter_room(room)] == [1, 2, 3, 4]
+
+
+def test_room_dirs_rejects_invalid_names(tmp_path: Path):
+    assert segstore.room_dirs(tmp_path, "ok.room-1") == [
+        tmp_path / "rooms" / "ok.room-1"
+    ]
+    for bad in ("../x", "a/b", "..", "", "x" * 65, "a\n"):
+        with pytest.raises(ValueError):
+            segstore.room_dirs(tmp_path, bad)
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import socket
+
+import pytest
+
+from ming_drlms.protocol import BufferedConnection
+from ming_drlms.session import LoginFailed, SessionPool
+
+
+class FakeServer:
+    """connect()/login() doubles backed by socketpairs."""
+
+    def __init__(self, accept_login: bool = True):
+        self.accept_login = accept_login
+        self.peers = []
+        self.connects = 0
+        self.logins = 0
+
+    def connect(self, host, port):
+        self.connects += 1
+        a, b = socket.socketpair()
+        self.peers.append(a)
+        return BufferedConnection(b)
+
+    def login(self, conn, user, password):
+        self.logins += 1
+        return self.accept_login
+
+    def close(self):
+        for p in self.peers:
+            p.close()
+
+
+@pytest.fixture()
+def fake():
+    srv = FakeServer()
+    yield srv
+    srv.close()
+
+
+def _acquire(pool, fake, password="p"):
+    return pool.acquire(
+        "h", 1, "alice", password, connect=fake.connect, login=fake.login
+    )
+
+
+def test_session_reused_across_commands(fake):
+    pool = SessionPool()
+    for _ in range(5):
+        with pool.session(
+            "h", 1, "alice", "p", connect=fake.connect, login=fake.login
+        ) as sess:
+            sess.conn.sendall(b"LIST\n")
+    assert fake.connects == 1
+    assert fake.logins == 1
+    assert pool.stats["reused"] == 4
+    pool.close_all()
+    # close_all sends QUIT on the pooled connection
+    assert fake.peers[0].recv(64).endswith(b"QUIT\n")
+
+
+def test_login_failure_raises(fake):
+    fake.accept_login = False
+    pool = SessionPool()
+    with pytest.raises(LoginFailed):
+        _acquire(pool, fake)
+    assert pool.idle_count() == 0
+
+
+def test_idle_sessions_are_evicted(fake):
+    pool = SessionPool(max_idle=0.0)
+    pool.release(_acquire(pool, fake))
+    assert pool.idle_count() == 1
+    _acquire(pool, fake)
+    assert fake.connects == 2
+    assert pool.stats["evicted"] == 1
+    pool.release(_acquire(pool, fake))
+    assert pool.evict_idle() == 1
+    assert pool.idle_count() == 0
+
+
+def test_health_check_drops_closed_peer(fake):
+    pool = SessionPool()
+    pool.release(_acquire(pool, fake))
+    fake.peers[0].close()
+    sess = _acquire(pool, fake)
+    assert fake.connects == 2
+    assert pool.stats["unhealthy"] == 1
+    assert sess.alive()
+
+
+def test_health_check_drops_session_with_pending_data(fake):
+    pool = SessionPool()
+    pool.release(_acquire(pool, fake))
+    fake.peers[0].sendall(b"EVT|TEXT|stray\n")
+    _acquire(pool, fake)
+    assert fake.connects == 2
+
+
+def test_password_change_forces_new_login(fake):
+    pool = SessionPool()
+    pool.release(_acquire(pool, fake, password="old"))
+    _acquire(pool, fake, password="new")
+    assert fake.logins == 2
+
+
+def test_error_inside_session_discards_connection(fake):
+    pool = SessionPool()
+    with pytest.raises(RuntimeError):
+        with pool.session("h", 1, "alice", "p", connect=fake.connect, login=fake.login):
+            raise RuntimeError("boom")
+    assert pool.idle_count() == 0
+
+
+class ScriptedConn:
+    """Records sent lines and answers each with the next scripted reply."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.sent = []
+
+    def sendall(self, data: bytes):
+        self.sent.append(data.decode().rstrip("\n"))
+
+    def readline(self) -> bytes:
+        return (self.replies.pop(0) + "\n").encode()
+
+
+def test_resume_token_cached_and_reused(monkeypatch, tmp_path):
+    from ming_drlms import state as state_mod
+    from ming_drlms.session import resume_or_login
+
+    monkeypatch.setattr(state_mod, "STATE_DIR", tmp_path)
+    monkeypatch.setattr(state_mod, "STATE_PATH", tmp_path / "state.json")
+    monkeypatch.delenv("DRLMS_SESSION_TOKENS", raising=False)
+    tok = "ab" * 32
+
+    first = ScriptedConn([f"OK|WELCOME|{tok}|900"])
+    assert resume_or_login(first, "alice", "p", host="h", port=1)
+    assert first.sent == ["LOGIN|alice|p"]
+    assert state_mod.get_session_token("h", 1, "alice") == tok
+
+    again = ScriptedConn(["OK|WELCOME"])
+    assert resume_or_login(again, "alice", "p", host="h", port=1)
+    assert again.sent == [f"RESUME|{tok}|p"]
+
+    # 令牌被拒（过期/服务器重启）：丢弃后回退 LOGIN
+    rejected = ScriptedConn(["ERR|AUTH|invalid or expired token", "OK|WELCOME"])
+    assert resume_or_login(rejected, "alice", "p", host="h", port=1)
+    assert rejected.sent == [f"RESUME|{tok}|p", "LOGIN|alice|p"]
+    assert state_mod.get_session_token("h", 1, "alice") is None
+
+    # 旧服务器不签发令牌，DRLMS_SESSION_TOKENS=0 时也不使用
+    monkeypatch.setenv("DRLMS_SESSION_TOKENS", "0")
+    plain = ScriptedConn([f"OK|WELCOME|{tok}|900"])
+    assert resume_or_login(plain, "alice", "p", host="h", port=1)
+    assert state_mod.get_session_token("h", 1, "alice") is None
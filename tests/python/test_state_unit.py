@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import json
+import multiprocessing as mp
+from pathlib import Path
+
+import pytest
+
+from ming_drlms import state as state_mod
+
+
+@pytest.fixture
+def state_file(monkeypatch, tmp_path: Path) -> Path:
+    monkeypatch.setattr(state_mod, "STATE_DIR", tmp_path)
+    monkeypatch.setattr(state_mod, "STATE_PATH", tmp_path / "state.json")
+    return tmp_path / "state.json"
+
+
+def _on_disk(path: Path) -> dict:
+    return json.loads(path.read_text())
+
+
+def test_cursor_store_batches_until_count_or_close(state_file: Path):
+    store = state_mod.CursorStore(flush_interval=3600, flush_every=3)
+    store.set("h:1:r", 1)
+    store.set("h:1:r", 2)
+    assert not state_file.exists() and store.pending == 1
+    store.set("h:1:r", 3)
+    assert _on_disk(state_file)["rooms"]["h:1:r"]["last_event_id"] == 3
+    store.set("h:1:r", 4)
+    store.set("h:1:r", 2)  # 游标不回退
+    store.close()
+    assert _on_disk(state_file)["rooms"]["h:1:r"]["last_event_id"] == 4
+    assert store.flushes == 2
+
+
+def test_cursor_store_interval_flush_in_background(state_file: Path):
+    import time
+
+    store = state_mod.CursorStore(flush_interval=0.05, flush_every=10_000)
+    store._last_flush = time.monotonic()
+    store.set("h:1:r", 7)
+    deadline = time.monotonic() + 2
+    while not state_file.exists() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert _on_disk(state_file)["rooms"]["h:1:r"]["last_event_id"] == 7
+    store.close()
+
+
+def test_save_state_merges_cursors_instead_of_clobbering(state_file: Path):
+    a = state_mod.load_state()
+    b = state_mod.load_state()
+    state_mod.set_last_event_id(a, "h:1:a", 5)
+    state_mod.save_state(a)
+    state_mod.set_last_event_id(b, "h:1:b", 9)
+    b["profiles"]["p"] = {"user": "bob"}
+    state_mod.save_state(b)
+    disk = _on_disk(state_file)
+    assert disk["rooms"]["h:1:a"]["last_event_id"] == 5
+    assert disk["rooms"]["h:1:b"]["last_event_id"] == 9
+    assert disk["profiles"] == {"p": {"user": "bob"}}
+    # stale writer cannot move a cursor backwards
+    state_mod.set_last_event_id(a, "h:1:b", 3)
+    state_mod.save_state(a)
+    assert _on_disk(state_file)["rooms"]["h:1:b"]["last_event_id"] == 9
+
+
+def _worker(path: str, room: str, n: int) -> None:
+    state_mod.STATE_DIR = Path(path).parent
+    state_mod.STATE_PATH = Path(path)
+    store = state_mod.CursorStore(flush_interval=0, flush_every=1)
+    for eid in range(1, n + 1):
+        store.set(f"h:1:{room}", eid)
+    store.close()
+
+
+def test_cursor_store_is_safe_across_processes(state_file: Path):
+    ctx = mp.get_context("fork")
+    procs = [
+        ctx.Process(target=_worker, args=(str(state_file), f"r{i}", 15))
+        for i in range(4)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+        assert p.exitcode == 0
+    rooms = _on_disk(state_file)["rooms"]
+    assert {k: v["last_event_id"] for k, v in rooms.items()} == {
+        f"h:1:r{i}": 15 for i in range(4)
+    }
+    assert not list(state_file.parent.glob("state.json.*.tmp"))
+
+
+def test_save_state_keeps_session_tokens_from_disk(state_file: Path):
+    stale = state_mod.load_state()
+    state_mod.save_session_token("h", 1, "alice", "tok", 900)
+    state_mod.set_last_event_id(stale, "h:1:r", 3)
+    state_mod.save_state(stale)
+    assert state_mod.get_session_token("h", 1, "alice") == "tok"
+
+    fresh = state_mod.load_state()
+    state_mod.drop_session_token("h", 1, "alice")
+    state_mod.save_state(fresh)  # 内存里的旧令牌不会被写回
+    assert state_mod.get_session_token("h", 1, "alice") is None
+    state_mod.save_session_token("h", 1, "bob", "old", -1)
+    assert state_mod.get_session_token("h", 1, "bob") is None
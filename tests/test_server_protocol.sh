@@ -31,6 +31,7 @@ function start_server() {
 }
 
 function stop_server() {
+    stop_aux_server
     if [ $SERVER_PID -ne 0 ] && kill -0 $SERVER_PID 2>/dev/null; then
         echo "--- Stopping Server ---"
         kill -TERM $SERVER_PID
@@ -65,6 +66,38 @@ function start_server_strict() {
     exit 1
 }
 
+# Extra server on its own port and data dir with extra env (NAME=VALUE ...),
+# for tests that need non-default tuning. Usage: start_aux_server PORT DIR ENV...
+AUX_PID=0
+function start_aux_server() {
+    local port="$1"; local dir="$2"; shift 2
+    mkdir -p "$dir"
+    env "$@" DRLMS_PORT="$port" DRLMS_AUTH_STRICT=0 DRLMS_DATA_DIR="$dir" \
+        ./log_collector_server >> "$dir/server.log" 2>&1 &
+    AUX_PID=$!
+    for i in {1..10}; do
+        if nc -z "$HOST" "$port"; then
+            return
+        fi
+        sleep 0.2
+    done
+    echo "Aux server failed to start. Logs:"
+    cat "$dir/server.log"
+    exit 1
+}
+
+function stop_aux_server() {
+    if [ $AUX_PID -ne 0 ] && kill -0 $AUX_PID 2>/dev/null; then
+        kill -TERM $AUX_PID
+        wait $AUX_PID 2>/dev/null
+    fi
+    AUX_PID=0
+}
+
+function free_port() {
+    python3 -c 'import socket; s = socket.socket(); s.bind(("127.0.0.1", 0)); print(s.getsockname()[1])'
+}
+
 function sha256_hex_concat() {
     local a="$1"; local b="$2"
     printf "%s%s" "$a" "$b" | sha256sum | cut -d' ' -f1
@@ -132,7 +165,7 @@ IFS= read -r upload_resp <&3
 exec 3>&- # Close the file descriptor
 
 # Verify the responses
-if [[ "$login_resp" == "OK|WELCOME" && "$ready_resp" == "READY" && "$upload_resp" == "OK|$SHA256" ]]; then
+if [[ "$login_resp" == OK\|WELCOME* && "$ready_resp" == "READY" && "$upload_resp" == "OK|$SHA256" ]]; then
     echo "PASS"
 else
     echo "FAIL"
@@ -175,7 +208,7 @@ printf "%s" "$MSG1" >&3
 IFS= read -r pubt_ok <&3
 exec 3>&-
 # Basic sanity
-if [[ "$login_resp" != "OK|WELCOME" || "$ready_resp" != "READY" || "$pubt_ok" != OK\|PUBT\|1 ]]; then
+if [[ "$login_resp" != OK\|WELCOME* || "$ready_resp" != "READY" || "$pubt_ok" != OK\|PUBT\|1 ]]; then
   echo "FAIL"
   echo "  login_resp=$login_resp"
   echo "  ready_resp=$ready_resp"
@@ -209,7 +242,7 @@ for i in 1 2 3; do
   IFS= read -r pubt_ok <&3
   exec 3>&-
   # Require OK|PUBT|<i>
-  if [[ "$login_resp" != "OK|WELCOME" || "$ready_resp" != "READY" || "$pubt_ok" != OK\|PUBT\|$i ]]; then
+  if [[ "$login_resp" != OK\|WELCOME* || "$ready_resp" != "READY" || "$pubt_ok" != OK\|PUBT\|$i ]]; then
     echo "FAIL"
     echo "  login_resp=$login_resp"
     echo "  ready_resp=$ready_resp"
@@ -239,6 +272,192 @@ else
   exit 1
 fi
 
+# Python helpers for tests that need concurrent connections or exact event
+# framing (TEXT payloads are length-prefixed, which nc pipes cannot split).
+PY_PROTO='
+import hashlib, socket, sys, threading, time
+HOST, PORT = sys.argv[1], int(sys.argv[2])
+
+def conn(user):
+    s = socket.create_connection((HOST, PORT), timeout=5)
+    f = s.makefile("rb")
+    s.sendall(("LOGIN|%s|pass\n" % user).encode())
+    line = f.readline()
+    assert line.startswith(b"OK|WELCOME"), line
+    return s, f
+
+def pubt(s, f, room, msg):
+    b = msg.encode()
+    sha = hashlib.sha256(b).hexdigest()
+    s.sendall(("PUBT|%s|%d|%s\n" % (room, len(b), sha)).encode())
+    assert f.readline() == b"READY\n"
+    s.sendall(b)
+    r = f.readline()
+    assert r.startswith(b"OK|PUBT|"), r
+    return int(r.split(b"|")[2])
+
+def read_events(s, f, end=None, quiet=0.5):
+    """Event ids until the `end` line, or until the stream is quiet."""
+    eids = []
+    if end is None:
+        s.settimeout(quiet)
+    while True:
+        try:
+            line = f.readline()
+        except (socket.timeout, OSError):
+            return eids
+        if not line or line.rstrip(b"\n") == end:
+            return eids
+        parts = line.rstrip(b"\n").split(b"|")
+        if parts[0] != b"EVT":
+            continue
+        eids.append(int(parts[5]))
+        if parts[1] == b"TEXT":
+            f.read(int(parts[6]))
+'
+
+# --- Test 8: SUB replay and live fanout deliver each event exactly once ---
+# An event published while SUB is still replaying must arrive once (live or
+# replayed), never both, and in order. The recent-events cache is off so the
+# replay reads the segment file, and the subscriber's tiny receive buffer keeps
+# that replay blocked mid-file while three more events are published.
+echo -n "Running test: publish right after SUB delivers each event once, in order... "
+AUX_PORT=$(free_port)
+AUX_DIR="$DATA_DIR/aux_sub_race"
+start_aux_server "$AUX_PORT" "$AUX_DIR" DRLMS_ROOM_CACHE_BYTES=0
+if python3 -c "$PY_PROTO
+big = 'x' * (512 * 1024)
+bad = []
+for run in range(3):
+    room = 'proto_sub_race_%d_%d' % (int(sys.argv[3]), run)
+    p, pf = conn('pubr')
+    for i in range(20):
+        pubt(p, pf, room, big)
+    s = socket.socket()
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    s.settimeout(5)
+    s.connect((HOST, PORT))
+    f = s.makefile('rb', buffering=0)
+    s.sendall(('LOGIN|subr|pass\nSUB|%s\n' % room).encode())
+    assert f.readline().startswith(b'OK|WELCOME')
+    assert f.readline().startswith(b'OK|SUB')
+    time.sleep(0.2)
+    for i in range(3):
+        pubt(p, pf, room, 'race-%d' % i)
+    eids = read_events(s, s.makefile('rb'), quiet=1.0)
+    if eids != list(range(1, 24)):
+        bad.append((run, eids[18:]))
+    s.close()
+    p.close()
+sys.exit('runs with wrong events: %r' % bad if bad else 0)
+" "$HOST" "$AUX_PORT" "$$"; then
+  echo "PASS"
+else
+  echo "FAIL"
+  exit 1
+fi
+stop_aux_server
+
+# --- Test 9: sparse index seek with since_id between index points ---
+# Stride 4 with the cache off and ~5 events per segment: every since_id below
+# lands inside a stride and often inside a segment, so HISTORY / SUB must seek
+# to the preceding index point and skip forward. The server is restarted on the
+# same data dir to cover index points loaded back from the .idx files.
+echo -n "Running test: HISTORY/SUB since_id mid-stride returns exactly the later events... "
+AUX_PORT=$(free_port)
+AUX_DIR="$DATA_DIR/aux_index_stride"
+IDX_ENV="DRLMS_HISTORY_INDEX_STRIDE=4 DRLMS_ROOM_CACHE_BYTES=0 DRLMS_SEGMENT_BYTES=1024"
+IDX_CHECK="$PY_PROTO
+room, n = 'proto_idx_stride', 30
+if sys.argv[3] == 'fill':
+    p, pf = conn('pubi')
+    for i in range(n):
+        assert pubt(p, pf, room, 'stride event %02d' % i) == i + 1
+    p.close()
+bad = []
+for since in (0, 1, 2, 3, 5, 6, 7, 9, 14, 29, 30):
+    want = list(range(since + 1, n + 1))
+    s, f = conn('histi')
+    s.sendall(('HISTORY|%s|100|%d\n' % (room, since)).encode())
+    got = read_events(s, f, end=b'OK|HISTORY')
+    s.close()
+    if got != want:
+        bad.append(('HISTORY', since, got))
+    s, f = conn('subi')
+    s.sendall(('SUB|%s|%d\n' % (room, since)).encode())
+    assert f.readline().startswith(b'OK|SUB')
+    got = read_events(s, f)
+    s.close()
+    if got != want:
+        bad.append(('SUB', since, got))
+sys.exit('wrong events: %r' % bad if bad else 0)
+"
+ok=1
+# shellcheck disable=SC2086
+start_aux_server "$AUX_PORT" "$AUX_DIR" $IDX_ENV
+python3 -c "$IDX_CHECK" "$HOST" "$AUX_PORT" fill || ok=0
+stop_aux_server
+# shellcheck disable=SC2086
+start_aux_server "$AUX_PORT" "$AUX_DIR" $IDX_ENV
+python3 -c "$IDX_CHECK" "$HOST" "$AUX_PORT" reload || ok=0
+stop_aux_server
+if [ $ok -eq 1 ] && ls "$AUX_DIR/rooms/proto_idx_stride/segments/"*.idx > /dev/null 2>&1; then
+  echo "PASS"
+else
+  echo "FAIL"
+  exit 1
+fi
+
+# --- Test 10: block policy stalls only the publisher that hits the full queue ---
+# A subscriber that never reads fills its queue; the first publisher then waits
+# up to DRLMS_SUB_BLOCK_MS. A second publisher in the same room must still get
+# its OK|PUBT promptly (no room-wide lock is held during the wait).
+echo -n "Running test: block policy does not delay a second publisher... "
+AUX_PORT=$(free_port)
+AUX_DIR="$DATA_DIR/aux_block"
+start_aux_server "$AUX_PORT" "$AUX_DIR" DRLMS_SLOW_CONSUMER=block \
+    DRLMS_SUB_QUEUE_BYTES=65536 DRLMS_SUB_BLOCK_MS=4000
+if python3 -c "$PY_PROTO
+room = 'proto_block_%d' % int(sys.argv[3])
+s = socket.socket()
+s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+s.connect((HOST, PORT))
+f = s.makefile('rb')
+s.sendall(('LOGIN|stall|pass\nSUB|%s\n' % room).encode())
+assert f.readline().startswith(b'OK|WELCOME')
+assert f.readline().startswith(b'OK|SUB')
+done = [0]
+def flood():
+    p, pf = conn('pub1')
+    big = 'x' * (32 * 1024)
+    try:
+        for i in range(2000):
+            pubt(p, pf, room, big)
+            done[0] += 1
+    except Exception:
+        pass
+th = threading.Thread(target=flood, daemon=True)
+th.start()
+# 等到第一个发布者卡在满队列上（计数 0.5 秒不再增长）
+last, t_last = -1, time.time()
+while time.time() - t_last < 0.5:
+    if done[0] != last:
+        last, t_last = done[0], time.time()
+    time.sleep(0.05)
+assert th.is_alive(), 'first publisher never blocked'
+p2, pf2 = conn('pub2')
+t0 = time.time()
+pubt(p2, pf2, room, 'second publisher')
+dt = time.time() - t0
+sys.exit('second publisher waited %.2fs' % dt if dt > 1.0 else 0)
+" "$HOST" "$AUX_PORT" "$$"; then
+  echo "PASS"
+else
+  echo "FAIL"
+  exit 1
+fi
+stop_aux_server
+
 echo ""
 echo "--- All server protocol tests passed! ---"
 # --- Argon2 Transparent Upgrade Test ---
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""CLI 启动基准：常用命令的进程墙钟时间与 `python -X importtime` 导入开销。
+
+无需服务器：
+  python tools/bench/bench_cli_startup.py                      # 当前源码树
+  python tools/bench/bench_cli_startup.py -r 20
+  python tools/bench/bench_cli_startup.py --src /path/to/old/src
+
+每条命令以新进程运行 r 次（DRLMS_UPDATE_CHECK=0，不访问网络），输出：
+  - wall：进程墙钟时间的最小值/中位数（解释器启动 + 导入 + 执行）；
+  - import：importtime 中顶层模块累计导入时间之和（最小值）；
+  - mods：ming_drlms.* 中被导入的模块数。
+给出 --src 时对比两棵源码树（如懒加载之前的版本）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Tuple
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+
+COMMANDS = (
+    ("--version",),
+    ("--help",),
+    ("user", "list"),
+    ("client", "list", "--help"),
+    ("space", "--help"),
+    ("server-status", "-p", "1"),
+    ("config", "--help"),
+)
+
+
+def run_once(src: Path, args, cwd: str) -> Tuple[float, float, int]:
+    env = dict(os.environ)
+    env.update(
+        PYTHONPATH=str(src),
+        DRLMS_UPDATE_CHECK="0",
+        DRLMS_DATA_DIR=os.path.join(cwd, "data"),
+    )
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "ming_drlms.main", *args],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    wall = time.perf_counter() - t0
+    total_us = 0
+    mods = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self, cum, name = line[len("import time:") :].split("|")
+        if not name.startswith("  "):  # 顶层导入（嵌套导入已计入其累计值）
+            total_us += int(cum)
+        mods += name.strip().startswith("ming_drlms")
+    return wall, total_us / 1000.0, mods
+
+
+def measure(src: Path, args, repeat: int, cwd: str):
+    runs: List[Tuple[float, float, int]] = [
+        run_once(src, args, cwd) for _ in range(repeat)
+    ]
+    walls = [r[0] * 1000.0 for r in runs]
+    return min(walls), statistics.median(walls), min(r[1] for r in runs), runs[0][2]
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-r", "--repeat", type=int, default=10)
+    ap.add_argument("--src", type=Path, action="append")
+    args = ap.parse_args()
+    trees = [_SRC, *(args.src or [])]
+
+    print(f"{args.repeat} runs per command (ms)")
+    print(
+        f"{'command':>24} {'tree':>5} {'wall min':>9} {'wall p50':>9} "
+        f"{'import':>8} {'mods':>5}"
+    )
+    with tempfile.TemporaryDirectory(prefix="drlms-startup-") as cwd:
+        for cmd in COMMANDS:
+            label = " ".join(cmd)
+            for i, src in enumerate(trees):
+                lo, med, imp, mods = measure(src.resolve(), cmd, args.repeat, cwd)
+                print(
+                    f"{label if i == 0 else '':>24} {i:>5} {lo:>9.1f} {med:>9.1f} "
+                    f"{imp:>8.1f} {mods:>5}"
+                )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
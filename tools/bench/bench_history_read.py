@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""HISTORY 流解析微基准：逐字节 recv 与 BufferedConnection 的 events/s 对比。
+
+用法：
+  python tools/bench/bench_history_read.py                 # 合成 20000 条事件
+  python tools/bench/bench_history_read.py -n 50000 -s 200
+  python tools/bench/bench_history_read.py --input hist.bin  # 回放录制的原始流
+
+录制真实流（服务器需运行）：
+  printf 'LOGIN|alice|password\\nHISTORY|demo|1000\\n' | nc -q 2 127.0.0.1 8080 > hist.bin
+录制内容中 HISTORY 之前的应答行（如 OK|WELCOME）会被自动跳过。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+_SRC = Path(__file__).resolve().parents[2] / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.protocol import BufferedConnection  # noqa: E402
+
+
+def synth_stream(events: int, payload_size: int) -> bytes:
+    out = bytearray()
+    for eid in range(1, events + 1):
+        body = (f"msg-{eid} ".encode() * (payload_size // 8 + 1))[:payload_size]
+        sha = hashlib.sha256(body).hexdigest()
+        out += (
+            f"EVT|TEXT|demo|2025-01-01T00:00:00Z|alice|{eid}|{len(body)}|{sha}\n"
+        ).encode()
+        out += body
+    out += b"OK|HISTORY\n"
+    return bytes(out)
+
+
+def legacy_recv_line(sock) -> str:
+    buf = bytearray()
+    while True:
+        ch = sock.recv(1)
+        if not ch or ch == b"\n":
+            break
+        buf.extend(ch)
+    return buf.decode(errors="ignore")
+
+
+def legacy_recv_exact(sock, n: int) -> bytes:
+    view = bytearray()
+    while n > 0:
+        chunk = sock.recv(n)
+        if not chunk:
+            break
+        view.extend(chunk)
+        n -= len(chunk)
+    return bytes(view)
+
+
+def buffered_recv_line(conn) -> str:
+    return conn.readline().decode(errors="ignore")
+
+
+def buffered_recv_exact(conn, n: int) -> bytes:
+    return conn.readexactly(n)
+
+
+def consume(reader, read_line, read_exact) -> int:
+    events = 0
+    while True:
+        line = read_line(reader)
+        if not line or line.startswith("OK|HISTORY"):
+            return events
+        if line.startswith("EVT|TEXT|"):
+            parts = line.split("|")
+            try:
+                plen = int(parts[6])
+            except Exception:
+                continue
+            read_exact(reader, plen)
+            events += 1
+        elif line.startswith("EVT|FILE|"):
+            events += 1
+
+
+def run_once(stream: bytes, buffered: bool) -> tuple[int, float]:
+    a, b = socket.socketpair()
+
+    def feed():
+        try:
+            a.sendall(stream)
+        finally:
+            a.shutdown(socket.SHUT_WR)
+
+    t = threading.Thread(target=feed, daemon=True)
+    t0 = time.perf_counter()
+    t.start()
+    if buffered:
+        n = consume(BufferedConnection(b), buffered_recv_line, buffered_recv_exact)
+    else:
+        n = consume(b, legacy_recv_line, legacy_recv_exact)
+    dt = time.perf_counter() - t0
+    t.join()
+    a.close()
+    b.close()
+    return n, dt
+
+
+def strip_preamble(stream: bytes) -> bytes:
+    for marker in (b"EVT|", b"OK|HISTORY"):
+        idx = stream.find(marker)
+        if idx != -1:
+            return stream[idx:]
+    return stream
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", "--events", type=int, default=20000)
+    ap.add_argument("-s", "--payload-size", type=int, default=64)
+    ap.add_argument("-r", "--repeat", type=int, default=3)
+    ap.add_argument("--input", type=Path, default=None, help="recorded raw stream")
+    args = ap.parse_args()
+
+    if args.input is not None:
+        stream = strip_preamble(args.input.read_bytes())
+        source = str(args.input)
+    else:
+        stream = synth_stream(args.events, args.payload_size)
+        source = f"synthetic events={args.events} payload={args.payload_size}B"
+    print(f"stream: {source}, {len(stream)} bytes")
+    results = {}
+    for label, buffered in (("recv(1) legacy", False), ("BufferedConnection", True)):
+        best = None
+        count = 0
+        for _ in range(max(1, args.repeat)):
+            count, dt = run_once(stream, buffered)
+            best = dt if best is None else min(best, dt)
+        eps = count / best if best else float("inf")
+        results[label] = eps
+        print(f"{label:>20}: {count} events in {best:.3f}s -> {eps:,.0f} events/s")
+    legacy = results["recv(1) legacy"]
+    if legacy:
+        print(f"{'speedup':>20}: {results['BufferedConnection'] / legacy:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""HISTORY 延迟随 events.log 规模变化的基准：events.idx 稀疏索引与全量扫描对比。
+
+脚本自行合成房间日志并启动服务器（无需预先运行）：
+  make log_collector_server
+  python tools/bench/bench_history_seek.py                     # 1e4/1e5/1e6 条事件
+  python tools/bench/bench_history_seek.py -n 10000 -n 200000 -r 20
+  python tools/bench/bench_history_seek.py --server ./log_collector_server
+
+每种规模分别以 DRLMS_HISTORY_INDEX_STRIDE=64（索引）与 0（顺序扫描）启动服务器，
+测量从日志头部、中部、尾部按 since_id 取 limit 条的耗时（含请求往返）。
+"cold" 为索引尚不存在时的首个请求（包含一次性重建 events.idx 的成本）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.protocol import decode_line, open_connection, parse_event_header  # noqa: E402
+
+ROOM = "bench"
+SHA = "0" * 64
+
+
+def synth_room(data_dir: Path, events: int) -> None:
+    """Write ``events`` FILE records: they replay as headers only (no payload)."""
+
+    room = data_dir / "rooms" / ROOM
+    (room / "files").mkdir(parents=True, exist_ok=True)
+    with open(room / "events.log", "w", encoding="utf-8") as f:
+        for eid in range(1, events + 1):
+            f.write(
+                f'{{"event_id":{eid},"ts":"2026-01-01T00:00:00Z","user":"alice",'
+                f'"kind":"FILE","filename":"f{eid}.bin","size":{eid},'
+                f'"sha":"{SHA}"}}\n'
+            )
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(binary: Path, data_dir: Path, port: int, stride: int):
+    env = dict(os.environ)
+    env.update(
+        DRLMS_DATA_DIR=str(data_dir),
+        DRLMS_PORT=str(port),
+        DRLMS_AUTH_STRICT="0",
+        DRLMS_HISTORY_INDEX_STRIDE=str(stride),
+        LD_LIBRARY_PATH=str(binary.resolve().parent),
+    )
+    proc = subprocess.Popen(
+        [str(binary.resolve())],
+        cwd=str(data_dir),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("server did not start")
+
+
+def history(conn, since: int, limit: int) -> int:
+    conn.sendall(f"HISTORY|{ROOM}|{limit}|{since}\n".encode())
+    got = 0
+    while True:
+        line = decode_line(conn.readline())
+        if line.startswith("OK|HISTORY") or line.startswith("ERR|"):
+            return got
+        ev = parse_event_header(line)
+        if ev is not None:
+            if ev.kind == "TEXT" and ev.length:
+                conn.readexactly(ev.length)
+            got += 1
+
+
+def measure(args, data_dir: Path, events: int, stride: int) -> Dict[str, float]:
+    idx = data_dir / "rooms" / ROOM / "events.idx"
+    if idx.exists():
+        idx.unlink()
+    port = free_port()
+    proc = start_server(args.server, data_dir, port, stride)
+    out: Dict[str, float] = {}
+    try:
+        conn = open_connection("127.0.0.1", port, 30.0)
+        conn.sendall(f"LOGIN|{args.user}|{args.password}\n".encode())
+        if not conn.readline().startswith(b"OK"):
+            raise SystemExit("login failed")
+        t0 = time.perf_counter()
+        history(conn, events - args.limit, args.limit)
+        out["cold"] = time.perf_counter() - t0
+        points = {
+            "head": 0,
+            "middle": events // 2,
+            "tail": max(0, events - args.limit),
+        }
+        for label, since in points.items():
+            best: Optional[float] = None
+            for _ in range(max(1, args.repeat)):
+                t0 = time.perf_counter()
+                n = history(conn, since, args.limit)
+                dt = time.perf_counter() - t0
+                best = dt if best is None else min(best, dt)
+            if n != min(args.limit, events - since):
+                raise SystemExit(f"{label}: expected events, got {n}")
+            out[label] = best or 0.0
+        conn.close()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=5)
+    return out
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", "--events", type=int, action="append")
+    ap.add_argument("-l", "--limit", type=int, default=50)
+    ap.add_argument("-r", "--repeat", type=int, default=10)
+    ap.add_argument("-u", "--user", default="alice")
+    ap.add_argument("-P", "--password", default="password")
+    ap.add_argument("--server", type=Path, default=_ROOT / "log_collector_server")
+    args = ap.parse_args()
+    if not args.server.exists():
+        raise SystemExit(f"server binary not found: {args.server}")
+    sizes: List[int] = args.events or [10_000, 100_000, 1_000_000]
+
+    print(f"limit={args.limit}, best of {args.repeat} (ms)")
+    print(
+        f"{'events':>10} {'mode':>6} {'cold':>9} {'head':>9} {'middle':>9} {'tail':>9}"
+    )
+    for events in sizes:
+        tmp = Path(tempfile.mkdtemp(prefix="drlms-hist-"))
+        try:
+            synth_room(tmp, events)
+            for mode, stride in (("index", 64), ("scan", 0)):
+                r = measure(args, tmp, events, stride)
+                cols = " ".join(
+                    f"{r[k] * 1000:9.2f}" for k in ("cold", "head", "middle", "tail")
+                )
+                print(f"{events:>10} {mode:>6} {cols}")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""连接引擎基准：DRLMS_IO_MODE=thread（每连接一线程）与 epoll（事件循环 + 工作线程池）对比。
+
+脚本自行启动服务器（无需预先运行）：
+  make log_collector_server
+  python tools/bench/bench_io_modes.py                       # 1000/5000 个空闲订阅者
+  python tools/bench/bench_io_modes.py -i 20000 --mode epoll
+  python tools/bench/bench_io_modes.py -i 1000 -n 500 -s 256
+
+对每种模式、每个规模：建立 i 条已登录并 SUB 同一房间的空闲连接，读取
+/proc/<pid>/status 中服务器的 VmRSS、VmSize 与线程数；随后由一个发布者
+连续发送 n 条 TEXT，统计发布吞吐（条/秒）以及一条消息扇出到全部订阅者
+所需的时间（最后一个订阅者收到该事件为止）。thread 模式下每个订阅者
+占一个线程与其栈空间，epoll 模式下线程数固定为工作线程数。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import resource
+import selectors
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.protocol import open_connection  # noqa: E402
+
+ROOM = "bench"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def raise_nofile(need: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < need:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, need), hard))
+
+
+def start_server(args, data_dir: Path, port: int, mode: str, max_conn: int):
+    env = dict(os.environ)
+    env.update(
+        DRLMS_DATA_DIR=str(data_dir),
+        DRLMS_PORT=str(port),
+        DRLMS_AUTH_STRICT="0",
+        DRLMS_MAX_CONN=str(max_conn),
+        DRLMS_IO_MODE=mode,
+        DRLMS_WORKERS=str(args.workers),
+        DRLMS_FSYNC="none",
+        LD_LIBRARY_PATH=str(args.server.resolve().parent),
+    )
+    proc = subprocess.Popen(
+        [str(args.server.resolve())],
+        cwd=str(data_dir),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("server did not start")
+
+
+def proc_status(pid: int) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        key, _, val = line.partition(":")
+        if key in ("VmRSS", "VmSize", "Threads"):
+            out[key] = int(val.split()[0])
+    return out
+
+
+def subscribe(args, port: int, count: int) -> List[socket.socket]:
+    """Open ``count`` idle subscribers; pipelined LOGIN+SUB keeps setup fast."""
+
+    socks: List[socket.socket] = []
+    req = f"LOGIN|{args.user}|{args.password}\nSUB|{ROOM}\n".encode()
+    for _ in range(count):
+        s = socket.create_connection(("127.0.0.1", port), timeout=30.0)
+        s.sendall(req)
+        socks.append(s)
+    for s in socks:
+        buf = b""
+        while buf.count(b"\n") < 2:
+            chunk = s.recv(4096)
+            if not chunk:
+                raise SystemExit("subscriber rejected (DRLMS_MAX_CONN?)")
+            buf += chunk
+        if not buf.startswith(b"OK") or b"OK|SUB" not in buf:
+            raise SystemExit(f"subscribe failed: {buf!r}")
+        s.setblocking(False)
+    return socks
+
+
+def fanout(socks: List[socket.socket], expect: int, deadline: float) -> None:
+    """Drain subscribers until each has received ``expect`` bytes."""
+
+    sel = selectors.DefaultSelector()
+    left = {}
+    for s in socks:
+        sel.register(s, selectors.EVENT_READ)
+        left[s] = expect
+    while left:
+        if time.monotonic() > deadline:
+            raise SystemExit(f"fanout timed out ({len(left)} subscribers pending)")
+        for key, _ in sel.select(timeout=1.0):
+            s = key.fileobj
+            try:
+                data = s.recv(1 << 16)
+            except BlockingIOError:
+                continue
+            if not data:
+                raise SystemExit("subscriber disconnected")
+            left[s] -= len(data)
+            if left[s] <= 0:
+                sel.unregister(s)
+                del left[s]
+    sel.close()
+
+
+def run(args, mode: str, idle: int) -> Dict[str, float]:
+    tmp = Path(tempfile.mkdtemp(prefix="drlms-io-"))
+    port = free_port()
+    proc = start_server(args, tmp, port, mode, idle + 16)
+    socks: List[socket.socket] = []
+    try:
+        t0 = time.perf_counter()
+        socks = subscribe(args, port, idle)
+        setup = time.perf_counter() - t0
+        time.sleep(0.5)
+        st = proc_status(proc.pid)
+
+        pub = open_connection("127.0.0.1", port, 30.0)
+        pub.sendall(f"LOGIN|{args.user}|{args.password}\n".encode())
+        if not pub.readline().startswith(b"OK"):
+            raise SystemExit("login failed")
+        body = os.urandom(args.size)
+        sha = hashlib.sha256(body).hexdigest()
+        cmd = f"PUBT|{ROOM}|{len(body)}|{sha}\n".encode()
+
+        def publish() -> bytes:
+            pub.sendall(cmd)
+            line = pub.readline()
+            if line.startswith(b"READY"):
+                pub.sendall(body)
+                line = pub.readline()
+            if not line.startswith(b"OK"):
+                raise SystemExit(f"publish failed: {line!r}")
+            return line
+
+        # 单条扇出：事件头 + 正文 到达每个订阅者
+        t0 = time.perf_counter()
+        publish()
+        # 事件头长度随 event_id 变化，按订阅者实际收到的首条事件计算
+        first = socks[0]
+        first.setblocking(True)
+        head = b""
+        while b"\n" not in head:
+            head += first.recv(1)
+        fan_bytes = len(head) + len(body)
+        rest = fan_bytes - len(head)
+        while rest > 0:
+            rest -= len(first.recv(rest))
+        first.setblocking(False)
+        fanout(socks[1:], fan_bytes, time.monotonic() + 60.0)
+        fan = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        for _ in range(args.count):
+            publish()
+        rate = args.count / (time.perf_counter() - t0)
+        pub.close()
+    finally:
+        for s in socks:
+            s.close()
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return {
+        "setup": setup,
+        "rss": st.get("VmRSS", 0) / 1024.0,
+        "vsz": st.get("VmSize", 0) / 1024.0,
+        "threads": st.get("Threads", 0),
+        "fanout": fan,
+        "rate": rate,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-i", "--idle", type=int, action="append")
+    ap.add_argument("-n", "--count", type=int, default=200)
+    ap.add_argument("-s", "--size", type=int, default=128)
+    ap.add_argument("-w", "--workers", type=int, default=8)
+    ap.add_argument("--mode", action="append", choices=["thread", "epoll"])
+    ap.add_argument("-u", "--user", default="alice")
+    ap.add_argument("-P", "--password", default="password")
+    ap.add_argument("--server", type=Path, default=_ROOT / "log_collector_server")
+    args = ap.parse_args()
+    if not args.server.exists():
+        raise SystemExit(f"server binary not found: {args.server}")
+    sizes = args.idle or [1000, 5000]
+    modes = args.mode or ["thread", "epoll"]
+    raise_nofile(max(sizes) + 256)
+
+    print(f"publisher: {args.count} x {args.size} B, epoll workers={args.workers}")
+    print(
+        f"{'mode':>6} {'idle':>7} {'threads':>8} {'RSS MiB':>8} {'VSZ MiB':>9} "
+        f"{'setup s':>8} {'fanout ms':>10} {'pub msg/s':>10}"
+    )
+    for mode in modes:
+        for idle in sizes:
+            r = run(args, mode, idle)
+            print(
+                f"{mode:>6} {idle:>7} {r['threads']:>8} {r['rss']:>8.1f} "
+                f"{r['vsz']:>9.0f} {r['setup']:>8.2f} {r['fanout'] * 1000:>10.1f} "
+                f"{r['rate']:>10,.0f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
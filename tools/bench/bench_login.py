@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""LOGIN 基准：Argon2id 校验缓存与并发限流对登录吞吐、服务器内存峰值的影响。
+
+脚本自行启动服务器（无需预先运行），users.txt 中写入一个 Argon2id 用户：
+  make log_collector_server
+  python tools/bench/bench_login.py                     # 缓存关/开，32 个并发客户端
+  python tools/bench/bench_login.py -c 64 -n 20 --max-concurrent 2
+  python tools/bench/bench_login.py --cache 0 --max-concurrent 0   # 旧行为：不缓存、不限流
+
+每个客户端反复“新建连接、LOGIN、断开”（与每条 CLI 命令重新登录相同），
+统计登录吞吐（次/秒）、单次登录延迟 p50/p99，以及服务器 VmHWM（常驻内存峰值）。
+不限流时并发校验各占 m_cost KiB，峰值随并发数线性增长；限流后峰值约为
+max_concurrent × m_cost。缓存命中后登录不再计算 Argon2。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.protocol import open_connection  # noqa: E402
+from ming_drlms.users import (  # noqa: E402
+    generate_argon2id_hash,
+    read_auth_params_from_env,
+    write_users_atomic,
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, data_dir: Path, port: int, cache: int):
+    env = dict(os.environ)
+    env.update(
+        DRLMS_DATA_DIR=str(data_dir),
+        DRLMS_PORT=str(port),
+        DRLMS_AUTH_STRICT="1",
+        DRLMS_MAX_CONN="1024",
+        DRLMS_AUTH_CACHE_SIZE=str(cache),
+        DRLMS_ARGON2_MAX_CONCURRENT=str(args.max_concurrent),
+        LD_LIBRARY_PATH=str(args.server.resolve().parent),
+    )
+    proc = subprocess.Popen(
+        [str(args.server.resolve())],
+        cwd=str(data_dir),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("server did not start")
+
+
+def vm_hwm(pid: int) -> float:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def client(args, port: int, lat: List[float], barrier: threading.Barrier) -> None:
+    req = f"LOGIN|{args.user}|{args.password}\n".encode()
+    barrier.wait()
+    for _ in range(args.count):
+        t0 = time.perf_counter()
+        conn = open_connection("127.0.0.1", port, 120.0)
+        conn.sendall(req)
+        line = conn.readline()
+        conn.close()
+        if not line.startswith(b"OK"):
+            raise SystemExit(f"login failed: {line!r}")
+        lat.append(time.perf_counter() - t0)
+
+
+def run(args, cache: int):
+    tmp = Path(tempfile.mkdtemp(prefix="drlms-login-"))
+    encoded = generate_argon2id_hash(args.password, **read_auth_params_from_env())
+    write_users_atomic(tmp / "users.txt", [(args.user, "argon2", encoded)])
+    port = free_port()
+    proc = start_server(args, tmp, port, cache)
+    try:
+        lat: List[float] = []
+        barrier = threading.Barrier(args.clients + 1)
+        threads = [
+            threading.Thread(target=client, args=(args, port, lat, barrier))
+            for _ in range(args.clients)
+        ]
+        for t in threads:
+            t.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        hwm = vm_hwm(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(tmp, ignore_errors=True)
+    lat.sort()
+    p50 = lat[len(lat) // 2]
+    p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+    return len(lat) / elapsed, p50, p99, hwm
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-c", "--clients", type=int, default=32)
+    ap.add_argument("-n", "--count", type=int, default=10)
+    ap.add_argument("--cache", type=int, action="append")
+    ap.add_argument("--max-concurrent", type=int, default=4)
+    ap.add_argument("-u", "--user", default="alice")
+    ap.add_argument("-P", "--password", default="password")
+    ap.add_argument("--server", type=Path, default=_ROOT / "log_collector_server")
+    args = ap.parse_args()
+    if not args.server.exists():
+        raise SystemExit(f"server binary not found: {args.server}")
+    caches = args.cache or [0, 1024]
+
+    print(
+        f"{args.clients} clients x {args.count} logins, "
+        f"argon2 max concurrent: {args.max_concurrent or 'unlimited'}"
+    )
+    print(
+        f"{'cache':>6} {'login/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'peak RSS MiB':>13}"
+    )
+    for cache in caches:
+        rate, p50, p99, hwm = run(args, cache)
+        print(
+            f"{cache:>6} {rate:>9,.1f} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f} "
+            f"{hwm:>13.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""PUBT 发布吞吐基准：房间段追加在不同 DRLMS_FSYNC 策略下的表现。
+
+脚本自行启动服务器（无需预先运行）：
+  make log_collector_server
+  python tools/bench/bench_publish.py                    # 1/8/32 个并发发布者
+  python tools/bench/bench_publish.py -c 16 -n 500 -s 256
+  python tools/bench/bench_publish.py --fsync batch --fsync none
+  python tools/bench/bench_publish.py --fsync none --stalled 4 --slow-consumer drop-oldest
+
+每个发布者一条已登录连接，向同一房间连续发送 n 条 s 字节的 TEXT，
+统计总吞吐（条/秒）与单条 PUBT 往返延迟的 p50/p99。batch 策略下并发
+发布者共享 fdatasync（组提交），吞吐应随并发数上升而不是被单盘 fsync 延迟钉死。
+--stalled k 额外挂 k 个只订阅不读取的订阅者：扇出经每订阅者的有界发送队列
+异步排空，发布吞吐不应被它们拖慢（队列满后按 DRLMS_SLOW_CONSUMER 处理）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.protocol import open_connection  # noqa: E402
+
+ROOM = "bench"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(binary: Path, data_dir: Path, port: int, fsync: str, slow: str):
+    env = dict(os.environ)
+    env.update(
+        DRLMS_DATA_DIR=str(data_dir),
+        DRLMS_PORT=str(port),
+        DRLMS_AUTH_STRICT="0",
+        DRLMS_MAX_CONN="1024",
+        DRLMS_FSYNC=fsync,
+        DRLMS_SLOW_CONSUMER=slow,
+        LD_LIBRARY_PATH=str(binary.resolve().parent),
+    )
+    proc = subprocess.Popen(
+        [str(binary.resolve())],
+        cwd=str(data_dir),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("server did not start")
+
+
+def publisher(args, port: int, lat: List[float], barrier: threading.Barrier) -> None:
+    conn = open_connection("127.0.0.1", port, 30.0)
+    conn.sendall(f"LOGIN|{args.user}|{args.password}\n".encode())
+    if not conn.readline().startswith(b"OK"):
+        raise SystemExit("login failed")
+    body = os.urandom(args.size)
+    sha = hashlib.sha256(body).hexdigest()
+    cmd = f"PUBT|{ROOM}|{len(body)}|{sha}\n".encode()
+    barrier.wait()
+    for _ in range(args.count):
+        t0 = time.perf_counter()
+        conn.sendall(cmd)
+        line = conn.readline()
+        if line.startswith(b"READY"):
+            conn.sendall(body)
+            line = conn.readline()
+        if not line.startswith(b"OK"):
+            raise SystemExit(f"publish failed: {line!r}")
+        lat.append(time.perf_counter() - t0)
+    conn.close()
+
+
+def stall(args, port: int) -> socket.socket:
+    """A subscriber that never reads (tiny receive buffer)."""
+
+    s = socket.socket()
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    s.connect(("127.0.0.1", port))
+    s.sendall(f"LOGIN|{args.user}|{args.password}\nSUB|{ROOM}\n".encode())
+    return s
+
+
+def run(args, fsync: str, clients: int):
+    tmp = Path(tempfile.mkdtemp(prefix="drlms-pub-"))
+    port = free_port()
+    proc = start_server(args.server, tmp, port, fsync, args.slow_consumer)
+    stalled = []
+    try:
+        stalled = [stall(args, port) for _ in range(args.stalled)]
+        time.sleep(0.2 if stalled else 0)
+        lat: List[float] = []
+        barrier = threading.Barrier(clients + 1)
+        threads = [
+            threading.Thread(target=publisher, args=(args, port, lat, barrier))
+            for _ in range(clients)
+        ]
+        for t in threads:
+            t.start()
+        barrier.wait()
+        t0 = time.perf_counter()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+    finally:
+        for s in stalled:
+            s.close()
+        proc.terminate()
+        proc.wait(timeout=5)
+        shutil.rmtree(tmp, ignore_errors=True)
+    lat.sort()
+    p50 = lat[len(lat) // 2]
+    p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+    return len(lat) / elapsed, p50, p99
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-c", "--clients", type=int, action="append")
+    ap.add_argument("-n", "--count", type=int, default=200)
+    ap.add_argument("-s", "--size", type=int, default=128)
+    ap.add_argument("--fsync", action="append", choices=["none", "interval", "batch"])
+    ap.add_argument("--stalled", type=int, default=0)
+    ap.add_argument(
+        "--slow-consumer",
+        default="disconnect",
+        choices=["drop-oldest", "disconnect", "block"],
+    )
+    ap.add_argument("-u", "--user", default="alice")
+    ap.add_argument("-P", "--password", default="password")
+    ap.add_argument("--server", type=Path, default=_ROOT / "log_collector_server")
+    args = ap.parse_args()
+    if not args.server.exists():
+        raise SystemExit(f"server binary not found: {args.server}")
+    clients = args.clients or [1, 8, 32]
+    policies = args.fsync or ["none", "interval", "batch"]
+
+    print(f"{args.count} x {args.size} B per publisher")
+    if args.stalled:
+        print(
+            f"{args.stalled} stalled subscribers, slow consumer: {args.slow_consumer}"
+        )
+    print(f"{'fsync':>9} {'clients':>8} {'msg/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+    for fsync in policies:
+        for c in clients:
+            rate, p50, p99 = run(args, fsync, c)
+            print(
+                f"{fsync:>9} {c:>8} {rate:>10,.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
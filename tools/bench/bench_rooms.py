@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""房间表基准：房间查找与断开清理的开销随房间总数的变化。
+
+脚本自行启动服务器（无需预先运行）：
+  make log_collector_server
+  python tools/bench/bench_rooms.py                      # 100/10000 个房间
+  python tools/bench/bench_rooms.py -r 1000 -r 50000 -n 5000
+  python tools/bench/bench_rooms.py --server /path/to/old/log_collector_server
+
+数据目录为空（无 users 文件）时服务器接受任意用户名。
+每个规模先由若干条 --owner 用户的长连接把 r 个房间各订阅一次（房间随之创建并常驻），再测：
+  - lookup：单连接顺序发送 n 条 ROOMINFO（随机房间）的吞吐，每条都走一次房间查找；
+  - churn：c 个并发客户端反复“连接、登录、SUB 一个房间、断开”的速率，
+    每次断开都要把该 fd 从其订阅的房间中摘除并检查房主策略。
+房间表分片哈希 + fd 反向索引后两项都不应随房间总数下降。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.protocol import open_connection  # noqa: E402
+
+HOLDERS = 16
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(binary: Path, data_dir: Path, port: int):
+    env = dict(os.environ)
+    env.update(
+        DRLMS_DATA_DIR=str(data_dir),
+        DRLMS_PORT=str(port),
+        DRLMS_AUTH_STRICT="0",
+        DRLMS_MAX_CONN="1024",
+        DRLMS_FSYNC="none",
+        LD_LIBRARY_PATH=str(binary.resolve().parent),
+    )
+    proc = subprocess.Popen(
+        [str(binary.resolve())],
+        cwd=str(data_dir),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("server did not start")
+
+
+def login(args, port: int, user: str = ""):
+    conn = open_connection("127.0.0.1", port, 60.0)
+    conn.sendall(f"LOGIN|{user or args.user}|{args.password}\n".encode())
+    if not conn.readline().startswith(b"OK"):
+        raise SystemExit("login failed")
+    return conn
+
+
+def populate(args, port: int, rooms: int) -> List:
+    """Subscribe HOLDERS long-lived connections to ``rooms`` rooms in total.
+
+    Rooms are owned by a separate user so churned connections are not owners.
+    """
+
+    holders = [login(args, port, args.owner) for _ in range(HOLDERS)]
+    for h, conn in enumerate(holders):
+        names = [f"room{i}" for i in range(h, rooms, HOLDERS)]
+        for k in range(0, len(names), 256):
+            batch = names[k : k + 256]
+            conn.sendall("".join(f"SUB|{n}\n" for n in batch).encode())
+            for _ in batch:
+                if not conn.readline().startswith(b"OK|SUB"):
+                    raise SystemExit("SUB failed")
+    return holders
+
+
+def lookup(args, port: int, rooms: int) -> float:
+    conn = login(args, port)
+    rnd = random.Random(1)
+    names = [f"room{rnd.randrange(rooms)}" for _ in range(args.count)]
+    t0 = time.perf_counter()
+    for n in names:
+        conn.sendall(f"ROOMINFO|{n}\n".encode())
+        if not conn.readline().startswith(b"OK|ROOMINFO"):
+            raise SystemExit("ROOMINFO failed")
+    dt = time.perf_counter() - t0
+    conn.close()
+    return args.count / dt
+
+
+def churn(args, port: int, rooms: int) -> float:
+    per = max(1, args.count // (10 * args.clients))
+    barrier = threading.Barrier(args.clients + 1)
+
+    def worker(seed: int) -> None:
+        rnd = random.Random(seed)
+        barrier.wait()
+        for _ in range(per):
+            conn = login(args, port)
+            conn.sendall(f"SUB|room{rnd.randrange(rooms)}\n".encode())
+            conn.readline()
+            conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.clients)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    return per * args.clients / (time.perf_counter() - t0)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-r", "--rooms", type=int, action="append")
+    ap.add_argument("-n", "--count", type=int, default=20000)
+    ap.add_argument("-c", "--clients", type=int, default=8)
+    ap.add_argument("-u", "--user", default="alice")
+    ap.add_argument("-P", "--password", default="password")
+    ap.add_argument("--owner", default="holder")
+    ap.add_argument("--server", type=Path, default=_ROOT / "log_collector_server")
+    args = ap.parse_args()
+    if not args.server.exists():
+        raise SystemExit(f"server binary not found: {args.server}")
+    sizes = args.rooms or [100, 10_000]
+
+    print(f"{args.count} ROOMINFO lookups, churn with {args.clients} clients")
+    print(f"{'rooms':>8} {'lookup/s':>10} {'churn conn/s':>13}")
+    for rooms in sizes:
+        tmp = Path(tempfile.mkdtemp(prefix="drlms-rooms-"))
+        port = free_port()
+        proc = start_server(args.server, tmp, port)
+        try:
+            holders = populate(args, port, rooms)
+            rate = lookup(args, port, rooms)
+            conns = churn(args, port, rooms)
+            for h in holders:
+                h.close()
+        finally:
+            proc.terminate()
+            proc.wait(timeout=10)
+            shutil.rmtree(tmp, ignore_errors=True)
+        print(f"{rooms:>8} {rate:>10,.0f} {conns:>13,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""UPLOAD/DOWNLOAD 吞吐基准：原生 Python 传输（ming_drlms.transfer）与 log_agent 子进程对比。
+
+需要一个正在运行的服务器：
+  ming-drlms server-up
+  python tools/bench/bench_transfer.py                  # 64 MiB，各跑 3 次取最好
+  python tools/bench/bench_transfer.py -s 256 -r 5 -p 8080
+  python tools/bench/bench_transfer.py --agent ./log_agent
+
+未找到 log_agent 时只测原生实现。每种实现的耗时都包含建连与登录，
+子进程方式另含进程启动开销——这正是 `client upload/download` 的实际成本。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.protocol import open_connection  # noqa: E402
+from ming_drlms.transfer import download_file, upload_file  # noqa: E402
+
+
+_seq = 0
+
+
+def fresh_name(src: Path) -> Path:
+    """Hard-link ``src`` under a new name: the server refuses to overwrite files."""
+
+    global _seq
+    _seq += 1
+    dst = src.with_name(f"{src.stem}_{_seq}{src.suffix}")
+    os.link(src, dst)
+    return dst
+
+
+def native_upload(args, path: Path) -> None:
+    conn = open_connection(args.host, args.port, 30.0)
+    try:
+        conn.sendall(f"LOGIN|{args.user}|{args.password}\n".encode())
+        if not conn.readline().startswith(b"OK"):
+            raise SystemExit("login failed")
+        upload_file(conn, path)
+    finally:
+        conn.close()
+
+
+def native_download(args, name: str, out: Path) -> None:
+    conn = open_connection(args.host, args.port, 30.0)
+    try:
+        conn.sendall(f"LOGIN|{args.user}|{args.password}\n".encode())
+        if not conn.readline().startswith(b"OK"):
+            raise SystemExit("login failed")
+        download_file(conn, name, out)
+    finally:
+        conn.close()
+
+
+def agent_run(args, *action: str) -> None:
+    cmd = [str(args.agent), args.host, str(args.port), "login"]
+    cmd += [args.user, args.password, *action]
+    p = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise SystemExit(f"log_agent failed: {p.stderr.decode(errors='ignore')}")
+
+
+def best_of(repeat: int, fn) -> float:
+    best: Optional[float] = None
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best or 0.0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-H", "--host", default="127.0.0.1")
+    ap.add_argument("-p", "--port", type=int, default=8080)
+    ap.add_argument("-u", "--user", default="alice")
+    ap.add_argument("-P", "--password", default="password")
+    ap.add_argument("-s", "--size-mb", type=int, default=64)
+    ap.add_argument("-r", "--repeat", type=int, default=3)
+    ap.add_argument("--agent", type=Path, default=_ROOT / "log_agent")
+    args = ap.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    with tempfile.TemporaryDirectory(prefix="drlms-bench-") as tmp:
+        tmpd = Path(tmp)
+        src = tmpd / f"bench_{os.getpid()}.bin"
+        with open(src, "wb") as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(args.size_mb):
+                f.write(block)
+        out = tmpd / "out.bin"
+        # 下载用例需要一个服务器上已存在的文件
+        native_upload(args, src)
+        print(f"payload: {args.size_mb} MiB, best of {args.repeat}")
+
+        cases = [
+            ("native upload", lambda: native_upload(args, fresh_name(src))),
+            ("native download", lambda: native_download(args, src.name, out)),
+        ]
+        if args.agent.exists():
+            cases += [
+                (
+                    "log_agent upload",
+                    lambda: agent_run(args, "upload", str(fresh_name(src))),
+                ),
+                (
+                    "log_agent download",
+                    lambda: agent_run(args, "download", src.name, str(out)),
+                ),
+            ]
+        else:
+            print(f"log_agent not found at {args.agent}; native only")
+        for label, fn in cases:
+            dt = best_of(args.repeat, fn)
+            mbps = size / dt / (1024 * 1024) if dt else float("inf")
+            print(f"{label:>20}: {dt:.3f}s -> {mbps:,.1f} MiB/s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""旧格式用户升级基准：重启后的登录风暴中 users.txt 的重写次数与登录延迟。
+
+脚本自行启动服务器（无需预先运行）：
+  make log_collector_server
+  python tools/bench/bench_upgrade.py                      # 批量写回 vs 逐个写回
+  python tools/bench/bench_upgrade.py -n 5000 -F 100000 -c 32
+  python tools/bench/bench_upgrade.py --batch-ms 0 --server /path/to/old/log_collector_server
+
+users.txt 中写入 n 个旧格式（user:salt:sha256）用户与 F 个 Argon2id 填充用户
+（文件越大，每次重写越贵）。c 个并发客户端各登录一部分旧格式用户一次，统计：
+风暴耗时、登录延迟 p50/p99、服务器重写 users.txt 的次数，以及所有旧用户都被
+写回为 Argon2id 所需的时间。服务器端 Argon2 参数压到 t=1, m=1024 KiB，
+以突出文件重写的开销。
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.protocol import open_connection  # noqa: E402
+from ming_drlms.users import (  # noqa: E402
+    generate_argon2id_hash,
+    parse_users,
+    write_users_atomic,
+)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, data_dir: Path, port: int, batch_ms: int, log):
+    env = dict(os.environ)
+    env.update(
+        DRLMS_DATA_DIR=str(data_dir),
+        DRLMS_PORT=str(port),
+        DRLMS_AUTH_STRICT="1",
+        DRLMS_MAX_CONN="1024",
+        DRLMS_ARGON2_T_COST="1",
+        DRLMS_ARGON2_M_COST="1024",
+        DRLMS_UPGRADE_BATCH_MS=str(batch_ms),
+        LD_LIBRARY_PATH=str(args.server.resolve().parent),
+    )
+    proc = subprocess.Popen(
+        [str(args.server.resolve())],
+        cwd=str(data_dir),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=log,
+    )
+    deadline = time.monotonic() + 30.0
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("server did not start")
+
+
+def seed(path: Path, legacy: int, filler: int) -> None:
+    enc = generate_argon2id_hash(
+        "x", time_cost=1, memory_cost=8, parallelism=1, hash_len=32, salt_len=16
+    )
+    records = [(f"fill{i}", "argon2", enc) for i in range(filler)]
+    for i in range(legacy):
+        salt = f"s{i}"
+        sha = hashlib.sha256(f"pw{i}{salt}".encode()).hexdigest()
+        records.append((f"old{i}", "legacy", f"{salt}:{sha}"))
+    write_users_atomic(path, records)
+
+
+def legacy_left(path: Path) -> int:
+    return sum(1 for _u, k, _e in parse_users(path) if k == "legacy")
+
+
+def run(args, batch_ms: int):
+    tmp = Path(tempfile.mkdtemp(prefix="drlms-upgrade-"))
+    path = tmp / "users.txt"
+    seed(path, args.legacy, args.filler)
+    port = free_port()
+    log_path = tmp / "server.err"
+    with open(log_path, "w") as log:
+        proc = start_server(args, tmp, port, batch_ms, log)
+        try:
+            lat: List[float] = []
+            barrier = threading.Barrier(args.clients + 1)
+
+            def client(k: int) -> None:
+                barrier.wait()
+                for i in range(k, args.legacy, args.clients):
+                    t0 = time.perf_counter()
+                    conn = open_connection("127.0.0.1", port, 120.0)
+                    conn.sendall(f"LOGIN|old{i}|pw{i}\n".encode())
+                    line = conn.readline()
+                    conn.close()
+                    if not line.startswith(b"OK"):
+                        raise SystemExit(f"login failed: {line!r}")
+                    lat.append(time.perf_counter() - t0)
+
+            threads = [
+                threading.Thread(target=client, args=(k,)) for k in range(args.clients)
+            ]
+            for t in threads:
+                t.start()
+            barrier.wait()
+            t0 = time.perf_counter()
+            for t in threads:
+                t.join()
+            storm = time.perf_counter() - t0
+            while legacy_left(path) and time.perf_counter() - t0 < 600:
+                time.sleep(0.05)
+            settled = time.perf_counter() - t0
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+    writes = sum(1 for ln in log_path.read_text().splitlines() if "upgraded" in ln)
+    shutil.rmtree(tmp, ignore_errors=True)
+    lat.sort()
+    p50 = lat[len(lat) // 2]
+    p99 = lat[min(len(lat) - 1, int(len(lat) * 0.99))]
+    return storm, p50, p99, writes, settled
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", "--legacy", type=int, default=2000)
+    ap.add_argument("-F", "--filler", type=int, default=50_000)
+    ap.add_argument("-c", "--clients", type=int, default=16)
+    ap.add_argument("--batch-ms", type=int, action="append")
+    ap.add_argument("--server", type=Path, default=_ROOT / "log_collector_server")
+    args = ap.parse_args()
+    if not args.server.exists():
+        raise SystemExit(f"server binary not found: {args.server}")
+    modes = args.batch_ms or [0, 1000]
+
+    print(
+        f"{args.legacy} legacy users logging in once, {args.filler} other users, "
+        f"{args.clients} clients"
+    )
+    print(
+        f"{'batch ms':>9} {'storm s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+        f"{'rewrites':>9} {'all argon2 s':>13}"
+    )
+    for batch_ms in modes:
+        storm, p50, p99, writes, settled = run(args, batch_ms)
+        print(
+            f"{batch_ms:>9} {storm:>8.2f} {p50 * 1000:>8.1f} {p99 * 1000:>8.1f} "
+            f"{writes:>9} {settled:>13.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""批量导入基准：逐个 `user add` 与 `user import`（进程池 + 一次原子写入）的对比。
+
+无需服务器：
+  python tools/bench/bench_user_import.py                   # 200 个新用户，已有 10000 个
+  python tools/bench/bench_user_import.py -n 1000 -j 4 --mem-budget 512
+  DRLMS_ARGON2_M_COST=16384 python tools/bench/bench_user_import.py
+
+三种方式写入同样的 n 个新用户（Argon2 参数取自 DRLMS_ARGON2_* 环境变量）：
+  - add：与 `user add` 相同，每个用户“解析 users.txt → 哈希 → 原子重写整个文件”；
+  - import -j 1：单进程哈希，一次写入；
+  - import：按 min(-j 或 CPU 数, --mem-budget ÷ m_cost) 个进程并行哈希，一次写入。
+输出耗时、用户/秒与哈希子进程的内存峰值（ru_maxrss）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.users import (  # noqa: E402
+    DEFAULT_IMPORT_MEM_MB,
+    UserStore,
+    add_user,
+    generate_argon2id_hash,
+    hash_passwords,
+    import_workers,
+    parse_users,
+    read_auth_params_from_env,
+    write_users_atomic,
+)
+
+
+def seed(path: Path, existing: int) -> None:
+    enc = generate_argon2id_hash(
+        "x", time_cost=1, memory_cost=8, parallelism=1, hash_len=32, salt_len=16
+    )
+    write_users_atomic(path, [(f"old{i}", "argon2", enc) for i in range(existing)])
+
+
+def run_add(path: Path, names, params) -> None:
+    for name in names:
+        records = parse_users(path)
+        enc = generate_argon2id_hash("pw-" + name, **params)
+        write_users_atomic(path, add_user(records, name, enc))
+
+
+def run_import(path: Path, names, params, workers: int) -> None:
+    encoded = hash_passwords(["pw-" + n for n in names], params, workers)
+    UserStore(path).import_encoded(zip(names, encoded))
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", "--count", type=int, default=200)
+    ap.add_argument("--existing", type=int, default=10_000)
+    ap.add_argument("-j", "--jobs", type=int, default=None)
+    ap.add_argument("--mem-budget", type=int, default=DEFAULT_IMPORT_MEM_MB)
+    args = ap.parse_args()
+    params = read_auth_params_from_env()
+    workers = import_workers(params, args.jobs, args.mem_budget)
+    names = [f"new{i}" for i in range(args.count)]
+
+    print(
+        f"{args.count} new users onto {args.existing} existing, "
+        f"t={params['time_cost']} m={params['memory_cost']} KiB"
+    )
+    print(f"{'mode':>14} {'seconds':>9} {'users/s':>9} {'child RSS MiB':>14}")
+    modes = [
+        ("add", lambda p: run_add(p, names, params)),
+        ("import -j 1", lambda p: run_import(p, names, params, 1)),
+        (f"import -j {workers}", lambda p: run_import(p, names, params, workers)),
+    ]
+    for label, fn in modes:
+        tmp = Path(tempfile.mkdtemp(prefix="drlms-import-"))
+        path = tmp / "users.txt"
+        try:
+            seed(path, args.existing)
+            t0 = time.perf_counter()
+            fn(path)
+            dt = time.perf_counter() - t0
+            if len(parse_users(path)) != args.existing + args.count:
+                raise SystemExit(f"{label}: wrong user count")
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+        print(f"{label:>14} {dt:>9.2f} {args.count / dt:>9.1f} {child:>14.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
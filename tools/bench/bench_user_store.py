@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""用户文件基准：100k 用户下 list/add/passwd/del 的耗时，旧函数式接口对比 UserStore。
+
+无需服务器：
+  python tools/bench/bench_user_store.py                  # 100000 个用户
+  python tools/bench/bench_user_store.py -N 10000 -b 5000
+
+为只测文件与索引开销，所有记录共用同一个预先生成的 Argon2id 编码串（不计哈希时间）。
+  - list：读取全部记录；
+  - add/passwd/del：单条修改并原子写回（与一条 CLI 命令相同）；
+  - batch：b 条 add 后 b 条 passwd 再 b 条 del。旧接口每条都“解析 → 重建列表 →
+    重写文件”；UserStore 在一个 batch() 中合并为一次写入。
+old 列为 parse_users + add_user/set_password/del_user + write_users_atomic，
+store 列为每次新建 UserStore（冷，等同一条 CLI 命令），cached 列复用同一实例
+（文件未变化时不再解析）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.users import (  # noqa: E402
+    UserStore,
+    add_user,
+    del_user,
+    generate_argon2id_hash,
+    parse_users,
+    set_password,
+    write_users_atomic,
+)
+
+
+def timed(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def old_ops(path: Path, enc: str, batch: int):
+    def add():
+        write_users_atomic(path, add_user(parse_users(path), "zz_new", enc))
+
+    def passwd():
+        write_users_atomic(path, set_password(parse_users(path), "zz_new", enc))
+
+    def delete():
+        write_users_atomic(path, del_user(parse_users(path), "zz_new"))
+
+    def many():
+        names = [f"b{i}" for i in range(batch)]
+        for n in names:
+            write_users_atomic(path, add_user(parse_users(path), n, enc))
+        for n in names:
+            write_users_atomic(path, set_password(parse_users(path), n, enc))
+        for n in names:
+            write_users_atomic(path, del_user(parse_users(path), n))
+
+    return {
+        "list": lambda: parse_users(path),
+        "add": add,
+        "passwd": passwd,
+        "del": delete,
+        "batch": many,
+    }
+
+
+def store_ops(path: Path, enc: str, batch: int, store=None):
+    def get():
+        if store is not None:
+            return store
+        UserStore._cache.clear()  # 冷启动：不借用进程内解析缓存
+        return UserStore(path)
+
+    def many():
+        s = get()
+        names = [f"b{i}" for i in range(batch)]
+        with s.batch():
+            for n in names:
+                s.add(n, enc)
+            for n in names:
+                s.set_password(n, enc)
+            for n in names:
+                s.delete(n)
+
+    return {
+        "list": lambda: get().records(),
+        "add": lambda: get().add("zz_new", enc),
+        "passwd": lambda: get().set_password("zz_new", enc),
+        "del": lambda: get().delete("zz_new"),
+        "batch": many,
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-N", "--users", type=int, default=100_000)
+    ap.add_argument("-b", "--batch", type=int, default=100)
+    args = ap.parse_args()
+    enc = generate_argon2id_hash(
+        "x", time_cost=1, memory_cost=8, parallelism=1, hash_len=32, salt_len=16
+    )
+    tmp = Path(tempfile.mkdtemp(prefix="drlms-store-"))
+    path = tmp / "users.txt"
+    try:
+        write_users_atomic(
+            path, [(f"user{i}", "argon2", enc) for i in range(args.users)]
+        )
+        results = {}
+        results["old"] = {
+            k: timed(f) for k, f in old_ops(path, enc, args.batch).items()
+        }
+        results["store"] = {
+            k: timed(f) for k, f in store_ops(path, enc, args.batch).items()
+        }
+        warm = UserStore(path)
+        results["cached"] = {
+            k: timed(f) for k, f in store_ops(path, enc, args.batch, warm).items()
+        }
+        if len(parse_users(path)) != args.users:
+            raise SystemExit("wrong user count")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"{args.users} users, batch of {args.batch} add+passwd+del (ms)")
+    print(f"{'op':>8} {'old':>10} {'store':>10} {'cached':>10}")
+    for op in ("list", "add", "passwd", "del", "batch"):
+        row = [results[m][op] for m in ("old", "store", "cached")]
+        print(f"{op:>8} {row[0]:>10.1f} {row[1]:>10.1f} {row[2]:>10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
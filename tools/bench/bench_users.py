@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""用户表基准：大量账户下 LOGIN 的查找开销，以及 users.txt 热重载的代价。
+
+脚本自行启动服务器（无需预先运行）：
+  make log_collector_server
+  python tools/bench/bench_users.py                    # 1000/100000 个账户
+  python tools/bench/bench_users.py -N 10000 -n 5000
+  python tools/bench/bench_users.py --server /path/to/old/log_collector_server
+
+为排除 Argon2 本身的开销，所有账户共用一个极低成本（t=1, m=8 KiB）的
+Argon2id 编码串。对每个规模：
+  - login：单连接往返测 n 次随机账户 LOGIN 的吞吐（每次新建连接）；
+  - reload：后台持续登录的同时原子替换 users.txt（追加一个新账户），记录新账户
+    首次登录成功所需时间，以及重载期间后台登录的最大延迟。
+失败列为被拒绝的登录数（旧服务器用户表上限 256 条）。
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+_ROOT = Path(__file__).resolve().parents[2]
+_SRC = _ROOT / "src"
+if str(_SRC) not in sys.path:
+    sys.path.insert(0, str(_SRC))
+
+from ming_drlms.users import generate_argon2id_hash  # noqa: E402
+
+PASSWORD = "password"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(binary: Path, data_dir: Path, port: int):
+    env = dict(os.environ)
+    env.update(
+        DRLMS_DATA_DIR=str(data_dir),
+        DRLMS_PORT=str(port),
+        DRLMS_AUTH_STRICT="1",
+        DRLMS_MAX_CONN="1024",
+        LD_LIBRARY_PATH=str(binary.resolve().parent),
+    )
+    proc = subprocess.Popen(
+        [str(binary.resolve())],
+        cwd=str(data_dir),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30.0
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("server did not start")
+
+
+def write_users(path: Path, count: int, encoded: str, extra: str = "") -> None:
+    tmp = path.with_name(".users.txt.bench.tmp")
+    with open(tmp, "w") as f:
+        for i in range(count):
+            f.write(f"user{i}::{encoded}\n")
+        if extra:
+            f.write(f"{extra}::{encoded}\n")
+    os.replace(tmp, path)
+
+
+def login(port: int, user: str) -> bool:
+    with socket.create_connection(("127.0.0.1", port), timeout=30.0) as s:
+        s.sendall(f"LOGIN|{user}|{PASSWORD}\n".encode())
+        buf = b""
+        while not buf.endswith(b"\n"):
+            chunk = s.recv(256)
+            if not chunk:
+                break
+            buf += chunk
+    return buf.startswith(b"OK")
+
+
+def run(args, users: int, encoded: str):
+    tmp = Path(tempfile.mkdtemp(prefix="drlms-users-"))
+    path = tmp / "users.txt"
+    write_users(path, users, encoded)
+    port = free_port()
+    proc = start_server(args.server, tmp, port)
+    try:
+        rnd = random.Random(1)
+        names = [f"user{rnd.randrange(users)}" for _ in range(args.count)]
+        failed = 0
+        t0 = time.perf_counter()
+        for name in names:
+            failed += not login(port, name)
+        rate = args.count / (time.perf_counter() - t0)
+
+        stop = threading.Event()
+        lat: List[float] = []
+
+        def background() -> None:
+            while not stop.is_set():
+                t = time.perf_counter()
+                login(port, names[len(lat) % len(names)])
+                lat.append(time.perf_counter() - t)
+
+        th = threading.Thread(target=background)
+        th.start()
+        time.sleep(0.2)
+        t0 = time.perf_counter()
+        write_users(path, users, encoded, extra="newcomer")
+        visible = None
+        while time.perf_counter() - t0 < 10.0:
+            if login(port, "newcomer"):
+                visible = time.perf_counter() - t0
+                break
+        time.sleep(0.2)
+        stop.set()
+        th.join()
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(tmp, ignore_errors=True)
+    return rate, failed, visible, max(lat) if lat else 0.0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-N", "--users", type=int, action="append")
+    ap.add_argument("-n", "--count", type=int, default=2000)
+    ap.add_argument("--server", type=Path, default=_ROOT / "log_collector_server")
+    args = ap.parse_args()
+    if not args.server.exists():
+        raise SystemExit(f"server binary not found: {args.server}")
+    sizes = args.users or [1000, 100_000]
+    encoded = generate_argon2id_hash(
+        PASSWORD, time_cost=1, memory_cost=8, parallelism=1, hash_len=32, salt_len=16
+    )
+
+    print(f"{args.count} LOGINs per size (random accounts)")
+    print(
+        f"{'users':>8} {'login/s':>9} {'failed':>7} {'reload ms':>10} "
+        f"{'max login ms':>13}"
+    )
+    for users in sizes:
+        rate, failed, visible, worst = run(args, users, encoded)
+        shown = f"{visible * 1000:.1f}" if visible is not None else "never"
+        print(f"{users:>8} {rate:>9,.0f} {failed:>7} {shown:>10} {worst * 1000:>13.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())